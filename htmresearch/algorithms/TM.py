@@ -13,7 +13,7 @@ from numpy import *
 import sys
 import time
 import cPickle as pickle
-from itertools import product
+from itertools import izip, product
 import pprint
 import copy
 
@@ -22,12 +22,25 @@ from nupic.support.consoleprinter import ConsolePrinterMixin
 from nupic.bindings.math import Random
 from nupic.bindings.algorithms import isSegmentActive, getSegmentActivityLevel
 
+from htmresearch.algorithms.segment_arrays import SegmentArrays
+
 # Default verbosity while running unit tests
 VERBOSITY = 0
 
 # The numpy equivalent to the floating point type used by NTA
 dtype = nupic.math.GetNTAReal()
 
+# Scalar members of a Segment, stored as columns of the packed segment arrays
+# when the TM is serialized. See TM._packCells.
+_SEGMENT_INT_FIELDS = ("segID", "isSequenceSeg", "lastActiveIteration",
+                       "positiveActivations", "totalActivations",
+                       "_lastPosDutyCycleIteration")
+_SEGMENT_FLOAT_FIELDS = ("_lastPosDutyCycle",)
+
+# Types of synapse permanences. Learning mixes numpy.float32 and Python
+# numbers, and later arithmetic depends on the type, so it's stored too.
+_PERMANENCE_TYPES = (float, numpy.float32, numpy.float64, int)
+
 class TM(ConsolePrinterMixin):
 
   """
@@ -59,6 +72,7 @@ class TM(ConsolePrinterMixin):
                collectStats =False,    # If true, collect training and inference stats
                seed =42,
                verbosity =VERBOSITY,
+               segmentStore ="objects",
                ):
     """
     Construct the TM
@@ -104,8 +118,17 @@ class TM(ConsolePrinterMixin):
 
     @param seed   seed for random number generator
 
+    @param segmentStore How segment activity is computed. With "objects", each
+                  segment's synapse list is checked in a Python loop. With
+                  "arrays", the synapses are also kept in flat NumPy arrays and
+                  all segments are computed at once, which is much faster for
+                  large models. Both give identical results.
+
     """
 
+    if segmentStore not in ("objects", "arrays"):
+      raise ValueError("Unknown segmentStore: %r" % (segmentStore,))
+
     ConsolePrinterMixin.__init__(self, verbosity)
 
     #---------------------------------------------------------------------------------
@@ -135,6 +158,7 @@ class TM(ConsolePrinterMixin):
     self.seed = seed
     self.verbosity = verbosity
     self.maxAge = maxAge
+    self.segmentStore = segmentStore
 
     self.segUpdateValidDuration = 1
 
@@ -207,6 +231,8 @@ class TM(ConsolePrinterMixin):
       'segmentUpdates',
       '_internalStats',
       '_stats',
+      '_segmentArrays',
+      '_predictionCache',
       ]
 
   #############################################################################
@@ -226,6 +252,39 @@ class TM(ConsolePrinterMixin):
     # Allocate and reset all stats
     self.resetStats()
 
+    # The flat synapse arrays are rebuilt from the segments. After unpickling,
+    # that waits until the segments are loaded, see __getattr__.
+    if "_packedCells" not in self.__dict__:
+      self._segmentArrays = self._createSegmentArrays()
+
+    # Multi-step predictions from the current state, see predict()
+    self._predictionCache = None
+
+  #############################################################################
+  def _createSegmentArrays(self):
+    """
+    Create the flat synapse arrays for the "arrays" segment store, or return
+    None for the "objects" store.
+    """
+    if getattr(self, "segmentStore", "objects") != "arrays":
+      return None
+
+    segmentArrays = SegmentArrays(self.cellsPerColumn,
+                                  [("syns", 0, self.cellsPerColumn)])
+    segmentArrays.markAllDirty(self.cells)
+    return segmentArrays
+
+  #############################################################################
+  def _segmentChanged(self, c, i, segment):
+    """
+    Must be called whenever the synapses of a segment are changed, or a
+    segment is added to or removed from cell (c, i), so that the flat synapse
+    arrays can be updated.
+    """
+    self._predictionCache = None
+    if self._segmentArrays is not None:
+      self._segmentArrays.markDirty(c, i, segment)
+
   #############################################################################
   def __getstate__(self):
     """
@@ -234,14 +293,16 @@ class TM(ConsolePrinterMixin):
     are defined as those that do not need to be (nor should be) stored
     in any kind of persistent file (e.g., NuPIC network XML file.)
     """
-    # Make sure we access "cells" so we'll load it if needed...
-    _ = self.cells
-
     state = self.__dict__.copy()
 
     for ephemeralMemberName in self._getEphemeralMembers():
       state.pop(ephemeralMemberName, None)
 
+    # The segments are stored as flat arrays. If "cells" was never loaded,
+    # the arrays we were restored from are still in the state.
+    if "cells" in state:
+      state["_packedCells"] = self._packCells(state.pop("cells"))
+
     state['_random'] = pickle.dumps(state['_random'])  # Must be done manually
 
     return state
@@ -265,6 +326,9 @@ class TM(ConsolePrinterMixin):
     This function is only called when we try to access an attribute that doesn't
     exist.  We purposely make sure that "self.cells" doesn't exist after
     unpickling so that we'll hit this, then we can load it on the first access.
+    Until then the segments stay in the flat arrays made by _packCells.
+    '_segmentArrays' is created from the segments when they're loaded, so it
+    is loaded the same way.
 
     If this is called at any other time, it will raise an AttributeError.
     That's because:
@@ -275,11 +339,176 @@ class TM(ConsolePrinterMixin):
       we'll just return what it gives us.
     """
 
+    if name in ("cells", "_segmentArrays"):
+      packedCells = self.__dict__.pop("_packedCells", None)
+      if packedCells is not None:
+        self.cells = self._unpackCells(packedCells)
+        self._segmentArrays = self._createSegmentArrays()
+        return self.__dict__[name]
+
     try:
       return super(TM, self).__getattr__(name)
     except AttributeError:
       raise AttributeError("'TM' object has no attribute '%s'" % name)
 
+  #############################################################################
+  def _getSegmentClass(self):
+    """
+    The class of the segments in self.cells.
+    """
+    return Segment
+
+  #############################################################################
+  def _packCells(self, cells):
+    """
+    Store the segments of cells[c][i] as flat arrays, which pickle much faster
+    and smaller than the Segment objects.
+
+    Parameters:
+    --------------------------------------------
+    cells:        The segments to pack, in the layout of self.cells
+    retval:       A dict of numpy arrays, for _unpackCells. Segments are listed
+                  in (column, cell, segment) order. For each segment there's
+                  its flat cell index and its scalar members. For each list
+                  of synapses, there's the number of synapses of each segment
+                  and the (column, cell) source, permanence and permanence type of each
+                  synapse.
+    """
+    synapseListNames = self._getSegmentClass().synapseListNames
+
+    segmentCells = []
+    segmentInts = []
+    segmentFloats = []
+    synapseCounts = dict((name, []) for name in synapseListNames)
+    synapses = dict((name, []) for name in synapseListNames)
+
+    for c, column in enumerate(cells):
+      for i, segments in enumerate(column):
+        cell = c * self.cellsPerColumn + i
+        for segment in segments:
+          segmentCells.append(cell)
+          segmentInts.append([getattr(segment, field)
+                              for field in _SEGMENT_INT_FIELDS])
+          segmentFloats.append([getattr(segment, field)
+                                for field in _SEGMENT_FLOAT_FIELDS])
+          for name in synapseListNames:
+            segmentSynapses = getattr(segment, name)
+            synapseCounts[name].append(len(segmentSynapses))
+            synapses[name].extend(segmentSynapses)
+
+    packedCells = {
+      "segmentCells": numpy.array(segmentCells, dtype="int32"),
+      "segmentInts": numpy.array(segmentInts, dtype="int64").reshape(
+        -1, len(_SEGMENT_INT_FIELDS)),
+      "segmentFloats": numpy.array(segmentFloats, dtype="float64").reshape(
+        -1, len(_SEGMENT_FLOAT_FIELDS)),
+    }
+
+    typeIndices = dict((permanenceType, k)
+                       for k, permanenceType in enumerate(_PERMANENCE_TYPES))
+
+    for name in synapseListNames:
+      # Permanences are stored as float64 so that they're restored exactly
+      values = numpy.array(synapses[name], dtype="float64").reshape(-1, 3)
+      packedCells[name + "Counts"] = numpy.array(synapseCounts[name],
+                                                 dtype="int32")
+      packedCells[name + "Sources"] = values[:, :2].astype("int32")
+      packedCells[name + "Permanences"] = values[:, 2].copy()
+      packedCells[name + "PermanenceTypes"] = numpy.array(
+        [typeIndices.get(type(synapse[2]), 0) for synapse in synapses[name]],
+        dtype="uint8")
+
+    return packedCells
+
+  #############################################################################
+  def _unpackCells(self, packedCells):
+    """
+    Recreate the Segment objects from the result of _packCells.
+
+    Parameters:
+    --------------------------------------------
+    packedCells:  The dict returned by _packCells
+    retval:       The segments, in the layout of self.cells
+    """
+    segmentClass = self._getSegmentClass()
+
+    cells = [[[] for _ in xrange(self.cellsPerColumn)]
+             for _ in xrange(self.numberOfCols)]
+
+    synapseLists = []
+    for name in segmentClass.synapseListNames:
+      sources = packedCells[name + "Sources"]
+      permanences = packedCells[name + "Permanences"]
+      permanenceTypes = packedCells[name + "PermanenceTypes"]
+
+      # Restore the type of each permanence
+      permanenceList = permanences.tolist()
+      for k, permanenceType in enumerate(_PERMANENCE_TYPES):
+        if permanenceType is float:
+          continue
+        indices = numpy.flatnonzero(permanenceTypes == k)
+        if permanenceType is int:
+          values = permanences[indices].astype("int64").tolist()
+        else:
+          values = permanences[indices].astype(permanenceType)
+        for index, value in izip(indices.tolist(), values):
+          permanenceList[index] = value
+
+      allSynapses = map(list, izip(sources[:, 0].tolist(),
+                                   sources[:, 1].tolist(),
+                                   permanenceList))
+      ends = numpy.cumsum(packedCells[name + "Counts"]).tolist()
+      synapseLists.append((name, allSynapses, ends))
+
+    for k, (cell, ints, floats) in enumerate(izip(
+        packedCells["segmentCells"].tolist(),
+        packedCells["segmentInts"].tolist(),
+        packedCells["segmentFloats"].tolist())):
+      # Bypass the constructor, which would assign a new segID
+      segment = segmentClass.__new__(segmentClass)
+      segment.tp = self
+      for field, value in izip(_SEGMENT_INT_FIELDS, ints):
+        setattr(segment, field, value)
+      for field, value in izip(_SEGMENT_FLOAT_FIELDS, floats):
+        setattr(segment, field, value)
+      segment.isSequenceSeg = bool(segment.isSequenceSeg)
+
+      for name, allSynapses, ends in synapseLists:
+        start = ends[k - 1] if k > 0 else 0
+        setattr(segment, name, allSynapses[start:ends[k]])
+
+      c, i = divmod(cell, self.cellsPerColumn)
+      cells[c][i].append(segment)
+
+    return cells
+
+  #############################################################################
+  def saveToFile(self, filePath):
+    """
+    Save the TM to a binary snapshot, with the segments stored as flat arrays.
+
+    Parameters:
+    --------------------------------------------
+    filePath:     Path of the snapshot file
+    """
+    with open(filePath, "wb") as f:
+      pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+
+  #############################################################################
+  @classmethod
+  def loadFromFile(cls, filePath):
+    """
+    Load a TM saved with saveToFile. The Segment objects are only created on
+    the first access to the cells.
+
+    Parameters:
+    --------------------------------------------
+    filePath:     Path of the snapshot file
+    retval:       The TM
+    """
+    with open(filePath, "rb") as f:
+      return pickle.load(f)
+
   #############################################################################
   def __del__(self):
     pass
@@ -323,6 +552,7 @@ class TM(ConsolePrinterMixin):
 
     # Flush the segment update queue
     self.segmentUpdates = {}
+    self._predictionCache = None
 
     self._internalStats['nInfersSinceReset'] = 0
 
@@ -924,16 +1154,13 @@ class TM(ConsolePrinterMixin):
   def predict(self, nSteps):
     """
     This function gives the future predictions for <nSteps> timesteps starting
-    from the current TP state. The TP is returned to its original state at the
-    end before returning.
+    from the current TP state. The TP state is not modified.
 
-    1) We save the TP state.
-    2) Loop for nSteps
+    Loop for nSteps, on copies of the state:
           a) Turn-on with lateral support from the current active cells
           b) Set the predicted cells as the next step's active cells. This step
              in learn and infer methods use input here to correct the predictions.
              We don't use any input here.
-    3) Revert back the TP state to the time before prediction
 
     Parameters:
     --------------------------------------------
@@ -945,48 +1172,33 @@ class TM(ConsolePrinterMixin):
 
     """
 
-    # Save the TP dynamic state, we will use to revert back in the end
-    pristineTPDynamicState = self._getTPDynamicState()
-
     assert (nSteps>0)
 
+    # The rollout runs on scratch buffers, so the TP state is never modified.
+    # The predictions are cached until the state changes, and a later call
+    # with more steps continues from the last cached step.
+    if self._predictionCache is None:
+      # Phase 2 in both learn and infer methods already predicts for timestep
+      # (t+1). We use that prediction for free.
+      self._predictionCache = ([self.topDownCompute()],
+                               self.predictedState['t'])
+    columnPredictions, lastPredictedState = self._predictionCache
+
+    if len(columnPredictions) < nSteps:
+      activeState = numpy.empty_like(lastPredictedState)
+      predictedState = lastPredictedState.copy()
+      confidence = numpy.zeros_like(self.confidence['t'])
+      while len(columnPredictions) < nSteps:
+        # Predicted state at "t-1" becomes the active state at "t"
+        activeState, predictedState = predictedState, activeState
+        self._computePredictedState(activeState, predictedState, confidence)
+        columnPredictions.append(self.columnConfidences(confidence))
+      self._predictionCache = (columnPredictions, predictedState)
+
     # multiStepColumnPredictions holds all the future prediction.
-    multiStepColumnPredictions = numpy.zeros((nSteps, self.numberOfCols),
+    multiStepColumnPredictions = numpy.array(columnPredictions[:nSteps],
                                              dtype="float32")
 
-    # This is a (nSteps-1)+half loop. Phase 2 in both learn and infer methods
-    # already predicts for timestep (t+1). We use that prediction for free and save
-    # the half-a-loop of work.
-
-    step = 0
-    while True:
-
-      # We get the prediction for the columns in the next time step from
-      # the topDownCompute method. It internally uses confidences.
-      multiStepColumnPredictions[step,:] = self.topDownCompute()
-
-      # Cleanest way in python to handle one and half loops
-      if step == nSteps-1:
-        break
-      step += 1
-
-      # Copy t-1 into t
-      self.activeState['t-1'][:,:] = self.activeState['t'][:,:]
-      self.predictedState['t-1'][:,:] = self.predictedState['t'][:,:]
-      self.confidence['t-1'][:,:] = self.confidence['t'][:,:]
-
-      # Predicted state at "t-1" becomes the active state at "t"
-      self.activeState['t'][:,:] = self.predictedState['t-1'][:,:]
-
-      # Predicted state and confidence are set in phase2.
-      self.predictedState['t'].fill(0)
-      self.confidence['t'].fill(0.0)
-      self.computePhase2(doLearn=False)
-
-    # Revert the dynamic state to the saved state
-    self._setTPDynamicState(pristineTPDynamicState)
-
-
     return multiStepColumnPredictions
 
   #############################################################################
@@ -1030,6 +1242,7 @@ class TM(ConsolePrinterMixin):
     """
     for variableName in self._getTPDynamicStateVariableNames():
       self.__dict__[variableName] = tpDynamicState.pop(variableName)
+    self._predictionCache = None
 
 
   #############################################################################
@@ -1045,6 +1258,12 @@ class TM(ConsolePrinterMixin):
     retval:       ?
     """
 
+    self._predictionCache = None
+
+    if self._segmentArrays is not None:
+      self._computePhase2WithArrays(doLearn)
+      return
+
     # Phase 2: compute predicted state for each cell
     # - if a segment has enough horizontal connections firing because of
     #   bottomUpInput, it's set to be predicting, and we queue up the segment
@@ -1079,6 +1298,79 @@ class TM(ConsolePrinterMixin):
         self.confidence['t'][c,i] = maxConfidence
 
 
+  def _computePhase2WithArrays(self, doLearn):
+    """
+    computePhase2 for the "arrays" segment store. The activity of all segments
+    is computed at once, and then only the cells with active segments are
+    visited, in the same order as computePhase2.
+    """
+    self._segmentArrays.sync(self.cells)
+    overlaps = self._segmentArrays.computeActivity(
+      self.activeState['t'].reshape(-1), self.connectedPerm)
+    activeSlots = numpy.flatnonzero(overlaps >= self.activationThreshold)
+    activeSegmentIds = set(
+      id(self._segmentArrays.getSlotSegment(slot)) for slot in activeSlots)
+
+    # Cells without active segments have a confidence of 0
+    self.confidence['t'].fill(0)
+
+    for cell in numpy.unique(self._segmentArrays.getSlotCells(activeSlots)):
+      c, i = divmod(int(cell), self.cellsPerColumn)
+      maxConfidence = 0
+      for s in self.cells[c][i]:
+        if id(s) not in activeSegmentIds:
+          continue
+
+        self.predictedState['t'][c,i] = 1
+        maxConfidence = max(maxConfidence, s.dutyCycle(readOnly=True))
+
+        if doLearn:
+          s.totalActivations += 1    # increment activationFrequency
+          s.lastActiveIteration = self.iterationIdx
+          # mark this segment for learning
+          activeUpdate = self.getSegmentActiveSynapses(c,i,s,'t')
+          activeUpdate.phase1Flag = False
+          self.addToSegmentUpdates(c, i, activeUpdate)
+
+      self.confidence['t'][c,i] = maxConfidence
+
+
+  def _computePredictedState(self, activeState, predictedState, confidence):
+    """
+    Phase 2 without learning, on the given arrays instead of the TP's own
+    state. Used for the multi-step predictions.
+
+    Parameters:
+    --------------------------------------------
+    activeState:    The active cells
+    predictedState: Output, set to the cells with an active segment
+    confidence:     Output, set to the confidence of each cell
+    """
+    predictedState.fill(0)
+    confidence.fill(0)
+
+    if self._segmentArrays is not None:
+      self._segmentArrays.sync(self.cells)
+      overlaps = self._segmentArrays.computeActivity(activeState.reshape(-1),
+                                                     self.connectedPerm)
+      for slot in numpy.flatnonzero(overlaps >= self.activationThreshold):
+        c, i = divmod(int(self._segmentArrays.getSlotCells(slot)),
+                      self.cellsPerColumn)
+        s = self._segmentArrays.getSlotSegment(slot)
+        predictedState[c,i] = 1
+        confidence[c,i] = max(confidence[c,i], s.dutyCycle(readOnly=True))
+      return
+
+    for c in xrange(self.numberOfCols):
+      for i in xrange(self.cellsPerColumn):
+        maxConfidence = 0
+        for s in self.cells[c][i]:
+          if self.isSegmentActive(s, activeState):
+            predictedState[c,i] = 1
+            maxConfidence = max(maxConfidence, s.dutyCycle(readOnly=True))
+        confidence[c,i] = maxConfidence
+
+
   def compute(self, bottomUpInput, enableLearn, computeInfOutput=None):
     """Computes output for both learning and inference. In both cases, the
     output is the boolean OR of activeState and predictedState at t.
@@ -1338,6 +1630,7 @@ class TM(ConsolePrinterMixin):
             continue
 
           #print "Decrementing seg age %d:" % (age), c, i, segment
+          self._segmentChanged(c, i, segment)
           synsToDel = [] # collect and remove outside the loop
           for synapse in segment.syns: # skip sequenceSegment flag
 
@@ -1456,6 +1749,7 @@ class TM(ConsolePrinterMixin):
         segsToDel.append(segment) # will remove the whole segment
       else:
         if len(synsToDel) > 0:
+          self._segmentChanged(colIdx, cellIdx, segment)
           for syn in synsToDel: # remove some synapses on segment
             segment.syns.remove(syn)
             nSynsRemoved += 1
@@ -1468,6 +1762,7 @@ class TM(ConsolePrinterMixin):
     for seg in segsToDel: # remove some segments of this cell
       self.cleanUpdatesList(colIdx, cellIdx, seg)
       self.cells[colIdx][cellIdx].remove(seg)
+      self._segmentChanged(colIdx, cellIdx, seg)
       nSynsRemoved += len(seg.syns)
 
     return nSegsRemoved, nSynsRemoved
@@ -2027,6 +2322,8 @@ class TM(ConsolePrinterMixin):
 
     if segment is not None: # modify an existing segment
 
+      self._segmentChanged(c, i, segment)
+
       if positiveReinforcement:
 
         if self.verbosity >= 4:
@@ -2095,6 +2392,7 @@ class TM(ConsolePrinterMixin):
         newSegment.printSegment()
 
       self.cells[c][i].append(newSegment)
+      self._segmentChanged(c, i, newSegment)
 
 
     return trimSegment
@@ -2184,6 +2482,9 @@ class Segment(object):
   the synapses it owns.
   """
 
+  ## Names of the lists of synapses of a segment
+  synapseListNames = ("syns",)
+
   ## These are iteration count tiers used when computing segment duty cycle.
   dutyCycleTiers =  [0,       100,      320,    1000,
                      3200,    10000,    32000,  100000,
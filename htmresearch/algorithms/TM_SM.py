@@ -22,6 +22,7 @@ from nupic.support.consoleprinter import ConsolePrinterMixin
 from nupic.bindings.math import Random
 from nupic.bindings.algorithms import isSegmentActive, getSegmentActivityLevel
 from TM import TM
+from htmresearch.algorithms.segment_arrays import SegmentArrays
 # Default verbosity while running unit tests
 VERBOSITY = 0
 
@@ -62,6 +63,7 @@ class TM_SM(TM):
                seed =42,
                learnOnOneCell=False,
                verbosity =VERBOSITY,
+               segmentStore ="objects",
                ):
     """
     Construct the TM
@@ -122,8 +124,18 @@ class TM_SM(TM):
 
     @param seed   seed for random number generator
 
+    @param segmentStore How segment activity is computed. With "objects", each
+                  segment's synapse lists are checked in a Python loop. With
+                  "arrays", the lateral and distal synapses are also kept in
+                  flat NumPy arrays and all segments are computed at once,
+                  which is much faster for large models. Both give identical
+                  results.
+
     """
 
+    if segmentStore not in ("objects", "arrays"):
+      raise ValueError("Unknown segmentStore: %r" % (segmentStore,))
+
     ConsolePrinterMixin.__init__(self, verbosity)
 
     #---------------------------------------------------------------------------------
@@ -159,6 +171,7 @@ class TM_SM(TM):
     self.learnDistalInputs = learnDistalInputs
     self.segUpdateValidDuration = 1
     self.learnOnOneCell = learnOnOneCell
+    self.segmentStore = segmentStore
 
     #---------------------------------------------------------------------------------
     # Create data structures
@@ -256,6 +269,7 @@ class TM_SM(TM):
 
     # Flush the segment update queue
     self.segmentUpdates = {}
+    self._predictionCache = None
 
     self._internalStats['nInfersSinceReset'] = 0
 
@@ -664,6 +678,12 @@ class TM_SM(TM):
     retval:       ?
     """
 
+    self._predictionCache = None
+
+    if self._segmentArrays is not None:
+      self._computePhase2WithArrays(doLearn)
+      return
+
     # Phase 2: compute predicted state for each cell
     # - if a segment has enough activity, either due to horizontal or distal
     # dendritic input, it's set to be predicting, and we queue up the segment
@@ -703,6 +723,98 @@ class TM_SM(TM):
         self.confidence['t'][c,i] = maxConfidence
 
 
+  def _computePhase2WithArrays(self, doLearn):
+    """
+    computePhase2 for the "arrays" segment store. The lateral and distal
+    activity of all segments is computed at once, and then only the cells with
+    active segments are visited, in the same order as computePhase2.
+    """
+    self._segmentArrays.sync(self.cells)
+    sourceActivity = numpy.concatenate(
+      (self.activeState['t'].reshape(-1),
+       self.distalDendriticInput['t'].reshape(-1)))
+    overlaps = self._segmentArrays.computeActivity(sourceActivity,
+                                                   self.connectedPerm)
+    activeSlots = numpy.flatnonzero(overlaps > self.activationThreshold)
+    activeSegmentIds = set(
+      id(self._segmentArrays.getSlotSegment(slot)) for slot in activeSlots)
+
+    # No confidence is computed for sensorimotor segments
+    self.confidence['t'].fill(0)
+
+    for cell in numpy.unique(self._segmentArrays.getSlotCells(activeSlots)):
+      c, i = divmod(int(cell), self.cellsPerColumn)
+      for s in self.cells[c][i]:
+        if id(s) not in activeSegmentIds:
+          continue
+
+        self.predictedState['t'][c,i] = 1
+
+        if doLearn:
+          s.totalActivations += 1    # increment activationFrequency
+          s.lastActiveIteration = self.iterationIdx
+          # mark this segment for learning
+          activeUpdate = self.getSegmentActiveSynapses(c, i, s, 't')
+          activeUpdate.phase1Flag = False
+          self.addToSegmentUpdates(c, i, activeUpdate)
+
+
+  def _computePredictedState(self, activeState, predictedState, confidence):
+    """
+    Phase 2 without learning, on the given arrays instead of the TM's own
+    state. The distal dendritic input is assumed to stay the same. Used for
+    the multi-step predictions.
+    """
+    predictedState.fill(0)
+    # No confidence is computed for sensorimotor segments
+    confidence.fill(0)
+
+    if self._segmentArrays is not None:
+      self._segmentArrays.sync(self.cells)
+      sourceActivity = numpy.concatenate(
+        (activeState.reshape(-1),
+         self.distalDendriticInput['t'].reshape(-1)))
+      overlaps = self._segmentArrays.computeActivity(sourceActivity,
+                                                     self.connectedPerm)
+      activeSlots = numpy.flatnonzero(overlaps > self.activationThreshold)
+      cells = self._segmentArrays.getSlotCells(activeSlots)
+      predictedState.reshape(-1)[cells] = 1
+      return
+
+    for c in xrange(self.numberOfCols):
+      for i in xrange(self.cellsPerColumn):
+        for s in self.cells[c][i]:
+          if self.isSegmentActive(s, activeState,
+                                  self.distalDendriticInput['t']):
+            predictedState[c,i] = 1
+            break
+
+
+  def _getSegmentClass(self):
+    """
+    The class of the segments in self.cells.
+    """
+    return Segment
+
+
+  def _createSegmentArrays(self):
+    """
+    Create the flat synapse arrays for the "arrays" segment store, or return
+    None for the "objects" store. Lateral synapses read the active state and
+    distal synapses read the distal dendritic input, which follows it in the
+    source activity.
+    """
+    if getattr(self, "segmentStore", "objects") != "arrays":
+      return None
+
+    segmentArrays = SegmentArrays(
+      self.cellsPerColumn,
+      [("syns", 0, self.cellsPerColumn),
+       ("dsyns", self.numberOfCols * self.cellsPerColumn, 1)])
+    segmentArrays.markAllDirty(self.cells)
+    return segmentArrays
+
+
   def compute(self, bottomUpInput, distalDendriticInput, enableLearn, computeInfOutput=None):
     """Computes output for both learning and inference. In both cases, the
     output is the boolean OR of activeState and predictedState at t.
@@ -1032,6 +1144,7 @@ class TM_SM(TM):
             continue
 
           #print "Decrementing seg age %d:" % (age), c, i, segment
+          self._segmentChanged(c, i, segment)
           synsToDel = [] # collect and remove outside the loop
           for synapse in segment.syns: # skip sequenceSegment flag
 
@@ -1106,6 +1219,8 @@ class TM_SM(TM):
       if (len(synsToDel) == len(segment.syns) ) and (len(dsynsToDel)==len(segment.dsyns)):
         segsToDel.append(segment) # will remove the whole segment
       else:
+        if len(synsToDel) > 0 or len(dsynsToDel) > 0:
+          self._segmentChanged(colIdx, cellIdx, segment)
         if len(synsToDel) > 0:
           for syn in synsToDel: # remove some synapses on segment
             segment.syns.remove(syn)
@@ -1123,6 +1238,7 @@ class TM_SM(TM):
     for seg in segsToDel: # remove some segments of this cell
       self.cleanUpdatesList(colIdx, cellIdx, seg)
       self.cells[colIdx][cellIdx].remove(seg)
+      self._segmentChanged(colIdx, cellIdx, seg)
       nSynsRemoved += len(seg.syns)
 
     return nSegsRemoved, nSynsRemoved, ndSynsRemoved
@@ -1647,6 +1763,8 @@ class TM_SM(TM):
 
     if segment is not None: # modify an existing segment
 
+      self._segmentChanged(c, i, segment)
+
       if positiveReinforcement:
 
         if self.verbosity >= 4:
@@ -1729,6 +1847,7 @@ class TM_SM(TM):
         newSegment.printSegment()
 
       self.cells[c][i].append(newSegment)
+      self._segmentChanged(c, i, newSegment)
 
 
     return trimSegment
@@ -1840,6 +1959,9 @@ class Segment(object):
   the synapses it owns.
   """
 
+  ## Names of the lists of synapses of a segment
+  synapseListNames = ("syns", "dsyns")
+
   ## These are iteration count tiers used when computing segment duty cycle.
   dutyCycleTiers =  [0,       100,      320,    1000,
                      3200,    10000,    32000,  100000,
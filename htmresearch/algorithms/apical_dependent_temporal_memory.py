@@ -24,6 +24,7 @@
 import numpy as np
 
 from htmresearch.support import numpy_helpers as np2
+from htmresearch.support.phase_profiler import NULL_PROFILER
 from nupic.bindings.math import Random, SparseMatrixConnections
 
 
@@ -47,6 +48,8 @@ class ApicalDependentTemporalMemory(object):
     what these cell numbers mean, but the TemporalMemory doesn't.
   """
 
+  phaseProfiler = NULL_PROFILER
+
   def __init__(self,
                columnCount=2048,
                basalInputSize=0,
@@ -167,6 +170,17 @@ class ApicalDependentTemporalMemory(object):
     self.apicalPotentialOverlaps = np.empty(0, dtype="int32")
 
 
+  def setPhaseProfiler(self, profiler):
+    """
+    Record the time spent in each phase of the compute step, and the numbers
+    of active and matching segments, with the given profiler.
+
+    @param profiler (PhaseProfiler or None)
+    None disables profiling.
+    """
+    self.phaseProfiler = profiler if profiler is not None else NULL_PROFILER
+
+
   def depolarizeCells(self, basalInput, apicalInput, learn):
     """
     Calculate predictions.
@@ -181,35 +195,49 @@ class ApicalDependentTemporalMemory(object):
     Whether learning is enabled. Some TM implementations may depolarize cells
     differently or do segment activity bookkeeping when learning is enabled.
     """
-    # Calculate predictions for this timestep
-    (activeApicalSegments,
-     matchingApicalSegments,
-     apicalPotentialOverlaps) = self._calculateSegmentActivity(
-       self.apicalConnections, apicalInput, self.connectedPermanence,
-       self.activationThreshold, self.minThreshold, self.reducedBasalThreshold)
-
-    apicallySupportedCells = self.apicalConnections.mapSegmentsToCells(
-      activeApicalSegments)
-    if not self.disableApicalDependence:
-      (activeBasalSegments,
-       matchingBasalSegments,
-       basalPotentialOverlaps) = self._calculateSegmentActivity(
-         self.basalConnections, basalInput,
-         self.connectedPermanence, self.activationThreshold,
-         self.minThreshold, self.reducedBasalThreshold,
-         reducedThresholdCells = apicallySupportedCells,)
-
-      predictedCells = np.intersect1d(
-        self.basalConnections.mapSegmentsToCells(activeBasalSegments),
-        apicallySupportedCells)
-    else:
-      (activeBasalSegments,
-      matchingBasalSegments,
-      basalPotentialOverlaps) = self._calculateSegmentActivity(
-        self.basalConnections, basalInput, self.connectedPermanence,
-        self.activationThreshold, self.minThreshold, self.reducedBasalThreshold)
+    profiler = self.phaseProfiler
 
-      predictedCells = self.basalConnections.mapSegmentsToCells(activeBasalSegments)
+    # Calculate predictions for this timestep
+    with profiler.phase("apicalSegmentActivity"):
+      (activeApicalSegments,
+       matchingApicalSegments,
+       apicalPotentialOverlaps) = self._calculateSegmentActivity(
+         self.apicalConnections, apicalInput, self.connectedPermanence,
+         self.activationThreshold, self.minThreshold, self.reducedBasalThreshold)
+
+      apicallySupportedCells = self.apicalConnections.mapSegmentsToCells(
+        activeApicalSegments)
+
+    with profiler.phase("basalSegmentActivity"):
+      if not self.disableApicalDependence:
+        (activeBasalSegments,
+         matchingBasalSegments,
+         basalPotentialOverlaps) = self._calculateSegmentActivity(
+           self.basalConnections, basalInput,
+           self.connectedPermanence, self.activationThreshold,
+           self.minThreshold, self.reducedBasalThreshold,
+           reducedThresholdCells = apicallySupportedCells,)
+      else:
+        (activeBasalSegments,
+        matchingBasalSegments,
+        basalPotentialOverlaps) = self._calculateSegmentActivity(
+          self.basalConnections, basalInput, self.connectedPermanence,
+          self.activationThreshold, self.minThreshold, self.reducedBasalThreshold)
+
+    with profiler.phase("predictedCells"):
+      if not self.disableApicalDependence:
+        predictedCells = np.intersect1d(
+          self.basalConnections.mapSegmentsToCells(activeBasalSegments),
+          apicallySupportedCells)
+      else:
+        predictedCells = self.basalConnections.mapSegmentsToCells(
+          activeBasalSegments)
+
+    profiler.recordSize("activeApicalSegments", len(activeApicalSegments))
+    profiler.recordSize("matchingApicalSegments", len(matchingApicalSegments))
+    profiler.recordSize("activeBasalSegments", len(activeBasalSegments))
+    profiler.recordSize("matchingBasalSegments", len(matchingBasalSegments))
+    profiler.recordSize("predictedCells", len(predictedCells))
 
     self.predictedCells = predictedCells
     self.activeBasalSegments = activeBasalSegments
@@ -249,75 +277,81 @@ class ApicalDependentTemporalMemory(object):
     @param learn (bool)
     Whether to grow / reinforce / punish synapses
     """
+    profiler = self.phaseProfiler
 
     # Calculate active cells
-    (correctPredictedCells,
-     burstingColumns) = np2.setCompare(self.predictedCells, activeColumns,
-                                       self.predictedCells / self.cellsPerColumn,
-                                       rightMinusLeft=True)
+    with profiler.phase("activeCells"):
+      (correctPredictedCells,
+       burstingColumns) = np2.setCompare(
+         self.predictedCells, activeColumns,
+         self.predictedCells / self.cellsPerColumn, rightMinusLeft=True)
 
-    newActiveCells = np.concatenate((correctPredictedCells,
-                                     np2.getAllCellsInColumns(
-                                       burstingColumns, self.cellsPerColumn)))
+      newActiveCells = np.concatenate((correctPredictedCells,
+                                       np2.getAllCellsInColumns(
+                                         burstingColumns, self.cellsPerColumn)))
 
     # Calculate learning
-    (learningActiveBasalSegments,
-     learningActiveApicalSegments,
-     learningMatchingBasalSegments,
-     learningMatchingApicalSegments,
-     basalSegmentsToPunish,
-     apicalSegmentsToPunish,
-     newSegmentCells,
-     learningCells) = self._calculateLearning(activeColumns,
-                                              burstingColumns,
-                                              correctPredictedCells,
-                                              self.activeBasalSegments,
-                                              self.activeApicalSegments,
-                                              self.matchingBasalSegments,
-                                              self.matchingApicalSegments,
-                                              self.basalPotentialOverlaps,
-                                              self.apicalPotentialOverlaps)
+    with profiler.phase("learningSelection"):
+      (learningActiveBasalSegments,
+       learningActiveApicalSegments,
+       learningMatchingBasalSegments,
+       learningMatchingApicalSegments,
+       basalSegmentsToPunish,
+       apicalSegmentsToPunish,
+       newSegmentCells,
+       learningCells) = self._calculateLearning(activeColumns,
+                                                burstingColumns,
+                                                correctPredictedCells,
+                                                self.activeBasalSegments,
+                                                self.activeApicalSegments,
+                                                self.matchingBasalSegments,
+                                                self.matchingApicalSegments,
+                                                self.basalPotentialOverlaps,
+                                                self.apicalPotentialOverlaps)
 
     if learn:
       # Learn on existing segments
-      for learningSegments in (learningActiveBasalSegments,
-                               learningMatchingBasalSegments):
-        self._learn(self.basalConnections, self.rng, learningSegments,
-                    basalReinforceCandidates, basalGrowthCandidates,
-                    self.basalPotentialOverlaps,
-                    self.initialPermanence, self.sampleSize,
-                    self.permanenceIncrement, self.permanenceDecrement,
-                    self.maxSynapsesPerSegment)
-
-      for learningSegments in (learningActiveApicalSegments,
-                               learningMatchingApicalSegments):
-        self._learn(self.apicalConnections, self.rng, learningSegments,
-                    apicalReinforceCandidates, apicalGrowthCandidates,
-                    self.apicalPotentialOverlaps, self.initialPermanence,
-                    self.sampleSize, self.permanenceIncrement,
-                    self.permanenceDecrement, self.maxSynapsesPerSegment)
+      with profiler.phase("learnOnExistingSegments"):
+        for learningSegments in (learningActiveBasalSegments,
+                                 learningMatchingBasalSegments):
+          self._learn(self.basalConnections, self.rng, learningSegments,
+                      basalReinforceCandidates, basalGrowthCandidates,
+                      self.basalPotentialOverlaps,
+                      self.initialPermanence, self.sampleSize,
+                      self.permanenceIncrement, self.permanenceDecrement,
+                      self.maxSynapsesPerSegment)
+
+        for learningSegments in (learningActiveApicalSegments,
+                                 learningMatchingApicalSegments):
+          self._learn(self.apicalConnections, self.rng, learningSegments,
+                      apicalReinforceCandidates, apicalGrowthCandidates,
+                      self.apicalPotentialOverlaps, self.initialPermanence,
+                      self.sampleSize, self.permanenceIncrement,
+                      self.permanenceDecrement, self.maxSynapsesPerSegment)
 
       # Punish incorrect predictions
-      if self.basalPredictedSegmentDecrement != 0.0:
-        self.basalConnections.adjustActiveSynapses(
-          basalSegmentsToPunish, basalReinforceCandidates,
-          -self.basalPredictedSegmentDecrement)
+      with profiler.phase("punishSegments"):
+        if self.basalPredictedSegmentDecrement != 0.0:
+          self.basalConnections.adjustActiveSynapses(
+            basalSegmentsToPunish, basalReinforceCandidates,
+            -self.basalPredictedSegmentDecrement)
 
-      if self.apicalPredictedSegmentDecrement != 0.0:
-        self.apicalConnections.adjustActiveSynapses(
-          apicalSegmentsToPunish, apicalReinforceCandidates,
-          -self.apicalPredictedSegmentDecrement)
+        if self.apicalPredictedSegmentDecrement != 0.0:
+          self.apicalConnections.adjustActiveSynapses(
+            apicalSegmentsToPunish, apicalReinforceCandidates,
+            -self.apicalPredictedSegmentDecrement)
 
       # Only grow segments if there is basal *and* apical input.
-      if len(basalGrowthCandidates) > 0 and len(apicalGrowthCandidates) > 0:
-        self._learnOnNewSegments(self.basalConnections, self.rng,
-                                 newSegmentCells, basalGrowthCandidates,
-                                 self.initialPermanence, self.sampleSize,
-                                 self.maxSynapsesPerSegment)
-        self._learnOnNewSegments(self.apicalConnections, self.rng,
-                                 newSegmentCells, apicalGrowthCandidates,
-                                 self.initialPermanence, self.sampleSize,
-                                 self.maxSynapsesPerSegment)
+      with profiler.phase("growNewSegments"):
+        if len(basalGrowthCandidates) > 0 and len(apicalGrowthCandidates) > 0:
+          self._learnOnNewSegments(self.basalConnections, self.rng,
+                                   newSegmentCells, basalGrowthCandidates,
+                                   self.initialPermanence, self.sampleSize,
+                                   self.maxSynapsesPerSegment)
+          self._learnOnNewSegments(self.apicalConnections, self.rng,
+                                   newSegmentCells, apicalGrowthCandidates,
+                                   self.initialPermanence, self.sampleSize,
+                                   self.maxSynapsesPerSegment)
 
 
     # Save the results
@@ -327,6 +361,9 @@ class ApicalDependentTemporalMemory(object):
     self.winnerCells = learningCells
     self.predictedActiveCells = correctPredictedCells
 
+    profiler.recordSize("activeCells", len(newActiveCells))
+    profiler.recordSize("burstingColumns", len(burstingColumns))
+
 
   def _calculateLearning(self,
                          activeColumns,
@@ -24,10 +24,98 @@
 import numpy as np
 
 from htmresearch.support import numpy_helpers as np2
+from htmresearch.support.phase_profiler import NULL_PROFILER
 from nupic.bindings.math import Random, SparseMatrixConnections
 
 
 
+class SegmentOverlapCache(object):
+  """
+  Computes the connected and potential overlaps of a set of segments with an
+  input, and remembers the last result so that it isn't recomputed when
+  neither the input nor the connections have changed.
+
+  The cache recognizes changes to the connections that create segments or
+  add or remove synapses. Changes that only modify permanences can't be
+  detected cheaply, so whoever makes them must call 'invalidate'. The
+  ApicalTiebreakTemporalMemory does this whenever it learns.
+  """
+
+  def __init__(self):
+    self._key = None
+    self._result = None
+
+
+  def invalidate(self):
+    """
+    Forget the last result.
+    """
+    self._key = None
+    self._result = None
+
+
+  def computeOverlaps(self, connections, activeInput, connectedPermanence):
+    """
+    @param connections (SparseMatrixConnections)
+    @param activeInput (numpy array)
+    @param connectedPermanence (float)
+
+    @return (tuple)
+    - overlaps (numpy array)
+      The number of active connected synapses for each segment.
+
+    - potentialOverlaps (numpy array)
+      The number of active potential synapses for each segment.
+
+    The returned arrays may be returned again by later calls, so they must not
+    be modified.
+    """
+    activeInput = np.asarray(activeInput, dtype="uint32")
+    key = (id(connections), connectedPermanence,
+           connections.matrix.nRows(), connections.matrix.nNonZeros(),
+           activeInput.tobytes())
+
+    if key != self._key:
+      self._result = computeSegmentOverlaps(connections, activeInput,
+                                            connectedPermanence)
+      self._key = key
+
+    return self._result
+
+
+
+def computeSegmentOverlaps(connections, activeInput, connectedPermanence):
+  """
+  Calculate both the connected and the potential overlaps of every segment
+  with the active input.
+
+  This still makes two passes over the active inputs' synapses, one
+  computeActivity call per count, because SparseMatrixConnections has no
+  kernel that produces both. It only saves work when the input is empty. The
+  savings of the TM come from the SegmentOverlapCache, which skips both calls
+  when nothing has changed.
+
+  @param connections (SparseMatrixConnections)
+  @param activeInput (numpy array)
+  @param connectedPermanence (float)
+
+  @return (tuple)
+  - overlaps (numpy array)
+    The number of active connected synapses for each segment.
+
+  - potentialOverlaps (numpy array)
+    The number of active potential synapses for each segment.
+  """
+  if len(activeInput) == 0:
+    numSegments = connections.matrix.nRows()
+    return (np.zeros(numSegments, dtype="int32"),
+            np.zeros(numSegments, dtype="int32"))
+
+  return (connections.computeActivity(activeInput, connectedPermanence),
+          connections.computeActivity(activeInput))
+
+
+
 class ApicalTiebreakTemporalMemory(object):
   """
   A generalized Temporal Memory with apical dendrites that add a "tiebreak".
@@ -52,6 +140,8 @@ class ApicalTiebreakTemporalMemory(object):
     what these cell numbers mean, but the TemporalMemory doesn't.
   """
 
+  phaseProfiler = NULL_PROFILER
+
   def __init__(self,
                columnCount=2048,
                basalInputSize=0,
@@ -157,6 +247,9 @@ class ApicalTiebreakTemporalMemory(object):
     self.useApicalTiebreak=True
     self.useApicalModulationBasalThreshold=True
 
+    self.basalOverlapCache = SegmentOverlapCache()
+    self.apicalOverlapCache = SegmentOverlapCache()
+
 
   def reset(self):
     """
@@ -174,6 +267,17 @@ class ApicalTiebreakTemporalMemory(object):
     self.apicalPotentialOverlaps = np.empty(0, dtype="int32")
 
 
+  def setPhaseProfiler(self, profiler):
+    """
+    Record the time spent in each phase of the compute step, and the numbers
+    of active and matching segments, with the given profiler.
+
+    @param profiler (PhaseProfiler or None)
+    None disables profiling.
+    """
+    self.phaseProfiler = profiler if profiler is not None else NULL_PROFILER
+
+
   def depolarizeCells(self, basalInput, apicalInput, learn):
     """
     Calculate predictions.
@@ -188,27 +292,39 @@ class ApicalTiebreakTemporalMemory(object):
     Whether learning is enabled. Some TM implementations may depolarize cells
     differently or do segment activity bookkeeping when learning is enabled.
     """
-    (activeApicalSegments,
-     matchingApicalSegments,
-     apicalPotentialOverlaps) = self._calculateApicalSegmentActivity(
-       self.apicalConnections, apicalInput, self.connectedPermanence,
-       self.activationThreshold, self.minThreshold)
-
-    if learn or self.useApicalModulationBasalThreshold==False:
-      reducedBasalThresholdCells = ()
-    else:
-      reducedBasalThresholdCells = self.apicalConnections.mapSegmentsToCells(
-        activeApicalSegments)
-
-    (activeBasalSegments,
-     matchingBasalSegments,
-     basalPotentialOverlaps) = self._calculateBasalSegmentActivity(
-       self.basalConnections, basalInput, reducedBasalThresholdCells,
-       self.connectedPermanence,
-       self.activationThreshold, self.minThreshold, self.reducedBasalThreshold)
-
-    predictedCells = self._calculatePredictedCells(activeBasalSegments,
-                                                   activeApicalSegments)
+    profiler = self.phaseProfiler
+
+    with profiler.phase("apicalSegmentActivity"):
+      (activeApicalSegments,
+       matchingApicalSegments,
+       apicalPotentialOverlaps) = self._calculateApicalSegmentActivity(
+         self.apicalConnections, apicalInput, self.connectedPermanence,
+         self.activationThreshold, self.minThreshold, self.apicalOverlapCache)
+
+    with profiler.phase("basalSegmentActivity"):
+      if learn or self.useApicalModulationBasalThreshold==False:
+        reducedBasalThresholdCells = ()
+      else:
+        reducedBasalThresholdCells = self.apicalConnections.mapSegmentsToCells(
+          activeApicalSegments)
+
+      (activeBasalSegments,
+       matchingBasalSegments,
+       basalPotentialOverlaps) = self._calculateBasalSegmentActivity(
+         self.basalConnections, basalInput, reducedBasalThresholdCells,
+         self.connectedPermanence,
+         self.activationThreshold, self.minThreshold, self.reducedBasalThreshold,
+         self.basalOverlapCache)
+
+    with profiler.phase("predictedCells"):
+      predictedCells = self._calculatePredictedCells(activeBasalSegments,
+                                                     activeApicalSegments)
+
+    profiler.recordSize("activeApicalSegments", len(activeApicalSegments))
+    profiler.recordSize("matchingApicalSegments", len(matchingApicalSegments))
+    profiler.recordSize("activeBasalSegments", len(activeBasalSegments))
+    profiler.recordSize("matchingBasalSegments", len(matchingBasalSegments))
+    profiler.recordSize("predictedCells", len(predictedCells))
 
     self.predictedCells = predictedCells
     self.activeBasalSegments = activeBasalSegments
@@ -248,77 +364,87 @@ class ApicalTiebreakTemporalMemory(object):
     @param learn (bool)
     Whether to grow / reinforce / punish synapses
     """
+    profiler = self.phaseProfiler
 
     # Calculate active cells
-    (correctPredictedCells,
-     burstingColumns) = np2.setCompare(self.predictedCells, activeColumns,
-                                       self.predictedCells / self.cellsPerColumn,
-                                       rightMinusLeft=True)
-    newActiveCells = np.concatenate((correctPredictedCells,
-                                     np2.getAllCellsInColumns(
-                                       burstingColumns, self.cellsPerColumn)))
+    with profiler.phase("activeCells"):
+      (correctPredictedCells,
+       burstingColumns) = np2.setCompare(
+         self.predictedCells, activeColumns,
+         self.predictedCells / self.cellsPerColumn, rightMinusLeft=True)
+      newActiveCells = np.concatenate((correctPredictedCells,
+                                       np2.getAllCellsInColumns(
+                                         burstingColumns, self.cellsPerColumn)))
 
     # Calculate learning
-    (learningActiveBasalSegments,
-     learningMatchingBasalSegments,
-     basalSegmentsToPunish,
-     newBasalSegmentCells,
-     learningCells) = self._calculateBasalLearning(
-       activeColumns, burstingColumns, correctPredictedCells,
-       self.activeBasalSegments, self.matchingBasalSegments,
-       self.basalPotentialOverlaps)
-
-    (learningActiveApicalSegments,
-     learningMatchingApicalSegments,
-     apicalSegmentsToPunish,
-     newApicalSegmentCells) = self._calculateApicalLearning(
-       learningCells, activeColumns, self.activeApicalSegments,
-       self.matchingApicalSegments, self.apicalPotentialOverlaps)
+    with profiler.phase("learningSelection"):
+      (learningActiveBasalSegments,
+       learningMatchingBasalSegments,
+       basalSegmentsToPunish,
+       newBasalSegmentCells,
+       learningCells) = self._calculateBasalLearning(
+         activeColumns, burstingColumns, correctPredictedCells,
+         self.activeBasalSegments, self.matchingBasalSegments,
+         self.basalPotentialOverlaps)
+
+      (learningActiveApicalSegments,
+       learningMatchingApicalSegments,
+       apicalSegmentsToPunish,
+       newApicalSegmentCells) = self._calculateApicalLearning(
+         learningCells, activeColumns, self.activeApicalSegments,
+         self.matchingApicalSegments, self.apicalPotentialOverlaps)
 
     # Learn
     if learn:
+      self.basalOverlapCache.invalidate()
+      self.apicalOverlapCache.invalidate()
+
       # Learn on existing segments
-      for learningSegments in (learningActiveBasalSegments,
-                               learningMatchingBasalSegments):
-        self._learn(self.basalConnections, self.rng, learningSegments,
-                    basalReinforceCandidates, basalGrowthCandidates,
-                    self.basalPotentialOverlaps,
-                    self.initialPermanence, self.sampleSize,
-                    self.permanenceIncrement, self.permanenceDecrement,
-                    self.maxSynapsesPerSegment)
-
-      for learningSegments in (learningActiveApicalSegments,
-                               learningMatchingApicalSegments):
-
-        self._learn(self.apicalConnections, self.rng, learningSegments,
-                    apicalReinforceCandidates, apicalGrowthCandidates,
-                    self.apicalPotentialOverlaps, self.initialPermanence,
-                    self.sampleSize, self.permanenceIncrement,
-                    self.permanenceDecrement, self.maxSynapsesPerSegment)
+      with profiler.phase("learnOnExistingSegments"):
+        for learningSegments in (learningActiveBasalSegments,
+                                 learningMatchingBasalSegments):
+          self._learn(self.basalConnections, self.rng, learningSegments,
+                      basalReinforceCandidates, basalGrowthCandidates,
+                      self.basalPotentialOverlaps,
+                      self.initialPermanence, self.sampleSize,
+                      self.permanenceIncrement, self.permanenceDecrement,
+                      self.maxSynapsesPerSegment)
+
+        for learningSegments in (learningActiveApicalSegments,
+                                 learningMatchingApicalSegments):
+
+          self._learn(self.apicalConnections, self.rng, learningSegments,
+                      apicalReinforceCandidates, apicalGrowthCandidates,
+                      self.apicalPotentialOverlaps, self.initialPermanence,
+                      self.sampleSize, self.permanenceIncrement,
+                      self.permanenceDecrement, self.maxSynapsesPerSegment)
 
       # Punish incorrect predictions
-      if self.basalPredictedSegmentDecrement != 0.0:
-        self.basalConnections.adjustActiveSynapses(
-          basalSegmentsToPunish, basalReinforceCandidates,
-          -self.basalPredictedSegmentDecrement)
+      with profiler.phase("punishSegments"):
+        if self.basalPredictedSegmentDecrement != 0.0:
+          self.basalConnections.adjustActiveSynapses(
+            basalSegmentsToPunish, basalReinforceCandidates,
+            -self.basalPredictedSegmentDecrement)
 
-      if self.apicalPredictedSegmentDecrement != 0.0:
-        self.apicalConnections.adjustActiveSynapses(
-          apicalSegmentsToPunish, apicalReinforceCandidates,
-          -self.apicalPredictedSegmentDecrement)
+        if self.apicalPredictedSegmentDecrement != 0.0:
+          self.apicalConnections.adjustActiveSynapses(
+            apicalSegmentsToPunish, apicalReinforceCandidates,
+            -self.apicalPredictedSegmentDecrement)
 
       # Grow new segments
-      if len(basalGrowthCandidates) > 0:
-        self._learnOnNewSegments(self.basalConnections, self.rng,
-                                 newBasalSegmentCells, basalGrowthCandidates,
-                                 self.initialPermanence, self.sampleSize,
-                                 self.maxSynapsesPerSegment)
-
-      if len(apicalGrowthCandidates) > 0:
-        self._learnOnNewSegments(self.apicalConnections, self.rng,
-                                 newApicalSegmentCells, apicalGrowthCandidates,
-                                 self.initialPermanence, self.sampleSize,
-                                 self.maxSynapsesPerSegment)
+      with profiler.phase("growNewSegments"):
+        if len(basalGrowthCandidates) > 0:
+          self._learnOnNewSegments(self.basalConnections, self.rng,
+                                   newBasalSegmentCells, basalGrowthCandidates,
+                                   self.initialPermanence, self.sampleSize,
+                                   self.maxSynapsesPerSegment)
+
+        if len(apicalGrowthCandidates) > 0:
+          self._learnOnNewSegments(self.apicalConnections, self.rng,
+                                   newApicalSegmentCells,
+                                   apicalGrowthCandidates,
+                                   self.initialPermanence, self.sampleSize,
+                                   self.maxSynapsesPerSegment)
 
     # Save the results
     newActiveCells.sort()
@@ -327,6 +453,9 @@ class ApicalTiebreakTemporalMemory(object):
     self.winnerCells = learningCells
     self.predictedActiveCells = correctPredictedCells
 
+    profiler.recordSize("activeCells", len(newActiveCells))
+    profiler.recordSize("burstingColumns", len(burstingColumns))
+
 
   def _calculateBasalLearning(self,
                               activeColumns,
@@ -477,12 +606,14 @@ class ApicalTiebreakTemporalMemory(object):
 
   @staticmethod
   def _calculateApicalSegmentActivity(connections, activeInput, connectedPermanence,
-                                activationThreshold, minThreshold):
+                                activationThreshold, minThreshold,
+                                overlapCache=None):
     """
     Calculate the active and matching apical segments for this timestep.
 
     @param connections (SparseMatrixConnections)
     @param activeInput (numpy array)
+    @param overlapCache (SegmentOverlapCache or None)
 
     @return (tuple)
     - activeSegments (numpy array)
@@ -498,12 +629,17 @@ class ApicalTiebreakTemporalMemory(object):
       Includes counts for active, matching, and nonmatching segments.
     """
 
+    if overlapCache is not None:
+      overlaps, potentialOverlaps = overlapCache.computeOverlaps(
+        connections, activeInput, connectedPermanence)
+    else:
+      overlaps, potentialOverlaps = computeSegmentOverlaps(
+        connections, activeInput, connectedPermanence)
+
     # Active
-    overlaps = connections.computeActivity(activeInput, connectedPermanence)
     activeSegments = np.flatnonzero(overlaps >= activationThreshold)
 
     # Matching
-    potentialOverlaps = connections.computeActivity(activeInput)
     matchingSegments = np.flatnonzero(potentialOverlaps >= minThreshold)
 
     return (activeSegments,
@@ -514,7 +650,8 @@ class ApicalTiebreakTemporalMemory(object):
   @staticmethod
   def _calculateBasalSegmentActivity(connections, activeInput,
                                 reducedBasalThresholdCells, connectedPermanence,
-                                activationThreshold, minThreshold, reducedBasalThreshold):
+                                activationThreshold, minThreshold, reducedBasalThreshold,
+                                overlapCache=None):
     """
     Calculate the active and matching basal segments for this timestep.
 
@@ -525,6 +662,7 @@ class ApicalTiebreakTemporalMemory(object):
 
     @param connections (SparseMatrixConnections)
     @param activeInput (numpy array)
+    @param overlapCache (SegmentOverlapCache or None)
 
     @return (tuple)
     - activeSegments (numpy array)
@@ -539,8 +677,14 @@ class ApicalTiebreakTemporalMemory(object):
       The number of active potential synapses for each segment.
       Includes counts for active, matching, and nonmatching segments.
     """
+    if overlapCache is not None:
+      overlaps, potentialOverlaps = overlapCache.computeOverlaps(
+        connections, activeInput, connectedPermanence)
+    else:
+      overlaps, potentialOverlaps = computeSegmentOverlaps(
+        connections, activeInput, connectedPermanence)
+
     # Active apical segments lower the activation threshold for basal (lateral) segments
-    overlaps = connections.computeActivity(activeInput, connectedPermanence)
     outrightActiveSegments = np.flatnonzero(overlaps >= activationThreshold)
     if reducedBasalThreshold != activationThreshold and len(reducedBasalThresholdCells) > 0:
         potentiallyActiveSegments = np.flatnonzero((overlaps < activationThreshold)
@@ -556,7 +700,6 @@ class ApicalTiebreakTemporalMemory(object):
 
 
     # Matching
-    potentialOverlaps = connections.computeActivity(activeInput)
     matchingSegments = np.flatnonzero(potentialOverlaps >= minThreshold)
 
     return (activeSegments,
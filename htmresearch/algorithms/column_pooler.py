@@ -20,9 +20,12 @@
 # ----------------------------------------------------------------------
 
 import numpy
+import scipy.sparse
 
 from nupic.bindings.math import SparseMatrix, GetNTAReal, Random
 
+from htmresearch.support.phase_profiler import NULL_PROFILER
+
 
 
 class ColumnPooler(object):
@@ -32,6 +35,8 @@ class ColumnPooler(object):
   creating a cleaner implementation.
   """
 
+  phaseProfiler = NULL_PROFILER
+
   def __init__(self,
                inputWidth,
                lateralInputWidths=(),
@@ -299,27 +304,31 @@ class ColumnPooler(object):
     # Finally, now that we have decided which cells we should be learning on, do
     # the actual learning.
     if len(feedforwardInput) > 0:
-      self._learn(self.proximalPermanences, self._random,
-                  self.activeCells, feedforwardInput,
-                  feedforwardGrowthCandidates, self.sampleSizeProximal,
-                  self.initialProximalPermanence, self.synPermProximalInc,
-                  self.synPermProximalDec, self.connectedPermanenceProximal)
-
-      # External distal learning
-      for i, lateralInput in enumerate(lateralInputs):
-        self._learn(self.distalPermanences[i], self._random,
-                    self.activeCells, lateralInput, lateralInput,
+      profiler = self.phaseProfiler
+
+      with profiler.phase("learnProximal"):
+        self._learn(self.proximalPermanences, self._random,
+                    self.activeCells, feedforwardInput,
+                    feedforwardGrowthCandidates, self.sampleSizeProximal,
+                    self.initialProximalPermanence, self.synPermProximalInc,
+                    self.synPermProximalDec, self.connectedPermanenceProximal)
+
+      with profiler.phase("learnDistal"):
+        # External distal learning
+        for i, lateralInput in enumerate(lateralInputs):
+          self._learn(self.distalPermanences[i], self._random,
+                      self.activeCells, lateralInput, lateralInput,
+                      self.sampleSizeDistal, self.initialDistalPermanence,
+                      self.synPermDistalInc, self.synPermDistalDec,
+                      self.connectedPermanenceDistal)
+
+        # Internal distal learning
+        self._learn(self.internalDistalPermanences, self._random,
+                    self.activeCells, prevActiveCells, prevActiveCells,
                     self.sampleSizeDistal, self.initialDistalPermanence,
                     self.synPermDistalInc, self.synPermDistalDec,
                     self.connectedPermanenceDistal)
 
-      # Internal distal learning
-      self._learn(self.internalDistalPermanences, self._random,
-                  self.activeCells, prevActiveCells, prevActiveCells,
-                  self.sampleSizeDistal, self.initialDistalPermanence,
-                  self.synPermDistalInc, self.synPermDistalDec,
-                  self.connectedPermanenceDistal)
-
 
   def _computeInferenceMode(self, feedforwardInput, lateralInputs):
     """
@@ -340,44 +349,153 @@ class ColumnPooler(object):
     """
 
     prevActiveCells = self.activeCells
+    profiler = self.phaseProfiler
 
     # Calculate the feedforward supported cells
-    overlaps = self.proximalPermanences.rightVecSumAtNZGteThresholdSparse(
-      feedforwardInput, self.connectedPermanenceProximal)
-    feedforwardSupportedCells = numpy.where(
-      overlaps >= self.minThresholdProximal)[0]
+    with profiler.phase("proximalOverlaps"):
+      overlaps = self.proximalPermanences.rightVecSumAtNZGteThresholdSparse(
+        feedforwardInput, self.connectedPermanenceProximal)
+      feedforwardSupportedCells = numpy.where(
+        overlaps >= self.minThresholdProximal)[0]
 
     # Calculate the number of active segments on each cell
-    numActiveSegmentsByCell = numpy.zeros(self.cellCount, dtype="int")
-    overlaps = self.internalDistalPermanences.rightVecSumAtNZGteThresholdSparse(
-      prevActiveCells, self.connectedPermanenceDistal)
-    numActiveSegmentsByCell[overlaps >= self.activationThresholdDistal] += 1
-    for i, lateralInput in enumerate(lateralInputs):
-      overlaps = self.distalPermanences[i].rightVecSumAtNZGteThresholdSparse(
-        lateralInput, self.connectedPermanenceDistal)
+    with profiler.phase("distalOverlaps"):
+      numActiveSegmentsByCell = numpy.zeros(self.cellCount, dtype="int")
+      overlaps = (
+        self.internalDistalPermanences.rightVecSumAtNZGteThresholdSparse(
+          prevActiveCells, self.connectedPermanenceDistal))
       numActiveSegmentsByCell[overlaps >= self.activationThresholdDistal] += 1
+      for i, lateralInput in enumerate(lateralInputs):
+        overlaps = self.distalPermanences[i].rightVecSumAtNZGteThresholdSparse(
+          lateralInput, self.connectedPermanenceDistal)
+        numActiveSegmentsByCell[overlaps >= self.activationThresholdDistal] += 1
 
-    chosenCells = []
-    minNumActiveCells = int(self.sdrSize * 0.75)
+    with profiler.phase("chooseActiveCells"):
+      self.activeCells = self._chooseActiveCells(feedforwardSupportedCells,
+                                                 prevActiveCells,
+                                                 numActiveSegmentsByCell)
 
-    numActiveSegsForFFSuppCells = numActiveSegmentsByCell[
-        feedforwardSupportedCells]
+    if profiler.enabled:
+      profiler.recordSize("feedforwardSupportedCells",
+                          len(feedforwardSupportedCells))
+      profiler.recordSize("activeDistalSegments",
+                          int(numActiveSegmentsByCell.sum()))
+      profiler.recordSize("activeCells", len(self.activeCells))
+
+
+  def computeBatch(self, feedforwardInputs, lateralInputsPerStep=None,
+                   prevActiveCellsPerStep=None):
+    """
+    Runs inference on a block of independent inputs at once. Each permanence
+    matrix is multiplied once against the whole block of inputs, and then the
+    active cells are selected for each input.
+
+    The result for input i is identical to:
+
+      pooler.activeCells = prevActiveCellsPerStep[i]
+      pooler.compute(feedforwardInputs[i], lateralInputsPerStep[i],
+                     learn=False)
+      pooler.getActiveCells()
+
+    The pooler's own state is not modified. Memory use grows with
+    len(feedforwardInputs) * cellCount, so very large workloads should be
+    passed in blocks.
+
+    @param  feedforwardInputs (list of sequences)
+            For each input, sorted indices of active feedforward input bits
+
+    @param  lateralInputsPerStep (list of lists of sequences or None)
+            For each input, the lateralInputs that would be passed to compute.
+            If None, no lateral input is used.
+
+    @param  prevActiveCellsPerStep (list of sequences or None)
+            For each input, the active cells prior to the input. If None, the
+            pooler's current active cells are used for every input.
+
+    @return (list of numpy arrays)
+            For each input, the sorted indices of the active cells
+    """
+    numInputs = len(feedforwardInputs)
+    if lateralInputsPerStep is None:
+      lateralInputsPerStep = [()] * numInputs
+    if prevActiveCellsPerStep is None:
+      prevActiveCellsPerStep = [self.activeCells] * numInputs
+
+    assert len(lateralInputsPerStep) == numInputs
+    assert len(prevActiveCellsPerStep) == numInputs
+
+    # Calculate the feedforward overlaps
+    overlaps = _batchOverlaps(self.proximalPermanences,
+                              self.connectedPermanenceProximal,
+                              feedforwardInputs)
+    feedforwardSupported = overlaps >= self.minThresholdProximal
+
+    # Calculate the number of active segments on each cell
+    numActiveSegmentsByCell = numpy.zeros((numInputs, self.cellCount),
+                                          dtype="int")
+    overlaps = _batchOverlaps(self.internalDistalPermanences,
+                              self.connectedPermanenceDistal,
+                              prevActiveCellsPerStep)
+    numActiveSegmentsByCell += overlaps >= self.activationThresholdDistal
+    for i, permanences in enumerate(self.distalPermanences):
+      # A lateral input that isn't provided never activates any segments.
+      provided = numpy.array([len(lateralInputs) > i
+                              for lateralInputs in lateralInputsPerStep],
+                             dtype="bool")
+      if not provided.any():
+        continue
+      lateralInputs = [lateralInputs[i] if len(lateralInputs) > i else ()
+                       for lateralInputs in lateralInputsPerStep]
+      overlaps = _batchOverlaps(permanences, self.connectedPermanenceDistal,
+                                lateralInputs)
+      numActiveSegmentsByCell += ((overlaps >= self.activationThresholdDistal) &
+                                  provided[:, numpy.newaxis])
+
+    return [self._chooseActiveCells(numpy.flatnonzero(feedforwardSupported[i]),
+                                    numpy.asarray(prevActiveCellsPerStep[i],
+                                                  dtype="uint32"),
+                                    numActiveSegmentsByCell[i])
+            for i in xrange(numInputs)]
+
+
+  def _chooseActiveCells(self, feedforwardSupportedCells, prevActiveCells,
+                         numActiveSegmentsByCell):
+    """
+    Selects the active cells from the feedforward supported cells and the
+    previously active cells, using their lateral support.
+
+    First the FF-supported cells with the most active lateral segments are
+    chosen, lowering the bar one segment at a time until the quorum is met.
+    If the quorum still isn't met, the previously active cells are added in
+    the same way (limited by the inertiaFactor), followed by all remaining
+    FF-supported cells. Each group is selected in a single pass rather than
+    one inhibition level at a time.
+
+    Parameters:
+    ----------------------------
+    @param  feedforwardSupportedCells (numpy array)
+            Sorted indices of the cells with feedforward support
+
+    @param  prevActiveCells (numpy array)
+            Sorted indices of the previously active cells
+
+    @param  numActiveSegmentsByCell (numpy array)
+            The number of active lateral segments on every cell
+
+    @return (numpy array)
+            Sorted indices of the chosen cells
+    """
+    chosenCells = numpy.empty(0, dtype="uint32")
+    minNumActiveCells = int(self.sdrSize * 0.75)
 
     # First, activate the FF-supported cells that have the highest number of
     # lateral active segments (as long as it's not 0)
-    if len(feedforwardSupportedCells) == 0:
-      pass
-    else:
-      # This loop will select the FF-supported AND laterally-active cells, in
-      # order of descending lateral activation, until we exceed the
-      # minNumActiveCells quorum - but will exclude cells with 0 lateral
-      # active segments.
-      ttop = numpy.max(numActiveSegsForFFSuppCells)
-      while ttop > 0 and len(chosenCells) <= minNumActiveCells:
-        chosenCells = numpy.union1d(chosenCells,
-                    feedforwardSupportedCells[numActiveSegsForFFSuppCells >
-                    self.distalSegmentInhibitionFactor * ttop])
-        ttop -= 1
+    if len(feedforwardSupportedCells) > 0:
+      numActiveSegsForFFSuppCells = numActiveSegmentsByCell[
+        feedforwardSupportedCells]
+      chosenCells = feedforwardSupportedCells[
+        _selectByQuorum(numActiveSegsForFFSuppCells, 0, minNumActiveCells,
+                        self.distalSegmentInhibitionFactor, lowestTop=1)]
 
     # If we still haven't filled the minNumActiveCells quorum, add in the
     # FF-supported cells with 0 lateral support AND the inertia cells.
@@ -386,27 +504,23 @@ class ColumnPooler(object):
         prevCells = numpy.setdiff1d(prevActiveCells, chosenCells)
         inertialCap = int(len(prevCells) * self.inertiaFactor)
         if inertialCap > 0:
-          numActiveSegsForPrevCells = numActiveSegmentsByCell[prevCells]
           # We sort the previously-active cells by number of active lateral
           # segments (this really helps).  We then activate them in order of
           # descending lateral activation.
+          numActiveSegsForPrevCells = numActiveSegmentsByCell[prevCells]
           sortIndices = numpy.argsort(numActiveSegsForPrevCells)[::-1]
-          prevCells = prevCells[sortIndices]
-          numActiveSegsForPrevCells = numActiveSegsForPrevCells[sortIndices]
+          prevCells = prevCells[sortIndices][:inertialCap]
+          numActiveSegsForPrevCells = numActiveSegsForPrevCells[
+            sortIndices][:inertialCap]
 
           # We use inertiaFactor to limit the number of previously-active cells
           # which can become active, forcing decay even if we are below quota.
-          prevCells = prevCells[:inertialCap]
-          numActiveSegsForPrevCells = numActiveSegsForPrevCells[:inertialCap]
-
-          # Activate groups of previously active cells by order of their lateral
-          # support until we either meet quota or run out of cells.
-          ttop = numpy.max(numActiveSegsForPrevCells)
-          while ttop >= 0 and len(chosenCells) <= minNumActiveCells:
-            chosenCells = numpy.union1d(chosenCells,
-                        prevCells[numActiveSegsForPrevCells >
-                        self.distalSegmentInhibitionFactor * ttop])
-            ttop -= 1
+          chosenCells = numpy.union1d(
+            chosenCells,
+            prevCells[_selectByQuorum(numActiveSegsForPrevCells,
+                                      len(chosenCells), minNumActiveCells,
+                                      self.distalSegmentInhibitionFactor,
+                                      lowestTop=0)])
 
       # Finally, add remaining cells with feedforward support
       remFFcells = numpy.setdiff1d(feedforwardSupportedCells, chosenCells)
@@ -415,7 +529,7 @@ class ColumnPooler(object):
       chosenCells = numpy.append(chosenCells, remFFcells)
 
     chosenCells.sort()
-    self.activeCells = numpy.asarray(chosenCells, dtype="uint32")
+    return numpy.asarray(chosenCells, dtype="uint32")
 
 
   def numberOfInputs(self):
@@ -551,6 +665,18 @@ class ColumnPooler(object):
     """
     self.activeCells = numpy.empty(0, dtype="uint32")
 
+
+  def setPhaseProfiler(self, profiler):
+    """
+    Record the time spent in each phase of the compute step, and the number
+    of active cells and segments, with the given profiler.
+
+    @param  profiler (PhaseProfiler or None)
+            None disables profiling.
+    """
+    self.phaseProfiler = profiler if profiler is not None else NULL_PROFILER
+
+
   def getUseInertia(self):
     """
     Get whether we actually use inertia  (i.e. a fraction of the
@@ -645,6 +771,78 @@ def _sampleRange(rng, start, end, step, k):
 
 
 
+def _batchOverlaps(permanences, threshold, activeInputsPerStep):
+  """
+  Batch version of rightVecSumAtNZGteThresholdSparse. Returns a dense
+  (len(activeInputsPerStep), nRows) array of overlaps, computed with a single
+  sparse matrix product.
+  """
+  rows, cols, values = permanences.getAllNonZeros(True)
+  # Compare in float32, like the C++ implementation does.
+  connected = values >= numpy.float32(threshold)
+  connectedMatrix = scipy.sparse.csr_matrix(
+    (numpy.ones(numpy.count_nonzero(connected), dtype="int32"),
+     (rows[connected], cols[connected])),
+    shape=(permanences.nRows(), permanences.nCols()))
+
+  lengths = numpy.array([len(activeInput)
+                         for activeInput in activeInputsPerStep], dtype="int64")
+  indptr = numpy.zeros(len(lengths) + 1, dtype="int64")
+  numpy.cumsum(lengths, out=indptr[1:])
+  if indptr[-1] > 0:
+    indices = numpy.concatenate([numpy.asarray(activeInput, dtype="int64")
+                                 for activeInput in activeInputsPerStep])
+  else:
+    indices = numpy.empty(0, dtype="int64")
+  inputMatrix = scipy.sparse.csr_matrix(
+    (numpy.ones(len(indices), dtype="int32"), indices, indptr),
+    shape=(len(lengths), permanences.nCols()))
+
+  return inputMatrix.dot(connectedMatrix.T).toarray()
+
+
+
+def _selectByQuorum(numActiveSegments, numAlreadyChosen, quorum,
+                    inhibitionFactor, lowestTop):
+  """
+  Equivalent to:
+
+  chosen = []
+  ttop = numpy.max(numActiveSegments)
+  while ttop >= lowestTop and numAlreadyChosen + len(chosen) <= quorum:
+    chosen = numpy.union1d(chosen, numpy.where(
+      numActiveSegments > inhibitionFactor * ttop)[0])
+    ttop -= 1
+
+  except it returns a boolean mask of the chosen elements, and it computes it
+  with a single bincount rather than one union per inhibition level.
+  """
+  numActiveSegments = numpy.asarray(numActiveSegments)
+  if len(numActiveSegments) == 0:
+    return numpy.zeros(0, dtype="bool")
+
+  maxTop = numActiveSegments.max()
+  if maxTop < lowestTop or numAlreadyChosen > quorum:
+    return numpy.zeros(len(numActiveSegments), dtype="bool")
+
+  # Every inhibition level the loop could visit, in the order it visits them,
+  # and the lowest segment count that passes each level.
+  tops = numpy.arange(maxTop, lowestTop - 1, -1)
+  cutoffs = numpy.minimum(
+    numpy.floor(inhibitionFactor * tops).astype("int64") + 1, maxTop + 1)
+
+  # The number of elements with at least n active segments, for every n.
+  atLeast = numpy.bincount(numActiveSegments,
+                           minlength=maxTop + 2)[::-1].cumsum()[::-1]
+
+  # The loop stops after the first level that exceeds the quorum.
+  exceeded = numpy.flatnonzero(numAlreadyChosen + atLeast[cutoffs] > quorum)
+  lastLevel = exceeded[0] if len(exceeded) > 0 else len(tops) - 1
+
+  return numActiveSegments >= cutoffs[lastLevel]
+
+
+
 def _countWhereGreaterEqualInRows(sparseMatrix, rows, threshold):
   """
   Like countWhereGreaterOrEqual, but for an arbitrary selection of rows, and
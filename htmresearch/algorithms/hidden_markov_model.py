@@ -30,6 +30,15 @@ def divide(a, b):
   return a/b
 
 
+def _divide(numer, denom):
+  """
+  Elementwise version of divide: numer / denom, with zeros wherever numer is
+  zero.
+  """
+  with np.errstate(divide="ignore", invalid="ignore"):
+    return np.where(numer == 0, 0.0, numer / denom)
+
+
 class HMM(object):
     def __init__(self, numCats, numStates, criterion=0.0001, verbosity=0):
       self.A = None # {a_ij} = P(X_t = j | X_t-1 = i)
@@ -41,129 +50,158 @@ class HMM(object):
       self.verbosity = verbosity
       self.criterion = criterion
 
+      # P(X_t = i | Y_1 = y_1, ..., Y_t = y_t) for the last of the
+      # observations, if it is up to date, see predict_next_inputs
+      self._filteredState = None
+
     def reset(self):
       self.observations = []
+      self._filteredState = None
 
     def _initializeTrial(self, observations):
       self.observations = observations
       self.T = len(observations)
       self.seenValues = set(self.observations)
-      self.alpha = np.zeros((self.numStates,self.T), dtype="float") # {a_it} = P(Y_1 = y_1, ..., Y_t=y_t, X_t=i | theta)
-      self.beta = np.zeros((self.numStates,self.T), dtype="float") # {b_it} = P(Y_t+1 = y_t+1, ..., Y_T=y_T | X_t=i, theta)
+      # The forward and backward variables are scaled at every time step so
+      # that long sequences don't underflow.
+      self.alpha = np.zeros((self.numStates,self.T), dtype="float") # {a_it} = P(X_t=i | Y_1 = y_1, ..., Y_t=y_t, theta)
+      self.beta = np.zeros((self.numStates,self.T), dtype="float") # {b_it} = P(Y_t+1 = y_t+1, ..., Y_T=y_T | X_t=i, theta) / P(Y_t+1 = y_t+1, ..., Y_T=y_T | Y_1 = y_1, ..., Y_t=y_t, theta)
       self.gamma = np.zeros((self.numStates,self.T), dtype="float") # {g_it} = P(X_t = i | Y, theta)
-      self.eps = np.zeros((self.numStates,self.numStates,self.T), dtype="float") # {eps_ijt} = P(X_t = i, Xt+1 = j | Y, theta)
+      self.scale = np.zeros(self.T, dtype="float") # {c_t} = P(Y_t = y_t | Y_1 = y_1, ..., Y_t-1 = y_t-1, theta)
+      self._filteredState = None
 
       if self.verbosity > 0:
         print "observations: ", observations
 
     def _forward(self):
       y1 = self.observations[0]
+      alphaT = self.pi * self.B[:,y1]
 
-      for i in range(self.numStates):
-        self.alpha[i,0] = self.pi[i]
-        self.alpha[i,0] *= self.B[i,y1]
-
-
-      for t in range(1, self.T):
-        yt = self.observations[t]
-
-        for j in range(0, self.numStates):
-          sumAlphaT1 = 0.0
+      for t in xrange(self.T):
+        if t > 0:
+          yt = self.observations[t]
+          alphaT = self.B[:,yt] * np.dot(self.alpha[:,t-1], self.A)
 
-          for i in range(0, self.numStates):
-            sumAlphaT1 += self.alpha[i,t-1]*self.A[i,j]
-
-          self.alpha[j,t] = self.B[j, yt]*sumAlphaT1
+        self.scale[t] = alphaT.sum()
+        self.alpha[:,t] = _divide(alphaT, self.scale[t])
 
       if self.verbosity > 0:
         print "alpha: ", self.alpha
 
 
     def _backward(self):
-      for i in range(self.numStates):
-        self.beta[i,self.T-1] = 1.0
+      self.beta[:,self.T-1] = 1.0
 
-      for t in range(self.T-1, 0, -1):
+      for t in xrange(self.T-1, 0, -1):
         yt = self.observations[t]
-
-        for i in range(self.numStates):
-          newBetaiT1 = 0.0
-
-          for j in range(0, self.numStates):
-            newBetaiT1 += self.beta[j,t]*self.A[i,j]*self.B[j,yt]
-
-          self.beta[i,t-1] = newBetaiT1
+        betaT1 = np.dot(self.A, self.B[:,yt] * self.beta[:,t])
+        self.beta[:,t-1] = _divide(betaT1, self.scale[t])
 
       if self.verbosity > 0:
         print "beta: ", self.beta
 
-    def _update(self):
+    def _expectedCounts(self):
+      """
+      Computes gamma for the current trial, and the expected counts that
+      re-estimate the parameters.
+
+      The expected transition counts sum {eps_ijt} = P(X_t = i, Xt+1 = j | Y,
+      theta) over t as a single matrix product, without storing eps.
+
+      @return (tuple) P(X_0 = i | Y), the expected number of transitions from
+      each state, the expected number of transitions between each pair of
+      states, and the expected number of times each state emits each value
+      """
+      if not self.scale.all():
+        # The observations are impossible under the current parameters, so
+        # every probability conditioned on them is zero
+        self.gamma[:] = 0.0
+        zeros = np.zeros(self.numStates, dtype="float")
+        return (zeros, zeros,
+                np.zeros((self.numStates, self.numStates), dtype="float"),
+                np.zeros((self.numStates, self.numCats), dtype="float"))
+
       # updating gamma
-      for t in range(self.T):
-        denom = 0.0
-        for i in range(self.numStates):
-          denom += self.alpha[i,t]*self.beta[i,t]
-
-        for i in range(self.numStates):
-          self.gamma[i,t] = divide(self.alpha[i,t]*self.beta[i,t], denom)
-
-      # updating eps
-      for t in range(self.T-1):
-        for i in range(self.numStates):
-          denom = sum([self.alpha[j,t]*self.beta[j,t] for j in range(self.numStates)])
-          yt1 = self.observations[t+1]
-          for j in range(self.numStates):
-            self.eps[i,j,t] = divide(self.alpha[i,t]*self.A[i,j]*self.beta[j,t+1]*self.B[j,yt1], denom)
+      alphaBeta = self.alpha * self.beta
+      denoms = alphaBeta.sum(axis=0)
+      self.gamma[:] = _divide(alphaBeta, denoms)
+
+      # summing eps over t
+      y = np.asarray(self.observations)
+      scaledAlpha = _divide(self.alpha[:,:-1], denoms[:-1])
+      scaledBeta = _divide(self.B[:,y[1:]] * self.beta[:,1:], self.scale[1:])
+      transitions = self.A * np.dot(scaledAlpha, scaledBeta.T)
+
+      emissions = np.zeros((self.numStates, self.numCats), dtype="float")
+      for v in self.seenValues:
+        emissions[:,v] = self.gamma[:,y == v].sum(axis=1)
 
       if self.verbosity > 0:
         print "gamma: ", self.gamma
-        print "eps: ", self.eps
+        print "eps summed over t: ", transitions
 
-      # updating A
-      denoms = np.zeros(self.numStates, dtype="float")
-      for i in range(self.numStates):
-        self.pi[i] = self.gamma[i, 0]
-        for t in range(self.T-1):
-          denoms[i] += self.gamma[i,t]
+      return (self.gamma[:,0].copy(), self.gamma[:,:-1].sum(axis=1),
+              transitions, emissions)
+
+    def _update(self):
+      self._reestimate([self._expectedCounts()], self.seenValues)
 
-      for i in range(self.numStates):
-        for j in range(self.numStates):
-          numer = 0.0
-          for t in range(self.T-1):
-            numer += self.eps[i,j,t]
+    def _reestimate(self, counts, seenValues):
+      """
+      Re-estimates pi, A and B from the expected counts of one or more
+      sequences. Emission probabilities of values that weren't observed are
+      left unchanged.
 
-          self.A[i,j] = divide(numer, denoms[i])
+      @param counts (list) _expectedCounts of each sequence
+      @param seenValues (set) Values in any of the sequences
+      """
+      initial, transitionsFrom, transitions, emissions = [
+        np.sum(c, axis=0) for c in zip(*counts)]
+
+      # updating A
+      self.pi[:] = initial / len(counts)
+      self.A[:] = _divide(transitions, transitionsFrom[:,np.newaxis])
 
       if self.verbosity > 0:
         print "A: ", self.A
 
-
       # updating B
-      for i in range(self.numStates):
-        for v in self.seenValues:
-          numer = 0.0
-          denom = 0.0
-          for t in range(self.T):
-            denom += self.gamma[i,t]
-            if self.observations[t] == v:
-              numer += self.gamma[i,t]
-          self.B[i,v] = divide(numer, denom)
+      seen = sorted(seenValues)
+      emissionsFrom = emissions.sum(axis=1)
+      self.B[:,seen] = _divide(emissions[:,seen], emissionsFrom[:,np.newaxis])
 
       if self.verbosity > 0:
         print "B: ", self.B
 
 
     def train(self, observations):
-      self._initializeTrial(observations)
+      self.trainBatch([observations])
+
+
+    def trainBatch(self, sequences):
+      """
+      Runs Baum-Welch on several sequences at once until the parameters
+      converge. Every iteration sums the expected counts of all sequences
+      before re-estimating the parameters.
+
+      @param sequences (list) Sequences of observations
+      """
+      seenValues = set()
+      for observations in sequences:
+        seenValues.update(observations)
 
       while True:
         startA = copy(self.A)
         startB = copy(self.B)
         startpi = copy(self.pi)
 
-        self._forward()
-        self._backward()
-        self._update()
+        counts = []
+        for observations in sequences:
+          self._initializeTrial(observations)
+          self._forward()
+          self._backward()
+          counts.append(self._expectedCounts())
+        self._reestimate(counts, seenValues)
 
         done = True
 
@@ -181,28 +219,22 @@ class HMM(object):
     def predict_next_inputs(self, current_input, threshold=0.3):
       next_inputs = set()
 
-      self._initializeTrial([x for x in self.observations] + [current_input])
-      t = len(self.observations)-1
-
       # P(X_t = i | Y, theta)
-      # Update alpha
-      self._forward()
-      denom = 0.0
-      for i in range(self.numStates):
-        denom += self.alpha[i,t]
-
-      curHiddenStateProbs = np.zeros(self.numStates, dtype="float")
-      for i in range(self.numStates):
-        curHiddenStateProbs[i] = divide(self.alpha[i,t], denom)
+      # Update alpha, continuing from the previous call when possible
+      if self._filteredState is not None:
+        self.observations = list(self.observations) + [current_input]
+        alphaT = self.B[:,current_input] * np.dot(self._filteredState, self.A)
+        curHiddenStateProbs = _divide(alphaT, alphaT.sum())
+      else:
+        self._initializeTrial([x for x in self.observations] + [current_input])
+        self._forward()
+        curHiddenStateProbs = self.alpha[:,self.T-1].copy()
+      self._filteredState = curHiddenStateProbs
 
       # P(X_t+1 | X_t) P(X_t) = A[i,j]
       # P(Y_t+1 | X_t+1) = B[i,j]
 
-      nextObservationProbs = np.zeros(self.numCats, dtype="float")
-      for k in range(self.numCats):
-        for j in range(self.numStates):
-          for i in range(self.numStates):
-            nextObservationProbs[k] += self.B[j,k]*self.A[j,i]*curHiddenStateProbs[i]
+      nextObservationProbs = np.dot(self.B.T, np.dot(self.A, curHiddenStateProbs))
 
       for v,p in enumerate(nextObservationProbs):
         if self.verbosity > 0:
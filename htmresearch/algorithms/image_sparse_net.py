@@ -37,6 +37,11 @@ Example use:
   net.plotLoss(filename="loss_history.png")
   net.plotBasis(filename="basis_functions.png")
 
+  # encode a large set of 8x8 patches, of shape (8, 8, numPatches), in chunks
+  # of 1000 patches spread over 4 processes
+  activations = net.encode(patches, flatten=True, chunkSize=1000,
+                           numProcesses=4)
+
 """
 
 import numpy as np
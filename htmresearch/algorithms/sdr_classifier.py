@@ -30,6 +30,7 @@ from collections import deque
 import itertools
 
 import numpy
+import scipy.sparse
 
 g_debugPrefix = "SDRClassifier"
 
@@ -74,7 +75,8 @@ class SDRClassifier(object):
                steps=(1,),
                alpha=0.001,
                actValueAlpha=0.3,
-               verbosity=0):
+               verbosity=0,
+               preallocate=False):
     """Constructor for the SDR classifier.
 
     Parameters:
@@ -87,12 +89,17 @@ class SDRClassifier(object):
     @param actValueAlpha (float) Used to track the actual value within each
         bucket. A lower actValueAlpha results in longer term memory
     @param verbosity (int) verbosity level, can be 0, 1, or 2
+    @param preallocate (bool) If True, the weight matrices grow by doubling
+        their capacity, rather than being reallocated every time a larger input
+        index or bucket index appears. Use this when the input is large and its
+        highest index grows slowly, e.g. the active cells of a TM.
     """
     # Save constructor args
     self.steps = steps
     self.alpha = alpha
     self.actValueAlpha = actValueAlpha
     self.verbosity = verbosity
+    self.preallocate = preallocate
 
     # Init learn iteration index
     self._learnIteration = 0
@@ -124,7 +131,9 @@ class SDRClassifier(object):
     # each bucket index during inference
     self._maxBucketIdx = 0
 
-    # The connection weight matrix
+    # The connection weight matrix. In preallocate mode, each matrix can be
+    # larger than (_maxInputIdx+1, _maxBucketIdx+1); the extra capacity is
+    # zero and unused.
     self._weightMatrix = dict()
     for step in self.steps:
       self._weightMatrix[step] = numpy.zeros(shape=(self._maxInputIdx+1,
@@ -203,11 +212,7 @@ class SDRClassifier(object):
     # Update maxInputIdx and augment weight matrix with zero padding
     if max(patternNZ) > self._maxInputIdx:
       newMaxInputIdx = max(patternNZ)
-      for nSteps in self.steps:
-        self._weightMatrix[nSteps] = numpy.concatenate((
-          self._weightMatrix[nSteps],
-          numpy.zeros(shape=(newMaxInputIdx-self._maxInputIdx,
-                             self._maxBucketIdx+1))), axis=0)
+      self._growWeightMatrices(newMaxInputIdx, self._maxBucketIdx)
       self._maxInputIdx = newMaxInputIdx
 
     # ------------------------------------------------------------------------
@@ -225,36 +230,31 @@ class SDRClassifier(object):
 
       # Update maxBucketIndex and augment weight matrix with zero padding
       if bucketIdx > self._maxBucketIdx:
-        for nSteps in self.steps:
-          self._weightMatrix[nSteps] = numpy.concatenate((
-            self._weightMatrix[nSteps],
-            numpy.zeros(shape=(self._maxInputIdx+1,
-                               bucketIdx-self._maxBucketIdx))), axis=1)
-
+        self._growWeightMatrices(self._maxInputIdx, bucketIdx)
         self._maxBucketIdx = bucketIdx
 
-      # Update rolling average of actual values if it's a scalar. If it's
-      # not, it must be a category, in which case each bucket only ever
-      # sees one category so we don't need a running average.
-      while self._maxBucketIdx > len(self._actualValues) - 1:
-        self._actualValues.append(None)
-      if self._actualValues[bucketIdx] is None:
-        self._actualValues[bucketIdx] = actValue
-      else:
-        if isinstance(actValue, int) or isinstance(actValue, float):
-          self._actualValues[bucketIdx] = ((1.0 - self.actValueAlpha)
-                                           * self._actualValues[bucketIdx]
-                                           + self.actValueAlpha * actValue)
-        else:
-          self._actualValues[bucketIdx] = actValue
+      self._updateActualValue(bucketIdx, actValue)
+
+      targetDist = numpy.zeros(self._maxBucketIdx + 1)
+      targetDist[bucketIdx] = 1.0
 
+      # The error for each step is calculated from the last pattern in the
+      # history with that many steps, using the weights as they are just
+      # before that step's update.
+      errorPatternNZ = dict()
       for (iteration, learnPatternNZ) in self._patternNZHistory:
-        error = self.calculateError(classification)
+        errorPatternNZ[self._learnIteration - iteration] = learnPatternNZ
 
+      for (iteration, learnPatternNZ) in self._patternNZHistory:
         nSteps = self._learnIteration - iteration
         if nSteps in self.steps:
-          for bit in learnPatternNZ:
-            self._weightMatrix[nSteps][bit, :] += self.alpha * error[nSteps]
+          weightMatrix = self._weightMatrix[nSteps]
+          error = targetDist - self.inferSingleStep(errorPatternNZ[nSteps],
+                                                    weightMatrix)
+          numpy.add.at(weightMatrix,
+                       (numpy.asarray(learnPatternNZ, dtype="int"),
+                        slice(0, self._maxBucketIdx + 1)),
+                       self.alpha * error)
 
     # ------------------------------------------------------------------------
     # Verbose print
@@ -322,9 +322,8 @@ class SDRClassifier(object):
 
 
   def inferSingleStep(self, patternNZ, weightMatrix):
-    outputActivation = numpy.zeros(self._maxBucketIdx + 1)
-    for bit in patternNZ:
-      outputActivation += weightMatrix[bit, :]
+    outputActivation = weightMatrix[numpy.asarray(patternNZ, dtype="int"),
+                                    :self._maxBucketIdx + 1].sum(axis=0)
 
     # softmax normalization
     expOutputActivation = numpy.exp(outputActivation)
@@ -352,3 +351,178 @@ class SDRClassifier(object):
 
     return error
 
+
+  def fitStream(self, records, chunkSize=1000):
+    """
+    Learn from a stream of recorded samples, e.g. a saved trace of TM active
+    cells. The resulting weights are the same as those from calling
+    compute(recordNum, patternNZ, classification, learn=True, infer=False)
+    on each record in turn.
+
+    The records are consumed in chunks. Within a chunk, the weight updates
+    for each step are applied in runs: an update joins the current run unless
+    it reads weights that an earlier update in the run writes. The errors for
+    a whole run are computed with one sparse product and its updates are
+    applied with one scatter. Only one chunk is held in memory at a time.
+
+    Parameters:
+    --------------------------------------------------------------------
+    @param records (iterable) (recordNum, patternNZ, classification) tuples,
+        as they would be passed to compute
+    @param chunkSize (int) Number of records to process at a time
+    """
+    records = iter(records)
+    while True:
+      chunk = list(itertools.islice(records, chunkSize))
+      if len(chunk) == 0:
+        break
+      self._fitChunk(chunk)
+
+
+  def _fitChunk(self, chunk):
+    """
+    Learn one chunk of records for fitStream.
+
+    Parameters:
+    --------------------------------------------------------------------
+    @param chunk (list) (recordNum, patternNZ, classification) tuples
+    """
+    # Step through the records like compute does, but rather than applying
+    # the weight updates, record the patterns they read and write.
+    updates = dict((nSteps, []) for nSteps in self.steps)
+    for recordNum, patternNZ, classification in chunk:
+      if self._recordNumMinusLearnIteration is None:
+        self._recordNumMinusLearnIteration = recordNum - self._learnIteration
+      self._learnIteration = recordNum - self._recordNumMinusLearnIteration
+
+      patternNZ = numpy.asarray(patternNZ, dtype="int")
+      self._patternNZHistory.append((self._learnIteration, patternNZ))
+      self._maxInputIdx = max(self._maxInputIdx, patternNZ.max())
+
+      bucketIdx = classification["bucketIdx"]
+      if bucketIdx is None:
+        continue
+      self._maxBucketIdx = max(self._maxBucketIdx, bucketIdx)
+      self._updateActualValue(bucketIdx, classification["actValue"])
+
+      errorPatternNZ = dict()
+      for (iteration, learnPatternNZ) in self._patternNZHistory:
+        errorPatternNZ[self._learnIteration - iteration] = learnPatternNZ
+
+      for (iteration, learnPatternNZ) in self._patternNZHistory:
+        nSteps = self._learnIteration - iteration
+        if nSteps in self.steps:
+          updates[nSteps].append((errorPatternNZ[nSteps], learnPatternNZ,
+                                  bucketIdx, self._maxBucketIdx + 1))
+
+    self._growWeightMatrices(self._maxInputIdx, self._maxBucketIdx)
+
+    for nSteps in self.steps:
+      weightMatrix = self._weightMatrix[nSteps]
+      written = numpy.zeros(weightMatrix.shape[0], dtype="bool")
+      run = []
+      for update in updates[nSteps]:
+        errorPatternNZ, learnPatternNZ, _, numBuckets = update
+        if len(run) > 0 and (numBuckets != run[0][3] or
+                             written[errorPatternNZ].any()):
+          self._applyUpdateRun(weightMatrix, run)
+          for (_, writtenPatternNZ, _, _) in run:
+            written[writtenPatternNZ] = False
+          run = []
+        run.append(update)
+        written[learnPatternNZ] = True
+
+      if len(run) > 0:
+        self._applyUpdateRun(weightMatrix, run)
+
+
+  def _applyUpdateRun(self, weightMatrix, run):
+    """
+    Apply a run of independent weight updates for fitStream. Each update's
+    error is calculated from the same weights it would see if the updates were
+    applied one at a time.
+
+    Parameters:
+    --------------------------------------------------------------------
+    @param weightMatrix (numpy array) The weight matrix to update
+    @param run (list) (errorPatternNZ, learnPatternNZ, bucketIdx, numBuckets)
+        tuples, all with the same numBuckets
+    """
+    numBuckets = run[0][3]
+
+    # Sum the weights of each update's error pattern, in the same order as
+    # inferSingleStep.
+    errorPatterns = [errorPatternNZ for (errorPatternNZ, _, _, _) in run]
+    indptr = numpy.zeros(len(run) + 1, dtype="int")
+    numpy.cumsum([len(pattern) for pattern in errorPatterns], out=indptr[1:])
+    rows = numpy.concatenate(errorPatterns)
+    rowSums = scipy.sparse.csr_matrix(
+      (numpy.ones(len(rows)), numpy.arange(len(rows)), indptr),
+      shape=(len(run), len(rows)))
+    outputActivation = rowSums.dot(weightMatrix[rows, :numBuckets])
+
+    # softmax normalization
+    expOutputActivation = numpy.exp(outputActivation)
+    predictDist = (expOutputActivation /
+                   numpy.sum(expOutputActivation, axis=1)[:, numpy.newaxis])
+
+    targetDist = numpy.zeros((len(run), numBuckets))
+    targetDist[numpy.arange(len(run)),
+               [bucketIdx for (_, _, bucketIdx, _) in run]] = 1.0
+    error = targetDist - predictDist
+
+    learnPatterns = [learnPatternNZ for (_, learnPatternNZ, _, _) in run]
+    numpy.add.at(weightMatrix,
+                 (numpy.concatenate(learnPatterns), slice(0, numBuckets)),
+                 numpy.repeat(self.alpha * error,
+                              [len(pattern) for pattern in learnPatterns],
+                              axis=0))
+
+
+  def _updateActualValue(self, bucketIdx, actValue):
+    """
+    Update rolling average of actual values if it's a scalar. If it's
+    not, it must be a category, in which case each bucket only ever
+    sees one category so we don't need a running average.
+    """
+    while self._maxBucketIdx > len(self._actualValues) - 1:
+      self._actualValues.append(None)
+    if self._actualValues[bucketIdx] is None:
+      self._actualValues[bucketIdx] = actValue
+    else:
+      if isinstance(actValue, int) or isinstance(actValue, float):
+        self._actualValues[bucketIdx] = ((1.0 - self.actValueAlpha)
+                                         * self._actualValues[bucketIdx]
+                                         + self.actValueAlpha * actValue)
+      else:
+        self._actualValues[bucketIdx] = actValue
+
+
+  def _growWeightMatrices(self, maxInputIdx, maxBucketIdx):
+    """
+    Make sure every weight matrix can hold inputs up to maxInputIdx and
+    buckets up to maxBucketIdx, padding with zeros. In preallocate mode, the
+    capacity is doubled until it is large enough.
+    """
+    numRows = maxInputIdx + 1
+    numCols = maxBucketIdx + 1
+    for nSteps in self.steps:
+      weightMatrix = self._weightMatrix[nSteps]
+      capacityRows, capacityCols = weightMatrix.shape
+      if numRows <= capacityRows and numCols <= capacityCols:
+        continue
+
+      if self.preallocate:
+        while capacityRows < numRows:
+          capacityRows *= 2
+        while capacityCols < numCols:
+          capacityCols *= 2
+      else:
+        capacityRows = max(capacityRows, numRows)
+        capacityCols = max(capacityCols, numCols)
+
+      newWeightMatrix = numpy.zeros(shape=(capacityRows, capacityCols))
+      newWeightMatrix[:weightMatrix.shape[0],
+                      :weightMatrix.shape[1]] = weightMatrix
+      self._weightMatrix[nSteps] = newWeightMatrix
+
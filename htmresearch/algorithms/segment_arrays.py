@@ -0,0 +1,270 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Flat array storage of the synapses of the pure-Python TM's segments, so that
+the activity of every segment can be computed with one vectorized gather and
+reduce instead of a Python loop over columns, cells and segments.
+"""
+
+import numpy
+
+# Permanence of the slots left behind when a segment's synapses are rewritten.
+# It's below any connected permanence, so these synapses are never counted.
+_DEAD_PERMANENCE = -1.0
+
+
+
+class SegmentArrays(object):
+  """
+  Mirrors the synapses of a TM's Segment objects in flat NumPy arrays.
+
+  Each segment owns a slot and a contiguous range of synapses, like a CSR
+  matrix with gaps. Each synapse stores the index of its source in a flat
+  "source activity" array, its permanence, and its segment's slot.
+
+  The Segment objects remain the master copy. Whenever the TM changes a
+  segment's synapses, or adds or removes a segment, it calls markDirty, and
+  the next call to sync rewrites that segment's synapses at the end of the
+  arrays. The arrays are compacted when more than half of the synapses are
+  stale.
+  """
+
+  def __init__(self, cellsPerColumn, sources):
+    """
+    @param cellsPerColumn (int)
+    Number of cells per column of the TM that owns the segments
+
+    @param sources (list of tuples)
+    For each list of synapses on a segment, (attributeName, offset, stride).
+    A synapse (srcCol, srcIdx, permanence) in segment.<attributeName> reads
+    its activity from element offset + srcCol*stride + srcIdx of the source
+    activity.
+    """
+    self.cellsPerColumn = cellsPerColumn
+    self.sources = sources
+
+    self._synSources = numpy.empty(0, dtype="int32")
+    # The "objects" store counts connected synapses with nupic's C++
+    # isSegmentActive and getSegmentActivityLevel, which round permanences and
+    # the connected permanence to float32. Storing float32 and comparing in
+    # float32 rounds them the same way, even for float64 permanences that lie
+    # between the two float32 values around the threshold.
+    self._synPermanences = numpy.empty(0, dtype="float32")
+    self._synSlots = numpy.empty(0, dtype="int32")
+    self._numSynapses = 0
+    self._numStaleSynapses = 0
+
+    self._slotCells = numpy.empty(0, dtype="int32")
+    self._slotStarts = numpy.empty(0, dtype="int32")
+    self._slotLengths = numpy.empty(0, dtype="int32")
+    self._slotSegments = []
+    self._freeSlots = []
+    self._slotBySegment = {}
+
+    self._dirty = {}
+
+
+  def markDirty(self, c, i, segment):
+    """
+    Record that a segment of cell (c, i) was changed, added or removed.
+    """
+    entry = self._dirty.get(id(segment))
+    if entry is None:
+      self._dirty[id(segment)] = (segment, set([(c, i)]))
+    else:
+      entry[1].add((c, i))
+
+
+  def markAllDirty(self, cells):
+    """
+    Record every segment of the TM as changed, e.g. after unpickling.
+
+    @param cells (list of lists of lists)
+    The TM's segments, cells[c][i]
+    """
+    for c, column in enumerate(cells):
+      for i, segments in enumerate(column):
+        for segment in segments:
+          self.markDirty(c, i, segment)
+
+
+  def sync(self, cells):
+    """
+    Bring the arrays up to date with the segments marked dirty.
+
+    @param cells (list of lists of lists)
+    The TM's segments, cells[c][i]
+    """
+    for segment, candidateCells in self._dirty.itervalues():
+      slot = self._slotBySegment.get(id(segment))
+      if slot is not None:
+        self._discardSynapses(slot)
+        candidateCells.add(divmod(int(self._slotCells[slot]),
+                                  self.cellsPerColumn))
+
+      # Segment updates aren't always queued under the segment's own cell, so
+      # look for the segment in every cell it was reported for.
+      cell = None
+      for c, i in candidateCells:
+        if any(s is segment for s in cells[c][i]):
+          cell = (c, i)
+          break
+
+      if cell is not None:
+        if slot is None:
+          slot = self._allocateSlot(cell[0], cell[1], segment)
+        else:
+          self._slotCells[slot] = cell[0] * self.cellsPerColumn + cell[1]
+        self._writeSynapses(slot, segment)
+      elif slot is not None:
+        self._freeSlot(slot)
+
+    self._dirty.clear()
+
+    if self._numStaleSynapses > max(self._numSynapses // 2, 1024):
+      self._compact()
+
+
+  def computeActivity(self, sourceActivity, connectedPermanence):
+    """
+    Count the active connected synapses of every segment.
+
+    @param sourceActivity (numpy array)
+    Flat activity of every synapse source, nonzero for active sources
+
+    @param connectedPermanence (float)
+    Synapses with at least this permanence, after both are rounded to
+    float32, are connected
+
+    @return (numpy array)
+    The number of active connected synapses for each slot
+    """
+    n = self._numSynapses
+    activeSynapses = ((sourceActivity[self._synSources[:n]] != 0) &
+                      (self._synPermanences[:n] >=
+                       numpy.float32(connectedPermanence)))
+    return numpy.bincount(self._synSlots[:n][activeSynapses],
+                          minlength=len(self._slotSegments))
+
+
+  def getSlotCells(self, slots):
+    """
+    @return (numpy array)
+    The flat cell index, c*cellsPerColumn + i, of each slot
+    """
+    return self._slotCells[slots]
+
+
+  def getSlotSegment(self, slot):
+    """
+    @return (Segment)
+    The segment that owns a slot
+    """
+    return self._slotSegments[slot]
+
+
+  def _allocateSlot(self, c, i, segment):
+    if len(self._freeSlots) > 0:
+      slot = self._freeSlots.pop()
+    else:
+      slot = len(self._slotSegments)
+      self._slotSegments.append(None)
+      if slot >= len(self._slotCells):
+        capacity = max(2 * len(self._slotCells), 64)
+        self._slotCells = _resize(self._slotCells, capacity)
+        self._slotStarts = _resize(self._slotStarts, capacity)
+        self._slotLengths = _resize(self._slotLengths, capacity)
+
+    self._slotSegments[slot] = segment
+    self._slotCells[slot] = c * self.cellsPerColumn + i
+    self._slotStarts[slot] = 0
+    self._slotLengths[slot] = 0
+    self._slotBySegment[id(segment)] = slot
+    return slot
+
+
+  def _freeSlot(self, slot):
+    del self._slotBySegment[id(self._slotSegments[slot])]
+    self._slotSegments[slot] = None
+    self._slotCells[slot] = -1
+    self._freeSlots.append(slot)
+
+
+  def _discardSynapses(self, slot):
+    start = self._slotStarts[slot]
+    end = start + self._slotLengths[slot]
+    self._synPermanences[start:end] = _DEAD_PERMANENCE
+    self._synSlots[start:end] = -1
+    self._numStaleSynapses += end - start
+    self._slotLengths[slot] = 0
+
+
+  def _writeSynapses(self, slot, segment):
+    sources = []
+    permanences = []
+    for attributeName, offset, stride in self.sources:
+      for srcCol, srcIdx, permanence in getattr(segment, attributeName):
+        sources.append(offset + srcCol * stride + srcIdx)
+        permanences.append(permanence)
+
+    start = self._numSynapses
+    end = start + len(sources)
+    if end > len(self._synSources):
+      capacity = max(2 * len(self._synSources), end, 1024)
+      self._synSources = _resize(self._synSources, capacity)
+      self._synPermanences = _resize(self._synPermanences, capacity)
+      self._synSlots = _resize(self._synSlots, capacity)
+
+    self._synSources[start:end] = sources
+    self._synPermanences[start:end] = permanences
+    self._synSlots[start:end] = slot
+    self._numSynapses = end
+    self._slotStarts[slot] = start
+    self._slotLengths[slot] = end - start
+
+
+  def _compact(self):
+    """
+    Remove the stale synapses, keeping each segment's synapses contiguous.
+    """
+    n = self._numSynapses
+    live = self._synSlots[:n] >= 0
+    newPositions = numpy.cumsum(live) - 1
+
+    numSlots = len(self._slotSegments)
+    occupied = self._slotLengths[:numSlots] > 0
+    self._slotStarts[:numSlots][occupied] = newPositions[
+      self._slotStarts[:numSlots][occupied]]
+
+    numLive = int(live.sum())
+    self._synSources[:numLive] = self._synSources[:n][live]
+    self._synPermanences[:numLive] = self._synPermanences[:n][live]
+    self._synSlots[:numLive] = self._synSlots[:n][live]
+    self._numSynapses = numLive
+    self._numStaleSynapses = 0
+
+
+
+def _resize(array, capacity):
+  resized = numpy.empty(capacity, dtype=array.dtype)
+  resized[:len(array)] = array
+  return resized
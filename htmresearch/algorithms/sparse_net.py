@@ -43,6 +43,8 @@ from abc import ABCMeta, abstractmethod
 import numpy as np
 import matplotlib.pyplot as plt
 
+from htmresearch.support.forked_map import forkedMap
+
 
 EPSILON = 0.000001
 
@@ -153,16 +155,36 @@ class SparseNet(object):
       self.plotBasis()
 
 
-  def encode(self, data, flatten=False):
+  @property
+  def basis(self):
+    return self._basis
+
+
+  @basis.setter
+  def basis(self, basis):
+    # The LCA Gram matrix is recomputed from the new basis when next needed.
+    # Modifying the basis in place through indexing does not invalidate it.
+    self._basis = basis
+    self._lcaGram = None
+
+
+  def encode(self, data, flatten=False, chunkSize=None, numProcesses=1):
     """
     Encodes the provided input data, returning a sparse vector of activations.
 
     It solves a dynamic system to find optimal activations, as proposed by
-    Rozell et al. (2008).
+    Rozell et al. (2008). Data points are encoded independently, so large
+    inputs can be split into chunks and encoded in parallel.
     :param data:          (array) Data to be encoded (single point or multiple)
     :param flatten        (bool)  Whether or not the data needs to be flattened,
                                   in the case of images for example. Does not
                                   need to be enabled during training.
+    :param chunkSize      (int)   Number of data points encoded at once. By
+                                  default, all of them.
+    :param numProcesses   (int)   If > 1, the chunks are encoded in this many
+                                  forked worker processes. Can't be used from
+                                  inside a daemonic process, such as a
+                                  multiprocessing.Pool worker.
     :return:              (array) Array of sparse activations (dimOutput,
                                   numPoints)
     """
@@ -185,18 +207,50 @@ class SparseNet(object):
       data = data[:, np.newaxis]
 
 
+    numPoints = data.shape[1]
+    if chunkSize is None:
+      chunkSize = max(numPoints, 1)
+    chunks = [(start, min(start + chunkSize, numPoints))
+              for start in xrange(0, numPoints, chunkSize)]
+    if len(chunks) <= 1:
+      return self._lca(data)
+
+    # compute the Gram matrix once, before the workers are forked
+    self._getLcaGram()
+    activations = np.empty((self.outputDim, numPoints))
+
+    numProcesses = min(numProcesses, len(chunks))
+    for (start, end), chunkActivations in zip(
+        chunks, forkedMap(_encodeChunk, (self, data), chunks, numProcesses)):
+      activations[:, start:end] = chunkActivations
+
+    return activations
+
+
+  def _lca(self, data):
+    """
+    Runs the LCA dynamic system on a (filterDim, numPoints) array, in place on
+    buffers allocated once per call.
+    """
+    gram = self._getLcaGram()
     projection = self.basis.T.dot(data)
-    representation = self.basis.T.dot(self.basis) - np.eye(self.outputDim)
     states = np.zeros((self.outputDim, data.shape[1]))
+    activations = np.zeros((self.outputDim, data.shape[1]))
+    inhibition = np.empty((self.outputDim, data.shape[1]))
+    scratch = np.empty((self.outputDim, data.shape[1]))
 
     threshold = 0.5 * np.max(np.abs(projection), axis=0)
-    activations = self._thresholdNonLinearity(states, threshold)
 
     for _ in xrange(self.numLcaIterations):
       # update dynamic system
+      np.dot(gram, activations, out=inhibition)
+      np.subtract(projection, inhibition, out=inhibition)
+      inhibition *= self.lcaLearningRate
       states *= (1 - self.lcaLearningRate)
-      states += self.lcaLearningRate * (projection - representation.dot(activations))
-      activations = self._thresholdNonLinearity(states, threshold)
+      states += inhibition
+      activations = self._thresholdNonLinearity(states, threshold,
+                                                out=activations,
+                                                scratch=scratch)
 
       # decay threshold
       threshold *= self.thresholdDecay
@@ -205,6 +259,16 @@ class SparseNet(object):
     return activations
 
 
+  def _getLcaGram(self):
+    """
+    Returns the LCA inhibition matrix, basis.T * basis - I, computed once per
+    basis.
+    """
+    if self._lcaGram is None:
+      self._lcaGram = self.basis.T.dot(self.basis) - np.eye(self.outputDim)
+    return self._lcaGram
+
+
   def plotLoss(self, filename=None):
     """
     Plots the loss history.
@@ -304,29 +368,42 @@ class SparseNet(object):
     self.basis /= np.sqrt(np.sum(self.basis ** 2, axis=0))
 
 
-  def _thresholdNonLinearity(self, input, threshold, thresholdType=None):
+  def _thresholdNonLinearity(self, input, threshold, thresholdType=None,
+                             out=None, scratch=None):
     """
     Non linearity function, to transform the activations during training and
     encoding.
     :param input:          (array)  Activations
     :param threshold:      (array)  Thresholds
     :param thresholdType:  (string) 'soft', 'absoluteHard' or 'relativeHard'
+    :param out:            (array)  Optional array, distinct from input, in
+                                    which to write the result
+    :param scratch:        (array)  Optional work array of the same shape
     """
     if thresholdType == None:
       thresholdType = self.thresholdType
 
-    activation = np.copy(input)
+    if out is None:
+      out = np.empty_like(input)
+    if scratch is None:
+      scratch = np.empty_like(input)
 
     if thresholdType == 'soft':
-      return np.maximum(np.abs(activation) - threshold, 0.) * np.sign(activation)
+      np.abs(input, out=out)
+      out -= threshold
+      np.maximum(out, 0., out=out)
+      out *= np.sign(input, out=scratch)
+      return out
 
     if thresholdType == 'absoluteHard':
-      activation[np.abs(activation) < threshold] = 0.
-      return activation
+      np.copyto(out, input)
+      out[np.less(np.abs(input, out=scratch), threshold)] = 0.
+      return out
 
     if thresholdType == 'relativeHard':
-      activation[activation < threshold] = 0.
-      return activation
+      np.copyto(out, input)
+      out[input < threshold] = 0.
+      return out
 
 
   @abstractmethod
@@ -489,3 +566,13 @@ class SparseNet(object):
     """
     className = self.__class__.__name__
     return className + "({0}, {1})".format(self.filterDim, self.outputDim)
+
+
+
+def _encodeChunk(sharedInputs, chunk):
+  """
+  Encodes the columns start:end of the data.
+  """
+  sparsenet, data = sharedInputs
+  start, end = chunk
+  return sparsenet._lca(data[:, start:end])
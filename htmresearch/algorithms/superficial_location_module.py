@@ -144,9 +144,30 @@ class SuperficialLocationModule2D(object):
 
     self.pointOffsets = pointOffsets
 
-    # These coordinates are in units of "cell fields".
-    self.activePoints = np.empty((0,2), dtype="float")
-    self.cellsForActivePoints = np.empty(0, dtype="int")
+    # The points that a newly activated cell adds, relative to the cell's
+    # corner, in the order [iOffset, jOffset] for iOffset, for jOffset.
+    self._offsetGrid = np.array([[iOffset, jOffset]
+                                 for iOffset in pointOffsets
+                                 for jOffset in pointOffsets], dtype="float")
+
+    # The active points are stored in the first _numActivePoints rows of a
+    # buffer that grows as needed. These coordinates are in units of "cell
+    # fields". _cellsForPoints holds the cell of each point, and the other
+    # buffers are scratch space for computing it.
+    self._numActivePoints = 0
+    self._points = np.empty((0, 2), dtype="float")
+    self._flooredPoints = np.empty((0, 2), dtype="float")
+    self._pointCoordinates = np.empty((0, 2), dtype="int")
+    self._cellsForPoints = np.empty(0, dtype="int")
+    self._ensurePointCapacity(64)
+
+    # Converts [i, j] cell coordinates into cell numbers
+    self._cellStrides = np.array([self.cellDimensions[1], 1], dtype="int")
+
+    # Lookup tables indexed by cell
+    numCells = np.prod(self.cellDimensions)
+    self._isActiveCell = np.zeros(numCells, dtype="bool")
+    self._isCandidateCell = np.zeros(numCells, dtype="bool")
 
     self.activeCells = np.empty(0, dtype="int")
     self.activeSegments = np.empty(0, dtype="uint32")
@@ -170,26 +191,75 @@ class SuperficialLocationModule2D(object):
     """
     Clear the active cells.
     """
-    self.activePoints = np.empty((0,2), dtype="float")
-    self.cellsForActivePoints = np.empty(0, dtype="int")
+    self._numActivePoints = 0
+    self._isActiveCell.fill(False)
     self.activeCells = np.empty(0, dtype="int")
 
 
+  @property
+  def activePoints(self):
+    """
+    The active points, in units of "cell fields". This is a view of the
+    module's buffer, so it changes as the module shifts and anchors.
+    """
+    return self._points[:self._numActivePoints]
+
+
+  @activePoints.setter
+  def activePoints(self, activePoints):
+    activePoints = np.asarray(activePoints, dtype="float").reshape(-1, 2)
+    self._ensurePointCapacity(len(activePoints))
+    self._points[:len(activePoints)] = activePoints
+    self._numActivePoints = len(activePoints)
+    self._computeActiveCells()
+
+
+  @property
+  def cellsForActivePoints(self):
+    return self._cellsForPoints[:self._numActivePoints]
+
+
+  def _ensurePointCapacity(self, numPoints):
+    capacity = len(self._points)
+    if numPoints <= capacity:
+      return
+
+    capacity = max(numPoints, 2 * capacity)
+    n = self._numActivePoints
+    points = np.empty((capacity, 2), dtype="float")
+    points[:n] = self._points[:n]
+    self._points = points
+    self._flooredPoints = np.empty((capacity, 2), dtype="float")
+    self._pointCoordinates = np.empty((capacity, 2), dtype="int")
+    self._cellsForPoints = np.empty(capacity, dtype="int")
+
+
   def _computeActiveCells(self):
+    n = self._numActivePoints
+
     # Round each coordinate to the nearest cell.
-    flooredActivePoints = np.floor(self.activePoints).astype("int")
+    flooredPoints = self._flooredPoints[:n]
+    np.floor(self._points[:n], out=flooredPoints)
+    coordinates = self._pointCoordinates[:n]
+    np.copyto(coordinates, flooredPoints, casting="unsafe")
 
-    # Convert coordinates to cell numbers.
-    self.cellsForActivePoints = (
-      np.ravel_multi_index(flooredActivePoints.T, self.cellDimensions))
-    self.activeCells = np.unique(self.cellsForActivePoints)
+    # Convert coordinates to cell numbers. The modulo only matters when
+    # floating point rounding puts a point exactly on the far edge.
+    np.mod(coordinates, self.cellDimensions, out=coordinates)
+    cells = self._cellsForPoints[:n]
+    np.dot(coordinates, self._cellStrides, out=cells)
+
+    self._isActiveCell.fill(False)
+    self._isActiveCell[cells] = True
+    self.activeCells = np.flatnonzero(self._isActiveCell)
 
 
   def activateRandomLocation(self):
     """
     Set the location to a random point.
     """
-    self.activePoints = np.array([np.random.random(2) * self.cellDimensions])
+    self._points[0] = np.random.random(2) * self.cellDimensions
+    self._numActivePoints = 1
     self._computeActiveCells()
 
 
@@ -205,8 +275,9 @@ class SuperficialLocationModule2D(object):
                                  self.cellFieldsPerUnitDistance)
 
     # Shift the active coordinates.
-    np.add(self.activePoints, deltaLocationInCellFields, out=self.activePoints)
-    np.mod(self.activePoints, self.cellDimensions, out=self.activePoints)
+    activePoints = self._points[:self._numActivePoints]
+    np.add(activePoints, deltaLocationInCellFields, out=activePoints)
+    np.mod(activePoints, self.cellDimensions, out=activePoints)
 
     self._computeActiveCells()
 
@@ -226,28 +297,29 @@ class SuperficialLocationModule2D(object):
                                                 self.connectedPermanence)
     activeSegments = np.where(overlaps >= self.activationThreshold)[0]
 
-    sensorySupportedCells = np.unique(
-      self.connections.mapSegmentsToCells(activeSegments))
-
-    inactivated = np.setdiff1d(self.activeCells, sensorySupportedCells)
-    inactivatedIndices = np.in1d(self.cellsForActivePoints,
-                                 inactivated).nonzero()[0]
-    if inactivatedIndices.size > 0:
-      self.activePoints = np.delete(self.activePoints, inactivatedIndices,
-                                    axis=0)
-
-    activated = np.setdiff1d(sensorySupportedCells, self.activeCells)
-
-    activatedCoordsBase = np.transpose(
-      np.unravel_index(activated, self.cellDimensions)).astype('float')
-
-    activatedCoords = np.concatenate(
-      [activatedCoordsBase + [iOffset, jOffset]
-       for iOffset in self.pointOffsets
-       for jOffset in self.pointOffsets]
-    )
-    if activatedCoords.size > 0:
-      self.activePoints = np.append(self.activePoints, activatedCoords, axis=0)
+    isSupportedCell = self._isCandidateCell
+    isSupportedCell.fill(False)
+    isSupportedCell[self.connections.mapSegmentsToCells(activeSegments)] = True
+
+    # Remove the points of cells that lost their sensory support, keeping the
+    # order of the others.
+    n = self._numActivePoints
+    keptPoints = isSupportedCell[self._cellsForPoints[:n]]
+    numKept = np.count_nonzero(keptPoints)
+    if numKept < n:
+      self._points[:numKept] = self._points[:n][keptPoints]
+
+    # Add points to the newly activated cells.
+    isSupportedCell &= ~self._isActiveCell
+    activated = np.flatnonzero(isSupportedCell)
+    numNewPoints = len(self._offsetGrid) * len(activated)
+    self._ensurePointCapacity(numKept + numNewPoints)
+    newPoints = self._points[numKept:numKept + numNewPoints].reshape(
+      len(self._offsetGrid), len(activated), 2)
+    newPoints[:, :, 0] = (activated // self.cellDimensions[1])[np.newaxis, :]
+    newPoints[:, :, 1] = (activated % self.cellDimensions[1])[np.newaxis, :]
+    newPoints += self._offsetGrid[:, np.newaxis, :]
+    self._numActivePoints = numKept + numNewPoints
 
     self._computeActiveCells()
     self.activeSegments = activeSegments
@@ -273,8 +345,11 @@ class SuperficialLocationModule2D(object):
     cellsForActiveSegments = self.connections.mapSegmentsToCells(
       activeSegments)
     learningActiveSegments = activeSegments[
-      np.in1d(cellsForActiveSegments, self.activeCells)]
-    remainingCells = np.setdiff1d(self.activeCells, cellsForActiveSegments)
+      self._isActiveCell[cellsForActiveSegments]]
+    isRemainingCell = self._isCandidateCell
+    np.copyto(isRemainingCell, self._isActiveCell)
+    isRemainingCell[cellsForActiveSegments] = False
+    remainingCells = np.flatnonzero(isRemainingCell)
 
     # Remaining cells with a matching segment: reinforce the best
     # matching segment.
@@ -283,12 +358,13 @@ class SuperficialLocationModule2D(object):
     cellsForCandidateSegments = (
       self.connections.mapSegmentsToCells(candidateSegments))
     candidateSegments = candidateSegments[
-      np.in1d(cellsForCandidateSegments, remainingCells)]
+      isRemainingCell[cellsForCandidateSegments]]
     onePerCellFilter = np2.argmaxMulti(potentialOverlaps[candidateSegments],
                                        cellsForCandidateSegments)
     learningMatchingSegments = candidateSegments[onePerCellFilter]
 
-    newSegmentCells = np.setdiff1d(remainingCells, cellsForCandidateSegments)
+    isRemainingCell[cellsForCandidateSegments] = False
+    newSegmentCells = np.flatnonzero(isRemainingCell)
 
     for learningSegments in (learningActiveSegments,
                              learningMatchingSegments):
@@ -358,3 +434,400 @@ class SuperficialLocationModule2D(object):
 
   def numberOfCells(self):
     return np.prod(self.cellDimensions)
+
+
+
+class SuperficialLocationModuleBank(object):
+  """
+  A set of SuperficialLocationModule2D modules that move and learn together.
+
+  Every module receives the same movements and the same anchor input, so
+  rather than stepping each module from Python, the bank stores all of the
+  modules' points, rotation matrices, scales and connections in stacked
+  arrays and applies each phase to all modules with one set of vectorized
+  operations. The cells of module i are numbered after the cells of modules
+  0..i-1, like Grid2DLocationExperiment.getActiveLocationCells numbers them.
+
+  Each module's active cells are the same as those of a
+  SuperficialLocationModule2D with the same configuration receiving the same
+  calls, including after learning: every module keeps its own random number
+  generator, and new synapses are sampled module by module in the same order.
+  """
+
+  def __init__(self,
+               moduleConfigs,
+               anchorInputSize,
+               activationThreshold=10,
+               initialPermanence=0.21,
+               connectedPermanence=0.50,
+               learningThreshold=10,
+               sampleSize=20,
+               permanenceIncrement=0.1,
+               permanenceDecrement=0.0,
+               maxSynapsesPerSegment=-1,
+               seed=42):
+    """
+    @param moduleConfigs (list of dicts)
+    The "cellDimensions", "moduleMapDimensions", "orientation" and optional
+    "pointOffsets" and "seed" of each module. See SuperficialLocationModule2D.
+
+    The other parameters are shared by all modules. See
+    SuperficialLocationModule2D.
+    """
+    self.numModules = len(moduleConfigs)
+    self.cellDimensions = np.array(
+      [config["cellDimensions"] for config in moduleConfigs],
+      dtype="int").reshape(-1, 2)
+    self.moduleMapDimensions = np.array(
+      [config["moduleMapDimensions"] for config in moduleConfigs],
+      dtype="float").reshape(-1, 2)
+    self.cellFieldsPerUnitDistance = (self.cellDimensions /
+                                      self.moduleMapDimensions)
+
+    self.orientations = np.array(
+      [config["orientation"] for config in moduleConfigs], dtype="float")
+    self.rotationMatrices = np.array(
+      [[[math.cos(orientation), -math.sin(orientation)],
+        [math.sin(orientation), math.cos(orientation)]]
+       for orientation in self.orientations]).reshape(-1, 2, 2)
+
+    # Cells of each module
+    self.cellsPerModule = np.prod(self.cellDimensions, axis=1)
+    self.firstCells = np.cumsum(self.cellsPerModule) - self.cellsPerModule
+    numCells = int(np.sum(self.cellsPerModule))
+    self._cellModules = np.repeat(np.arange(self.numModules),
+                                  self.cellsPerModule)
+
+    # The offset grids of all modules, one after the other
+    offsetGrids = [np.array([[iOffset, jOffset]
+                             for iOffset in pointOffsets
+                             for jOffset in pointOffsets],
+                            dtype="float").reshape(-1, 2)
+                   for pointOffsets in (config.get("pointOffsets", (0.5,))
+                                        for config in moduleConfigs)]
+    self._offsetGridSizes = np.array([len(grid) for grid in offsetGrids],
+                                     dtype="int")
+    self._offsetGridStarts = (np.cumsum(self._offsetGridSizes) -
+                              self._offsetGridSizes)
+    self._offsetGrids = np.concatenate(offsetGrids + [np.empty((0, 2))])
+
+    # The active points of all modules are stored in the first
+    # _numActivePoints rows of a set of buffers: the point, its module, the
+    # cell dimensions and first cell of its module, and its cell.
+    self._numActivePoints = 0
+    self._points = np.empty((0, 2), dtype="float")
+    self._pointModules = np.empty(0, dtype="int")
+    self._pointCellDimensions = np.empty((0, 2), dtype="int")
+    self._pointFirstCells = np.empty(0, dtype="int")
+    self._cellsForPoints = np.empty(0, dtype="int")
+    self._pointDeltas = np.empty((0, 2), dtype="float")
+    self._flooredPoints = np.empty((0, 2), dtype="float")
+    self._pointCoordinates = np.empty((0, 2), dtype="int")
+    self._ensurePointCapacity(max(64, 2 * self.numModules))
+
+    # Lookup tables indexed by cell
+    self._isActiveCell = np.zeros(numCells, dtype="bool")
+    self._isCandidateCell = np.zeros(numCells, dtype="bool")
+
+    self.activeCells = np.empty(0, dtype="int")
+    self.activeSegments = np.empty(0, dtype="uint32")
+
+    self.connections = SparseMatrixConnections(numCells, anchorInputSize)
+
+    self.initialPermanence = initialPermanence
+    self.connectedPermanence = connectedPermanence
+    self.learningThreshold = learningThreshold
+    self.sampleSize = sampleSize
+    self.permanenceIncrement = permanenceIncrement
+    self.permanenceDecrement = permanenceDecrement
+    self.activationThreshold = activationThreshold
+    self.maxSynapsesPerSegment = maxSynapsesPerSegment
+
+    self.rngs = [Random(config.get("seed", seed)) for config in moduleConfigs]
+
+
+  def reset(self):
+    """
+    Clear the active cells of every module.
+    """
+    self._numActivePoints = 0
+    self._isActiveCell.fill(False)
+    self.activeCells = np.empty(0, dtype="int")
+
+
+  def activateRandomLocation(self):
+    """
+    Set the location of each module to a random point, drawing the points in
+    module order.
+    """
+    for module in xrange(self.numModules):
+      self._points[module] = np.random.random(2) * self.cellDimensions[module]
+    self._numActivePoints = self.numModules
+    self._setPointModules(slice(0, self.numModules),
+                          np.arange(self.numModules))
+    self._computeActiveCells()
+
+
+  def shift(self, deltaLocation):
+    """
+    Shift the active cells of every module by a vector.
+
+    @param deltaLocation (pair of floats)
+    A translation vector [di, dj].
+    """
+    # Calculate delta in each module's coordinates.
+    deltaLocationsInCellFields = (
+      (self.rotationMatrices[:, :, 0] * deltaLocation[0] +
+       self.rotationMatrices[:, :, 1] * deltaLocation[1]) *
+      self.cellFieldsPerUnitDistance)
+
+    # Shift the active coordinates.
+    n = self._numActivePoints
+    activePoints = self._points[:n]
+    pointDeltas = self._pointDeltas[:n]
+    np.take(deltaLocationsInCellFields, self._pointModules[:n], axis=0,
+            out=pointDeltas)
+    np.add(activePoints, pointDeltas, out=activePoints)
+    np.mod(activePoints, self._pointCellDimensions[:n], out=activePoints)
+
+    self._computeActiveCells()
+
+
+  def anchor(self, anchorInput):
+    """
+    Infer the location of every module from sensory input. Activate any cells
+    with enough active synapses to this sensory input. Deactivate all other
+    cells.
+
+    @param anchorInput (numpy array)
+    A sensory input. This will often come from a feature-location pair layer.
+    """
+    if len(anchorInput) == 0:
+      return
+
+    overlaps = self.connections.computeActivity(anchorInput,
+                                                self.connectedPermanence)
+    activeSegments = np.where(overlaps >= self.activationThreshold)[0]
+
+    isSupportedCell = self._isCandidateCell
+    isSupportedCell.fill(False)
+    isSupportedCell[self.connections.mapSegmentsToCells(activeSegments)] = True
+
+    # Remove the points of cells that lost their sensory support.
+    n = self._numActivePoints
+    keptPoints = isSupportedCell[self._cellsForPoints[:n]]
+    numKept = np.count_nonzero(keptPoints)
+    if numKept < n:
+      for buf in (self._points, self._pointModules,
+                  self._pointCellDimensions, self._pointFirstCells):
+        buf[:numKept] = buf[:n][keptPoints]
+
+    # Add points to the newly activated cells, one per entry of their
+    # module's offset grid.
+    isSupportedCell &= ~self._isActiveCell
+    activated = np.flatnonzero(isSupportedCell)
+    modules = self._cellModules[activated]
+    gridSizes = self._offsetGridSizes[modules]
+    numNewPoints = int(np.sum(gridSizes))
+    self._ensurePointCapacity(numKept + numNewPoints)
+
+    newCells = np.repeat(activated, gridSizes)
+    newModules = np.repeat(modules, gridSizes)
+    gridIndices = (np.arange(numNewPoints) +
+                   np.repeat(self._offsetGridStarts[modules] -
+                             (np.cumsum(gridSizes) - gridSizes), gridSizes))
+    localCells = newCells - self.firstCells[newModules]
+    numColumns = self.cellDimensions[newModules, 1]
+
+    newPoints = self._points[numKept:numKept + numNewPoints]
+    newPoints[:, 0] = localCells // numColumns
+    newPoints[:, 1] = localCells % numColumns
+    newPoints += self._offsetGrids[gridIndices]
+    self._setPointModules(slice(numKept, numKept + numNewPoints), newModules)
+    self._numActivePoints = numKept + numNewPoints
+
+    self._computeActiveCells()
+    self.activeSegments = activeSegments
+
+
+  def learn(self, anchorInput):
+    """
+    Associate the current location of every module with a sensory input.
+    Subsequently, anchorInput will activate these locations during anchor().
+
+    @param anchorInput (numpy array)
+    A sensory input. This will often come from a feature-location pair layer.
+    """
+    overlaps = self.connections.computeActivity(anchorInput,
+                                                self.connectedPermanence)
+    activeSegments = np.where(overlaps >= self.activationThreshold)[0]
+
+    potentialOverlaps = self.connections.computeActivity(anchorInput)
+    matchingSegments = np.where(potentialOverlaps >=
+                                self.learningThreshold)[0]
+
+    # Cells with a active segment: reinforce the segment
+    cellsForActiveSegments = self.connections.mapSegmentsToCells(
+      activeSegments)
+    learningActiveSegments = activeSegments[
+      self._isActiveCell[cellsForActiveSegments]]
+    isRemainingCell = self._isCandidateCell
+    np.copyto(isRemainingCell, self._isActiveCell)
+    isRemainingCell[cellsForActiveSegments] = False
+    remainingCells = np.flatnonzero(isRemainingCell)
+
+    # Remaining cells with a matching segment: reinforce the best
+    # matching segment.
+    candidateSegments = self.connections.filterSegmentsByCell(
+      matchingSegments, remainingCells)
+    cellsForCandidateSegments = (
+      self.connections.mapSegmentsToCells(candidateSegments))
+    candidateSegments = candidateSegments[
+      isRemainingCell[cellsForCandidateSegments]]
+    onePerCellFilter = np2.argmaxMulti(potentialOverlaps[candidateSegments],
+                                       cellsForCandidateSegments)
+    learningMatchingSegments = candidateSegments[onePerCellFilter]
+
+    isRemainingCell[cellsForCandidateSegments] = False
+    newSegmentCells = np.flatnonzero(isRemainingCell)
+
+    # Learn on existing segments
+    learningSegments = np.concatenate((learningActiveSegments,
+                                       learningMatchingSegments))
+    self.connections.adjustSynapses(learningSegments, anchorInput,
+                                    self.permanenceIncrement,
+                                    -self.permanenceDecrement)
+
+    # Remaining cells without a matching segment: grow one.
+    numNewSynapses = len(anchorInput)
+
+    if self.sampleSize != -1:
+      numNewSynapses = min(numNewSynapses, self.sampleSize)
+
+    if self.maxSynapsesPerSegment != -1:
+      numNewSynapses = min(numNewSynapses, self.maxSynapsesPerSegment)
+
+    newSegments = self.connections.createSegments(newSegmentCells)
+
+    # Grow new synapses. Each module samples them with its own random number
+    # generator, in the order SuperficialLocationModule2D would.
+    growths = [
+      (segments, self._maxNewSynapses(segments, len(anchorInput),
+                                      potentialOverlaps),
+       self._cellModules[self.connections.mapSegmentsToCells(segments)])
+      for segments in (learningActiveSegments, learningMatchingSegments)]
+    growths.append((newSegments, numNewSynapses,
+                    self._cellModules[newSegmentCells]))
+
+    for module in np.unique(np.concatenate([modules for _, _, modules
+                                            in growths])):
+      for segments, maxNew, modules in growths:
+        inModule = modules == module
+        if np.any(inModule):
+          moduleMaxNew = (maxNew[inModule] if isinstance(maxNew, np.ndarray)
+                          else maxNew)
+          self.connections.growSynapsesToSample(
+            segments[inModule], anchorInput, moduleMaxNew,
+            self.initialPermanence, self.rngs[module])
+
+    self.activeSegments = activeSegments
+
+
+  def getActiveCells(self):
+    """
+    @return (numpy array)
+    The active cells of all modules, numbered across the bank
+    """
+    return self.activeCells
+
+
+  def getModuleActiveCells(self, module):
+    """
+    @return (numpy array)
+    The active cells of one module, numbered within the module
+    """
+    start, end = np.searchsorted(
+      self.activeCells, [self.firstCells[module],
+                         self.firstCells[module] + self.cellsPerModule[module]])
+    return self.activeCells[start:end] - self.firstCells[module]
+
+
+  def getModuleActivePoints(self, module):
+    """
+    @return (numpy array)
+    The active points of one module, in units of its "cell fields"
+    """
+    n = self._numActivePoints
+    return self._points[:n][self._pointModules[:n] == module]
+
+
+  def numberOfCells(self):
+    return self._isActiveCell.size
+
+
+  def _maxNewSynapses(self, learningSegments, numActiveInputs,
+                      potentialOverlaps):
+    """
+    The number of synapses to grow on each learning segment, computed like
+    SuperficialLocationModule2D._learn.
+    """
+    if self.sampleSize == -1:
+      maxNew = numActiveInputs
+    else:
+      maxNew = self.sampleSize - potentialOverlaps[learningSegments]
+
+    if self.maxSynapsesPerSegment != -1:
+      synapseCounts = self.connections.mapSegmentsToSynapseCounts(
+        learningSegments)
+      numSynapsesToReachMax = self.maxSynapsesPerSegment - synapseCounts
+      maxNew = np.where(maxNew <= numSynapsesToReachMax,
+                        maxNew, numSynapsesToReachMax)
+
+    return maxNew
+
+
+  def _setPointModules(self, points, modules):
+    self._pointModules[points] = modules
+    self._pointCellDimensions[points] = self.cellDimensions[modules]
+    self._pointFirstCells[points] = self.firstCells[modules]
+
+
+  def _ensurePointCapacity(self, numPoints):
+    capacity = len(self._points)
+    if numPoints <= capacity:
+      return
+
+    capacity = max(numPoints, 2 * capacity)
+    n = self._numActivePoints
+    for name in ("_points", "_pointModules", "_pointCellDimensions",
+                 "_pointFirstCells"):
+      buf = getattr(self, name)
+      resized = np.empty((capacity,) + buf.shape[1:], dtype=buf.dtype)
+      resized[:n] = buf[:n]
+      setattr(self, name, resized)
+    self._cellsForPoints = np.empty(capacity, dtype="int")
+    self._pointDeltas = np.empty((capacity, 2), dtype="float")
+    self._flooredPoints = np.empty((capacity, 2), dtype="float")
+    self._pointCoordinates = np.empty((capacity, 2), dtype="int")
+
+
+  def _computeActiveCells(self):
+    n = self._numActivePoints
+
+    # Round each coordinate to the nearest cell.
+    flooredPoints = self._flooredPoints[:n]
+    np.floor(self._points[:n], out=flooredPoints)
+    coordinates = self._pointCoordinates[:n]
+    np.copyto(coordinates, flooredPoints, casting="unsafe")
+
+    # Convert coordinates to cell numbers.
+    cellDimensions = self._pointCellDimensions[:n]
+    np.mod(coordinates, cellDimensions, out=coordinates)
+    cells = self._cellsForPoints[:n]
+    np.multiply(coordinates[:, 0], cellDimensions[:, 1], out=cells)
+    cells += coordinates[:, 1]
+    cells += self._pointFirstCells[:n]
+
+    self._isActiveCell.fill(False)
+    self._isActiveCell[cells] = True
+    self.activeCells = np.flatnonzero(self._isActiveCell)
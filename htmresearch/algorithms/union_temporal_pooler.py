@@ -20,7 +20,6 @@
 # ----------------------------------------------------------------------
 
 import random
-import copy
 import numpy
 from nupic.bindings.algorithms import SpatialPooler
 # Uncomment below line to use python SP
@@ -36,6 +35,8 @@ from htmresearch.frameworks.union_temporal_pooling.activation.decay_functions.de
 REAL_DTYPE = GetNTAReal()
 UINT_DTYPE = "uint32"
 _TIE_BREAKER_FACTOR = 0.000001
+# The number of cells whose permanences _learn updates at a time
+_LEARN_BLOCK_SIZE = 64
 
 
 
@@ -152,9 +153,24 @@ class UnionTemporalPooler(SpatialPooler):
     # lowest possible pooling activation level
     self._poolingActivationlowerBound = 0.1
 
-    self._preActiveInput = numpy.zeros(self.getNumInputs(), dtype=REAL_DTYPE)
-    # predicted inputs from the last n steps
-    self._prePredictedActiveInput = numpy.zeros((self.getNumInputs(), self._historyLength), dtype=REAL_DTYPE)
+    # Indices of active inputs from the previous time step
+    self._preActiveInput = numpy.array([], dtype=UINT_DTYPE)
+    # Indices of predicted inputs from the last n steps, kept as a ring buffer.
+    # The most recent step is at _prePredictedActiveInput[_historyIndex - 1].
+    self._prePredictedActiveInput = [numpy.array([], dtype=UINT_DTYPE)] * self._historyLength
+    self._historyIndex = 0
+
+    # Input vector handed to the overlap computation, see _calculateOverlaps
+    self._overlapInput = numpy.zeros(self.getNumInputs(), dtype=UINT_DTYPE)
+
+    # Permanences and potential synapses of the cells being updated, see _learn
+    self._learnPermanences = numpy.zeros(
+      (_LEARN_BLOCK_SIZE, self.getNumInputs()), dtype=REAL_DTYPE)
+    self._learnPotentials = numpy.zeros(
+      (_LEARN_BLOCK_SIZE, self.getNumInputs()), dtype=UINT_DTYPE)
+    self._learnIsPotential = numpy.zeros(
+      (_LEARN_BLOCK_SIZE, self.getNumInputs()), dtype=bool)
+    self._learnPermChanges = numpy.zeros(self.getNumInputs(), dtype=REAL_DTYPE)
 
 
   def reset(self):
@@ -167,8 +183,9 @@ class UnionTemporalPooler(SpatialPooler):
     self._unionSDR = numpy.array([], dtype=UINT_DTYPE)
     self._poolingTimer = numpy.ones(self.getNumColumns(), dtype=REAL_DTYPE) * 1000
     self._poolingActivationInitLevel = numpy.zeros(self.getNumColumns(), dtype=REAL_DTYPE)
-    self._preActiveInput = numpy.zeros(self.getNumInputs(), dtype=REAL_DTYPE)
-    self._prePredictedActiveInput = numpy.zeros((self.getNumInputs(), self._historyLength), dtype=REAL_DTYPE)
+    self._preActiveInput = numpy.array([], dtype=UINT_DTYPE)
+    self._prePredictedActiveInput = [numpy.array([], dtype=UINT_DTYPE)] * self._historyLength
+    self._historyIndex = 0
 
     # Reset Spatial Pooler fields
     self.setOverlapDutyCycles(numpy.zeros(self.getNumColumns(), dtype=REAL_DTYPE))
@@ -187,11 +204,26 @@ class UnionTemporalPooler(SpatialPooler):
     """
     assert numpy.size(activeInput) == self.getNumInputs()
     assert numpy.size(predictedActiveInput) == self.getNumInputs()
+    return self.computeSparse(numpy.flatnonzero(activeInput),
+                              numpy.flatnonzero(predictedActiveInput),
+                              learn)
+
+
+  def computeSparse(self, activeInput, predictedActiveInput, learn):
+    """
+    Computes one cycle of the Union Temporal Pooler algorithm, like compute,
+    with the input given as indices.
+    @param activeInput            (numpy array) Indices of the active inputs
+    @param predictedActiveInput   (numpy array) Indices of the correctly predicted inputs
+    @param learn                  (boolen)      A boolen value indicating whether learning should be performed
+    """
+    activeInput = numpy.asarray(activeInput, dtype=UINT_DTYPE)
+    predictedActiveInput = numpy.asarray(predictedActiveInput, dtype=UINT_DTYPE)
     self._updateBookeepingVars(learn)
 
     # Compute proximal dendrite overlaps with active and active-predicted inputs
-    overlapsActive = self._calculateOverlap(activeInput)
-    overlapsPredictedActive = self._calculateOverlap(predictedActiveInput)
+    overlapsActive, overlapsPredictedActive = self._calculateOverlaps(
+      activeInput, predictedActiveInput)
     totalOverlap = (overlapsActive * self._activeOverlapWeight +
                     overlapsPredictedActive *
                     self._predictedActiveOverlapWeight).astype(REAL_DTYPE)
@@ -216,22 +248,15 @@ class UnionTemporalPooler(SpatialPooler):
     self._getMostActiveCells()
 
     if learn:
-      # adapt permanence of connections from predicted active inputs to newly active cell
-      # This step is the spatial pooler learning rule, applied only to the predictedActiveInput
-      # Todo: should we also include unpredicted active input in this step?
-      self._adaptSynapses(predictedActiveInput, activeCells, self.getSynPermActiveInc(), self.getSynPermInactiveDec())
-
-      # Increase permanence of connections from predicted active inputs to cells in the union SDR
-      # This is Hebbian learning applied to the current time step
-      self._adaptSynapses(predictedActiveInput, self._unionSDR, self._synPermPredActiveInc, 0.0)
-
-      # adapt permenence of connections from previously predicted inputs to newly active cells
-      # This is a reinforcement learning rule that considers previous input to the current cell
-      for i in xrange(self._historyLength):
-        self._adaptSynapses(self._prePredictedActiveInput[:,i], activeCells, self._synPermPreviousPredActiveInc, 0.0)
+      # Adapt the permanences of the active cells and the union SDR to the
+      # predicted input of this and the previous time steps
+      self._learn(activeCells, predictedActiveInput)
 
       # Homeostasis learning inherited from the spatial pooler
-      self._updateDutyCycles(totalOverlap.astype(UINT_DTYPE), activeCells)
+      # The spatial pooler takes the active cells as a dense array here
+      activeArray = numpy.zeros(self.getNumColumns(), dtype=UINT_DTYPE)
+      activeArray[activeCells] = 1
+      self._updateDutyCycles(totalOverlap.astype(UINT_DTYPE), activeArray)
       self._bumpUpWeakColumns()
       self._updateBoostFactors()
       if self._isUpdateRound():
@@ -239,14 +264,143 @@ class UnionTemporalPooler(SpatialPooler):
         self._updateMinDutyCycles()
 
     # save inputs from the previous time step
-    self._preActiveInput = copy.copy(activeInput)
-    self._prePredictedActiveInput = numpy.roll(self._prePredictedActiveInput,1,1)
+    self._preActiveInput = activeInput.copy()
     if self._historyLength > 0:
-      self._prePredictedActiveInput[:, 0] = predictedActiveInput
+      self._prePredictedActiveInput[self._historyIndex] = predictedActiveInput.copy()
+      self._historyIndex = (self._historyIndex + 1) % self._historyLength
 
     return self._unionSDR
 
 
+  def _calculateOverlaps(self, activeInput, predictedActiveInput):
+    """
+    Computes the overlaps of every cell with the active and the predicted
+    active inputs.
+
+    The spatial pooler sums the input values on each cell's connected
+    synapses, so giving active inputs a value of 1 and predicted inputs an
+    additional value larger than any overlap yields both overlaps from a
+    single pass over the synapses.
+
+    @param activeInput (numpy array) Indices of the active inputs
+    @param predictedActiveInput (numpy array) Indices of the predicted inputs
+    @return (tuple of numpy arrays) The active and predicted active overlaps
+    """
+    predictedValue = self.getNumInputs() + 1
+    inputVector = self._overlapInput
+    if predictedValue * (predictedValue + 1) > numpy.iinfo(UINT_DTYPE).max:
+      inputVector[activeInput] = 1
+      overlapsActive = self._calculateOverlap(inputVector)
+      inputVector[activeInput] = 0
+      inputVector[predictedActiveInput] = 1
+      overlapsPredictedActive = self._calculateOverlap(inputVector)
+      inputVector[predictedActiveInput] = 0
+      return overlapsActive, overlapsPredictedActive
+
+    inputVector[activeInput] = 1
+    inputVector[predictedActiveInput] += predictedValue
+    overlaps = self._calculateOverlap(inputVector)
+    inputVector[activeInput] = 0
+    inputVector[predictedActiveInput] = 0
+    overlapsPredictedActive, overlapsActive = numpy.divmod(overlaps,
+                                                           predictedValue)
+    return overlapsActive, overlapsPredictedActive
+
+
+  def _learn(self, activeCells, predictedActiveInput):
+    """
+    Applies the learning rules of one time step:
+
+    1. The spatial pooler learning rule, applied only to the predicted active
+       input, adapts the permanences of the newly active cells.
+       Todo: should we also include unpredicted active input in this step?
+    2. Hebbian learning increases the permanences from the predicted active
+       input to the cells in the union SDR.
+    3. Reinforcement learning increases the permanences from the inputs
+       predicted in each of the previous historyLength time steps to the newly
+       active cells.
+
+    Each cell's permanences are read and written once. The cells are updated
+    in blocks of at most _LEARN_BLOCK_SIZE, through buffers that are reused for
+    every block and time step. The rules are applied in this order, clipping
+    the permanences after each rule and each previous time step, so the result
+    is the same as calling _adaptSynapses once per rule and time step.
+
+    @param activeCells (numpy array) Indices of the newly active cells
+    @param predictedActiveInput (numpy array) Indices of the predicted inputs
+    """
+    history = []
+    if self._synPermPreviousPredActiveInc != 0:
+      for i in xrange(1, self._historyLength + 1):
+        inputIndices = self._prePredictedActiveInput[self._historyIndex - i]
+        if len(inputIndices) > 0:
+          history.append(inputIndices)
+
+    # Cells whose permanences change
+    cells = activeCells
+    if self._synPermPredActiveInc != 0 and len(self._unionSDR) > 0:
+      cells = numpy.union1d(activeCells, self._unionSDR)
+    cells = numpy.asarray(cells, dtype=UINT_DTYPE)
+
+    # Spatial pooler learning rule changes
+    permChanges = self._learnPermChanges
+    permChanges.fill(-1 * self.getSynPermInactiveDec())
+    permChanges[predictedActiveInput] = self.getSynPermActiveInc()
+
+    for start in xrange(0, len(cells), _LEARN_BLOCK_SIZE):
+      self._learnBlock(cells[start:start + _LEARN_BLOCK_SIZE], activeCells,
+                       predictedActiveInput, history)
+
+
+  def _learnBlock(self, cells, activeCells, predictedActiveInput, history):
+    """
+    Applies the learning rules of _learn to a block of cells.
+    """
+    permanences = self._learnPermanences[:len(cells)]
+    potentials = self._learnPotentials[:len(cells)]
+    for row, cell in enumerate(cells):
+      self.getPermanence(cell, permanences[row])
+      self.getPotential(cell, potentials[row])
+    isPotential = self._learnIsPotential[:len(cells)]
+    numpy.greater(potentials, 0, out=isPotential)
+
+    activeRows = numpy.flatnonzero(numpy.in1d(cells, activeCells))
+
+    synPermMax = self.getSynPermMax()
+    synPermTrimThreshold = self.getSynPermTrimThreshold()
+
+    def clip(perm):
+      numpy.minimum(perm, synPermMax, out=perm)
+      perm[perm < synPermTrimThreshold] = 0
+      return perm
+
+    def increase(rows, inputIndices, synPermActiveInc):
+      if len(rows) == 0 or len(inputIndices) == 0:
+        return
+      block = numpy.ix_(rows, inputIndices)
+      perm = permanences[block]
+      perm += REAL_DTYPE(synPermActiveInc) * isPotential[block]
+      permanences[block] = clip(perm)
+
+    # 1. Spatial pooler learning rule
+    for row in activeRows:
+      numpy.add(permanences[row], self._learnPermChanges,
+                out=permanences[row], where=isPotential[row])
+      clip(permanences[row])
+
+    # 2. Hebbian learning for the union SDR
+    if self._synPermPredActiveInc != 0:
+      unionRows = numpy.flatnonzero(numpy.in1d(cells, self._unionSDR))
+      increase(unionRows, predictedActiveInput, self._synPermPredActiveInc)
+
+    # 3. Reinforcement learning from the previous time steps
+    for inputIndices in history:
+      increase(activeRows, inputIndices, self._synPermPreviousPredActiveInc)
+
+    for row, cell in enumerate(cells):
+      self._updatePermanencesForColumn(permanences[row], cell, raisePerm=False)
+
+
   def _decayPoolingActivation(self):
     """
     Decrements pooling activation of all cells
@@ -288,16 +442,18 @@ class UnionTemporalPooler(SpatialPooler):
     @return: a list of cell indices
     """
     poolingActivation = self._poolingActivation
-    nonZeroCells = numpy.argwhere(poolingActivation > 0)[:,0]
-
-    # include a tie-breaker before sorting
-    poolingActivationSubset = poolingActivation[nonZeroCells] + \
-                              self._poolingActivation_tieBreaker[nonZeroCells]
-    potentialUnionSDR = nonZeroCells[numpy.argsort(poolingActivationSubset)[::-1]]
-
-    topCells = potentialUnionSDR[0: self._maxUnionCells]
+    nonZeroCells = numpy.flatnonzero(poolingActivation > 0)
+
+    if len(nonZeroCells) > self._maxUnionCells > 0:
+      # include a tie-breaker before selecting the most active cells
+      poolingActivationSubset = poolingActivation[nonZeroCells] + \
+                                self._poolingActivation_tieBreaker[nonZeroCells]
+      topCells = nonZeroCells[numpy.argpartition(
+        -poolingActivationSubset, self._maxUnionCells - 1)[:self._maxUnionCells]]
+    else:
+      topCells = nonZeroCells[0: self._maxUnionCells]
 
-    if max(self._poolingTimer) > self._minHistory:
+    if self._poolingTimer.max() > self._minHistory:
       self._unionSDR = numpy.sort(topCells).astype(UINT_DTYPE)
     else:
       self._unionSDR = []
@@ -19,7 +19,17 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 
+import multiprocessing
+
 import numpy as np
+from scipy import sparse
+
+from htmresearch.support.forked_map import forkedMap
+
+# Squared euclidean distances below this fraction of the sum of the squared
+# norms are computed again from the differences of the vectors, because the
+# matrix products lose most of their digits to cancellation.
+_EUCLIDEAN_CANCELLATION_RATIO = 1e-4
 
 
 
@@ -71,6 +81,203 @@ def aligned_distances(sequence_embeddings_1, sequence_embeddings_2):
 
 
 
+def sequence_distance_matrices(sp_sequence_embeddings, tm_sequence_embeddings,
+                               assume_sequence_alignment, sp_w=1.0, tm_w=1.0,
+                               block_size=1024, n_jobs=1):
+  """
+  Vectorized equivalent of distance_matrix with sequence_distance as the
+  distance.
+
+  :param sp_sequence_embeddings: (np.array) SP sequence embeddings, shape
+    (nb_sequences, nb_chunks, sp_width)
+  :param tm_sequence_embeddings: (np.array) TM sequence embeddings, shape
+    (nb_sequences, nb_chunks, tm_width)
+  :param assume_sequence_alignment: (bool) see sequence_distance
+  :param block_size: (int) see pairwise_distances
+  :param n_jobs: (int) see pairwise_distances
+  :return: (tuple of np.array) SP, TM and combined distance matrices
+  """
+  if len(sp_sequence_embeddings) != len(tm_sequence_embeddings):
+    raise ValueError('The number of SP sequence embeddings (%s) is '
+                     'different from the number of TM sequence embeddings (%s)'
+                     % (len(sp_sequence_embeddings),
+                        len(tm_sequence_embeddings)))
+  col_mat = sequence_distance_matrix(sp_sequence_embeddings,
+                                     assume_sequence_alignment, block_size,
+                                     n_jobs)
+  cell_mat = sequence_distance_matrix(tm_sequence_embeddings,
+                                      assume_sequence_alignment, block_size,
+                                      n_jobs)
+  combined_mat = (tm_w * col_mat + sp_w * cell_mat) / (tm_w + sp_w)
+  return col_mat, cell_mat, combined_mat
+
+
+
+def sequence_distance_matrix(sequence_embeddings, assume_sequence_alignment,
+                             block_size=1024, n_jobs=1):
+  """
+  Pair-wise sequence_distance between sequence embeddings. Like
+  distance_matrix, entry (i, j) with i <= j is the distance from sequence i
+  to sequence j, mirrored to (j, i).
+
+  :param sequence_embeddings: (np.array or list of sparse matrices) shape
+    (nb_sequences, nb_chunks, sdr_width)
+  :param assume_sequence_alignment: (bool) see sequence_distance
+  :param block_size: (int) see pairwise_distances
+  :param n_jobs: (int) see pairwise_distances
+  :return: (np.array) distance matrix, shape (nb_sequences, nb_sequences)
+  """
+  nb_sequences = len(sequence_embeddings)
+  if nb_sequences == 0:
+    return np.zeros((0, 0), dtype=np.float64)
+  nb_chunks = sequence_embeddings[0].shape[0]
+
+  # Embeddings of chunk k of every sequence
+  chunks = [_chunk_rows(sequence_embeddings, k) for k in range(nb_chunks)]
+
+  chunk_dists = []
+  for k in range(nb_chunks):
+    if assume_sequence_alignment:
+      chunk_dists.append(pairwise_distances(chunks[k], chunks[k],
+                                            'euclidean', block_size, n_jobs))
+    else:
+      chunk_dists.append(np.min(
+        [pairwise_distances(chunks[k], chunks[l], 'euclidean', block_size,
+                            n_jobs)
+         for l in range(nb_chunks)], axis=0))
+  return _mirror_upper_triangle(np.mean(chunk_dists, axis=0))
+
+
+
+def pairwise_distances(X, Y=None, metric='overlap', block_size=1024,
+                       n_jobs=1):
+  """
+  Distances between all rows of X and all rows of Y, computed from sparse
+  matrix products, one block of rows of X at a time.
+
+  :param X: (np.array or sparse matrix) vectors, one per row
+  :param Y: (np.array or sparse matrix) vectors, one per row. If None, the
+    distances between the rows of X, with an exactly symmetric result.
+  :param metric: (str) one of:
+    - 'overlap': percent_overlap_distance
+    - 'cosine': 1 - cosine similarity, or 1 if either vector is zero
+    - 'euclidean': euclidian_distance. Pairs of near-identical vectors are
+      computed from their differences, so the distances agree with
+      euclidian_distance to a relative tolerance of 1e-10.
+  :param block_size: (int) number of rows of X per block, which bounds the
+    size of the intermediate dense products
+  :param n_jobs: (int) number of worker processes computing the blocks. -1
+    uses all the cores.
+  :return: (np.array) distance matrix, shape (len(X), len(Y))
+  """
+  if metric not in _ROW_STATISTICS:
+    raise ValueError('Invalid metric name: %s' % metric)
+
+  symmetric = Y is None
+  X = _as_csr(X)
+  Y = X if symmetric else _as_csr(Y)
+  if X.shape[1] != Y.shape[1]:
+    raise ValueError('X and Y have different widths: %s and %s'
+                     % (X.shape[1], Y.shape[1]))
+
+  inputs = (X, Y, Y.T.tocsr(), _ROW_STATISTICS[metric](X),
+            _ROW_STATISTICS[metric](Y), metric)
+  blocks = [(start, min(start + block_size, X.shape[0]))
+            for start in range(0, X.shape[0], block_size)]
+
+  if n_jobs < 0:
+    n_jobs = multiprocessing.cpu_count()
+  n_jobs = min(n_jobs, len(blocks))
+
+  results = list(forkedMap(_distance_block, inputs, blocks, n_jobs))
+
+  if len(results) == 0:
+    return np.zeros((0, Y.shape[0]), dtype=np.float64)
+  dists = np.vstack(results)
+
+  if symmetric:
+    if metric != 'overlap':
+      # The products of a row with itself can leave rounding errors
+      nonzero = np.flatnonzero(inputs[3] > 0)
+      dists[nonzero, nonzero] = 0
+    dists = _mirror_upper_triangle(dists)
+  return dists
+
+
+
+def _overlap_statistics(X):
+  return np.diff(X.indptr).astype(np.float64)
+
+
+
+def _euclidean_statistics(X):
+  return np.asarray(X.multiply(X).sum(axis=1), dtype=np.float64).ravel()
+
+
+
+def _cosine_statistics(X):
+  return np.sqrt(_euclidean_statistics(X))
+
+
+
+# Per-row statistic used by each metric: the number of nonzeros, the squared
+# norm, or the norm.
+_ROW_STATISTICS = {
+  'overlap': _overlap_statistics,
+  'euclidean': _euclidean_statistics,
+  'cosine': _cosine_statistics,
+}
+
+
+
+def _distance_block(inputs, block):
+  X, Y, Y_T, x_stats, y_stats, metric = inputs
+  start, stop = block
+  dots = (X[start:stop] * Y_T).toarray()
+  x_stats = x_stats[start:stop, np.newaxis]
+
+  if metric == 'euclidean':
+    squared = x_stats + y_stats - 2 * dots
+    rows, cols = np.nonzero(
+      squared < _EUCLIDEAN_CANCELLATION_RATIO * (x_stats + y_stats))
+    if len(rows) > 0:
+      squared[rows, cols] = _euclidean_statistics(X[rows + start] - Y[cols])
+    np.maximum(squared, 0, out=squared)
+    return np.sqrt(squared)
+
+  if metric == 'overlap':
+    denominators = np.sqrt(x_stats * y_stats)
+  else:
+    denominators = x_stats * y_stats
+  similarities = np.zeros_like(dots)
+  np.divide(dots, denominators, out=similarities, where=denominators > 0)
+  return 1 - similarities
+
+
+
+def _as_csr(X):
+  if sparse.issparse(X):
+    X = X.tocsr().astype(np.float64)
+  else:
+    X = sparse.csr_matrix(np.asarray(X, dtype=np.float64))
+  X.eliminate_zeros()
+  X.sort_indices()
+  return X
+
+
+
+def _chunk_rows(sequence_embeddings, k):
+  if sparse.issparse(sequence_embeddings[0]):
+    return sparse.vstack([e[k] for e in sequence_embeddings])
+  return np.asarray(sequence_embeddings)[:, k]
+
+
+
+def _mirror_upper_triangle(mat):
+  return np.triu(mat) + np.triu(mat, 1).T
+
+
+
 def distance_matrix(sp_sequence_embeddings,
                     tm_sequence_embeddings, distance, sp_w=1.0, tm_w=1.0):
   if len(sp_sequence_embeddings) != len(tm_sequence_embeddings):
@@ -179,6 +386,10 @@ def cluster_distance_matrix(sdr_clusters, distance_func):
   :return: distance matrix
   """
 
+  if distance_func in _VECTORIZED_DISTANCES:
+    return _vectorized_cluster_distance_matrix(
+      sdr_clusters, _VECTORIZED_DISTANCES[distance_func])
+
   cluster_dist = cluster_distance_factory(distance_func)
 
   num_clusters = len(sdr_clusters)
@@ -191,3 +402,30 @@ def cluster_distance_matrix(sdr_clusters, distance_func):
       distance_mat[j, i] = distance_mat[i, j]
 
   return distance_mat
+
+
+
+# Distances that pairwise_distances can compute for all pairs at once
+_VECTORIZED_DISTANCES = {
+  euclidian_distance: 'euclidean',
+  percent_overlap_distance: 'overlap',
+}
+
+
+
+def _vectorized_cluster_distance_matrix(sdr_clusters, metric):
+  """
+  cluster_distance_matrix for a distance supported by pairwise_distances.
+  The distance between two clusters is the distance between their centroids,
+  or 0 if either cluster is empty.
+  """
+  centroids = [np.sum(c, axis=0) / float(len(c)) for c in sdr_clusters
+               if len(c) > 0]
+  non_empty = np.array([len(c) > 0 for c in sdr_clusters], dtype=bool)
+
+  distance_mat = np.zeros((len(sdr_clusters), len(sdr_clusters)),
+                          dtype=np.float64)
+  if len(centroids) > 0:
+    distance_mat[np.ix_(non_empty, non_empty)] = pairwise_distances(
+      np.array(centroids), metric=metric)
+  return distance_mat
@@ -29,6 +29,10 @@ import numpy as np
 
 
 def load_sdrs(file_path, sp_output_width, tm_output_width):
+  """
+  Load a sequence-indexed trace CSV with dense SDRs. For large traces, use
+  htmresearch.frameworks.capybara.sparse_trace instead.
+  """
   return pd.read_csv(file_path, converters={
     'spActiveColumns': sdr_converter_factory(sp_output_width),
     'tmPredictedActiveCells': sdr_converter_factory(tm_output_width)})
@@ -38,12 +42,10 @@ def load_sdrs(file_path, sp_output_width, tm_output_width):
 def sdr_converter_factory(sdr_width):
   def convert_sdr(patternNZ_strings):
     patternNZs = json.loads(patternNZ_strings)
-    sdrs = []
-    for patternNZ in patternNZs:
-      sdr = np.zeros(sdr_width)
-      sdr[patternNZ] = 1
-      sdrs.append(sdr.tolist())
-    return np.array(sdrs)
+    sdrs = np.zeros((len(patternNZs), sdr_width))
+    for i, patternNZ in enumerate(patternNZs):
+      sdrs[i, patternNZ] = 1
+    return sdrs
 
 
   return convert_sdr
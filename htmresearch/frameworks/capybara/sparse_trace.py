@@ -0,0 +1,417 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Sparse, streaming access to network traces.
+
+Trace CSVs store the active indices of each SDR as JSON, in one of two
+layouts:
+  - sequence-indexed: one row per sequence. Each SDR column holds one list of
+    active indices per timestep. This is what load_sdrs reads.
+  - time-indexed: one row per timestep. Each SDR column holds one list of
+    active indices.
+
+iter_sparse_sequences streams either layout one sequence at a time, with each
+SDR column as a scipy.sparse CSR matrix of shape (num_steps, sdr_width), so
+no dense SDR is ever created. The other columns of the trace are returned as
+fields. By default these are only the scalar columns, such as the label:
+list-valued columns, such as SDRs that weren't requested, are skipped.
+
+convert_trace parses a trace CSV once and writes it to a directory of flat
+binary arrays. SparseTrace opens that directory with memory maps, so later
+analysis runs need no parsing and only read the steps they use.
+"""
+
+import csv
+import itertools
+import json
+import os
+import sys
+
+import numpy as np
+from scipy import sparse
+
+TRACE_METADATA_FILE = 'trace.json'
+
+
+
+def iter_sparse_sequences(file_path, sdr_widths, time_indexed=False,
+                          sequence_field=None, chunk_size=1000,
+                          field_names=None):
+  """
+  Stream the sequences of a trace CSV.
+
+  :param file_path: (str) path to the trace CSV
+  :param sdr_widths: (dict) width of each SDR column to load. E.g:
+    {'spActiveColumns': 2048, 'tmPredictedActiveCells': 65536}
+  :param time_indexed: (bool) whether the trace has one row per timestep
+    rather than one row per sequence
+  :param sequence_field: (str) for time-indexed traces, the column whose
+    changes delimit the sequences. E.g: 'label'
+  :param chunk_size: (int) for time-indexed traces without a sequence_field,
+    the number of timesteps of each yielded chunk
+  :param field_names: (list) the non-SDR columns to return as fields. E.g:
+    ['label']. Defaults to the columns whose value in the first row is not a
+    list.
+  :return: (generator) yields (fields, sdrs) for each sequence. fields is a
+    dict with the values of the field columns; for time-indexed traces each
+    value is the list of values of the sequence's timesteps. sdrs is a dict
+    with a CSR matrix of shape (num_steps, sdr_width) for each SDR column.
+  """
+  for fields, active_indices in _iter_active_indices(
+      file_path, sdr_widths.keys(), time_indexed, sequence_field, chunk_size,
+      field_names):
+    sdrs = dict((name, _to_csr(indices, lengths, sdr_widths[name]))
+                for name, (indices, lengths) in active_indices.iteritems())
+    yield fields, sdrs
+
+
+
+def convert_trace(file_path, trace_dir, sdr_widths, time_indexed=False,
+                  sequence_field=None, chunk_size=1000, field_names=None):
+  """
+  Convert a trace CSV to the binary format read by SparseTrace.
+
+  :param file_path: (str) path to the trace CSV
+  :param trace_dir: (str) output directory
+  :param sdr_widths: (dict) width of each SDR column to convert
+  :param time_indexed: (bool) see iter_sparse_sequences
+  :param sequence_field: (str) see iter_sparse_sequences
+  :param chunk_size: (int) see iter_sparse_sequences
+  :param field_names: (list) see iter_sparse_sequences
+  :return num_sequences: (int) number of sequences written
+  """
+  writer = SparseTraceWriter(trace_dir, sdr_widths)
+  try:
+    for fields, active_indices in _iter_active_indices(
+        file_path, sdr_widths.keys(), time_indexed, sequence_field,
+        chunk_size, field_names):
+      writer.write_sequence(fields, active_indices)
+  finally:
+    writer.close()
+  return writer.num_sequences
+
+
+
+class SparseTraceWriter(object):
+  """
+  Writes sequences of SDRs to a trace directory.
+
+  For each SDR column, the directory has '<column>.indices.bin', the active
+  indices of all timesteps (int32), and '<column>.indptr.bin', the offset of
+  each timestep in the indices (int64, one more than the number of
+  timesteps). 'sequence_starts.bin' has the first timestep of each sequence
+  (int64, one more than the number of sequences). The SDR widths and the
+  other fields of each sequence are in 'trace.json'.
+  """
+
+
+  def __init__(self, trace_dir, sdr_widths):
+    """
+    :param trace_dir: (str) output directory, created if needed
+    :param sdr_widths: (dict) width of each SDR column
+    """
+    if not os.path.exists(trace_dir):
+      os.makedirs(trace_dir)
+
+    self.trace_dir = trace_dir
+    self.sdr_widths = dict(sdr_widths)
+    self.num_sequences = 0
+    self.num_steps = 0
+    self._fields = []
+    self._num_indices = dict((name, 0) for name in sdr_widths)
+
+    self._indices_files = {}
+    self._indptr_files = {}
+    for name in sdr_widths:
+      self._indices_files[name] = open(
+        os.path.join(trace_dir, '%s.indices.bin' % name), 'wb')
+      self._indptr_files[name] = open(
+        os.path.join(trace_dir, '%s.indptr.bin' % name), 'wb')
+      np.zeros(1, dtype='int64').tofile(self._indptr_files[name])
+
+    self._sequence_starts_file = open(
+      os.path.join(trace_dir, 'sequence_starts.bin'), 'wb')
+    np.zeros(1, dtype='int64').tofile(self._sequence_starts_file)
+
+
+  def write_sequence(self, fields, active_indices):
+    """
+    Append a sequence.
+
+    :param fields: (dict) the values of the non-SDR columns, JSON serializable
+    :param active_indices: (dict) for each SDR column, a tuple (indices,
+      lengths) with the concatenated active indices of all timesteps and the
+      number of active indices of each timestep
+    """
+    num_steps = None
+    for name in self.sdr_widths:
+      indices, lengths = active_indices[name]
+      indices = np.asarray(indices, dtype='int32')
+      lengths = np.asarray(lengths, dtype='int64')
+      if num_steps is None:
+        num_steps = len(lengths)
+      elif len(lengths) != num_steps:
+        raise ValueError('SDR columns have different numbers of timesteps in '
+                         'sequence %d' % self.num_sequences)
+
+      indices.tofile(self._indices_files[name])
+      (self._num_indices[name] + np.cumsum(lengths)).tofile(
+        self._indptr_files[name])
+      self._num_indices[name] += len(indices)
+
+    self.num_steps += num_steps or 0
+    self.num_sequences += 1
+    np.array([self.num_steps], dtype='int64').tofile(
+      self._sequence_starts_file)
+    self._fields.append(fields)
+
+
+  def close(self):
+    """
+    Flush the arrays and write the metadata.
+    """
+    for f in (self._indices_files.values() + self._indptr_files.values() +
+              [self._sequence_starts_file]):
+      f.close()
+
+    with open(os.path.join(self.trace_dir, TRACE_METADATA_FILE), 'wb') as f:
+      json.dump({'sdr_widths': self.sdr_widths,
+                 'num_sequences': self.num_sequences,
+                 'num_steps': self.num_steps,
+                 'fields': self._fields}, f)
+
+
+
+class SparseTrace(object):
+  """
+  Read-only, memory-mapped access to a trace directory written by
+  convert_trace or SparseTraceWriter.
+  """
+
+
+  def __init__(self, trace_dir):
+    """
+    :param trace_dir: (str) trace directory
+    """
+    with open(os.path.join(trace_dir, TRACE_METADATA_FILE), 'rb') as f:
+      metadata = json.load(f)
+
+    self.trace_dir = trace_dir
+    self.sdr_widths = dict((str(name), width) for name, width
+                           in metadata['sdr_widths'].iteritems())
+    self.fields = metadata['fields']
+    self.num_steps = metadata['num_steps']
+
+    self._sequence_starts = _open_array(
+      os.path.join(trace_dir, 'sequence_starts.bin'), 'int64')
+    self._indices = {}
+    self._indptr = {}
+    for name in self.sdr_widths:
+      self._indices[name] = _open_array(
+        os.path.join(trace_dir, '%s.indices.bin' % name), 'int32')
+      self._indptr[name] = _open_array(
+        os.path.join(trace_dir, '%s.indptr.bin' % name), 'int64')
+
+
+  def __len__(self):
+    return len(self._sequence_starts) - 1
+
+
+  def get_steps(self, column, start, stop):
+    """
+    :param column: (str) SDR column
+    :param start: (int) first timestep
+    :param stop: (int) timestep after the last one
+    :return: (csr_matrix) the SDRs of the timesteps, shape
+      (stop - start, sdr_width)
+    """
+    indptr = self._indptr[column][start:stop + 1]
+    indices = self._indices[column][indptr[0]:indptr[-1]]
+    return sparse.csr_matrix(
+      (np.ones(len(indices), dtype='float32'), indices, indptr - indptr[0]),
+      shape=(stop - start, self.sdr_widths[column]))
+
+
+  def get_active_indices(self, column, step):
+    """
+    :param column: (str) SDR column
+    :param step: (int) timestep
+    :return: (array) active indices of the SDR at that timestep
+    """
+    indptr = self._indptr[column]
+    return self._indices[column][indptr[step]:indptr[step + 1]]
+
+
+  def get_sequence(self, column, sequence_idx):
+    """
+    :param column: (str) SDR column
+    :param sequence_idx: (int) index of the sequence
+    :return: (csr_matrix) the SDRs of the sequence, shape
+      (num_steps, sdr_width)
+    """
+    return self.get_steps(column, self._sequence_starts[sequence_idx],
+                          self._sequence_starts[sequence_idx + 1])
+
+
+  def iter_sequences(self, columns=None):
+    """
+    :param columns: (list) SDR columns to read. Defaults to all of them.
+    :return: (generator) yields (fields, sdrs) for each sequence, like
+      iter_sparse_sequences
+    """
+    if columns is None:
+      columns = self.sdr_widths.keys()
+    for sequence_idx in xrange(len(self)):
+      sdrs = dict((column, self.get_sequence(column, sequence_idx))
+                  for column in columns)
+      yield self.fields[sequence_idx], sdrs
+
+
+  def iter_chunks(self, column, chunk_size):
+    """
+    :param column: (str) SDR column
+    :param chunk_size: (int) number of timesteps per chunk
+    :return: (generator) yields the SDRs of consecutive timesteps as CSR
+      matrices, regardless of sequence boundaries
+    """
+    for start in xrange(0, self.num_steps, chunk_size):
+      yield self.get_steps(column, start,
+                           min(start + chunk_size, self.num_steps))
+
+
+
+def _open_array(file_path, dtype):
+  # np.memmap can't map empty files
+  if os.path.getsize(file_path) == 0:
+    return np.zeros(0, dtype=dtype)
+  return np.memmap(file_path, dtype=dtype, mode='r')
+
+
+
+def _to_csr(indices, lengths, sdr_width):
+  indptr = np.zeros(len(lengths) + 1, dtype='int64')
+  np.cumsum(lengths, out=indptr[1:])
+  return sparse.csr_matrix(
+    (np.ones(len(indices), dtype='float32'), indices, indptr),
+    shape=(len(lengths), sdr_width))
+
+
+
+def _iter_active_indices(file_path, sdr_columns, time_indexed, sequence_field,
+                         chunk_size, field_names):
+  """
+  Stream a trace CSV as (fields, {column: (indices, lengths)}) per sequence.
+  """
+  csv.field_size_limit(sys.maxsize)
+
+  with open(file_path, 'rb') as f:
+    reader = csv.reader(f)
+    headers = reader.next()
+
+    if field_names is None:
+      first_row = next(reader, None)
+      if first_row is None:
+        return
+      reader = itertools.chain([first_row], reader)
+      field_names = [name for name, text in zip(headers, first_row)
+                     if name not in sdr_columns and not _is_list(text)]
+
+    columns = set(sdr_columns) | set(field_names)
+    if sequence_field is not None:
+      columns.add(sequence_field)
+    missing = columns - set(headers)
+    if missing:
+      raise ValueError('Missing columns in %s: %s'
+                       % (file_path, sorted(missing)))
+
+    sdr_positions = [(name, headers.index(name)) for name in sdr_columns]
+    field_positions = [(name, headers.index(name)) for name in field_names]
+    if sequence_field is not None:
+      sequence_position = headers.index(sequence_field)
+
+    if not time_indexed:
+      for row in reader:
+        fields = dict((name, _parse_value(row[i]))
+                      for name, i in field_positions)
+        active_indices = {}
+        for name, i in sdr_positions:
+          steps = _parse_value(row[i]) or []
+          active_indices[name] = _concatenate_steps(steps)
+        yield fields, active_indices
+      return
+
+    sequence = None
+    sequence_key = None
+    for row in reader:
+      fields = [(name, _parse_value(row[i])) for name, i in field_positions]
+      if sequence_field is None:
+        key = None
+        boundary = sequence is not None and sequence[2] >= chunk_size
+      else:
+        key = _parse_value(row[sequence_position])
+        boundary = sequence is not None and key != sequence_key
+
+      if boundary:
+        yield _finish_sequence(sequence)
+        sequence = None
+
+      if sequence is None:
+        sequence = (dict((name, []) for name, _ in field_positions),
+                    dict((name, []) for name, _ in sdr_positions), 0)
+        sequence_key = key
+
+      for name, value in fields:
+        sequence[0][name].append(value)
+      for name, i in sdr_positions:
+        sequence[1][name].append(_parse_value(row[i]) or [])
+      sequence = (sequence[0], sequence[1], sequence[2] + 1)
+
+    if sequence is not None:
+      yield _finish_sequence(sequence)
+
+
+
+def _finish_sequence(sequence):
+  fields, steps, _ = sequence
+  return fields, dict((name, _concatenate_steps(column_steps))
+                      for name, column_steps in steps.iteritems())
+
+
+
+def _concatenate_steps(steps):
+  lengths = np.array([len(step) for step in steps], dtype='int64')
+  if lengths.sum() == 0:
+    return np.zeros(0, dtype='int32'), lengths
+  return np.concatenate([np.asarray(step, dtype='int32')
+                         for step in steps]), lengths
+
+
+
+def _parse_value(text):
+  if text == '':
+    return None
+  return json.loads(text)
+
+
+
+def _is_list(text):
+  return text.lstrip().startswith('[')
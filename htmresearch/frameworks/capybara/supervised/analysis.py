@@ -23,7 +23,7 @@ import os
 import time
 
 from htmresearch.frameworks.capybara.distance import \
-  distance_matrix, sequence_distance, reshaped_sequence_distance
+  sequence_distance_matrices, reshaped_sequence_distance
 from htmresearch.frameworks.capybara.embedding import \
   convert_to_embeddings, reshape_embeddings
 from htmresearch.frameworks.capybara.sdr import load_sdrs
@@ -46,7 +46,7 @@ LOGGER = get_logger()
 
 def analyze_sdr_sequences(sdr_sequences_train, sdr_sequences_test, data_id,
                           nb_chunks, n_neighbors, tsne, aggregation, plot_dir,
-                          assume_sequence_alignment):
+                          assume_sequence_alignment, n_jobs=1):
   sdr_widths = {'sp': SP_OUT_WIDTH, 'tm': TM_OUT_WIDTH}
   accuracies = {cell_type: {} for cell_type in CELL_TYPES}
   dist_mats = {cell_type: {} for cell_type in CELL_TYPES}
@@ -78,9 +78,10 @@ def analyze_sdr_sequences(sdr_sequences_train, sdr_sequences_test, data_id,
     check_shape(y[phase], (nb_sequences,))
 
     # Compute distance matrix.
-    distance = lambda a, b: sequence_distance(a, b, assume_sequence_alignment)
-    dist_mats['sp'][phase], dist_mats['tm'][phase], _ = distance_matrix(
-      embeddings['sp'][phase], embeddings['tm'][phase], distance)
+    dist_mats['sp'][phase], dist_mats['tm'][phase], _ = \
+      sequence_distance_matrices(embeddings['sp'][phase],
+                                 embeddings['tm'][phase],
+                                 assume_sequence_alignment, n_jobs=n_jobs)
 
   # Step 2: Flatten the sequence embeddings to be able to classify each
   # sequence with a supervised classifier. The classifier uses the same
@@ -143,7 +144,7 @@ def analyze_sdr_sequences(sdr_sequences_train, sdr_sequences_test, data_id,
 
 
 def run_analysis(trace_dir, data_ids, chunks, n_neighbors, tsne, aggregations,
-                 plot_dir, assume_sequence_alignment):
+                 plot_dir, assume_sequence_alignment, n_jobs=1):
   if not os.path.exists(plot_dir): os.makedirs(plot_dir)
 
   tic = time.time()
@@ -163,7 +164,7 @@ def run_analysis(trace_dir, data_ids, chunks, n_neighbors, tsne, aggregations,
         accuracies = analyze_sdr_sequences(
           sdr_sequences['train'].copy(), sdr_sequences['test'].copy(), data_id,
           nb_chunks, n_neighbors, tsne, aggregation, plot_dir,
-          assume_sequence_alignment)
+          assume_sequence_alignment, n_jobs)
         for cell_type, train_test_acc in accuracies.items():
           for phase, acc in train_test_acc.items():
             LOGGER.info(indent(4) + '%s %s accuracy: %s /100'
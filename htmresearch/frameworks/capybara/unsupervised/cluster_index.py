@@ -0,0 +1,327 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+import numpy as np
+
+from htmresearch.frameworks.capybara.distance import \
+  euclidian_distance, percent_overlap_distance
+
+
+
+class ClusterCenterIndex(object):
+  def __init__(self, distance_func):
+    """
+    Incremental index over the centers of a set of clusters.
+
+    The centers are stored as the rows of one matrix, so that the distances
+    from a point to every center are computed at once. For each center, the
+    index also caches its nearest other center, so the closest pair of
+    clusters is found with one argmin, and it keeps the sum of all the
+    inter-center distances, so their average is available in constant time.
+
+    :param distance_func: (function) distance metric, "distance_func(c, p)"
+      where c and p are numpy arrays. The metric must be symmetric.
+      euclidian_distance and percent_overlap_distance are vectorized; any
+      other metric is evaluated one center at a time.
+    """
+    self.distance_func = distance_func
+    self._row_distances = _VECTORIZED_DISTANCES.get(distance_func,
+                                                    _generic_distances)
+
+    self._centers = np.zeros((0, 0), dtype=np.float64)
+    self._nnz = np.zeros(0, dtype=np.float64)
+    self._live = np.zeros(0, dtype=bool)
+    self._nn_dist = np.zeros(0, dtype=np.float64)
+    self._nn_row = np.zeros(0, dtype=np.int64)
+    self._order = np.zeros(0, dtype=np.int64)
+    self._last_changed = np.zeros(0, dtype=np.int64)
+
+    self._keys = []
+    self._row_of = {}
+    self._free_rows = []
+    self._num_added = 0
+    self._num_changes = 0
+    self._distance_sum = 0.0
+
+
+  def __len__(self):
+    return len(self._row_of)
+
+
+  def __contains__(self, key):
+    return key in self._row_of
+
+
+  def add(self, key, center):
+    """
+    Add a cluster center to the index.
+
+    :param key: (hashable) key of the cluster, e.g. the Cluster itself
+    :param center: (np.array) center of the cluster
+    :raise: (ValueError) raise error if the key is already in the index
+    """
+    if key in self._row_of:
+      raise ValueError('Cluster %s is already indexed' % key)
+    center = self._as_center(center)
+    row = self._allocate_row()
+    self._keys[row] = key
+    self._row_of[key] = row
+    self._order[row] = self._num_added
+    self._num_added += 1
+    self._attach(row, center)
+
+
+  def update(self, key, center):
+    """
+    Update the center of a cluster, e.g. after points were added or another
+    cluster was merged into it.
+
+    :param key: (hashable) key of the cluster
+    :param center: (np.array) new center of the cluster
+    """
+    center = self._as_center(center)
+    row = self._row_of[key]
+    self._detach(row)
+    self._attach(row, center)
+
+
+  def remove(self, key):
+    """
+    Remove a cluster from the index.
+
+    :param key: (hashable) key of the cluster
+    """
+    row = self._row_of.pop(key)
+    self._detach(row)
+    self._keys[row] = None
+    self._free_rows.append(row)
+
+
+  def resize(self, dim):
+    """
+    Pad every center with zeros up to a new dimension.
+
+    :param dim: (int) new dimension of the centers
+    """
+    if dim > self._centers.shape[1]:
+      centers = np.zeros((len(self._centers), dim), dtype=np.float64)
+      centers[:, :self._centers.shape[1]] = self._centers
+      self._centers = centers
+
+
+  def distances(self, point, keys=None):
+    """
+    Distances from a point to cluster centers.
+
+    :param point: (np.array) point of interest
+    :param keys: (list) optional keys of the clusters to consider. Defaults to
+      all clusters, in the order they were added.
+    :return keys, distances: (list, np.array) the clusters and the distance
+      from each of their centers to the point.
+    """
+    if keys is None:
+      rows = np.flatnonzero(self._live)
+      rows = rows[np.argsort(self._order[rows], kind='mergesort')]
+    else:
+      rows = np.array([self._row_of[k] for k in keys], dtype=np.int64)
+    distances = self._row_distances(self, rows, self._as_center(point))
+    return [self._keys[r] for r in rows], distances
+
+
+  def closest(self, point, keys=None):
+    """
+    Find the closest cluster to a point.
+
+    :param point: (np.array) point of interest
+    :param keys: (list) optional keys of the clusters to consider
+    :return average_distance, distance_to_closest, closest: (float, float,
+      hashable) average distance between the point and the cluster centers,
+      distance to the closest center, and key of the closest cluster. All
+      None if there are no clusters.
+    """
+    keys, distances = self.distances(point, keys)
+    if len(keys) == 0:
+      return None, None, None
+    closest = np.argmin(distances)
+    return np.mean(distances), distances[closest], keys[closest]
+
+
+  def closest_pair(self):
+    """
+    Find the two closest clusters.
+
+    :return distance, key1, key2: (float, hashable, hashable) distance between
+      the two closest clusters and their keys, the one added or updated least
+      recently coming first. All None if there are fewer than two clusters.
+    """
+    if len(self._row_of) < 2:
+      return None, None, None
+    row = np.argmin(self._nn_dist)
+    other = self._nn_row[row]
+    if self._last_changed[other] < self._last_changed[row]:
+      row, other = other, row
+    return self._nn_dist[row], self._keys[row], self._keys[other]
+
+
+  def average_distance(self):
+    """
+    Average distance between the cluster centers.
+
+    :return average_distance: (float) average distance between clusters, or
+      0.0 if there are fewer than two clusters.
+    """
+    n = len(self._row_of)
+    if n < 2:
+      return 0.0
+    return self._distance_sum / (n * (n - 1) / 2.0)
+
+
+  def _as_center(self, center):
+    center = np.asarray(center, dtype=np.float64).ravel()
+    if len(center) > self._centers.shape[1]:
+      self.resize(len(center))
+    if len(center) < self._centers.shape[1]:
+      center = np.append(center, np.zeros(self._centers.shape[1] -
+                                          len(center)))
+    return center
+
+
+  def _allocate_row(self):
+    if len(self._free_rows) > 0:
+      return self._free_rows.pop()
+
+    row = len(self._keys)
+    self._keys.append(None)
+    if row >= len(self._centers):
+      capacity = max(2 * len(self._centers), 64)
+      centers = np.zeros((capacity, self._centers.shape[1]), dtype=np.float64)
+      centers[:row] = self._centers
+      self._centers = centers
+      self._nnz = _resize(self._nnz, capacity, 0)
+      self._live = _resize(self._live, capacity, False)
+      self._nn_dist = _resize(self._nn_dist, capacity, np.inf)
+      self._nn_row = _resize(self._nn_row, capacity, -1)
+      self._order = _resize(self._order, capacity, 0)
+      self._last_changed = _resize(self._last_changed, capacity, 0)
+    return row
+
+
+  def _live_distances(self, live_rows, center):
+    """
+    Distances from a center to the centers in live_rows. When most rows are
+    live, it's cheaper to compute the distances to all the rows in place than
+    to gather the live ones first.
+    """
+    num_rows = len(self._keys)
+    if 2 * len(live_rows) < num_rows:
+      return self._row_distances(self, live_rows, center)
+    return self._row_distances(self, slice(0, num_rows), center)[live_rows]
+
+
+  def _attach(self, row, center):
+    """
+    Store a center and update the cached distances.
+    """
+    self._centers[row] = center
+    self._nnz[row] = np.count_nonzero(center)
+    self._last_changed[row] = self._num_changes
+    self._num_changes += 1
+
+    others = np.flatnonzero(self._live)
+    self._live[row] = True
+    if len(others) == 0:
+      return
+
+    distances = self._live_distances(others, center)
+    self._distance_sum += distances.sum()
+
+    nearest = np.argmin(distances)
+    self._nn_dist[row] = distances[nearest]
+    self._nn_row[row] = others[nearest]
+
+    improved = distances < self._nn_dist[others]
+    self._nn_dist[others[improved]] = distances[improved]
+    self._nn_row[others[improved]] = row
+
+
+  def _detach(self, row):
+    """
+    Take a center out of the cached distances, leaving its row unused.
+    """
+    self._live[row] = False
+    self._nn_dist[row] = np.inf
+    self._nn_row[row] = -1
+
+    others = np.flatnonzero(self._live)
+    if len(others) == 0:
+      self._distance_sum = 0.0
+      return
+
+    distances = self._live_distances(others, self._centers[row])
+    self._distance_sum -= distances.sum()
+
+    for other in others[self._nn_row[others] == row]:
+      self._nn_dist[other] = np.inf
+      self._nn_row[other] = -1
+      candidates = others[others != other]
+      if len(candidates) > 0:
+        candidate_distances = self._row_distances(self, candidates,
+                                                  self._centers[other])
+        nearest = np.argmin(candidate_distances)
+        self._nn_dist[other] = candidate_distances[nearest]
+        self._nn_row[other] = candidates[nearest]
+
+
+
+def _euclidean_distances(index, rows, point):
+  diff = index._centers[rows] - point
+  return np.sqrt(np.einsum('ij,ij->i', diff, diff))
+
+
+
+def _overlap_distances(index, rows, point):
+  norms = np.sqrt(index._nnz[rows] * np.count_nonzero(point))
+  overlaps = index._centers[rows].dot(point)
+  pct_overlaps = np.zeros(len(overlaps), dtype=np.float64)
+  np.divide(overlaps, norms, out=pct_overlaps, where=norms > 0)
+  return 1 - pct_overlaps
+
+
+
+def _generic_distances(index, rows, point):
+  return np.array([index.distance_func(center, point)
+                   for center in index._centers[rows]], dtype=np.float64)
+
+
+
+def _resize(array, capacity, fill_value):
+  resized = np.empty(capacity, dtype=array.dtype)
+  resized[:len(array)] = array
+  resized[len(array):] = fill_value
+  return resized
+
+
+
+# Distances from a point to a set of centers, for the metrics that can be
+# computed on the whole center matrix at once.
+_VECTORIZED_DISTANCES = {
+  euclidian_distance: _euclidean_distances,
+  percent_overlap_distance: _overlap_distances,
+}
@@ -22,7 +22,9 @@
 import numpy as np
 
 from abc import ABCMeta, abstractmethod
-from queue import PriorityQueue
+
+from htmresearch.frameworks.capybara.unsupervised.cluster_index import \
+  ClusterCenterIndex
 
 
 
@@ -124,6 +126,8 @@ class ClusteringInterface(object):
     """
     self.distance_func = distance_func
     self.clusters = {}  # Keys are cluster IDs; Values are Clusters.
+    # Centers of the clusters, keyed by Cluster.
+    self.cluster_index = ClusterCenterIndex(distance_func)
 
 
   @abstractmethod
@@ -175,48 +179,19 @@ class ClusteringInterface(object):
 
   def merge_closest_clusters(self):
     """
-    Merge closest two clusters.
+    Merge closest two clusters. The cluster with the larger ID is merged into
+    the other one.
     """
-    inter_cluster_dists = PriorityQueue()
-
-    numClusters = len(self.clusters)
-    for i in range(numClusters):
-      for j in range(i + 1, numClusters):
-        c1 = self.clusters.values()[i]
-        c2 = self.clusters.values()[j]
-        d = self.distance_func(c1.center.value, c2.center.value)
-        inter_cluster_dists.put(InterClusterDist(c1, c2, d))
-
-    smallest_inter_cluster_dist = inter_cluster_dists.get()
-    cluster_to_merge = smallest_inter_cluster_dist.c2
-    smallest_inter_cluster_dist.c1.merge(cluster_to_merge)
+    _, c1, cluster_to_merge = self.cluster_index.closest_pair()
+    if cluster_to_merge.id < c1.id:
+      c1, cluster_to_merge = cluster_to_merge, c1
+    c1.merge(cluster_to_merge)
+    self.cluster_index.remove(cluster_to_merge)
+    self.cluster_index.update(c1, c1.center.value)
     del self.clusters[cluster_to_merge.id]
 
 
 
-class InterClusterDist(object):
-  """
-  Inter-cluster distance.
-
-  Useful to define cmp() for queue.PriorityQueue.
-  """
-
-
-  def __init__(self, c1, c2, c1_c2_dist):
-    self.c1 = c1
-    self.c2 = c2
-    self.dist = c1_c2_dist
-
-
-  def __cmp__(self, inter_cluster_dist):
-    return cmp(self.dist, inter_cluster_dist.dist)
-
-
-  def __str__(self):
-    return "InterClusterDist(%f)" % self.dist
-
-
-
 class OnlineClustering(ClusteringInterface):
   def __init__(self, distance_func, merge_threshold=3.15):
     """
@@ -279,25 +254,13 @@ class OnlineClustering(ClusteringInterface):
 
   def _average_cluster_distance(self):
     """
-    Average cluster distance between clusters.
+    Average cluster distance between clusters. The index keeps the sum of
+    the inter-cluster distances up to date, so this doesn't compute any
+    distance.
     
     :return average_distance: (float) average distance between clusters. 
     """
-    cluster_distances = []
-    cluster_ids = self.clusters.keys()
-
-    numClusters = len(cluster_ids)
-    for i in range(numClusters):
-      for j in range(i + 1, numClusters):
-        ci = self.clusters[cluster_ids[i]].center.value
-        cj = self.clusters[cluster_ids[j]].center.value
-        d = self.distance_func(ci, cj)
-        cluster_distances.append(d)
-
-    if len(cluster_distances) > 0:
-      return np.mean(cluster_distances)
-    else:
-      return 0.0
+    return self.cluster_index.average_distance()
 
 
   def _add_or_merge_cluster(self, cluster, merge_threshold):
@@ -316,6 +279,7 @@ class OnlineClustering(ClusteringInterface):
      closest) = self._find_closest_cluster(cluster.center)
     if closest and distance_to_closest < merge_threshold:
       closest.merge(cluster)
+      self.cluster_index.update(closest, closest.center.value)
     else:
       self._add_cluster(cluster)
 
@@ -330,6 +294,7 @@ class OnlineClustering(ClusteringInterface):
     if cluster.id in self.clusters:
       raise ValueError('Cluster ID %s already exists' % cluster.id)
     self.clusters[cluster.id] = cluster
+    self.cluster_index.add(cluster, cluster.center.value)
 
 
   def _find_closest_cluster(self, point):
@@ -343,21 +308,7 @@ class OnlineClustering(ClusteringInterface):
       center and point.
     :return closest: (Cluster) closest cluster to point.
     """
-    distance_cluster_pairs = []
-    for cluster in self.clusters.values():
-      d = self.distance_func(cluster.center.value, point.value)
-      distance_cluster_pairs.append((d, cluster))
-    if len(distance_cluster_pairs) > 0:
-      cluster_distances = [d[0] for d in distance_cluster_pairs]
-      min_dist_idx = np.argmin(cluster_distances)
-
-      # Get the closest cluster and some other useful distance metrics.
-      average_cluster_distances = np.mean(cluster_distances)
-      distance_to_closest = distance_cluster_pairs[min_dist_idx][0]
-      closest = distance_cluster_pairs[min_dist_idx][1]
-      return average_cluster_distances, distance_to_closest, closest
-    else:
-      return None, None, None
+    return self.cluster_index.closest(point.value)
 
 
   @staticmethod
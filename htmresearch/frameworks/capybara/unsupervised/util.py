@@ -3,9 +3,11 @@ from collections import OrderedDict
 import numpy as np
 from matplotlib import colors
 from matplotlib import pyplot as plt
+from scipy import sparse
 
+from htmresearch.frameworks.capybara.distance import pairwise_distances
 from htmresearch.frameworks.capybara.unsupervised.cluster_distance import \
-  percentOverlap, clusterDist
+  clusterDist
 
 
 
@@ -26,13 +28,27 @@ def computeDistanceMat(sdrs):
   :param sdrs: (array of arrays) array of SDRs
   :return: distance matrix
   """
-  numSDRs = len(sdrs)
+  if len(sdrs) > 0 and type(sdrs[0]) is not np.ndarray:
+    # SDRs given as active indices. Like percentOverlap, the overlaps count
+    # each shared index once, but the SDR sizes include repeated indices.
+    indices = [sorted(set(sdr)) for sdr in sdrs]
+    indptr = np.cumsum([0] + [len(sdr) for sdr in indices])
+    flatIndices = np.array([i for sdr in indices for i in sdr], dtype='int64')
+    width = flatIndices.max() + 1 if len(flatIndices) > 0 else 1
+    activeBits = sparse.csr_matrix(
+      (np.ones(len(flatIndices)), flatIndices, indptr),
+      shape=(len(indices), width))
+    sizes = np.array([len(sdr) for sdr in sdrs], dtype=np.float64)
+
+    overlaps = (activeBits * activeBits.T).toarray()
+    denominators = np.sqrt(np.outer(sizes, sizes))
+    percentOverlaps = np.zeros_like(overlaps)
+    np.divide(overlaps, denominators, out=percentOverlaps,
+              where=denominators > 0)
+    return 1 - percentOverlaps
+
   # calculate pairwise distance
-  distanceMat = np.zeros((numSDRs, numSDRs), dtype=np.float64)
-  for i in range(numSDRs):
-    for j in range(numSDRs):
-      distanceMat[i, j] = 1 - percentOverlap(sdrs[i], sdrs[j])
-  return distanceMat
+  return pairwise_distances(np.array(sdrs), metric='overlap')
 
 
 
@@ -29,7 +29,6 @@ is identical to the use of its superclass.
 import pprint
 import random
 
-from nupic.bindings.math import SparseMatrix
 from htmresearch.support.register_regions import registerAllResearchRegions
 from htmresearch.frameworks.layers.laminar_network import createNetwork
 from htmresearch.frameworks.layers.l2_l4_inference import L4L2Experiment
@@ -130,12 +129,11 @@ class L4TMExperiment(L4L2Experiment):
     self.L4Columns = [region.getSelf() for region in self.L4Regions]
     self.L2Columns = [region.getSelf() for region in self.L2Regions]
     self.TMColumns = [region.getSelf() for region in self.TMRegions]
+    self.columnRunner = None
+    self.phaseProfilingEnabled = False
 
     # will be populated during training
     self.objectL2Representations = {}
-    self.objectL2RepresentationsMatrices = [
-      SparseMatrix(0, self.config["L2Params"]["cellCount"])
-      for _ in xrange(self.numColumns)]
     self.objectNameToIndex = {}
     self.statistics = []
 
@@ -61,6 +61,8 @@ import matplotlib.pyplot as plt
 from tabulate import tabulate
 
 from htmresearch.support.logging_decorator import LoggingDecorator
+from htmresearch.support.phase_profiler import (PhaseProfiler, mergeStats,
+                                                formatStats)
 from htmresearch.support.register_regions import registerAllResearchRegions
 from htmresearch.frameworks.layers.laminar_network import createNetwork
 
@@ -170,6 +172,7 @@ class L2456Model(object):
     # create network and retrieve regions
     self.network = createNetwork(self.config)
     self._retrieveRegions()
+    self.phaseProfilingEnabled = False
 
     # will be populated during training
     self.objectRepresentationsL2 = {}
@@ -462,15 +465,88 @@ class L2456Model(object):
     print "Total time in L2 =", L2Time
     print "Total time in L4 =", L4Time
 
+    if self.phaseProfilingEnabled:
+      for layer, stats in sorted(self.getPhaseProfile().iteritems()):
+        print
+        print "Phases of {} (all columns)".format(layer)
+        print formatStats(stats)
+
     if reset:
       self.resetProfile()
 
 
   def resetProfile(self):
     """
-    Resets the network profiling.
+    Resets the network profiling, and the phase profiling if it's enabled.
     """
     self.network.resetProfiling()
+    if self.phaseProfilingEnabled:
+      for algorithms in self._getPhaseProfiledAlgorithms().itervalues():
+        for algorithm in algorithms:
+          algorithm.phaseProfiler.reset()
+
+
+  def enablePhaseProfiling(self):
+    """
+    Starts recording the time spent in each phase of the L2, L4, L5 and L6
+    algorithms, with the numbers of active and matching segments. The results
+    are included in printProfile, and are available from getPhaseProfile.
+    """
+    for algorithms in self._getPhaseProfiledAlgorithms().itervalues():
+      for algorithm in algorithms:
+        algorithm.setPhaseProfiler(PhaseProfiler())
+    self.phaseProfilingEnabled = True
+
+
+  def disablePhaseProfiling(self):
+    """
+    Stops recording the phase timings and discards them.
+    """
+    for algorithms in self._getPhaseProfiledAlgorithms().itervalues():
+      for algorithm in algorithms:
+        algorithm.setPhaseProfiler(None)
+    self.phaseProfilingEnabled = False
+
+
+  def getPhaseProfile(self, perColumn=False):
+    """
+    Returns the phase timings recorded since phase profiling was enabled or
+    the profile was reset.
+
+    @param   perColumn (bool)
+             If True, return a list with the stats of each column rather than
+             their combined stats.
+
+    @return  (dict)
+             Maps each layer to the stats of its algorithm, as returned by
+             PhaseProfiler.getStats
+    """
+    profile = {}
+    for layer, algorithms in self._getPhaseProfiledAlgorithms().iteritems():
+      stats = [algorithm.phaseProfiler.getStats() for algorithm in algorithms]
+      profile[layer] = stats if perColumn else mergeStats(stats)
+    return profile
+
+
+  def _getPhaseProfiledAlgorithms(self):
+    """
+    Returns a dict that maps each layer to the algorithm instances of its
+    columns that support phase profiling.
+    """
+    # The algorithms are created when the network is initialized.
+    self.network.initialize()
+
+    profiled = {}
+    for layer, columns, attribute in (("L2", self.L2Columns, "_pooler"),
+                                      ("L4", self.L4Columns, "_tm"),
+                                      ("L5", self.L5Columns, "_pooler"),
+                                      ("L6", self.L6Columns, "_tm")):
+      algorithms = [getattr(column, attribute) for column in columns]
+      algorithms = [algorithm for algorithm in algorithms
+                    if hasattr(algorithm, "setPhaseProfiler")]
+      if len(algorithms) > 0:
+        profiled[layer] = algorithms
+    return profiled
 
 
   def getL4Representations(self):
@@ -88,11 +88,16 @@ import matplotlib.pyplot as plt
 import numpy as np
 from tabulate import tabulate
 
-from nupic.bindings.math import SparseMatrix
-
 from htmresearch.support.logging_decorator import LoggingDecorator
+from htmresearch.support.phase_profiler import (PhaseProfiler, mergeStats,
+                                                formatStats)
 from htmresearch.support.register_regions import registerAllResearchRegions
+from htmresearch.support.sparse_region_io import getRegionOutputIndices
 from htmresearch.frameworks.layers.laminar_network import createNetwork
+from htmresearch.frameworks.layers.object_representation_index import (
+  IndexedObjectRepresentations)
+from htmresearch.frameworks.layers.parallel_column_runner import (
+  ParallelColumnRunner)
 
 
 
@@ -149,7 +154,9 @@ class L4L2Experiment(object):
                lateralSPOverrides=None,
                enableFeedForwardSP=False,
                feedForwardSPOverrides=None,
-               objectNamesAreIndices=False
+               objectNamesAreIndices=False,
+               sparseIO=False,
+               numWorkers=0
                ):
     """
     Creates the network.
@@ -223,6 +230,20 @@ class L4L2Experiment(object):
              integers. If False, object names can be strings, and indices will
              be assigned to each object name.
 
+    @param   sparseIO (bool)
+             If True, the sensors, L4 and L2 regions pass active indices to
+             each other rather than dense 0/1 arrays. The links still copy
+             arrays as wide as the populations. Can't be combined with
+             enableLateralSP or enableFeedForwardSP.
+
+    @param   numWorkers (int)
+             If greater than 1, the L4 and L2 regions of the columns are
+             computed in this many worker processes (see
+             ParallelColumnRunner). The results are identical to a serial run,
+             but the L4Columns and L2Columns region instances in this process
+             no longer hold the algorithm state, so use getL2Representations
+             etc., or columnRunner.callMethod, to inspect the columns.
+
     """
     # Handle logging - this has to be done first
     self.logCalls = logCalls
@@ -251,6 +272,7 @@ class L4L2Experiment(object):
       "L4RegionType": L4RegionType,
       "L4Params": self.getDefaultL4Params(inputSize, numExternalInputBits),
       "L2Params": self.getDefaultL2Params(inputSize, numInputBits),
+      "sparseIO": sparseIO,
     }
 
     if enableLateralSP:
@@ -308,11 +330,18 @@ class L4L2Experiment(object):
     self.L4Columns = [region.getSelf() for region in self.L4Regions]
     self.L2Columns = [region.getSelf() for region in self.L2Regions]
 
+    # compute the columns in worker processes, if requested
+    self.columnRunner = None
+    if numWorkers > 1:
+      self.columnRunner = ParallelColumnRunner(
+        self.network,
+        [region.name for region in self.L4Regions],
+        [region.name for region in self.L2Regions],
+        numWorkers)
+    self.phaseProfilingEnabled = False
+
     # will be populated during training
     self.objectL2Representations = {}
-    self.objectL2RepresentationsMatrices = [
-      SparseMatrix(0, self.config["L2Params"]["cellCount"])
-      for _ in xrange(self.numColumns)]
     self.objectNameToIndex = {}
     self.statistics = []
 
@@ -367,22 +396,22 @@ class L4L2Experiment(object):
       if len(sensationList) == 0:
         continue
 
-      # keep track of numbers of iterations to run
-      iterations = 0
-
-      for sensations in sensationList:
-        # learn each pattern multiple times
-        for _ in xrange(self.numLearningPoints):
-
-          for col in xrange(self.numColumns):
-            location, feature = sensations[col]
-            self.sensorInputs[col].addDataToQueue(list(feature), 0, 0)
-            self.externalInputs[col].addDataToQueue(list(location), 0, 0)
-          iterations += 1
+      # load the whole object into the sensors, learning each pattern
+      # multiple times
+      for col in xrange(self.numColumns):
+        locations = []
+        features = []
+        for sensations in sensationList:
+          location, feature = sensations[col]
+          locations.extend([location] * self.numLearningPoints)
+          features.extend([feature] * self.numLearningPoints)
+        self.sensorInputs[col].addDataBlockToQueue(features)
+        self.externalInputs[col].addDataBlockToQueue(locations)
 
       # actually learn the objects
+      iterations = len(sensationList) * self.numLearningPoints
       if iterations > 0:
-        self.network.run(iterations)
+        self._run(iterations)
 
       # update L2 representations
       self._saveL2Representation(objectName)
@@ -443,14 +472,15 @@ class L4L2Experiment(object):
         raise ValueError("The provided objectName was not given during"
                          " learning")
 
-    for sensations in sensationList:
+    # load all sensations into the sensors
+    for col in xrange(self.numColumns):
+      self.sensorInputs[col].addDataBlockToQueue(
+        [sensations[col][1] for sensations in sensationList])
+      self.externalInputs[col].addDataBlockToQueue(
+        [sensations[col][0] for sensations in sensationList])
 
-      # feed all columns with sensations
-      for col in xrange(self.numColumns):
-        location, feature = sensations[col]
-        self.sensorInputs[col].addDataToQueue(list(feature), 0, 0)
-        self.externalInputs[col].addDataToQueue(list(location), 0, 0)
-      self.network.run(1)
+    for _ in xrange(len(sensationList)):
+      self._run(1)
       self._updateInferenceStats(statistics, objectName)
 
     if reset:
@@ -470,26 +500,27 @@ class L4L2Experiment(object):
     """
     self.objectL2Representations[objectName] = self.getL2Representations()
 
-    try:
-      objectIndex = self.objectNameToIndex[objectName]
-    except KeyError:
-      # Grow the matrices as needed.
+    if objectName not in self.objectNameToIndex:
       if self.objectNamesAreIndices:
-        objectIndex = objectName
-        if objectIndex >= self.objectL2RepresentationsMatrices[0].nRows():
-          for matrix in self.objectL2RepresentationsMatrices:
-            matrix.resize(objectIndex + 1, matrix.nCols())
+        self.objectNameToIndex[objectName] = objectName
       else:
-        objectIndex = self.objectL2RepresentationsMatrices[0].nRows()
-        for matrix in self.objectL2RepresentationsMatrices:
-          matrix.resize(matrix.nRows() + 1, matrix.nCols())
+        self.objectNameToIndex[objectName] = len(self.objectNameToIndex)
 
-      self.objectNameToIndex[objectName] = objectIndex
 
-    for colIdx, matrix in enumerate(self.objectL2RepresentationsMatrices):
-      activeCells = self.L2Columns[colIdx]._pooler.getActiveCells()
-      matrix.setRowFromSparse(objectIndex, activeCells,
-                              np.ones(len(activeCells), dtype="float32"))
+  @property
+  def objectL2Representations(self):
+    """
+    The L2 representation of each learned object: a dict-like mapping from
+    object name to a list with one set of cells per column. It keeps an
+    inverted index from cells to objects (see IndexedObjectRepresentations).
+    """
+    return self._objectL2Representations
+
+
+  @objectL2Representations.setter
+  def objectL2Representations(self, representations):
+    self._objectL2Representations = IndexedObjectRepresentations(
+      self.numColumns, representations)
 
 
   def _sendReset(self, sequenceId=0):
@@ -499,7 +530,7 @@ class L4L2Experiment(object):
     for col in xrange(self.numColumns):
       self.sensorInputs[col].addResetToQueue(sequenceId)
       self.externalInputs[col].addResetToQueue(sequenceId)
-    self.network.run(1)
+    self._run(1)
 
 
   @LoggingDecorator()
@@ -510,6 +541,24 @@ class L4L2Experiment(object):
     self._sendReset(*args, **kwargs)
 
 
+  def close(self):
+    """
+    Stops the worker processes that compute the columns, if any. The
+    experiment can't be run after it is closed. Experiments can also be used
+    as context managers, which close them on exit.
+    """
+    if self.columnRunner is not None:
+      self.columnRunner.close()
+
+
+  def __enter__(self):
+    return self
+
+
+  def __exit__(self, excType, excValue, traceback):
+    self.close()
+
+
   def plotInferenceStats(self,
                          fields,
                          plotDir="plots",
@@ -633,22 +682,79 @@ class L4L2Experiment(object):
     print "Total time in L2 =", L2Time
     print "Total time in L4 =", L4Time
 
+    if self.phaseProfilingEnabled:
+      for layer, stats in sorted(self.getPhaseProfile().iteritems()):
+        print
+        print "Phases of {} (all columns)".format(layer)
+        print formatStats(stats)
+
     if reset:
       self.resetProfile()
 
 
   def resetProfile(self):
     """
-    Resets the network profiling.
+    Resets the network profiling, and the phase profiling if it's enabled.
     """
     self.network.resetProfiling()
+    if self.phaseProfilingEnabled:
+      for regions, algorithm in self._getPhaseProfiledRegions().itervalues():
+        self._callColumnMethod(regions, algorithm + ".phaseProfiler.reset")
+
+
+  def enablePhaseProfiling(self):
+    """
+    Starts recording the time spent in each phase of the L4 and L2 algorithms,
+    with the numbers of active and matching segments. The results are included
+    in printProfile, and are available from getPhaseProfile.
+
+    L4 regions whose implementation doesn't support phase profiling (e.g. the
+    C++ temporal memory) are left out.
+    """
+    for regions, algorithm in self._getPhaseProfiledRegions().itervalues():
+      for region in regions:
+        # Each column gets its own profiler, so that they can be compared.
+        self._callColumnMethod([region], algorithm + ".setPhaseProfiler",
+                               PhaseProfiler())
+    self.phaseProfilingEnabled = True
+
+
+  def disablePhaseProfiling(self):
+    """
+    Stops recording the phase timings and discards them.
+    """
+    for regions, algorithm in self._getPhaseProfiledRegions().itervalues():
+      self._callColumnMethod(regions, algorithm + ".setPhaseProfiler", None)
+    self.phaseProfilingEnabled = False
+
+
+  def getPhaseProfile(self, perColumn=False):
+    """
+    Returns the phase timings recorded since phase profiling was enabled or
+    the profile was reset.
+
+    @param   perColumn (bool)
+             If True, return a list with the stats of each column rather than
+             their combined stats.
+
+    @return  (dict)
+             Maps "L4" and "L2" to the stats of their algorithm, as returned by
+             PhaseProfiler.getStats
+    """
+    profile = {}
+    for layer, (regions, algorithm) in (
+        self._getPhaseProfiledRegions().iteritems()):
+      stats = self._callColumnMethod(regions,
+                                     algorithm + ".phaseProfiler.getStats")
+      profile[layer] = stats if perColumn else mergeStats(stats)
+    return profile
 
 
   def getL4Representations(self):
     """
     Returns the active representation in L4.
     """
-    return [set(column.getOutputData("activeCells").nonzero()[0])
+    return [set(getRegionOutputIndices(column, "activeCells"))
             for column in self.L4Regions]
 
 
@@ -656,7 +762,7 @@ class L4L2Experiment(object):
     """
     Returns the cells in L4 that were predicted by the location input.
     """
-    return [set(column.getOutputData("predictedCells").nonzero()[0])
+    return [set(getRegionOutputIndices(column, "predictedCells"))
             for column in self.L4Regions]
 
 
@@ -665,7 +771,7 @@ class L4L2Experiment(object):
     Returns the cells in L4 that were predicted by the location signal
     and are currently active.  Does not consider apical input.
     """
-    return [set(column.getOutputData("predictedActiveCells").nonzero()[0])
+    return [set(getRegionOutputIndices(column, "predictedActiveCells"))
             for column in self.L4Regions]
 
 
@@ -673,7 +779,7 @@ class L4L2Experiment(object):
     """
     Returns the active representation in L2.
     """
-    return [set(column._pooler.getActiveCells()) for column in self.L2Columns]
+    return [set(self._getL2ActiveCells(i)) for i in xrange(self.numColumns)]
 
 
   def getCurrentObjectOverlaps(self):
@@ -690,9 +796,11 @@ class L4L2Experiment(object):
                          len(self.objectL2Representations)),
                         dtype="uint32")
 
-    for i, representations in enumerate(self.objectL2RepresentationsMatrices):
-      activeCells = self.L2Columns[i]._pooler.getActiveCells()
-      overlaps[i, :] = representations.rightVecSumAtNZSparse(activeCells)
+    for i in xrange(self.numColumns):
+      columnOverlaps = self.objectL2Representations.getOverlaps(
+        i, self._getL2ActiveCells(i))
+      for objectName, overlap in columnOverlaps.iteritems():
+        overlaps[i, self.objectNameToIndex[objectName]] = overlap
 
     return overlaps
 
@@ -717,25 +825,30 @@ class L4L2Experiment(object):
     if minOverlap is None:
       minOverlap = sdrSize / 2
 
-    for objectName, objectSdr in self.objectL2Representations.iteritems():
-      count = 0
-      score = 0.0
-      for i in xrange(self.numColumns):
-        # Ignore inactive column
-        if len(l2sdr[i]) == 0:
-          continue
-
-        count += 1
-        overlap = len(l2sdr[i] & objectSdr[i])
-        if overlap >= minOverlap:
-          score += 1
-
-      if count == 0:
-        if includeZeros:
-          results[objectName] = 0
+    # Count, for each object, the active columns that recognize it. Inactive
+    # columns are ignored.
+    count = 0
+    scores = collections.Counter()
+    for i in xrange(self.numColumns):
+      if len(l2sdr[i]) == 0:
+        continue
+
+      count += 1
+      if minOverlap <= 0:
+        scores.update(self.objectL2Representations.iterkeys())
       else:
-        if includeZeros or score>0.0:
-          results[objectName] = score / count
+        overlaps = self.objectL2Representations.getOverlaps(i, l2sdr[i])
+        scores.update(objectName
+                      for objectName, overlap in overlaps.iteritems()
+                      if overlap >= minOverlap)
+
+    if includeZeros:
+      zeroScore = 0.0 if count > 0 else 0
+      for objectName in self.objectL2Representations:
+        results[objectName] = zeroScore
+    if count > 0:
+      for objectName, score in scores.iteritems():
+        results[objectName] = float(score) / count
 
     return results
 
@@ -846,20 +959,94 @@ class L4L2Experiment(object):
     Unsets the learning mode, to start inference.
     """
 
-    for region in self.L4Regions:
-      region.setParameter("learn", False)
-    for region in self.L2Regions:
-      region.setParameter("learningMode", False)
+    self._setColumnParameter(self.L4Regions, "learn", False)
+    self._setColumnParameter(self.L2Regions, "learningMode", False)
 
 
   def _setLearningMode(self):
     """
     Sets the learning mode.
     """
-    for region in self.L4Regions:
-      region.setParameter("learn", True)
-    for region in self.L2Regions:
-      region.setParameter("learningMode", True)
+    self._setColumnParameter(self.L4Regions, "learn", True)
+    self._setColumnParameter(self.L2Regions, "learningMode", True)
+
+
+  def _setColumnParameter(self, regions, parameterName, value):
+    """
+    Sets a parameter on L4 or L2 regions, including their copies in the
+    worker processes if the columns run in parallel.
+    """
+    if self.columnRunner is not None:
+      self.columnRunner.setParameter([region.name for region in regions],
+                                     parameterName, value)
+    else:
+      for region in regions:
+        region.setParameter(parameterName, value)
+
+
+  def _callColumnMethod(self, regions, methodPath, *args):
+    """
+    Calls a method on L4 or L2 regions, on their copies in the worker
+    processes if the columns run in parallel.
+
+    @param   methodPath (str)
+             Path of the method, relative to the region instance, e.g.
+             "_tm.getActiveApicalSegments"
+
+    @return  (list)
+             The return value for each region
+    """
+    if self.columnRunner is not None:
+      return self.columnRunner.callMethod([region.name for region in regions],
+                                          methodPath, *args)
+
+    results = []
+    for region in regions:
+      method = region.getSelf()
+      for attribute in methodPath.split("."):
+        method = getattr(method, attribute)
+      results.append(method(*args))
+    return results
+
+
+  def _getPhaseProfiledRegions(self):
+    """
+    Returns the regions whose algorithms support phase profiling, as a dict
+    that maps "L4" and "L2" to the regions and the name of the algorithm
+    attribute.
+    """
+    # The algorithms are created when the network is initialized.
+    self.network.initialize()
+
+    profiled = {}
+    for layer, regions, algorithm in (("L4", self.L4Regions, "_tm"),
+                                      ("L2", self.L2Regions, "_pooler")):
+      regions = [region for region in regions
+                 if hasattr(getattr(region.getSelf(), algorithm, None),
+                            "setPhaseProfiler")]
+      if len(regions) > 0:
+        profiled[layer] = (regions, algorithm)
+    return profiled
+
+
+  def _getL2ActiveCells(self, colIdx):
+    """
+    Returns the active cells of an L2 column, read from the region's output so
+    that it works whether or not the columns run in parallel.
+    """
+    return np.asarray(getRegionOutputIndices(self.L2Regions[colIdx],
+                                             "activeCells"),
+                      dtype="uint32")
+
+
+  def _run(self, iterations):
+    """
+    Runs the network, computing the columns in parallel if requested.
+    """
+    if self.columnRunner is not None:
+      self.columnRunner.run(iterations)
+    else:
+      self.network.run(iterations)
 
 
   def _updateInferenceStats(self, statistics, objectName=None):
@@ -879,6 +1066,9 @@ class L4L2Experiment(object):
     L4PredictedCells = self.getL4PredictedCells()
     L2Representation = self.getL2Representations()
 
+    activeApicalSegments = self._callColumnMethod(
+      self.L4Regions, "_tm.getActiveApicalSegments")
+
     for i in xrange(self.numColumns):
       statistics["L4 Representation C" + str(i)].append(
         len(L4Representations[i])
@@ -890,7 +1080,7 @@ class L4L2Experiment(object):
         len(L2Representation[i])
       )
       statistics["L4 Apical Segments C" + str(i)].append(
-        len(self.L4Columns[i]._tm.getActiveApicalSegments())
+        len(activeApicalSegments[i])
       )
 
       # add true overlap if objectName was provided
@@ -91,6 +91,13 @@ For all network types, regions will be named as shown above plus a suffix
 indicating column number, such as "externalInput_0", "L2Column_3", etc. The
 reset signal from sensorInput is sent to the other regions.
 
+If networkConfig contains "sparseIO": True, the sensors, L4 and L2 regions pass
+active indices to each other rather than dense 0/1 arrays (see
+htmresearch.support.sparse_region_io). This saves the regions from scanning
+and zeroing dense arrays, but the links still copy one element per bit of each
+output. The L4 region type must support this (e.g. py.ApicalTMPairRegion), and
+the optional spatial poolers can't be used.
+
 Also, how do you like my ascii art?
 
 """
@@ -212,6 +219,9 @@ def createL4L2Column(network, networkConfig, suffix=""):
 
   Configuration options:
 
+    "sparseIO" is optional. If True, the sensors, L4 and L2 exchange active
+    indices rather than dense arrays.
+
     "lateralSPParams" and "feedForwardSPParams" are optional. If included
     appropriate spatial pooler regions will be added to the network.
 
@@ -228,14 +238,26 @@ def createL4L2Column(network, networkConfig, suffix=""):
   L4Params = copy.deepcopy(networkConfig["L4Params"])
   L4Params["basalInputWidth"] = networkConfig["externalInputSize"]
   L4Params["apicalInputWidth"] = networkConfig["L2Params"]["cellCount"]
+  L2Params = copy.deepcopy(networkConfig["L2Params"])
+
+  externalInputParams = {"outputWidth": networkConfig["externalInputSize"]}
+  sensorInputParams = {"outputWidth": networkConfig["sensorInputSize"]}
+
+  if networkConfig.get("sparseIO", False):
+    if (networkConfig.get("lateralSPParams", {}) or
+        networkConfig.get("feedForwardSPParams", {})):
+      raise ValueError("sparseIO can't be used with spatial pooler regions")
+
+    for params in (L4Params, L2Params, externalInputParams, sensorInputParams):
+      params["sparseIO"] = True
 
   if networkConfig["externalInputSize"] > 0:
     network.addRegion(
       externalInputName, "py.RawSensor",
-      json.dumps({"outputWidth": networkConfig["externalInputSize"]}))
+      json.dumps(externalInputParams))
   network.addRegion(
     sensorInputName, "py.RawSensor",
-    json.dumps({"outputWidth": networkConfig["sensorInputSize"]}))
+    json.dumps(sensorInputParams))
 
   # Fixup network to include SP, if defined in networkConfig
   if networkConfig["externalInputSize"] > 0:
@@ -247,7 +269,7 @@ def createL4L2Column(network, networkConfig, suffix=""):
     json.dumps(L4Params))
   network.addRegion(
     L2ColumnName, "py.ColumnPoolerRegion",
-    json.dumps(networkConfig["L2Params"]))
+    json.dumps(L2Params))
 
   # Set phases appropriately so regions are executed in the proper sequence
   # This is required when we create multiple columns - the order of execution
@@ -0,0 +1,117 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+A mapping from object names to their learned L2 representations that also
+keeps an inverted index from cells to objects, so the overlap of an activity
+pattern with every object costs time proportional to the number of active
+cells and the objects they belong to, not to the number of objects.
+"""
+
+import collections
+import itertools
+
+
+
+class IndexedObjectRepresentations(collections.MutableMapping):
+  """
+  Maps each object name to its representation: a sequence with one set of L2
+  cells per cortical column. Behaves like a dict, and maintains an inverted
+  index (column, cell) -> object names as objects are added and replaced.
+
+  The index is updated when an object is set or deleted, so the sets of cells
+  must not be modified in place after they are stored.
+  """
+
+  def __init__(self, numColumns, representations=()):
+    """
+    @param numColumns (int)
+    Number of cortical columns in each representation
+
+    @param representations (dict or iterable of pairs)
+    Initial contents
+    """
+    self.numColumns = numColumns
+    self._representations = {}
+    self._objectsByCell = [collections.defaultdict(set)
+                           for _ in xrange(numColumns)]
+    self.update(representations)
+
+
+  def __getitem__(self, objectName):
+    return self._representations[objectName]
+
+
+  def __setitem__(self, objectName, representation):
+    if objectName in self._representations:
+      del self[objectName]
+
+    self._representations[objectName] = representation
+    for objectsByCell, cells in itertools.izip(self._objectsByCell,
+                                               representation):
+      for cell in cells:
+        objectsByCell[cell].add(objectName)
+
+
+  def __delitem__(self, objectName):
+    representation = self._representations.pop(objectName)
+    for objectsByCell, cells in itertools.izip(self._objectsByCell,
+                                               representation):
+      for cell in cells:
+        objects = objectsByCell[cell]
+        objects.discard(objectName)
+        if len(objects) == 0:
+          del objectsByCell[cell]
+
+
+  def __iter__(self):
+    return iter(self._representations)
+
+
+  def __len__(self):
+    return len(self._representations)
+
+
+  def __repr__(self):
+    return repr(self._representations)
+
+
+  def getOverlaps(self, column, activeCells):
+    """
+    Computes the overlap of a column's active cells with every object.
+
+    @param column (int)
+    The cortical column
+
+    @param activeCells (iterable)
+    The active L2 cells of that column
+
+    @return (collections.Counter)
+    The overlap with each object that shares at least one cell. Objects that
+    aren't in the counter have an overlap of 0.
+    """
+    objectsByCell = self._objectsByCell[column]
+    overlaps = collections.Counter()
+    for cell in activeCells:
+      objects = objectsByCell.get(cell)
+      if objects is not None:
+        overlaps.update(objects)
+    return overlaps
@@ -0,0 +1,376 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Runs the L4 and L2 regions of a multi-column L4-L2 network in a pool of worker
+processes.
+
+Within a time step the columns only interact through the L2 lateral links and
+the L2 -> L4 apical links, which all have a propagation delay of 1. So each
+column's L4 and L2 can be computed independently of the other columns, and
+the only synchronization point is the end of the time step, when the new L2
+outputs become next step's lateral and apical inputs.
+
+The workers are forked from the main process after the network has been
+initialized, so each one starts with an identical copy of the regions it is
+responsible for. Each time step:
+
+  1. The main process runs the sensors (and any spatial poolers) with the
+     network's column phases disabled. This also advances the delayed links.
+  2. It reads each L4 and L2 region's inputs, exactly as the network would
+     present them, and sends them to the worker that owns the column.
+  3. The workers compute L4, then L2 with L4's fresh outputs, and send back
+     their outputs.
+  4. The main process waits for every worker (the barrier) and writes the
+     outputs into the network's regions.
+
+Because every region sees exactly the inputs it would have seen in a serial
+run, the results are identical. The algorithm state (e.g. "_tm", "_pooler")
+lives in the workers, so the region objects in the main process must not be
+used for anything other than reading outputs. Use callMethod and
+setParameter to reach the worker copies. An exception in a worker is raised
+in the main process as a RuntimeError that includes the worker's traceback.
+
+Workers are forked, so this requires a platform with fork, and it can't be
+used from inside a daemonic process such as a multiprocessing.Pool worker.
+"""
+
+import multiprocessing
+import traceback
+
+import numpy
+
+
+
+def _pack(arrays):
+  """
+  Packs a dict of mostly-zero arrays into their non-zero entries, which are
+  much cheaper to send between processes.
+  """
+  packed = {}
+  for name, array in arrays.iteritems():
+    nonZeros = array.nonzero()[0]
+    packed[name] = (len(array), nonZeros, array[nonZeros])
+  return packed
+
+
+def _unpack(packed, arrays=None):
+  """
+  Inverse of _pack. If 'arrays' is given, the values are written into those
+  arrays rather than new ones.
+  """
+  if arrays is None:
+    arrays = dict((name, numpy.zeros(size, dtype=values.dtype))
+                  for name, (size, _, values) in packed.iteritems())
+  for name, (_, nonZeros, values) in packed.iteritems():
+    array = arrays[name]
+    array[:] = 0
+    array[nonZeros] = values
+  return arrays
+
+
+def _workerLoop(connection, regions):
+  """
+  Serves requests from the main process until told to stop.
+
+  @param connection (multiprocessing.Connection)
+  The worker end of the pipe
+
+  @param regions (dict)
+  Maps the names of this worker's regions to their python region instances
+  """
+  outputs = {}
+  for name, region in regions.iteritems():
+    outputs[name] = dict(
+      (outputName, numpy.zeros(region.getOutputElementCount(outputName),
+                               dtype="float32"))
+      for outputName in region.getSpec()["outputs"].iterkeys())
+
+  while True:
+    command = connection.recv()
+    if command[0] == "stop":
+      connection.close()
+      return
+
+    try:
+      result = _handleCommand(command, regions, outputs)
+    except Exception:
+      connection.send((traceback.format_exc(), None))
+    else:
+      connection.send((None, result))
+
+
+def _handleCommand(command, regions, outputs):
+  """
+  Runs one request from the main process in a worker and returns its result.
+  """
+  if command[0] == "compute":
+    results = []
+    for L4Name, L4Inputs, L2Name, L2Inputs, feedforwardLinks in command[1]:
+      L4Inputs = _unpack(L4Inputs)
+      L2Inputs = _unpack(L2Inputs)
+      regions[L4Name].compute(L4Inputs, outputs[L4Name])
+      for srcOutput, destInput in feedforwardLinks:
+        L2Inputs[destInput] = outputs[L4Name][srcOutput]
+      regions[L2Name].compute(L2Inputs, outputs[L2Name])
+      results.append((_pack(outputs[L4Name]), _pack(outputs[L2Name])))
+    return results
+
+  elif command[0] == "setParameter":
+    _, names, parameterName, value = command
+    for name in names:
+      regions[name].setParameter(parameterName, -1, value)
+    return None
+
+  elif command[0] == "callMethod":
+    _, names, methodPath, args = command
+    results = []
+    for name in names:
+      method = regions[name]
+      for attribute in methodPath.split("."):
+        method = getattr(method, attribute)
+      results.append(method(*args))
+    return results
+
+  raise ValueError("Unknown command: %s" % command[0])
+
+
+
+class ParallelColumnRunner(object):
+  """
+  Runs the (L4, L2) region pairs of a network in parallel worker processes.
+  The network's other regions (sensors, spatial poolers) run in the main
+  process, in phases before the L4 and L2 phases.
+  """
+
+  def __init__(self, network, L4RegionNames, L2RegionNames, numWorkers):
+    """
+    @param network (Network)
+    A network created by createMultipleL4L2Columns or
+    createMultipleL4L2ColumnsWithTopology (or a single column)
+
+    @param L4RegionNames (list of str)
+    The L4 region of each column
+
+    @param L2RegionNames (list of str)
+    The L2 region of each column, in the same order
+
+    @param numWorkers (int)
+    The number of worker processes. Columns are assigned to workers in a
+    round-robin fashion.
+    """
+    self.network = network
+    self.L4RegionNames = list(L4RegionNames)
+    self.L2RegionNames = list(L2RegionNames)
+    self.numWorkers = min(numWorkers, len(self.L4RegionNames))
+
+    L4Phase = min(min(network.getPhases(name))
+                  for name in self.L4RegionNames)
+    self.columnPhases = (L4Phase, network.getMaxPhase())
+
+    # The inputs that each region receives through links from the main
+    # process, and the L2 inputs that come from the same column's L4 within
+    # the same time step.
+    self.linkedInputs = dict((name, set())
+                             for name in self.L4RegionNames +
+                             self.L2RegionNames)
+    self.feedforwardLinks = dict((name, []) for name in self.L2RegionNames)
+    L4ByL2 = dict(zip(self.L2RegionNames, self.L4RegionNames))
+    for _, link in network.getLinks():
+      destName = link.getDestRegionName()
+      if (destName in L4ByL2 and
+          link.getSrcRegionName() == L4ByL2[destName]):
+        self.feedforwardLinks[destName].append((link.getSrcOutputName(),
+                                                link.getDestInputName()))
+      elif destName in self.linkedInputs:
+        self.linkedInputs[destName].add(link.getDestInputName())
+
+    # Regions create their algorithm instances when the network is
+    # initialized, so do it before forking.
+    network.initialize()
+
+    self.columnsByWorker = [range(worker, len(self.L4RegionNames),
+                                  self.numWorkers)
+                            for worker in xrange(self.numWorkers)]
+    self.workerByRegion = {}
+    self.connections = []
+    self.processes = []
+    self.closed = False
+    for worker, columns in enumerate(self.columnsByWorker):
+      regions = {}
+      for column in columns:
+        for name in (self.L4RegionNames[column], self.L2RegionNames[column]):
+          regions[name] = network.regions[name].getSelf()
+          self.workerByRegion[name] = worker
+
+      connection, workerConnection = multiprocessing.Pipe()
+      process = multiprocessing.Process(target=_workerLoop,
+                                        args=(workerConnection, regions))
+      process.daemon = True
+      process.start()
+      workerConnection.close()
+      self.connections.append(connection)
+      self.processes.append(process)
+
+
+  def run(self, numSteps):
+    """
+    Runs the network for numSteps time steps. This replaces network.run.
+
+    @param numSteps (int)
+    The number of time steps
+    """
+    self._checkOpen()
+    for _ in xrange(numSteps):
+      self.network.setMaxEnabledPhase(self.columnPhases[0] - 1)
+      try:
+        self.network.run(1)
+      finally:
+        self.network.setMaxEnabledPhase(self.columnPhases[1])
+
+      for worker, columns in enumerate(self.columnsByWorker):
+        requests = []
+        for column in columns:
+          L4Name = self.L4RegionNames[column]
+          L2Name = self.L2RegionNames[column]
+          requests.append((L4Name, self._getInputs(L4Name),
+                           L2Name, self._getInputs(L2Name),
+                           self.feedforwardLinks[L2Name]))
+        self.connections[worker].send(("compute", requests))
+
+      resultsByWorker = self._receive(xrange(self.numWorkers))
+      for columns, results in zip(self.columnsByWorker, resultsByWorker):
+        for column, (L4Outputs, L2Outputs) in zip(columns, results):
+          for name, outputs in ((self.L4RegionNames[column], L4Outputs),
+                                (self.L2RegionNames[column], L2Outputs)):
+            region = self.network.regions[name]
+            _unpack(outputs,
+                    dict((outputName, region.getOutputData(outputName))
+                         for outputName in outputs))
+
+
+  def setParameter(self, regionNames, parameterName, value):
+    """
+    Sets a parameter on the worker copies of the given regions, and on the
+    regions in the main process.
+
+    @param regionNames (list of str)
+    Names of L4 or L2 regions
+
+    @param parameterName (str)
+    The parameter to set
+
+    @param value
+    The new value
+    """
+    self._request(regionNames, ("setParameter", parameterName, value))
+    for name in regionNames:
+      self.network.regions[name].setParameter(parameterName, value)
+
+
+  def callMethod(self, regionNames, methodPath, *args):
+    """
+    Calls a method on the worker copies of the given regions.
+
+    @param regionNames (list of str)
+    Names of L4 or L2 regions
+
+    @param methodPath (str)
+    Path of the method, relative to the region instance, e.g.
+    "_tm.getActiveApicalSegments"
+
+    @return (list)
+    The return value for each region, in the order of regionNames
+    """
+    return self._request(regionNames, ("callMethod", methodPath, args))
+
+
+  def close(self):
+    """
+    Stops the worker processes. The runner can't be used afterwards.
+    """
+    for connection, process in zip(self.connections, self.processes):
+      if process.is_alive():
+        connection.send(("stop",))
+        process.join()
+      connection.close()
+    self.connections = []
+    self.processes = []
+    self.closed = True
+
+
+  def _checkOpen(self):
+    if self.closed:
+      raise RuntimeError("The column runner's worker processes were stopped")
+
+
+  def _getInputs(self, regionName):
+    """
+    Returns a region's linked inputs, packed, as the network would present
+    them to the region's compute method.
+    """
+    region = self.network.regions[regionName]
+    region.prepareInputs()
+    return _pack(dict((inputName, region.getInputData(inputName))
+                      for inputName in self.linkedInputs[regionName]))
+
+
+  def _request(self, regionNames, command):
+    """
+    Sends a command to every worker that owns one of the regions, and returns
+    the results in the order of regionNames.
+    """
+    self._checkOpen()
+    namesByWorker = {}
+    for name in regionNames:
+      namesByWorker.setdefault(self.workerByRegion[name], []).append(name)
+
+    for worker, names in namesByWorker.iteritems():
+      self.connections[worker].send((command[0], names) + command[1:])
+
+    workers = namesByWorker.keys()
+    resultsByName = {}
+    for worker, results in zip(workers, self._receive(workers)):
+      if results is not None:
+        resultsByName.update(zip(namesByWorker[worker], results))
+
+    return [resultsByName.get(name) for name in regionNames]
+
+
+  def _receive(self, workers):
+    """
+    Waits for the reply of each of the given workers and returns their
+    results. If a worker failed, raises a RuntimeError with the worker's
+    traceback once every reply has been received, so that the pipes stay in
+    sync.
+    """
+    results = []
+    errors = []
+    for worker in workers:
+      error, result = self.connections[worker].recv()
+      if error is not None:
+        errors.append("Worker %d failed:\n%s" % (worker, error))
+      results.append(result)
+
+    if errors:
+      raise RuntimeError("\n".join(errors))
+
+    return results
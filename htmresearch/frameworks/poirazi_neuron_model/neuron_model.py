@@ -22,6 +22,7 @@
 import random
 import numpy
 import copy
+from scipy import sparse
 from sklearn.cluster import KMeans
 from collections import Counter
 from nupic.bindings.math import *
@@ -51,6 +52,48 @@ def sigmoid_nonlinearity(center, scale):
     return SM32(f(dense))
   return l
 
+def random_subsets(num_subsets, population_size, subset_size):
+  """
+  Draws num_subsets random subsets of range(population_size) at once, as rows
+  of sorted indices.  When subsets are small next to the population, rows are
+  drawn with replacement and the few rows with repeats are drawn again.
+  """
+  if subset_size**2 > population_size:
+    keys = numpy.random.rand(num_subsets, population_size)
+    return numpy.sort(keys.argpartition(subset_size - 1, axis = 1)[:, :subset_size], axis = 1)
+
+  subsets = numpy.zeros((num_subsets, subset_size), dtype = "int64")
+  redraw = numpy.arange(num_subsets)
+  while len(redraw) > 0:
+    draws = numpy.sort(numpy.random.randint(population_size, size = (len(redraw), subset_size)), axis = 1)
+    subsets[redraw] = draws
+    redraw = redraw[(numpy.diff(draws, axis = 1) == 0).any(axis = 1)]
+  return subsets
+
+def random_picks(groups, num_picks):
+  """
+  Picks num_picks random elements out of every group at once, given the group
+  of each element.  num_picks is either one count for all groups or a count
+  per group.  Returns the indices of the picked elements.
+  """
+  groups = numpy.asarray(groups)
+  order = numpy.lexsort((numpy.random.rand(len(groups)), groups))
+  sorted_groups = groups[order]
+  ranks = numpy.arange(len(groups)) - numpy.searchsorted(sorted_groups, sorted_groups)
+  num_picks = numpy.asarray(num_picks)
+  if num_picks.ndim > 0:
+    num_picks = num_picks[sorted_groups]
+  return order[ranks < num_picks]
+
+def random_row_nonzeros(matrix, size):
+  """
+  Picks size random nonzeros from every row of a sparse matrix at once.
+  Returns the rows and columns of the picked nonzeros.
+  """
+  rows, cols = matrix.getAllNonZeros(True)[:2]
+  picked = random_picks(rows, size)
+  return rows[picked], cols[picked]
+
 class Matrix_Neuron(object):
   def __init__(self,
          size = 10000,
@@ -79,18 +122,25 @@ class Matrix_Neuron(object):
     Initialize all the dendrites of the neuron to a set of random connections
     """
     # Wipe any preexisting connections by creating a new connection matrix
-    self.dendrites = SM32()
-    self.dendrites.reshape(self.dim, self.num_dendrites)
-
-    for row in range(self.num_dendrites):
-      synapses = numpy.random.choice(self.dim, self.dendrite_length, replace = False)
-      for synapse in synapses:
-        self.dendrites[synapse, row] = 1
+    synapses = random_subsets(self.num_dendrites, self.dim, self.dendrite_length)
+    self.dendrites = self._connection_matrix(
+      synapses.ravel(), numpy.repeat(numpy.arange(self.num_dendrites), self.dendrite_length))
 
+  def _connection_matrix(self, synapses, dendrites):
+    """
+    Builds a dim x num_dendrites connection matrix in a single call, with a
+    synapse at each (synapses[i], dendrites[i]).
+    """
+    matrix = SM32()
+    matrix.reshape(self.dim, self.num_dendrites)
+    matrix.setAllNonZeros(self.dim, self.num_dendrites,
+                          numpy.asarray(synapses, dtype = "uint32"),
+                          numpy.asarray(dendrites, dtype = "uint32"),
+                          numpy.ones(len(synapses), dtype = "float32"), False)
+    return matrix
 
   def initialize_permanences(self):
-    self.permanences = copy.deepcopy(self.dendrites)
-    self.permanences = self.permanences*self.initial_permanence
+    self.permanences = self.dendrites*self.initial_permanence
 
   def calculate_activation(self, datapoint):
     """
@@ -122,7 +172,7 @@ class Matrix_Neuron(object):
     self.dendrites.reshape(self.dim, self.num_dendrites)
 
     # We want to avoid training on any negative examples
-    data = copy.deepcopy(data)
+    data = SM32(data)
     data.deleteRows([i for i, v in enumerate(labels) if v != 1])
 
     if data.nRows() > self.num_dendrites:
@@ -150,19 +200,119 @@ class Matrix_Neuron(object):
         current_dendrite += 1
 
     else:
-      for i in range(data.nRows()):
-        ones = data.rowNonZeros(i)[0]
-        dendrite_connections = numpy.random.choice(ones, size = self.dendrite_length, replace = False)
-        for synapse in dendrite_connections:
-          self.dendrites[synapse, current_dendrite] = 1.
-
-        current_dendrite += 1
+      dendrites, synapses = random_row_nonzeros(data, self.dendrite_length)
+      self.dendrites = self._connection_matrix(synapses, dendrites)
 
     self.initialize_permanences()
 
-  def HTM_style_train_on_data(self, data, labels):
-    for i in range(data.nRows()):
-      self.HTM_style_train_on_datapoint(data.getSlice(i, i+1, 0, data.nCols()), labels[i])
+  def HTM_style_train_on_data(self, data, labels, batch_size = 1):
+    """
+    Trains on the rows of data.  With a batch_size above 1, each mini-batch
+    is trained on at once by HTM_style_train_on_batch, on dense copies of the
+    connections, rather than one datapoint at a time.
+    """
+    if batch_size <= 1:
+      for i in range(data.nRows()):
+        self.HTM_style_train_on_datapoint(data.getSlice(i, i+1, 0, data.nCols()), labels[i])
+      return
+
+    rows, cols = data.getAllNonZeros(True)[:2]
+    data = sparse.csr_matrix((numpy.ones(len(rows), dtype = "float32"), (rows, cols)),
+                             shape = (data.nRows(), data.nCols()))
+    labels = numpy.asarray(labels)
+    dendrites = self.dendrites.toDense()
+    permanences = self.permanences.toDense()
+    for start in range(0, data.shape[0], batch_size):
+      self.HTM_style_train_on_batch(data[start:start + batch_size],
+                                    labels[start:start + batch_size],
+                                    dendrites, permanences)
+    self.dendrites = SM32(dendrites)
+    self.permanences = SM32(permanences)
+
+  def HTM_style_train_on_batch(self, batch, labels, dendrites, permanences):
+    """
+    The mini-batch version of HTM_style_train_on_datapoint, for a batch in a
+    scipy.sparse CSR matrix.  Every datapoint picks its branch against the
+    connections as they were at the start of the batch, and all of the
+    updates are then applied together to the dense dendrites and permanences,
+    which are modified in place.
+
+    Permanence changes to a branch picked by several datapoints add up, and its
+    weak synapses are moved to bits of the last of those datapoints.  Each
+    missed positive datapoint gets a different one of the weakest branches.
+
+    Otherwise the rules are those of HTM_style_train_on_datapoint.  The
+    nonlinearity is applied in place, and its return value is ignored, so
+    nonlinearities that return a new matrix, such as sigmoid_nonlinearity,
+    leave the raw overlaps.  Detected positives strengthen all of the
+    strongest branch's synapses, the inactive ones by permanence_decrement,
+    since HTM_style_train_on_datapoint computes 1 - datapoint on an SM32,
+    which gives datapoint - 1.
+    """
+    activations = SM32(batch.dot(dendrites))
+    self.nonlinearity(activations)
+    activations = activations.toDense()
+    active = activations.sum(axis = 1) > 0
+    strongest_branches = activations.argmax(axis = 1)
+    positive = labels >= 1
+
+    # Weaken the strongest branch on its active synapses for false positives.
+    false_positives = numpy.flatnonzero(~positive & active)
+    branches, sums, _ = self._branch_sums(batch, false_positives,
+                                          strongest_branches[false_positives])
+    permanences[:, branches] -= self.permanence_decrement * dendrites[:, branches] * sums
+
+    # Strengthen the strongest branch for detected positives, by
+    # permanence_increment on its active synapses and by permanence_decrement
+    # on the others, and move its weak synapses to random active bits.
+    detected = numpy.flatnonzero(positive & active)
+    branches, sums, counts = self._branch_sums(batch, detected,
+                                               strongest_branches[detected])
+    permanences[:, branches] += dendrites[:, branches] * (
+      (self.permanence_increment - self.permanence_decrement) * sums +
+      self.permanence_decrement * counts)
+
+    last_detected = numpy.zeros(len(branches), dtype = "int64")
+    last_detected[numpy.searchsorted(branches, strongest_branches[detected])] = detected
+    connected = dendrites[:, branches] > 0
+    weak = connected & (permanences[:, branches] < self.permanence_threshold)
+    groups, bits = batch[last_detected].nonzero()
+    candidates = ~connected[bits, groups]
+    groups, bits = groups[candidates], bits[candidates]
+    picked = random_picks(groups, weak.sum(axis = 0))
+
+    weak_synapses, weak_groups = numpy.nonzero(weak)
+    dendrites[weak_synapses, branches[weak_groups]] = 0
+    permanences[weak_synapses, branches[weak_groups]] = 0
+    dendrites[bits[picked], branches[groups[picked]]] = 1.
+    permanences[bits[picked], branches[groups[picked]]] = self.initial_permanence
+
+    # Reset the weakest branches onto random bits of missed positives.
+    missed = numpy.flatnonzero(positive & ~active)[:self.num_dendrites]
+    if len(missed) > 0:
+      weakest_branches = numpy.argsort(permanences.sum(axis = 0), kind = "mergesort")[:len(missed)]
+      reset = numpy.median(permanences[:, weakest_branches], axis = 0) < self.permanence_threshold
+      missed, weakest_branches = missed[reset], weakest_branches[reset]
+      dendrites[:, weakest_branches] = 0
+      permanences[:, weakest_branches] = 0
+
+      groups, bits = batch[missed].nonzero()
+      picked = random_picks(groups, self.dendrite_length)
+      dendrites[bits[picked], weakest_branches[groups[picked]]] = 1.
+      permanences[bits[picked], weakest_branches[groups[picked]]] = self.initial_permanence
+
+  def _branch_sums(self, batch, datapoints, branches):
+    """
+    Groups the given datapoints of a batch by branch.  Returns the sorted
+    branches, the sum of their datapoints as dim x branches columns, and the
+    number of datapoints on each branch.
+    """
+    branches, groups = numpy.unique(branches, return_inverse = True)
+    membership = sparse.csr_matrix((numpy.ones(len(datapoints), dtype = "float32"),
+                                    (groups, datapoints)),
+                                   shape = (len(branches), batch.shape[0]))
+    return (branches, membership.dot(batch).toarray().T,
+            numpy.bincount(groups, minlength = len(branches)))
 
   def HTM_style_train_on_datapoint(self, datapoint, label):
     """
@@ -0,0 +1,46 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+import random
+import numpy
+
+from htmresearch.support.forked_map import forkedMap
+
+def run_trials(trial_function, params, seeds, num_processes = 1):
+  """
+  Runs trial_function(**params) once per seed, seeding both numpy and
+  Python's random module with the seed first, and returns the results in
+  order.  The trials are spread across num_processes processes; since every
+  trial is seeded, the results do not depend on the number of processes.
+  The trial function and its parameters are shared with the processes by
+  forking, so that closures such as the nonlinearities need not be pickled.
+  """
+  if len(seeds) <= 1:
+    num_processes = 1
+  return list(forkedMap(_run_seeded_trial, (trial_function, params), seeds,
+                        num_processes))
+
+def _run_seeded_trial(trial, seed):
+  trial_function, params = trial
+  random.seed(seed)
+  numpy.random.seed(seed)
+  return trial_function(**params)
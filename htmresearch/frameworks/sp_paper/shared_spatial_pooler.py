@@ -0,0 +1,306 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+"""
+Inference-only spatial pooler over state shared between processes.
+
+exportSpatialPooler writes the permanences and connected synapses of a trained
+spatial pooler, along with what its inhibition needs, to a directory of .npy
+files. SharedSpatialPooler memory-maps these read-only, so any number of
+worker processes can compute outputs with learning off against one copy of
+the state in the page cache, rather than each holding its own spatial pooler.
+"""
+
+import itertools
+import json
+import os
+
+import numpy as np
+from scipy import sparse
+
+from nupic.bindings.math import GetNTAReal
+
+realDType = GetNTAReal()
+uintType = "uint32"
+
+
+
+def exportSpatialPooler(sp, path):
+  """
+  Writes the state a spatial pooler uses when computing without learning to
+  the directory path, which is created if needed. Works with the C++ and
+  Python spatial poolers.
+
+  @param sp a spatial pooler instance
+  @param path (string) directory to write the state to
+  """
+  if not os.path.isdir(path):
+    os.makedirs(path)
+
+  numColumns = int(np.prod(sp.getColumnDimensions()))
+  numInputs = sp.getNumInputs()
+  permanence = np.zeros(numInputs, dtype=realDType)
+  connected = np.zeros(numInputs, dtype=uintType)
+  permanenceRows = []
+  permanenceValues = []
+  connectedRows = []
+  for column in xrange(numColumns):
+    sp.getPermanence(column, permanence)
+    sp.getConnectedSynapses(column, connected)
+    permanenceRows.append(np.flatnonzero(permanence))
+    permanenceValues.append(permanence[permanenceRows[-1]])
+    connectedRows.append(np.flatnonzero(connected))
+
+  permanenceIndices, permanenceIndptr = _concatenateRows(permanenceRows)
+  connectedIndices, connectedIndptr = _concatenateRows(connectedRows)
+  arrays = {
+    "permanenceData": np.concatenate(
+      permanenceValues + [np.zeros(0, dtype=realDType)]),
+    "permanenceIndices": permanenceIndices,
+    "permanenceIndptr": permanenceIndptr,
+    "connectedData": np.ones(len(connectedIndices), dtype=realDType),
+    "connectedIndices": connectedIndices,
+    "connectedIndptr": connectedIndptr,
+  }
+
+  wrapAround = (sp.getWrapAround() if hasattr(sp, "getWrapAround")
+                else sp._wrapAround)
+  params = {
+    "inputDimensions": [int(d) for d in sp.getInputDimensions()],
+    "columnDimensions": [int(d) for d in sp.getColumnDimensions()],
+    "inhibitionRadius": int(sp.getInhibitionRadius()),
+    "globalInhibition": bool(sp.getGlobalInhibition()),
+    "localAreaDensity": float(sp.getLocalAreaDensity()),
+    "numActiveColumnsPerInhArea": int(sp.getNumActiveColumnsPerInhArea()),
+    "stimulusThreshold": float(sp.getStimulusThreshold()),
+    "wrapAround": bool(wrapAround),
+  }
+  if not _usesGlobalInhibition(params):
+    arrays["neighbors"] = _columnNeighbors(params["columnDimensions"],
+                                           params["inhibitionRadius"],
+                                           params["wrapAround"])
+
+  for name, array in arrays.iteritems():
+    np.save(os.path.join(path, name + ".npy"), array)
+  with open(os.path.join(path, "params.json"), "w") as f:
+    json.dump(params, f)
+
+
+
+def _concatenateRows(rows):
+  """
+  Joins the column indices of each row into CSR indices and indptr arrays.
+  """
+  indptr = np.zeros(len(rows) + 1, dtype="int32")
+  indptr[1:] = np.cumsum([len(row) for row in rows])
+  indices = np.concatenate(rows + [np.zeros(0, dtype="int32")])
+  return indices.astype("int32"), indptr
+
+
+
+def _usesGlobalInhibition(params):
+  return (params["globalInhibition"] or
+          params["inhibitionRadius"] > max(params["columnDimensions"]))
+
+
+
+def _columnNeighbors(columnDimensions, inhibitionRadius, wrapAround):
+  """
+  Lists the neighbors of every column, as topology.neighborhood or
+  topology.wrappingNeighborhood would, without the column itself.
+
+  @return neighbors (array) one row per neighbor offset, one column per column,
+                    with numColumns where the neighbor falls off an edge
+  """
+  numColumns = int(np.prod(columnDimensions))
+  coordinates = np.array(np.unravel_index(np.arange(numColumns),
+                                          columnDimensions))
+  offsets = []
+  for dimension in columnDimensions:
+    right = inhibitionRadius
+    if wrapAround:
+      right = min(right, dimension - 1 - inhibitionRadius)
+    offsets.append(xrange(-inhibitionRadius, right + 1))
+
+  neighbors = []
+  for offset in itertools.product(*offsets):
+    if not any(offset):
+      continue
+    neighborCoordinates = coordinates + np.array(offset)[:, np.newaxis]
+    if wrapAround:
+      neighborCoordinates %= np.array(columnDimensions)[:, np.newaxis]
+      neighbors.append(np.ravel_multi_index(neighborCoordinates,
+                                            columnDimensions))
+    else:
+      valid = ((neighborCoordinates >= 0).all(axis=0) &
+               (neighborCoordinates <
+                np.array(columnDimensions)[:, np.newaxis]).all(axis=0))
+      neighborCoordinates[:, ~valid] = 0
+      neighbors.append(np.where(
+        valid, np.ravel_multi_index(neighborCoordinates, columnDimensions),
+        numColumns))
+
+  return np.array(neighbors, dtype="int32").reshape(-1, numColumns)
+
+
+
+class SharedSpatialPooler(object):
+  """
+  A read-only spatial pooler over state written by exportSpatialPooler. It
+  computes the same active columns as the exported spatial pooler with
+  learning off, including its tie-breaking, but cannot learn.
+  """
+
+  def __init__(self, path):
+    """
+    @param path (string) directory the state was exported to
+    """
+    with open(os.path.join(path, "params.json")) as f:
+      self._params = json.load(f)
+
+    load = lambda name: np.load(os.path.join(path, name + ".npy"),
+                                mmap_mode="r")
+    self._numColumns = int(np.prod(self._params["columnDimensions"]))
+    self._numInputs = int(np.prod(self._params["inputDimensions"]))
+    shape = (self._numColumns, self._numInputs)
+    self._permanences = sparse.csr_matrix(
+      (load("permanenceData"), load("permanenceIndices"),
+       load("permanenceIndptr")), shape=shape, copy=False)
+    self._connectedSynapses = sparse.csr_matrix(
+      (load("connectedData"), load("connectedIndices"),
+       load("connectedIndptr")), shape=shape, copy=False)
+
+    self._globalInhibition = _usesGlobalInhibition(self._params)
+    if not self._globalInhibition:
+      self._neighbors = load("neighbors")
+      self._numNeighbors = np.count_nonzero(
+        np.asarray(self._neighbors) < self._numColumns, axis=0)
+
+    # Density as the C++ spatial pooler computes it, in single precision.
+    density = np.float32(self._params["localAreaDensity"])
+    if self._params["numActiveColumnsPerInhArea"] > 0:
+      inhibitionArea = min(
+        (2 * self._params["inhibitionRadius"] + 1) **
+        len(self._params["columnDimensions"]), self._numColumns)
+      density = min(np.float32(self._params["numActiveColumnsPerInhArea"]) /
+                    np.float32(inhibitionArea), np.float32(0.5))
+    self._density = density
+
+
+  def getNumColumns(self):
+    return self._numColumns
+
+
+  def getNumInputs(self):
+    return self._numInputs
+
+
+  def getColumnDimensions(self):
+    return np.array(self._params["columnDimensions"])
+
+
+  def getInputDimensions(self):
+    return np.array(self._params["inputDimensions"])
+
+
+  def getPermanence(self, columnIndex, permanence):
+    permanence[:] = self._permanences[columnIndex].toarray().ravel()
+
+
+  def getConnectedSynapses(self, columnIndex, connectedSynapses):
+    connectedSynapses[:] = self._connectedSynapses[columnIndex].toarray().ravel()
+
+
+  def getConnectedCounts(self, connectedCounts):
+    connectedCounts[:] = np.diff(self._connectedSynapses.indptr)
+
+
+  def compute(self, inputVector, learn, activeArray):
+    """
+    Computes the active columns for an input, like SpatialPooler.compute.
+
+    @param inputVector (array) binary input vector
+    @param learn (bool) must be False
+    @param activeArray (array) filled with 1's at the active columns
+    """
+    if learn:
+      raise ValueError("SharedSpatialPooler cannot learn")
+    activeArray[:] = self.computeBatch(np.reshape(inputVector, (1, -1)))[0]
+
+
+  def computeBatch(self, inputVectors):
+    """
+    Computes the active columns for many inputs at once.
+
+    @param inputVectors (array) binary input vectors, one per row
+
+    @return activeColumns (array) binary output vectors, one per row
+    """
+    overlaps = np.asarray(
+      self._connectedSynapses.dot(np.asarray(inputVectors, dtype=realDType).T)
+    ).T
+    activeColumns = np.zeros((len(inputVectors), self._numColumns),
+                             dtype=uintType)
+    for i in xrange(len(inputVectors)):
+      if self._globalInhibition:
+        activeColumns[i, self._inhibitColumnsGlobal(overlaps[i])] = 1
+      else:
+        activeColumns[i, self._inhibitColumnsLocal(overlaps[i])] = 1
+    return activeColumns
+
+
+  def _inhibitColumnsGlobal(self, overlaps):
+    """
+    Picks the columns with the top overlaps, preferring later columns on ties.
+    """
+    numActive = int(self._density * np.float32(self._numColumns))
+    if numActive == 0:
+      return np.zeros(0, dtype="int64")
+    winners = np.argsort(overlaps, kind="mergesort")[-numActive:]
+    return winners[overlaps[winners] >= self._params["stimulusThreshold"]]
+
+
+  def _inhibitColumnsLocal(self, overlaps):
+    """
+    Picks the columns whose overlap is among the top in their neighborhood.
+    Columns are considered in order, and a tie with a neighbor that is already
+    active counts as a loss, so only columns that could lose on ties are
+    decided one by one.
+    """
+    paddedOverlaps = np.append(overlaps, -np.inf)
+    neighborOverlaps = paddedOverlaps[self._neighbors]
+    numBigger = np.count_nonzero(neighborOverlaps > overlaps, axis=0)
+    numTies = np.count_nonzero(neighborOverlaps == overlaps, axis=0)
+    numActive = (0.5 + self._density *
+                 (self._numNeighbors + 1).astype(realDType)).astype("int64")
+
+    candidates = overlaps >= self._params["stimulusThreshold"]
+    active = candidates & (numBigger + numTies < numActive)
+    undecided = np.flatnonzero(candidates & ~active & (numBigger < numActive))
+    for column in undecided:
+      neighbors = self._neighbors[:, column]
+      tiedNeighbors = neighbors[(neighbors < column) &
+                                (neighborOverlaps[:, column] ==
+                                 overlaps[column])]
+      numTiesLost = np.count_nonzero(active[tiedNeighbors])
+      active[column] = numBigger[column] + numTiesLost < numActive[column]
+    return np.flatnonzero(active)
@@ -21,13 +21,21 @@
 # ----------------------------------------------------------------------
 
 
+import contextlib
 import copy
 import random
+import shutil
+import tempfile
 
 import matplotlib.pyplot as plt
 import numpy as np
+from scipy import sparse
 
 from nupic.bindings.math import GetNTAReal
+
+from htmresearch.frameworks.sp_paper.shared_spatial_pooler import (
+  exportSpatialPooler, SharedSpatialPooler)
+from htmresearch.support.forked_map import forkedMap
 # !/usr/bin/env python
 # ----------------------------------------------------------------------
 # Numenta Platform for Intelligent Computing (NuPIC)
@@ -477,38 +485,182 @@ def corruptSparseVector(sdr, noiseLevel):
 
 
 
-def calculateOverlapCurve(sp, inputVectors):
+def percentOverlaps(x1, x2):
+  """
+  Computes the percentage of overlap between corresponding rows of x1 and x2,
+  like percentOverlap.
+
+  @param x1 (array) binary vectors, one per row
+  @param x2 (array) binary vectors, one per row
+
+  @return percentOverlaps (array) percentage overlap between each pair of rows
+  """
+  overlaps = np.einsum("ij,ij->i", x1.astype("float64"), x2)
+  minX1X2 = np.minimum(np.count_nonzero(x1, axis=1),
+                       np.count_nonzero(x2, axis=1))
+  percentOverlaps = np.zeros(len(overlaps))
+  nonZero = minX1X2 > 0
+  percentOverlaps[nonZero] = overlaps[nonZero] / minX1X2[nonZero]
+  return percentOverlaps
+
+
+
+def computeSPOutputs(sp, inputVectors, numProcesses=1, chunkSize=100,
+                     sharedSPPath=None):
+  """
+  Computes the SP output of every input vector without learning. With
+  numProcesses > 1, the SP's state is exported to read-only memory-mapped
+  files, and the inputs are split in chunks across a pool of processes that
+  all compute against that one copy with a SharedSpatialPooler.
+
+  The SP's iteration number is advanced by the number of inputs either way,
+  as if it had computed every input itself.
+
+  @param sp a spatial pooler instance
+  @param inputVectors (array) input vectors, one per row
+  @param numProcesses (int) number of processes computing the outputs
+  @param chunkSize (int) number of inputs handed to a process at a time
+  @param sharedSPPath (string) directory sp was exported to with
+         exportSpatialPooler. If None, sp is exported to a temporary
+         directory for this call only. When computing the outputs of several
+         batches with the same trained SP, export it once and pass the
+         directory to every call.
+
+  @return outputColumns (array) output columns of each input, one per row
+  """
+  numInputVector = len(inputVectors)
+  iterationNum = sp.getIterationNum()
+  chunks = [(start, min(start + chunkSize, numInputVector))
+            for start in xrange(0, numInputVector, chunkSize)]
+
+  if numProcesses > 1 and len(chunks) > 1:
+    outputColumns = np.zeros((numInputVector, _getNumColumns(sp)),
+                             dtype=uintType)
+    with _exportedSpatialPooler(sp, numProcesses, sharedSPPath) as path:
+      # The workers inherit the memory maps of this one SharedSpatialPooler
+      sharedInputs = (SharedSpatialPooler(path), inputVectors)
+      for (start, end), chunkOutputColumns in zip(
+          chunks, forkedMap(_computeChunk, sharedInputs, chunks,
+                            numProcesses)):
+        outputColumns[start:end] = chunkOutputColumns
+  else:
+    outputColumns = _computeOutputs(sp, inputVectors)
+
+  sp.setIterationNum(iterationNum + numInputVector)
+  return outputColumns
+
+
+
+@contextlib.contextmanager
+def _exportedSpatialPooler(sp, numProcesses, sharedSPPath):
+  """
+  Provides the directory the processes of computeSPOutputs read sp from:
+  sharedSPPath if it is given, None if there is no SP or a single process,
+  and otherwise a temporary export of sp that is removed on exit.
+  """
+  if sp is None or sharedSPPath is not None or numProcesses <= 1:
+    yield sharedSPPath
+    return
+
+  path = tempfile.mkdtemp()
+  try:
+    exportSpatialPooler(sp, path)
+    yield path
+  finally:
+    shutil.rmtree(path)
+
+
+
+def _getNumColumns(sp):
+  return int(np.prod(sp.getColumnDimensions()))
+
+
+
+def _computeOutputs(sp, inputVectors):
+  outputColumns = np.zeros((len(inputVectors), _getNumColumns(sp)),
+                           dtype=uintType)
+  for i in xrange(len(inputVectors)):
+    sp.compute(inputVectors[i], False, outputColumns[i])
+  return outputColumns
+
+
+
+def _computeChunk(sharedInputs, chunk):
+  """
+  Computes the SP outputs of the rows start:end of the inputs.
+  """
+  sharedSP, inputVectors = sharedInputs
+  start, end = chunk
+  return sharedSP.computeBatch(inputVectors[start:end])
+
+
+
+def _corruptInputVectors(inputVectors, noiseLevelList, noiseLevelFirst):
+  """
+  Corrupts a copy of every input vector at every noise level, drawing the
+  noise in the same order as a loop over noise levels and inputs.
+
+  @param inputVectors (array) input SDRs, one per row
+  @param noiseLevelList (list) list of noise levels
+  @param noiseLevelFirst (bool) whether the outer loop is over noise levels
+
+  @return corruptedInputVectors (array) corrupted inputs, indexed by noise
+          level then input if noiseLevelFirst, else by input then noise level
+  """
+  numInputVector, inputSize = inputVectors.shape
+  if noiseLevelFirst:
+    corrupted = np.empty((len(noiseLevelList), numInputVector, inputSize),
+                         dtype=inputVectors.dtype)
+    corrupted[:] = inputVectors[np.newaxis]
+    for i in range(len(noiseLevelList)):
+      for j in range(numInputVector):
+        corruptSparseVector(corrupted[i, j], noiseLevelList[i])
+  else:
+    corrupted = np.empty((numInputVector, len(noiseLevelList), inputSize),
+                         dtype=inputVectors.dtype)
+    corrupted[:] = inputVectors[:, np.newaxis]
+    for i in range(numInputVector):
+      for j in range(len(noiseLevelList)):
+        corruptSparseVector(corrupted[i, j], noiseLevelList[j])
+  return corrupted
+
+
+
+def calculateOverlapCurve(sp, inputVectors, numProcesses=1,
+                          sharedSPPath=None):
   """
   Evalulate noise robustness of SP for a given set of SDRs
   @param sp a spatial pooler instance
   @param inputVectors list of arrays.
+  @param numProcesses (int) number of processes computing the SP outputs
+  @param sharedSPPath (string) see computeSPOutputs
   :return:
   """
-  columnNumber = np.prod(sp.getColumnDimensions())
   numInputVector, inputSize = inputVectors.shape
-
-  outputColumns = np.zeros((numInputVector, columnNumber), dtype=uintType)
-  outputColumnsCorrupted = np.zeros((numInputVector, columnNumber),
-                                    dtype=uintType)
-
   noiseLevelList = np.linspace(0, 1.0, 21)
-  inputOverlapScore = np.zeros((numInputVector, len(noiseLevelList)))
-  outputOverlapScore = np.zeros((numInputVector, len(noiseLevelList)))
-  for i in range(numInputVector):
-    for j in range(len(noiseLevelList)):
-      inputVectorCorrupted = copy.deepcopy(inputVectors[i][:])
-      corruptSparseVector(inputVectorCorrupted, noiseLevelList[j])
+  numNoiseLevels = len(noiseLevelList)
+
+  inputVectorsCorrupted = _corruptInputVectors(
+    inputVectors, noiseLevelList, noiseLevelFirst=False).reshape(
+      numInputVector * numNoiseLevels, inputSize)
 
-      sp.compute(inputVectors[i][:], False, outputColumns[i][:])
-      sp.compute(inputVectorCorrupted, False,
-                 outputColumnsCorrupted[i][:])
+  with _exportedSpatialPooler(sp, numProcesses, sharedSPPath) as path:
+    # The SP computed the output of each clean input once per noise level
+    outputColumns = computeSPOutputs(sp, inputVectors, numProcesses,
+                                     sharedSPPath=path)
+    sp.setIterationNum(sp.getIterationNum() +
+                       numInputVector * (numNoiseLevels - 1))
+    outputColumnsCorrupted = computeSPOutputs(sp, inputVectorsCorrupted,
+                                              numProcesses, sharedSPPath=path)
 
-      inputOverlapScore[i][j] = percentOverlap(inputVectors[i][:],
-                                               inputVectorCorrupted)
-      outputOverlapScore[i][j] = percentOverlap(outputColumns[i][:],
-                                                outputColumnsCorrupted[i][:])
+  inputOverlapScore = percentOverlaps(
+    np.repeat(inputVectors, numNoiseLevels, axis=0), inputVectorsCorrupted)
+  outputOverlapScore = percentOverlaps(
+    np.repeat(outputColumns, numNoiseLevels, axis=0), outputColumnsCorrupted)
 
-  return noiseLevelList, inputOverlapScore, outputOverlapScore
+  return (noiseLevelList,
+          inputOverlapScore.reshape(numInputVector, numNoiseLevels),
+          outputOverlapScore.reshape(numInputVector, numNoiseLevels))
 
 
 
@@ -520,49 +672,64 @@ def classifySPoutput(targetOutputColumns, outputColumns):
   @param outputColumns (array) The current output
   @return classLabel (int) classification outcome
   """
-  numTargets, numDims = targetOutputColumns.shape
-  overlap = np.zeros((numTargets,))
-  for i in range(numTargets):
-    overlap[i] = percentOverlap(outputColumns, targetOutputColumns[i, :])
-  classLabel = np.argmax(overlap)
-  return classLabel
+  return classifySPoutputs(targetOutputColumns,
+                           np.asarray(outputColumns)[np.newaxis])[0]
+
+
+
+def classifySPoutputs(targetOutputColumns, outputColumns):
+  """
+  Classify a batch of SP outputs, scoring every output against every target
+  with a single matrix product.
+  @param targetOutputColumns (array) The target outputs, corresponding to
+                                     different classes
+  @param outputColumns (array) The outputs to classify, one per row
+  @return classLabels (array) classification outcome of each output
+  """
+  overlaps = np.dot(outputColumns.astype("float64"), targetOutputColumns.T)
+  minOverlaps = np.minimum(
+    np.count_nonzero(outputColumns, axis=1)[:, np.newaxis],
+    np.count_nonzero(targetOutputColumns, axis=1)[np.newaxis, :])
+  overlaps[minOverlaps == 0] = 0
+  np.divide(overlaps, minOverlaps, out=overlaps, where=minOverlaps > 0)
+  return np.argmax(overlaps, axis=1)
 
 
 
-def classificationAccuracyVsNoise(sp, inputVectors, noiseLevelList):
+def classificationAccuracyVsNoise(sp, inputVectors, noiseLevelList,
+                                  numProcesses=1, sharedSPPath=None):
   """
   Evaluate whether the SP output is classifiable, with varying amount of noise
   @param sp a spatial pooler instance
   @param inputVectors (list) list of input SDRs
   @param noiseLevelList (list) list of noise levels
+  @param numProcesses (int) number of processes computing the SP outputs
+  @param sharedSPPath (string) see computeSPOutputs
   :return:
   """
   numInputVector, inputSize = inputVectors.shape
 
-  if sp is None:
-    targetOutputColumns = copy.deepcopy(inputVectors)
-  else:
-    columnNumber = np.prod(sp.getColumnDimensions())
-    # calculate target output given the uncorrupted input vectors
-    targetOutputColumns = np.zeros((numInputVector, columnNumber),
-                                   dtype=uintType)
-    for i in range(numInputVector):
-      sp.compute(inputVectors[i][:], False, targetOutputColumns[i][:])
+  with _exportedSpatialPooler(sp, numProcesses, sharedSPPath) as path:
+    if sp is None:
+      targetOutputColumns = copy.deepcopy(inputVectors)
+    else:
+      # calculate target output given the uncorrupted input vectors
+      targetOutputColumns = computeSPOutputs(sp, inputVectors, numProcesses,
+                                             sharedSPPath=path)
 
-  outcomes = np.zeros((len(noiseLevelList), numInputVector))
-  for i in range(len(noiseLevelList)):
-    for j in range(numInputVector):
-      corruptedInputVector = copy.deepcopy(inputVectors[j][:])
-      corruptSparseVector(corruptedInputVector, noiseLevelList[i])
+    corruptedInputVectors = _corruptInputVectors(
+      inputVectors, noiseLevelList, noiseLevelFirst=True).reshape(
+        len(noiseLevelList) * numInputVector, inputSize)
 
-      if sp is None:
-        outputColumns = copy.deepcopy(corruptedInputVector)
-      else:
-        outputColumns = np.zeros((columnNumber, ), dtype=uintType)
-        sp.compute(corruptedInputVector, False, outputColumns)
+    if sp is None:
+      outputColumns = corruptedInputVectors
+    else:
+      outputColumns = computeSPOutputs(sp, corruptedInputVectors,
+                                       numProcesses, sharedSPPath=path)
 
-      predictedClassLabel = classifySPoutput(targetOutputColumns, outputColumns)
-      outcomes[i][j] = predictedClassLabel == j
+  predictedClassLabels = classifySPoutputs(targetOutputColumns, outputColumns)
+  outcomes = (predictedClassLabels.reshape(len(noiseLevelList), numInputVector)
+              == np.arange(numInputVector))
 
   predictionAccuracy = np.mean(outcomes, 1)
   return predictionAccuracy
@@ -759,15 +926,27 @@ def calculateEntropy(activeColumns, type='binary'):
 
 
 
-def calculateInputOverlapMat(inputVectors, sp):
-  numColumns = np.product(sp.getColumnDimensions())
-  numInputVector, inputSize = inputVectors.shape
-  overlapMat = np.zeros((numColumns, numInputVector))
-  for c in range(numColumns):
-    connectedSynapses = np.zeros((inputSize, ), dtype=uintType)
-    sp.getConnectedSynapses(c, connectedSynapses)
-    for i in range(numInputVector):
-      overlapMat[c, i] = percentOverlap(connectedSynapses, inputVectors[i, :])
+def calculateInputOverlapMat(inputVectors, sp, connectedSyns=None):
+  """
+  Computes the percentOverlap of every column's connected synapses with every
+  input vector.
+
+  @param inputVectors (array) input vectors, one per row
+  @param sp (SpatialPooler) the spatial pooler instance
+  @param connectedSyns (array) the result of getConnectedSyns(sp), if it is
+                               already available
+  @return overlapMat (array) overlaps, one row per column and one column per
+                             input vector
+  """
+  if connectedSyns is None:
+    connectedSyns = getConnectedSyns(sp)
+
+  overlapMat = np.dot(connectedSyns.astype("float64"), inputVectors.T)
+  minOverlaps = np.minimum(
+    np.count_nonzero(connectedSyns, axis=1)[:, np.newaxis],
+    np.count_nonzero(inputVectors, axis=1)[np.newaxis, :])
+  overlapMat[minOverlaps == 0] = 0
+  np.divide(overlapMat, minOverlaps, out=overlapMat, where=minOverlaps > 0)
   return overlapMat
 
 
@@ -780,20 +959,25 @@ def calculateStability(activeColumnsCurrentEpoch, activeColumnsPreviousEpoch):
   return stability
 
 
-def calculateInputSpaceCoverage(sp):
-  numInputs = np.prod(sp.getInputDimensions())
-  numColumns = np.prod(sp.getColumnDimensions())
-  inputSpaceCoverage = np.zeros(numInputs)
+def calculateInputSpaceCoverage(sp, connectedSyns=None):
+  """
+  Counts the columns connected to each input bit.
 
-  connectedSynapses = np.zeros((numInputs), dtype=uintType)
-  for columnIndex in range(numColumns):
-    sp.getConnectedSynapses(columnIndex, connectedSynapses)
-    inputSpaceCoverage += connectedSynapses
+  @param sp (SpatialPooler) the spatial pooler instance
+  @param connectedSyns (array) the result of getConnectedSyns(sp), if it is
+                               already available
+  @return inputSpaceCoverage (array) number of connected columns per input
+                                     bit, shaped like the input
+  """
+  if connectedSyns is None:
+    connectedSyns = getConnectedSyns(sp)
+  inputSpaceCoverage = np.sum(connectedSyns, axis=0, dtype="float64")
   inputSpaceCoverage = np.reshape(inputSpaceCoverage, sp.getInputDimensions())
   return inputSpaceCoverage
 
 
-def reconstructionError(sp, inputVectors, activeColumnVectors, threshold=0.):
+def reconstructionError(sp, inputVectors, activeColumnVectors, threshold=0.,
+                        connectedSyns=None):
   """
   Computes a reconstruction error. The reconstuction $r(x)$ of an input vector $x$
   is given by the sum of the active column's connected synapses vector of 
@@ -827,10 +1011,13 @@ def reconstructionError(sp, inputVectors, activeColumnVectors, threshold=0.):
   @param threshold (float) if set > 0 it serves as threshold for a step function 
                            applied to the reconstruction vectors (values smaller than 
                            threshold are set to zero, and values bigger to one)
+  @param connectedSyns (array) the result of getConnectedSyns(sp), if it is
+                               already available
   @return error (float) the reconstruction error
   """
   batchSize        = inputVectors.shape[0]
-  connectionMatrix = getConnectedSyns(sp)
+  connectionMatrix = (getConnectedSyns(sp) if connectedSyns is None
+                      else connectedSyns)
 
   reconstructionVectors = np.dot(activeColumnVectors, connectionMatrix)
   numActiveColumns      = np.sum(activeColumnVectors, 1)[0]
@@ -847,7 +1034,8 @@ def reconstructionError(sp, inputVectors, activeColumnVectors, threshold=0.):
   return Err/batchSize
 
 
-def witnessError(sp, inputVectors, activeColumnsCurrentEpoch):
+def witnessError(sp, inputVectors, activeColumnsCurrentEpoch,
+                 connectedSyns=None):
   """
   Computes a variation of a reconstruction error. It measures the average 
   hamming distance of an active column's connected synapses vector and its witnesses. 
@@ -864,22 +1052,40 @@ def witnessError(sp, inputVectors, activeColumnsCurrentEpoch):
   \]
   It can be shown that the error is optimized by the Hebbian-like update rule 
   of the spatial pooler. 
+
+  Since syn(i) is binary, 
+  \[
+      \| x - syn(i) \|_1 = \| x \|_1 + syn(i) \cdot ( |1 - x| - |x| ),
+  \]
+  so the inner sum only needs the sum of the active columns' connected 
+  synapses, which is a sparse matrix product. 
+
+  Raises a ValueError if an input has no active columns, as the error is
+  undefined for it.
+
+  @param connectedSyns (array) the result of getConnectedSyns(sp), if it is
+                               already available
   """
-  connectionMatrix = getConnectedSyns(sp)
+  connectionMatrix = (getConnectedSyns(sp) if connectedSyns is None
+                      else connectedSyns)
   batchSize        = inputVectors.shape[0]
+  inputVectors     = inputVectors.astype("float64")
+  activeColumns    = sparse.csr_matrix(activeColumnsCurrentEpoch > 0.,
+                                       dtype="float64")
+  numActiveColumns = np.asarray(activeColumns.sum(1)).ravel()
+  if np.any(numActiveColumns == 0):
+    raise ValueError("every input needs at least one active column")
+
+  # Sum of the connected synapses of each input's active columns
+  activeSyns = activeColumns.dot(connectionMatrix.astype("float64"))
+
+  # 2nd sum... over each active column, for each input in batch
+  err = (numActiveColumns * np.sum(np.absolute(inputVectors), 1) +
+         np.sum((np.absolute(1. - inputVectors) - np.absolute(inputVectors)) *
+                activeSyns, 1))
 
   # 1st sum... over each input in batch
-  Err = 0.
-  for i in range(batchSize):
-    activeColumns    = np.where(activeColumnsCurrentEpoch[i] > 0.)[0]
-    numActiveColumns = activeColumns.shape[0]
-    # 2nd sum... over each active colum
-    err = 0.
-    for j in activeColumns:
-      # Compute hamming distance and accumulate
-      err += np.sum(np.absolute(connectionMatrix[j] - inputVectors[i]))
-
-    Err += err/numActiveColumns
+  Err = np.sum(err/numActiveColumns)
 
   return Err/batchSize
 
@@ -899,23 +1105,60 @@ def mutualInformation(sp, activeColumnsCurrentEpoch, column_1, column_2):
   batchSize   = activeColumnsCurrentEpoch.shape[0]
 
   # Activity Counts
-  ci, cj, cij = 0., 0., dict([((0,0),0.), ((1,0),0.), ((0,1),0.), ((1,1),0.)])
-  for t in range(batchSize):
-    ai = activeColumnsCurrentEpoch[t, i]
-    aj = activeColumnsCurrentEpoch[t, j]
-    cij[(ai, aj)] += 1.
-    ci += ai
-    cj += aj
-
-  # Mutual information calculation 
-  Iij = 0
-  for a,b in [(0,0), (1,0), (0,1), (1,1)]:
-    # Compute probabilities
-    pij = cij[(a,b)]/batchSize
-    pi  = ci/batchSize if a == 1 else 1. - ci/batchSize
-    pj  = cj/batchSize if b == 1 else 1. - cj/batchSize
+  ai  = activeColumnsCurrentEpoch[:, i] > 0
+  aj  = activeColumnsCurrentEpoch[:, j] > 0
+  ci  = np.count_nonzero(ai)
+  cj  = np.count_nonzero(aj)
+  cij = np.count_nonzero(ai & aj)
+
+  return float(_mutualInformationFromCounts(ci, cj, cij, batchSize))
+
+
+
+def pairwiseMutualInformation(activeColumnsCurrentEpoch, columns=None):
+  """
+  Computes the mutual information of every pair of columns (see
+  mutualInformation) from the co-activation counts A^T A of the activation
+  history A.
+
+  @param activeColumnsCurrentEpoch (array) 2D numpy array of activation
+                                           history, one row per input
+  @param columns (list) columns to consider, all of them by default
+  @return mutualInfo (array) symmetric matrix of mutual information, indexed
+                             like columns
+  """
+  if columns is not None:
+    activeColumnsCurrentEpoch = activeColumnsCurrentEpoch[:, columns]
+  batchSize = activeColumnsCurrentEpoch.shape[0]
+  activity  = (activeColumnsCurrentEpoch > 0).astype("float64")
+
+  coActivity = np.dot(activity.T, activity)
+  counts     = np.diag(coActivity)
+  return _mutualInformationFromCounts(counts[:, np.newaxis],
+                                      counts[np.newaxis, :],
+                                      coActivity, batchSize)
+
+
+
+def _mutualInformationFromCounts(ci, cj, cij, batchSize):
+  """
+  Computes the mutual information of pairs of binary variables from the
+  number of times each one and both of them are active.
+  """
+  ci  = np.asarray(ci, dtype="float64")
+  cj  = np.asarray(cj, dtype="float64")
+  cij = np.asarray(cij, dtype="float64")
+  pi1 = ci/batchSize
+  pj1 = cj/batchSize
+
+  Iij = 0.
+  for pij, pi, pj in [((batchSize - ci - cj + cij)/batchSize, 1. - pi1, 1. - pj1),
+                      ((ci - cij)/batchSize, pi1, 1. - pj1),
+                      ((cj - cij)/batchSize, 1. - pi1, pj1),
+                      (cij/batchSize, pi1, pj1)]:
     # Add current term of mutual information 
-    Iij += pij * np.log2(pij/(pi*pj)) if pij > 0 else 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+      Iij = Iij + np.where(pij > 0, pij * np.log2(pij/(pi*pj)), 0.)
 
   return Iij
 
@@ -931,13 +1174,8 @@ def meanMutualInformation(sp, activeColumnsCurrentEpoch, columnsUnderInvestigati
   else:
     columns = columnsUnderInvestigation
   numCols = len(columns)
-  sumMutualInfo = 0
   normalizingConst = numCols*(numCols - 1)/2
-  for i in range(numCols):
-    for j in range(i+1, numCols):
-      sumMutualInfo += mutualInformation(sp, activeColumnsCurrentEpoch, columns[i], columns[j])
+  mutualInfo = pairwiseMutualInformation(activeColumnsCurrentEpoch, columns)
+  sumMutualInfo = np.sum(np.triu(mutualInfo, 1))
 
   return sumMutualInfo/normalizingConst
-
-
-
@@ -27,6 +27,9 @@ import numpy as np
 
 from nupic.bindings.regions.PyRegion import PyRegion
 
+from htmresearch.support.sparse_region_io import (sparseWidth, writeIndices,
+                                                  readIndices)
+
 
 
 class ApicalTMPairRegion(PyRegion):
@@ -303,6 +306,15 @@ class ApicalTMPairRegion(PyRegion):
           "constraints": ("enum: ApicalTiebreak, ApicalTiebreakCPP, ApicalDependent"),
           "defaultValue": "ApicalTiebreakCPP"
         },
+        "sparseIO": {
+          "description": ("If true, all inputs and outputs (except resetIn) "
+                          "contain the number of active bits followed by "
+                          "their indices, rather than 0's and 1's."),
+          "accessMode": "Read",
+          "dataType": "Bool",
+          "count": 1,
+          "defaultValue": "false"
+        },
       },
     }
 
@@ -336,6 +348,7 @@ class ApicalTMPairRegion(PyRegion):
                # Region params
                implementation="ApicalTiebreak",
                learn=True,
+               sparseIO=False,
                **kwargs):
 
     # Input sizes (the network API doesn't provide these during initialize)
@@ -363,6 +376,7 @@ class ApicalTMPairRegion(PyRegion):
     # Region params
     self.implementation = implementation
     self.learn = learn
+    self.sparseIO = sparseIO
 
     PyRegion.__init__(self, **kwargs)
 
@@ -430,36 +444,55 @@ class ApicalTMPairRegion(PyRegion):
       if inputs["resetIn"][0] != 0:
         # send empty output
         self._tm.reset()
-        outputs["activeCells"][:] = 0
-        outputs["predictedActiveCells"][:] = 0
-        outputs["winnerCells"][:] = 0
+        if self.sparseIO:
+          for name in ("activeCells", "predictedActiveCells", "winnerCells"):
+            writeIndices(outputs[name], ())
+        else:
+          outputs["activeCells"][:] = 0
+          outputs["predictedActiveCells"][:] = 0
+          outputs["winnerCells"][:] = 0
         return
 
-    activeColumns = inputs["activeColumns"].nonzero()[0]
+    if self.sparseIO:
+      getIndices = readIndices
+    else:
+      getIndices = lambda array: array.nonzero()[0]
+
+    activeColumns = getIndices(inputs["activeColumns"])
 
     if "basalInput" in inputs:
-      basalInput = inputs["basalInput"].nonzero()[0]
+      basalInput = getIndices(inputs["basalInput"])
     else:
       basalInput = np.empty(0, dtype="uint32")
 
     if "apicalInput" in inputs:
-      apicalInput = inputs["apicalInput"].nonzero()[0]
+      apicalInput = getIndices(inputs["apicalInput"])
     else:
       apicalInput = np.empty(0, dtype="uint32")
 
     if "basalGrowthCandidates" in inputs:
-      basalGrowthCandidates = inputs["basalGrowthCandidates"].nonzero()[0]
+      basalGrowthCandidates = getIndices(inputs["basalGrowthCandidates"])
     else:
       basalGrowthCandidates = basalInput
 
     if "apicalGrowthCandidates" in inputs:
-      apicalGrowthCandidates = inputs["apicalGrowthCandidates"].nonzero()[0]
+      apicalGrowthCandidates = getIndices(inputs["apicalGrowthCandidates"])
     else:
       apicalGrowthCandidates = apicalInput
 
     self._tm.compute(activeColumns, basalInput, apicalInput,
                      basalGrowthCandidates, apicalGrowthCandidates, self.learn)
 
+    if self.sparseIO:
+      activeCells = self._tm.getActiveCells()
+      predictedCells = self._tm.getPredictedCells()
+      writeIndices(outputs["activeCells"], activeCells)
+      writeIndices(outputs["predictedCells"], predictedCells)
+      writeIndices(outputs["predictedActiveCells"],
+                   np.intersect1d(activeCells, predictedCells))
+      writeIndices(outputs["winnerCells"], self._tm.getWinnerCells())
+      return
+
     # Extract the active / predicted cells and put them into binary arrays.
     outputs["activeCells"][:] = 0
     outputs["activeCells"][self._tm.getActiveCells()] = 1
@@ -499,6 +532,8 @@ class ApicalTMPairRegion(PyRegion):
     """
     if name in ["activeCells", "predictedCells", "predictedActiveCells",
                 "winnerCells"]:
+      if self.sparseIO:
+        return sparseWidth(self.cellsPerColumn * self.columnCount)
       return self.cellsPerColumn * self.columnCount
     else:
       raise Exception("Invalid output name specified: %s" % name)
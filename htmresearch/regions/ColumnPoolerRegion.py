@@ -25,6 +25,9 @@ import inspect
 
 from nupic.bindings.regions.PyRegion import PyRegion
 from htmresearch.algorithms.column_pooler import ColumnPooler
+from htmresearch.support.sparse_region_io import (sparseWidth, writeIndices,
+                                                  readIndices,
+                                                  readConcatenatedIndices)
 
 
 def getConstructorArguments():
@@ -318,6 +321,14 @@ class ColumnPoolerRegion(PyRegion):
           count=0,
           constraints="enum: active,predicted,predictedActiveCells",
           defaultValue="active"),
+        sparseIO=dict(
+          description="If true, all inputs and outputs (except resetIn) "
+                      "contain the number of active bits followed by their "
+                      "indices, rather than 0's and 1's.",
+          accessMode="Read",
+          dataType="Bool",
+          count=1,
+          defaultValue="false"),
       ),
       commands=dict(
         reset=dict(description="Explicitly reset TM states now."),
@@ -357,6 +368,7 @@ class ColumnPoolerRegion(PyRegion):
 
                seed=42,
                defaultOutputType = "active",
+               sparseIO=False,
                **kwargs):
 
     # Used to derive Column Pooler params
@@ -389,6 +401,7 @@ class ColumnPoolerRegion(PyRegion):
     # Region params
     self.learningMode = True
     self.defaultOutputType = defaultOutputType
+    self.sparseIO = sparseIO
 
     self._pooler = None
 
@@ -443,10 +456,18 @@ class ColumnPoolerRegion(PyRegion):
       if inputs["resetIn"][0] != 0:
         # send empty output
         self.reset()
-        outputs["feedForwardOutput"][:] = 0
-        outputs["activeCells"][:] = 0
+        if self.sparseIO:
+          writeIndices(outputs["feedForwardOutput"], ())
+          writeIndices(outputs["activeCells"], ())
+        else:
+          outputs["feedForwardOutput"][:] = 0
+          outputs["activeCells"][:] = 0
         return
 
+    if self.sparseIO:
+      self._computeSparse(inputs, outputs)
+      return
+
     feedforwardInput = numpy.asarray(inputs["feedforwardInput"].nonzero()[0],
                                      dtype="uint32")
 
@@ -487,6 +508,41 @@ class ColumnPoolerRegion(PyRegion):
       raise Exception("Unknown outputType: " + self.defaultOutputType)
 
 
+  def _computeSparse(self, inputs, outputs):
+    """
+    Same as compute, for inputs and outputs that contain active indices.
+    """
+    feedforwardInput = readIndices(inputs["feedforwardInput"])
+
+    if "feedforwardGrowthCandidates" in inputs:
+      feedforwardGrowthCandidates = readIndices(
+        inputs["feedforwardGrowthCandidates"])
+    else:
+      feedforwardGrowthCandidates = feedforwardInput
+
+    if "lateralInput" in inputs:
+      lateralInputs = readConcatenatedIndices(inputs["lateralInput"],
+                                              self.numOtherCorticalColumns)
+    else:
+      lateralInputs = ()
+
+    if "predictedInput" in inputs:
+      predictedInput = readIndices(inputs["predictedInput"])
+    else:
+      predictedInput = None
+
+    self._pooler.compute(feedforwardInput, lateralInputs,
+                         feedforwardGrowthCandidates, learn=self.learningMode,
+                         predictedInput = predictedInput)
+
+    writeIndices(outputs["activeCells"], self._pooler.getActiveCells())
+
+    if self.defaultOutputType == "active":
+      writeIndices(outputs["feedForwardOutput"], self._pooler.getActiveCells())
+    else:
+      raise Exception("Unknown outputType: " + self.defaultOutputType)
+
+
   def reset(self):
     """ Reset the state of the layer"""
     if self._pooler is not None:
@@ -517,6 +573,8 @@ class ColumnPoolerRegion(PyRegion):
     Return the number of elements for the given output.
     """
     if name in ["feedForwardOutput", "activeCells"]:
+      if self.sparseIO:
+        return sparseWidth(self.cellCount)
       return self.cellCount
     else:
       raise Exception("Invalid output name specified: " + name)
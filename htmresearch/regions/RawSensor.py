@@ -19,9 +19,60 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 
+import itertools
 from collections import deque
+
+import numpy
 from nupic.bindings.regions.PyRegion import PyRegion
 
+from htmresearch.support.sparse_region_io import sparseWidth, writeIndices
+
+
+
+class _RecordBlock(object):
+  """
+  A block of records that was added with a single call to
+  addDataBlockToQueue. The non-zero indices of all records are stored in one
+  preallocated array, and compute steps through them without creating a new
+  record for each step.
+  """
+
+  def __init__(self, nonZerosList, outputWidth, sequenceId):
+    numRecords = len(nonZerosList)
+    lengths = numpy.fromiter((len(nonZeros) for nonZeros in nonZerosList),
+                             dtype="int", count=numRecords)
+    nonZeros = numpy.fromiter(itertools.chain.from_iterable(nonZerosList),
+                              dtype="int", count=lengths.sum())
+    if len(nonZeros) > 0 and (nonZeros.min() < 0 or
+                              nonZeros.max() >= outputWidth):
+      raise ValueError("RawSensor: index out of range for outputWidth %d"
+                       % outputWidth)
+
+    # Sort and deduplicate every record at once, keyed by (record, index).
+    keys = numpy.unique(numpy.repeat(numpy.arange(numRecords), lengths) *
+                        outputWidth + nonZeros)
+    self.nonZeros = (keys % outputWidth).astype("uint32")
+    self.offsets = numpy.searchsorted(
+      keys, numpy.arange(numRecords + 1) * outputWidth).tolist()
+    self.sequenceId = int(sequenceId)
+    self.position = 0
+
+
+  def __len__(self):
+    return len(self.offsets) - 1 - self.position
+
+
+  def popNonZeros(self):
+    """
+    Returns the sorted non-zero indices of the next record, as a view into the
+    block, and advances to the following record.
+    """
+    begin = self.offsets[self.position]
+    end = self.offsets[self.position + 1]
+    self.position += 1
+    return self.nonZeros[begin:end]
+
+
 
 class RawSensor(PyRegion):
   """
@@ -33,14 +84,24 @@ class RawSensor(PyRegion):
 
   Each data record consists of the non-zero indices of the sparse vector,
   a 0/1 reset flag, and an integer sequence ID.
+
+  Many records can be queued at once with addDataBlockToQueue(). The block is
+  stored as a single index array, which is much cheaper than queueing the
+  records one at a time when feeding millions of records.
+
+  If sparseIO is True, dataOut holds the number of non-zero indices followed by
+  the indices themselves (see htmresearch.support.sparse_region_io) rather than
+  a dense 0/1 vector.
   """
 
   def __init__(self,
                outputWidth=2048,
-               verbosity=0):
+               verbosity=0,
+               sparseIO=False):
     """Create an instance with the appropriate output size."""
     self.verbosity = verbosity
     self.outputWidth = outputWidth
+    self.sparseIO = sparseIO
     self.queue = deque()
 
 
@@ -90,6 +151,16 @@ class RawSensor(PyRegion):
           "defaultValue": 2048,
           "constraints":"",
         },
+        "sparseIO":{
+          "description":"If true, dataOut contains the number of non-zero "
+                        "indices followed by the indices, rather than a dense "
+                        "0/1 vector.",
+          "dataType":"Bool",
+          "accessMode":"Read",
+          "count":1,
+          "defaultValue":"false",
+          "constraints":"",
+        },
       },
       "commands":{
         "addDataToQueue": {
@@ -106,24 +177,44 @@ class RawSensor(PyRegion):
     Get the next record from the queue and encode it. The fields for inputs and
     outputs are as defined in the spec above.
     """
-    if len(self.queue) > 0:
-      # Take the top element of the data queue
-      data = self.queue.pop()
+    if len(self.queue) == 0:
+      raise Exception("RawSensor: No data to encode: queue is empty ")
+
+    if isinstance(self.queue[-1], _RecordBlock):
+      # Take the next record of the block at the top of the data queue
+      block = self.queue[-1]
+      reset = 0
+      sequenceId = block.sequenceId
+      nonZeros = block.popNonZeros()
+      if len(block) == 0:
+        self.queue.pop()
 
     else:
-      raise Exception("RawSensor: No data to encode: queue is empty ")
+      # Take the top element of the data queue
+      data = self.queue.pop()
+      reset = data["reset"]
+      sequenceId = data["sequenceId"]
+      nonZeros = data["nonZeros"]
+      if self.sparseIO:
+        nonZeros = numpy.unique(nonZeros)
 
     # Copy data into output vectors
-    outputs["resetOut"][0] = data["reset"]
-    outputs["sequenceIdOut"][0] = data["sequenceId"]
-    outputs["dataOut"][:] = 0
-    outputs["dataOut"][data["nonZeros"]] = 1
+    outputs["resetOut"][0] = reset
+    outputs["sequenceIdOut"][0] = sequenceId
+    if self.sparseIO:
+      writeIndices(outputs["dataOut"], nonZeros)
+    else:
+      outputs["dataOut"][:] = 0
+      outputs["dataOut"][nonZeros] = 1
 
     if self.verbosity > 1:
       print "RawSensor outputs:"
       print "sequenceIdOut: ", outputs["sequenceIdOut"]
       print "resetOut: ", outputs["resetOut"]
-      print "dataOut: ", outputs["dataOut"].nonzero()[0]
+      if self.sparseIO:
+        print "dataOut: ", nonZeros
+      else:
+        print "dataOut: ", outputs["dataOut"].nonzero()[0]
 
 
   def addDataToQueue(self, nonZeros, reset, sequenceId):
@@ -154,6 +245,21 @@ class RawSensor(PyRegion):
     })
 
 
+  def addDataBlockToQueue(self, nonZerosList, sequenceId=0):
+    """
+    Add a block of data items to the sensor's internal queue. Calls to compute
+    will step through the items in order, each with a reset of 0, before
+    moving on to the rest of the queue.
+
+    @param nonZerosList A list of iterables of non-zero elements, one per item.
+    @param sequenceId   An int with an integer ID associated with all the items
+                        in the block.
+    """
+    block = _RecordBlock(nonZerosList, self.outputWidth, sequenceId)
+    if len(block) > 0:
+      self.queue.appendleft(block)
+
+
   def addResetToQueue(self, sequenceId):
     """
     Add a reset signal to the sensor's internal queue. Calls to compute
@@ -177,6 +283,8 @@ class RawSensor(PyRegion):
       return 1
 
     elif name == "dataOut":
+      if self.sparseIO:
+        return sparseWidth(self.outputWidth)
       return self.outputWidth
 
     else:
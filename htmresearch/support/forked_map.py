@@ -0,0 +1,84 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Maps a function over many small work items in a pool of forked worker
+processes, where every item needs the same large inputs.
+
+The shared inputs are stored in a module global before the pool is forked, so
+the workers inherit them rather than receiving a pickled copy with each item.
+Only the items and the results are pickled. The inputs don't need to be
+picklable at all, so they can hold closures or memory-mapped arrays.
+
+This requires a platform with fork, and it can't be used from inside a
+daemonic process such as a multiprocessing.Pool worker.
+"""
+
+import multiprocessing
+
+# The inputs shared with the workers of the running forkedMap
+_SHARED_INPUTS = None
+
+
+
+def forkedMap(function, sharedInputs, items, numProcesses, chunkSize=1):
+  """
+  Yields function(sharedInputs, item) for each item, in order.
+
+  @param function (function)
+  A module-level function, so that the workers can find it by name
+
+  @param sharedInputs
+  The inputs shared by every call, inherited by the worker processes
+
+  @param items (sequence)
+  The work items, pickled to the workers
+
+  @param numProcesses (int)
+  The number of worker processes. If 1 or less, the calls are made in this
+  process.
+
+  @param chunkSize (int)
+  The number of items sent to a worker at a time
+  """
+  global _SHARED_INPUTS
+
+  if numProcesses <= 1:
+    for item in items:
+      yield function(sharedInputs, item)
+    return
+
+  _SHARED_INPUTS = sharedInputs
+  pool = multiprocessing.Pool(numProcesses)
+  try:
+    for result in pool.imap(_callWithSharedInputs,
+                            [(function, item) for item in items],
+                            chunkSize):
+      yield result
+  finally:
+    pool.terminate()
+    _SHARED_INPUTS = None
+
+
+
+def _callWithSharedInputs(call):
+  function, item = call
+  return function(_SHARED_INPUTS, item)
@@ -0,0 +1,253 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Opt-in timing of the phases of an algorithm's compute step.
+
+An algorithm wraps each phase in a 'with profiler.phase(name)' block and
+reports the sizes of intermediate arrays with 'profiler.recordSize'. By
+default algorithms use NULL_PROFILER, whose methods do nothing, so the
+instrumentation costs a couple of method calls per phase when it's disabled.
+
+  tm.phaseProfiler = PhaseProfiler()
+  ...
+  stats = tm.phaseProfiler.getStats()
+  print formatStats(stats)
+
+The stats are plain dicts, so they can be merged across columns with
+mergeStats, pickled, or sent between processes.
+"""
+
+import time
+
+from tabulate import tabulate
+
+
+
+class PhaseProfiler(object):
+  """
+  Accumulates the wall time and call count of named phases, and the sizes of
+  named arrays.
+  """
+
+  enabled = True
+
+  def __init__(self):
+    self.reset()
+
+
+  def reset(self):
+    """
+    Clear all recorded timings and sizes.
+    """
+    # name -> [calls, elapsed]
+    self._phases = {}
+    # name -> [count, total, max]
+    self._sizes = {}
+
+
+  def phase(self, name):
+    """
+    Returns a context manager that times one execution of a phase.
+
+    @param name (str)
+    Name of the phase
+    """
+    return _PhaseTimer(self, name)
+
+
+  def addPhaseTime(self, name, elapsed):
+    """
+    Records one execution of a phase.
+
+    @param name (str)
+    Name of the phase
+
+    @param elapsed (float)
+    Wall time of the execution, in seconds
+    """
+    record = self._phases.get(name)
+    if record is None:
+      self._phases[name] = [1, elapsed]
+    else:
+      record[0] += 1
+      record[1] += elapsed
+
+
+  def recordSize(self, name, size):
+    """
+    Records the size of an array, e.g. the number of active segments.
+
+    @param name (str)
+    Name of the array
+
+    @param size (int)
+    Its size
+    """
+    record = self._sizes.get(name)
+    if record is None:
+      self._sizes[name] = [1, size, size]
+    else:
+      record[0] += 1
+      record[1] += size
+      if size > record[2]:
+        record[2] = size
+
+
+  def getStats(self):
+    """
+    @return (dict)
+    {"phases": {name: {"calls": int, "elapsed": float}},
+     "sizes": {name: {"count": int, "total": int, "max": int}}}
+    """
+    return {
+      "phases": dict((name, {"calls": calls, "elapsed": elapsed})
+                     for name, (calls, elapsed) in self._phases.iteritems()),
+      "sizes": dict((name, {"count": count, "total": total, "max": maximum})
+                    for name, (count, total, maximum)
+                    in self._sizes.iteritems()),
+    }
+
+
+
+class _PhaseTimer(object):
+  __slots__ = ("profiler", "name", "start")
+
+  def __init__(self, profiler, name):
+    self.profiler = profiler
+    self.name = name
+
+
+  def __enter__(self):
+    self.start = time.time()
+
+
+  def __exit__(self, *args):
+    self.profiler.addPhaseTime(self.name, time.time() - self.start)
+
+
+
+class _NullPhaseTimer(object):
+  __slots__ = ()
+
+  def __enter__(self):
+    pass
+
+
+  def __exit__(self, *args):
+    pass
+
+
+
+class NullPhaseProfiler(object):
+  """
+  A profiler that records nothing.
+  """
+
+  enabled = False
+
+  _timer = _NullPhaseTimer()
+
+  def reset(self):
+    pass
+
+
+  def phase(self, name):
+    return self._timer
+
+
+  def addPhaseTime(self, name, elapsed):
+    pass
+
+
+  def recordSize(self, name, size):
+    pass
+
+
+  def getStats(self):
+    return {"phases": {}, "sizes": {}}
+
+
+
+NULL_PROFILER = NullPhaseProfiler()
+
+
+
+def mergeStats(statsList):
+  """
+  Combines the stats of several profilers, e.g. one per cortical column.
+
+  @param statsList (iterable of dicts)
+  Results of PhaseProfiler.getStats
+
+  @return (dict)
+  Stats in the same format, with summed times, calls and sizes, and the
+  largest maximum sizes
+  """
+  merged = {"phases": {}, "sizes": {}}
+  for stats in statsList:
+    for name, phase in stats["phases"].iteritems():
+      record = merged["phases"].setdefault(name, {"calls": 0, "elapsed": 0.0})
+      record["calls"] += phase["calls"]
+      record["elapsed"] += phase["elapsed"]
+    for name, size in stats["sizes"].iteritems():
+      record = merged["sizes"].setdefault(name, {"count": 0, "total": 0,
+                                                 "max": 0})
+      record["count"] += size["count"]
+      record["total"] += size["total"]
+      record["max"] = max(record["max"], size["max"])
+  return merged
+
+
+
+def formatStats(stats):
+  """
+  Formats stats as two tables: the phases, sorted by elapsed time, and the
+  array sizes.
+
+  @param stats (dict)
+  Result of PhaseProfiler.getStats or mergeStats
+
+  @return (str)
+  """
+  phases = sorted(stats["phases"].iteritems(),
+                  key=lambda (name, phase): -phase["elapsed"])
+  totalTime = max(sum(phase["elapsed"] for _, phase in phases), 0.000001)
+  phaseTable = [[name,
+                 phase["calls"],
+                 phase["elapsed"],
+                 100.0 * phase["elapsed"] / totalTime,
+                 phase["elapsed"] / max(phase["calls"], 1)]
+                for name, phase in phases]
+
+  sizeTable = [[name,
+                size["count"],
+                float(size["total"]) / max(size["count"], 1),
+                size["max"]]
+               for name, size in sorted(stats["sizes"].iteritems())]
+
+  return "\n\n".join([
+    tabulate(phaseTable, headers=["Phase", "Count", "Elapsed",
+                                  "Pct of total", "Secs/call"],
+             tablefmt="grid", floatfmt="6.3f"),
+    tabulate(sizeTable, headers=["Array", "Count", "Mean size", "Max size"],
+             tablefmt="grid", floatfmt="6.1f"),
+  ])
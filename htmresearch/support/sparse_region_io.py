@@ -0,0 +1,141 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Helpers for passing active indices between regions instead of dense 0/1
+arrays.
+
+The network API only supports fixed-size outputs, so a sparse output for a
+population of N bits is an array of N+1 elements: the first element is the
+number of active bits k, and the next k elements are their sorted indices.
+The rest of the array is ignored, so writing an output and reading an input
+both cost O(k) rather than O(N). Because the arrays are fixed-size, several
+sparse outputs linked to the same input are concatenated into equal-size
+pieces, just like dense outputs.
+
+The network engine's links still copy every output array in full on each
+step, and a sparse array is one element longer than the dense one, so this
+format does not reduce the cost of those copies. It only saves the work the
+regions do to encode and decode their inputs and outputs. Passing only the
+indices would need outputs sized by a bound on the number of active bits,
+which L4 can't know in advance (bursting columns activate all their cells),
+and UInt32 links, whose types are fixed by each region's spec whether or not
+it is in sparse mode.
+
+Indices are stored in the regions' Real32 arrays, so they are exact for
+populations of up to 2^24 bits.
+"""
+
+import numpy
+
+
+
+def sparseWidth(width):
+  """
+  Returns the size of the array that holds a sparse representation of a
+  population of 'width' bits.
+  """
+  return width + 1
+
+
+def writeIndices(array, indices):
+  """
+  Writes active indices into a sparse output array.
+
+  @param array (numpy array)
+  The output array, with at least len(indices) + 1 elements
+
+  @param indices (sequence)
+  Sorted indices of the active bits
+  """
+  numActive = len(indices)
+  array[0] = numActive
+  array[1:numActive + 1] = indices
+
+
+def readIndices(array):
+  """
+  Reads the active indices from a sparse input array.
+
+  @param array (numpy array)
+  The input array
+
+  @return (numpy array)
+  Sorted indices of the active bits, as uint32
+  """
+  return numpy.asarray(array[1:int(array[0]) + 1], dtype="uint32")
+
+
+def readConcatenatedIndices(array, numPieces):
+  """
+  Reads the active indices from an input array that is the concatenation of
+  several sparse outputs of the same size.
+
+  @param array (numpy array)
+  The input array
+
+  @param numPieces (int)
+  The number of outputs that were concatenated
+
+  @return (tuple of numpy arrays)
+  The sorted indices of the active bits in each piece
+  """
+  return tuple(readIndices(piece)
+               for piece in numpy.split(array, numPieces))
+
+
+def toDense(array, width):
+  """
+  Converts a sparse input or output array into a dense 0/1 array.
+
+  @param array (numpy array)
+  The sparse array
+
+  @param width (int)
+  The size of the population
+
+  @return (numpy array)
+  A dense array of 'width' elements
+  """
+  dense = numpy.zeros(width, dtype=array.dtype)
+  dense[readIndices(array)] = 1
+  return dense
+
+
+def getRegionOutputIndices(region, outputName):
+  """
+  Returns the active indices of a region's output, whether or not the region
+  is in sparse mode.
+
+  @param region (nupic.engine.Region)
+  A region, which may or may not have a "sparseIO" parameter
+
+  @param outputName (str)
+  The name of the output
+
+  @return (numpy array)
+  Sorted indices of the active bits
+  """
+  output = region.getOutputData(outputName)
+  if getattr(region.getSelf(), "sparseIO", False):
+    return readIndices(output)
+  else:
+    return output.nonzero()[0]
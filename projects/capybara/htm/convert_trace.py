@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Convert an HTM trace CSV to the binary format of
+htmresearch.frameworks.capybara.sparse_trace, so that analysis scripts can
+open it with SparseTrace without parsing any JSON.
+
+Example:
+  python convert_trace.py traces/trace_body_acc_x_TRAIN \
+    traces/trace_body_acc_x_TRAIN.sparse \
+    --sdr spActiveColumns=2048 --sdr tmPredictedActiveCells=65536
+"""
+
+import argparse
+
+from htmresearch.frameworks.capybara.sparse_trace import convert_trace
+
+
+
+def _parseSdrWidths(sdrOptions):
+  sdrWidths = {}
+  for option in sdrOptions:
+    name, width = option.split('=')
+    sdrWidths[name] = int(width)
+  return sdrWidths
+
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('inputFile',
+                      type=str,
+                      help='Trace CSV written by run_htm_network.py.')
+  parser.add_argument('outputDir',
+                      type=str,
+                      help='Directory of the converted trace.')
+  parser.add_argument('--sdr',
+                      dest='sdrs',
+                      action='append',
+                      required=True,
+                      help='SDR column and width to convert, e.g. '
+                           'tmPredictedActiveCells=65536. Can be repeated.')
+  parser.add_argument('--field',
+                      dest='fields',
+                      action='append',
+                      default=None,
+                      help='Non-SDR column to keep, e.g. label. Can be '
+                           'repeated. Defaults to all the columns that '
+                           'don\'t hold lists.')
+  parser.add_argument('--timeIndexed',
+                      dest='timeIndexed',
+                      action='store_true',
+                      help='The trace has one row per timestep.')
+  parser.add_argument('--sequenceField',
+                      dest='sequenceField',
+                      type=str,
+                      default=None,
+                      help='For time-indexed traces, the column whose changes '
+                           'delimit the sequences, e.g. label.')
+  parser.add_argument('--chunkSize',
+                      dest='chunkSize',
+                      type=int,
+                      default=1000,
+                      help='For time-indexed traces without a sequence field, '
+                           'the number of timesteps per sequence.')
+  options = parser.parse_args()
+
+  numSequences = convert_trace(options.inputFile, options.outputDir,
+                               _parseSdrWidths(options.sdrs),
+                               time_indexed=options.timeIndexed,
+                               sequence_field=options.sequenceField,
+                               chunk_size=options.chunkSize,
+                               field_names=options.fields)
+  print 'Wrote %d sequences to %s' % (numSequences, options.outputDir)
+
+
+
+if __name__ == '__main__':
+  main()
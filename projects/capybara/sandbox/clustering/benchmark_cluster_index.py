@@ -0,0 +1,102 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+"""
+Time the cluster center index against the Python loops it replaces, for
+growing numbers of clusters.
+"""
+import time
+
+import numpy as np
+
+from htmresearch.frameworks.capybara.distance import euclidian_distance
+from htmresearch.frameworks.capybara.unsupervised.cluster_index import \
+  ClusterCenterIndex
+
+
+
+def loop_closest(centers, point):
+  distances = [euclidian_distance(c, point) for c in centers]
+  return np.argmin(distances)
+
+
+
+def loop_average_distance(centers):
+  distances = [euclidian_distance(centers[i], centers[j])
+               for i in range(len(centers))
+               for j in range(i + 1, len(centers))]
+  return np.mean(distances)
+
+
+
+def benchmark(num_clusters, dim, num_queries, max_loop_pairs=2e6):
+  rng = np.random.RandomState(42)
+  centers = rng.rand(num_clusters, dim)
+  points = rng.rand(num_queries, dim)
+
+  start = time.time()
+  index = ClusterCenterIndex(euclidian_distance)
+  for i in range(num_clusters):
+    index.add(i, centers[i])
+  build_time = time.time() - start
+
+  start = time.time()
+  for point in points:
+    index.closest(point)
+  closest_time = (time.time() - start) / num_queries
+
+  # An online step: update a center, then look up the closest pair and the
+  # average distance.
+  start = time.time()
+  for i in range(num_queries):
+    index.update(i, centers[i] + 0.01)
+    index.closest_pair()
+    index.average_distance()
+  step_time = (time.time() - start) / num_queries
+
+  start = time.time()
+  for point in points:
+    loop_closest(centers, point)
+  loop_closest_time = (time.time() - start) / num_queries
+
+  if num_clusters * (num_clusters - 1) / 2 <= max_loop_pairs:
+    start = time.time()
+    loop_average_distance(centers)
+    loop_step_time = '%.4fs' % (time.time() - start)
+  else:
+    loop_step_time = 'skipped'
+
+  print ('%6d clusters | build %.2fs | closest %.5fs (loop %.5fs) | '
+         'update + closest pair + average %.5fs (loop average %s)'
+         % (num_clusters, build_time, closest_time, loop_closest_time,
+            step_time, loop_step_time))
+
+
+
+def main():
+  dim = 64
+  num_queries = 20
+  for num_clusters in [100, 1000, 5000, 10000]:
+    benchmark(num_clusters, dim, num_queries)
+
+
+
+if __name__ == '__main__':
+  main()
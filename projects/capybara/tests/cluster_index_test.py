@@ -0,0 +1,104 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import unittest
+
+import numpy as np
+
+from htmresearch.frameworks.capybara.distance import \
+  euclidian_distance, percent_overlap_distance
+from htmresearch.frameworks.capybara.unsupervised.cluster_index import \
+  ClusterCenterIndex
+
+
+
+def manhattan_distance(x1, x2):
+  return np.abs(x1 - x2).sum()
+
+
+
+class ClusterCenterIndexTest(unittest.TestCase):
+  """
+  Check the cluster center index against brute-force searches while clusters
+  are added, updated and removed.
+  """
+
+
+  def check_index(self, index, centers, distance_func, point):
+    keys = sorted(centers)
+    distances = [distance_func(centers[k], point) for k in keys]
+    average_distance, distance_to_closest, closest = index.closest(point)
+    self.assertAlmostEqual(average_distance, np.mean(distances))
+    self.assertAlmostEqual(distance_to_closest, min(distances))
+    self.assertAlmostEqual(distance_func(centers[closest], point),
+                           min(distances))
+
+    pair_distances = [distance_func(centers[k1], centers[k2])
+                      for i, k1 in enumerate(keys) for k2 in keys[i + 1:]]
+    self.assertAlmostEqual(index.average_distance(), np.mean(pair_distances))
+    distance, k1, k2 = index.closest_pair()
+    self.assertNotEqual(k1, k2)
+    self.assertAlmostEqual(distance, min(pair_distances))
+    self.assertAlmostEqual(distance_func(centers[k1], centers[k2]),
+                           min(pair_distances))
+
+
+  def test_matches_brute_force(self):
+    for distance_func in (euclidian_distance, percent_overlap_distance,
+                          manhattan_distance):
+      rng = np.random.RandomState(42)
+      index = ClusterCenterIndex(distance_func)
+      centers = {}
+      new_center = lambda: (rng.rand(40) < 0.2).astype(np.float64)
+
+      for key in xrange(150):
+        action = rng.rand()
+        if action < 0.5 or len(centers) < 3:
+          centers[key] = new_center()
+          index.add(key, centers[key])
+        elif action < 0.8:
+          key = rng.choice(sorted(centers))
+          centers[key] = new_center()
+          index.update(key, centers[key])
+        else:
+          key = rng.choice(sorted(centers))
+          del centers[key]
+          index.remove(key)
+
+        self.assertEqual(len(index), len(centers))
+        if len(centers) >= 2:
+          self.check_index(index, centers, distance_func, new_center())
+
+
+  def test_empty_index(self):
+    index = ClusterCenterIndex(euclidian_distance)
+    self.assertEqual(index.closest(np.zeros(3)), (None, None, None))
+    self.assertEqual(index.closest_pair(), (None, None, None))
+    self.assertEqual(index.average_distance(), 0.0)
+
+    index.add('a', np.ones(3))
+    self.assertEqual(index.closest_pair(), (None, None, None))
+    self.assertRaises(ValueError, index.add, 'a', np.ones(3))
+
+
+
+if __name__ == '__main__':
+  unittest.main()
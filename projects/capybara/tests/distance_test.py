@@ -0,0 +1,142 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import unittest
+
+import numpy as np
+from scipy import sparse
+
+from htmresearch.frameworks.capybara.distance import (
+  cluster_distance_factory, cluster_distance_matrix, distance_matrix,
+  euclidian_distance, pairwise_distances, percent_overlap_distance,
+  sequence_distance, sequence_distance_matrices)
+from htmresearch.frameworks.capybara.unsupervised.cluster_distance import (
+  percentOverlap)
+from htmresearch.frameworks.capybara.unsupervised.util import (
+  computeDistanceMat)
+
+
+
+class DistanceTest(unittest.TestCase):
+  """
+  Check the vectorized distances against the one-pair-at-a-time functions.
+  """
+
+
+  def setUp(self):
+    rng = np.random.RandomState(42)
+    self.sp = (rng.rand(12, 3, 128) < 0.05).astype(float)
+    self.tm = (rng.rand(12, 3, 512) < 0.02).astype(float)
+    # An empty sequence, whose overlap with anything is 0
+    self.sp[4] = 0
+    self.tm[4] = 0
+    self.sdrs = self.tm.reshape(-1, 512)
+
+
+  def test_sequence_distance_matrices(self):
+    for assume_sequence_alignment in (True, False):
+      distance = lambda a, b: sequence_distance(a, b,
+                                                assume_sequence_alignment)
+      expected = distance_matrix(self.sp, self.tm, distance)
+      for n_jobs in (1, 2):
+        actual = sequence_distance_matrices(self.sp, self.tm,
+                                            assume_sequence_alignment,
+                                            block_size=5, n_jobs=n_jobs)
+        for expected_mat, actual_mat in zip(expected, actual):
+          np.testing.assert_equal(actual_mat, expected_mat)
+
+
+  def test_pairwise_overlap(self):
+    expected = np.array([[percent_overlap_distance(a, b) for b in self.sdrs]
+                         for a in self.sdrs])
+    np.testing.assert_equal(pairwise_distances(self.sdrs, block_size=7),
+                            expected)
+    np.testing.assert_equal(
+      pairwise_distances(sparse.csr_matrix(self.sdrs), block_size=7), expected)
+    np.testing.assert_equal(
+      pairwise_distances(self.sdrs[:5], self.sdrs, block_size=2),
+      expected[:5])
+
+
+  def test_pairwise_euclidean(self):
+    expected = np.array([[euclidian_distance(a, b) for b in self.sdrs]
+                         for a in self.sdrs])
+    np.testing.assert_allclose(
+      pairwise_distances(self.sdrs, metric='euclidean', block_size=7),
+      expected, atol=1e-12)
+
+
+  def test_euclidean_near_duplicates(self):
+    # Real-valued embeddings where every vector has a near-identical twin.
+    # The distances of those pairs are computed from the differences of the
+    # vectors, so every distance matches the one-pair-at-a-time loops to a
+    # relative tolerance of 1e-10.
+    rng = np.random.RandomState(7)
+    embeddings = rng.rand(6, 2, 64) * 100
+    embeddings = np.concatenate([embeddings,
+                                 embeddings + rng.rand(6, 2, 64) * 1e-6])
+    vectors = embeddings.reshape(-1, 64)
+
+    expected = np.array([[euclidian_distance(a, b) for b in vectors]
+                         for a in vectors])
+    for n_jobs in (1, 2):
+      actual = pairwise_distances(vectors, metric='euclidean', block_size=5,
+                                  n_jobs=n_jobs)
+      np.testing.assert_allclose(actual, expected, rtol=1e-10, atol=0)
+    self.assertTrue(np.all(np.diag(actual) == 0))
+
+    for assume_sequence_alignment in (True, False):
+      distance = lambda a, b: sequence_distance(a, b,
+                                                assume_sequence_alignment)
+      expected = distance_matrix(embeddings, embeddings, distance)[0]
+      actual = sequence_distance_matrices(embeddings, embeddings,
+                                          assume_sequence_alignment)[0]
+      np.testing.assert_allclose(actual, expected, rtol=1e-10, atol=0)
+
+
+  def test_compute_distance_mat(self):
+    # Active indices with repeats, which percentOverlap counts in the sizes
+    # of the SDRs but not in their overlaps
+    sdrs = [[1, 2, 3], [2, 3, 3, 4], [], [5, 5], [1, 2, 3, 7]]
+    expected = np.array([[1 - percentOverlap(a, b) for b in sdrs]
+                         for a in sdrs])
+    np.testing.assert_equal(computeDistanceMat(sdrs), expected)
+
+    dense = [np.array(sdr) for sdr in self.sdrs[:10]]
+    expected = np.array([[1 - percentOverlap(a, b) for b in dense]
+                         for a in dense])
+    np.testing.assert_equal(computeDistanceMat(dense), expected)
+
+
+  def test_cluster_distance_matrix(self):
+    clusters = [self.sdrs[:5], self.sdrs[5:20], self.sdrs[20:20],
+                self.sdrs[20:]]
+    for distance in (euclidian_distance, percent_overlap_distance):
+      cluster_distance = cluster_distance_factory(distance)
+      expected = np.array([[cluster_distance(a, b) for b in clusters]
+                           for a in clusters])
+      np.testing.assert_allclose(cluster_distance_matrix(clusters, distance),
+                                 expected, atol=1e-12)
+
+
+
+if __name__ == '__main__':
+  unittest.main()
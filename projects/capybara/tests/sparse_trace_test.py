@@ -0,0 +1,176 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import csv
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from htmresearch.frameworks.capybara.sdr import load_sdrs
+from htmresearch.frameworks.capybara.sparse_trace import (
+  SparseTrace, convert_trace, iter_sparse_sequences)
+
+SP_WIDTH = 64
+TM_WIDTH = 512
+
+
+
+class SparseTraceTest(unittest.TestCase):
+  """
+  Check the sparse trace readers against the dense SDRs of load_sdrs.
+  """
+
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    rng = np.random.RandomState(42)
+
+    # Sequence-indexed trace, like the ones read by load_sdrs
+    self.sequences = []
+    for label in [0, 1, 1, 2]:
+      num_steps = rng.randint(0, 6)
+      sp = [sorted(rng.choice(SP_WIDTH, rng.randint(0, 5),
+                              replace=False).tolist())
+            for _ in xrange(num_steps)]
+      tm = [sorted(rng.choice(TM_WIDTH, rng.randint(0, 20),
+                              replace=False).tolist())
+            for _ in xrange(num_steps)]
+      self.sequences.append((label, sp, tm))
+
+    self.sequence_csv = os.path.join(self.tmp_dir, 'sequences.csv')
+    with open(self.sequence_csv, 'wb') as f:
+      writer = csv.writer(f)
+      writer.writerow(['label', 'spActiveColumns', 'tmPredictedActiveCells',
+                       'tmActiveCells'])
+      for label, sp, tm in self.sequences:
+        writer.writerow([json.dumps(label), json.dumps(sp), json.dumps(tm),
+                         json.dumps(tm)])
+
+    # The same SDRs as a time-indexed trace
+    self.time_csv = os.path.join(self.tmp_dir, 'time.csv')
+    with open(self.time_csv, 'wb') as f:
+      writer = csv.writer(f)
+      writer.writerow(['t', 'label', 'tmPredictedActiveCells',
+                       'tmActiveCells'])
+      t = 0
+      for label, _, tm in self.sequences:
+        for active_cells in tm:
+          writer.writerow([json.dumps(t), json.dumps(label),
+                           json.dumps(active_cells), json.dumps(active_cells)])
+          t += 1
+
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+
+  def test_sequence_indexed(self):
+    dense = load_sdrs(self.sequence_csv, SP_WIDTH, TM_WIDTH)
+    sdr_widths = {'spActiveColumns': SP_WIDTH,
+                  'tmPredictedActiveCells': TM_WIDTH}
+
+    streamed = list(iter_sparse_sequences(self.sequence_csv, sdr_widths))
+    trace_dir = os.path.join(self.tmp_dir, 'trace')
+    self.assertEqual(convert_trace(self.sequence_csv, trace_dir, sdr_widths),
+                     len(self.sequences))
+    trace = SparseTrace(trace_dir)
+    self.assertEqual(len(trace), len(self.sequences))
+    stored = list(trace.iter_sequences())
+
+    for results in (streamed, stored):
+      self.assertEqual(len(results), len(dense))
+      for i, (fields, sdrs) in enumerate(results):
+        self.assertEqual(fields, {'label': dense.label[i]})
+        for name, width in sdr_widths.iteritems():
+          expected = dense[name][i].reshape(-1, width)
+          np.testing.assert_equal(sdrs[name].toarray(), expected)
+
+    for i, (_, sp, _) in enumerate(self.sequences):
+      start = sum(len(s[1]) for s in self.sequences[:i])
+      for j, active_columns in enumerate(sp):
+        np.testing.assert_equal(
+          trace.get_active_indices('spActiveColumns', start + j),
+          active_columns)
+
+
+  def test_time_indexed(self):
+    sdr_widths = {'tmPredictedActiveCells': TM_WIDTH}
+    all_steps = [tm for _, _, tm in self.sequences for tm in tm]
+
+    # Grouped by label, consecutive sequences with the same label are merged
+    by_label = list(iter_sparse_sequences(self.time_csv, sdr_widths,
+                                          time_indexed=True,
+                                          sequence_field='label'))
+    labels = [fields['label'][0] for fields, _ in by_label]
+    self.assertEqual(labels, [0, 1, 2])
+    for fields, _ in by_label:
+      self.assertEqual(len(set(fields['label'])), 1)
+
+    trace_dir = os.path.join(self.tmp_dir, 'trace')
+    convert_trace(self.time_csv, trace_dir, sdr_widths, time_indexed=True,
+                  chunk_size=3)
+    trace = SparseTrace(trace_dir)
+    self.assertEqual(trace.num_steps, len(all_steps))
+    self.assertTrue(all(len(fields['t']) <= 3 for fields in trace.fields))
+    self.assertTrue(all(sorted(fields) == ['label', 't']
+                        for fields in trace.fields))
+
+    for results in ([sdrs for _, sdrs in by_label],
+                    [sdrs for _, sdrs in trace.iter_sequences()],
+                    [{'tmPredictedActiveCells': chunk} for chunk
+                     in trace.iter_chunks('tmPredictedActiveCells', 4)]):
+      matrix = np.concatenate([sdrs['tmPredictedActiveCells'].toarray()
+                               for sdrs in results])
+      expected = np.zeros((len(all_steps), TM_WIDTH))
+      for t, active_cells in enumerate(all_steps):
+        expected[t, active_cells] = 1
+      np.testing.assert_equal(matrix, expected)
+
+
+
+  def test_field_names(self):
+    sdr_widths = {'spActiveColumns': SP_WIDTH}
+
+    # List-valued columns can be kept explicitly
+    streamed = list(iter_sparse_sequences(
+      self.sequence_csv, sdr_widths,
+      field_names=['label', 'tmPredictedActiveCells']))
+    for (fields, _), (label, _, tm) in zip(streamed, self.sequences):
+      self.assertEqual(fields, {'label': label,
+                                'tmPredictedActiveCells': tm})
+
+    by_label = list(iter_sparse_sequences(
+      self.time_csv, {'tmPredictedActiveCells': TM_WIDTH}, time_indexed=True,
+      sequence_field='label', field_names=[]))
+    self.assertEqual([fields for fields, _ in by_label], [{}, {}, {}])
+
+    with self.assertRaises(ValueError):
+      list(iter_sparse_sequences(self.sequence_csv, sdr_widths,
+                                 field_names=['category']))
+
+
+
+if __name__ == '__main__':
+  unittest.main()
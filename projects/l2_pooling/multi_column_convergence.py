@@ -172,6 +172,9 @@ def runExperiment(args):
                              with lateral connections.
   @param includeRandomLocation (bool) If True, a random location SDR will be
                              generated during inference for each feature.
+  @param numWorkers  (int)   If > 1, the columns are computed in this many
+                             worker processes. Can't be used from inside a
+                             multiprocessing Pool. Default: 0
 
   The method returns the args dict updated with two additional keys:
     convergencePoint (int)   The average number of iterations it took
@@ -192,6 +195,7 @@ def runExperiment(args):
   plotInferenceStats = args.get("plotInferenceStats", True)
   settlingTime = args.get("settlingTime", 3)
   includeRandomLocation = args.get("includeRandomLocation", False)
+  numWorkers = args.get("numWorkers", 0)
 
 
   # Create the objects
@@ -231,7 +235,8 @@ def runExperiment(args):
     inputSize=150,
     externalInputSize=2400,
     numInputBits=20,
-    seed=trialNum
+    seed=trialNum,
+    numWorkers=numWorkers
   )
 
   exp.learnObjects(objects.provideObjectsToLearn())
@@ -300,6 +305,8 @@ def runExperiment(args):
   convergencePoint = averageConvergencePoint(
     exp.getInferenceStats(),"L2 Representation", 30, 40, settlingTime)
 
+  exp.close()
+
 
   print "# objects {} # features {} # locations {} # columns {} trial # {} network type {}".format(
     numObjects, numFeatures, numLocations, numColumns, trialNum, networkType)
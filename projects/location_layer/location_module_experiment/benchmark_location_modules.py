@@ -0,0 +1,139 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Time many location modules stepping together: every module shifts, then
+learns or anchors on the same input, like in Grid2DLocationExperiment. The
+modules are stepped one by one, then as a SuperficialLocationModuleBank.
+"""
+
+from __future__ import print_function
+import math
+import random
+import time
+
+import numpy as np
+
+from htmresearch.algorithms.superficial_location_module import (
+  SuperficialLocationModule2D, SuperficialLocationModuleBank)
+
+MODULE_PARAMS = {
+  "activationThreshold": 8,
+  "learningThreshold": 8,
+  "initialPermanence": 0.6,
+}
+
+
+def createModuleConfigs(numModules, pointOffsets):
+  configs = []
+  for i in xrange(numModules):
+    scale = 10.0 * (math.sqrt(2) ** (i / 2))
+    orientation = random.gauss(7.5, 7.5) * math.pi / 180.0
+    configs.append({
+      "cellDimensions": (5, 5),
+      "moduleMapDimensions": (scale, scale),
+      "orientation": random.choice([orientation, -orientation]),
+      "pointOffsets": pointOffsets,
+    })
+  return configs
+
+
+class ModuleList(object):
+  """
+  Steps a list of SuperficialLocationModule2D one by one.
+  """
+
+  def __init__(self, configs, anchorInputSize):
+    self.modules = [SuperficialLocationModule2D(
+                      anchorInputSize=anchorInputSize,
+                      **dict(config, **MODULE_PARAMS))
+                    for config in configs]
+
+  def activateRandomLocation(self):
+    for module in self.modules:
+      module.activateRandomLocation()
+
+  def shift(self, deltaLocation):
+    for module in self.modules:
+      module.shift(deltaLocation)
+
+  def anchor(self, anchorInput):
+    for module in self.modules:
+      module.anchor(anchorInput)
+
+  def learn(self, anchorInput):
+    for module in self.modules:
+      module.learn(anchorInput)
+
+  def numActivePoints(self):
+    return sum(len(module.activePoints) for module in self.modules)
+
+
+class ModuleBank(SuperficialLocationModuleBank):
+
+  def __init__(self, configs, anchorInputSize):
+    super(ModuleBank, self).__init__(configs, anchorInputSize,
+                                     **MODULE_PARAMS)
+
+  def numActivePoints(self):
+    return self._numActivePoints
+
+
+def benchmark(ModuleClass, numModules, pointOffsets, numSteps=200,
+              anchorInputSize=4800):
+  random.seed(42)
+  np.random.seed(42)
+  modules = ModuleClass(createModuleConfigs(numModules, pointOffsets),
+                        anchorInputSize)
+  inputs = [np.array(sorted(random.sample(xrange(anchorInputSize), 40)),
+                     dtype="uint32")
+            for _ in xrange(20)]
+  deltas = np.random.randn(numSteps, 2) * 3.0
+
+  modules.activateRandomLocation()
+
+  timings = {"shift": 0.0, "learn": 0.0, "anchor": 0.0}
+  for step in xrange(numSteps):
+    start = time.time()
+    modules.shift(deltas[step])
+    timings["shift"] += time.time() - start
+
+    anchorInput = inputs[step % len(inputs)]
+    phase = "learn" if step < numSteps / 2 else "anchor"
+    start = time.time()
+    getattr(modules, phase)(anchorInput)
+    timings[phase] += time.time() - start
+
+  print("{:3d} modules, {} offsets, {:>10}: shift {:7.1f}us, "
+        "learn {:7.1f}us, anchor {:7.1f}us per step "
+        "({:.1f} points per module)".format(
+          numModules, len(pointOffsets), ModuleClass.__name__,
+          1e6 * timings["shift"] / numSteps,
+          2e6 * timings["learn"] / numSteps,
+          2e6 * timings["anchor"] / numSteps,
+          modules.numActivePoints() / float(numModules)))
+
+
+if __name__ == "__main__":
+  for pointOffsets in [(0.5,), (0.2, 0.8), (0.1, 0.3, 0.5, 0.7, 0.9)]:
+    for numModules in [1, 10, 18, 40, 100]:
+      for ModuleClass in (ModuleList, ModuleBank):
+        benchmark(ModuleClass, numModules, pointOffsets)
@@ -25,6 +25,8 @@ from htmresearch.frameworks.poirazi_neuron_model.neuron_model import (
   power_nonlinearity, threshold_nonlinearity, sigmoid_nonlinearity)
 from htmresearch.frameworks.poirazi_neuron_model.neuron_model import Matrix_Neuron as Neuron
 from htmresearch.frameworks.poirazi_neuron_model.data_tools import generate_evenly_distributed_data_sparse
+from htmresearch.frameworks.poirazi_neuron_model.parallel_trials import run_trials
+from multiprocessing import cpu_count
 numpy.random.seed(19)
 
 def run_false_positive_experiment_dim(num_neurons = 1,
@@ -35,38 +37,49 @@ def run_false_positive_experiment_dim(num_neurons = 1,
                     num_dendrites = 500,
                     dendrite_length = 24,
                     num_trials = 10000,
-                    nonlinearity = sigmoid_nonlinearity(11.5, 5)):
+                    nonlinearity = sigmoid_nonlinearity(11.5, 5),
+                    num_processes = 1):
   """
   Run an experiment to test the false positive rate based on number of
   synapses per dendrite, dimension and sparsity.  Uses two competing neurons,
   along the P&M model.
 
+  Trials are independent, and are run across num_processes processes.
+
   Based on figure 5B in the original SDR paper.
   """
   for dim in test_dims:
 
-    fps = []
-    fns = []
-
-    for trial in range(num_trials):
+    params = dict(a = a, dim = dim, num_samples = num_samples,
+                  num_dendrites = num_dendrites,
+                  dendrite_length = dendrite_length,
+                  nonlinearity = nonlinearity)
+    seeds = numpy.random.randint(2**31, size = num_trials)
+    results = run_trials(run_trial, params, seeds, num_processes)
+    fps = [fp for fp, fn in results]
+    fns = [fn for fp, fn in results]
 
-      neuron = Neuron(size = dendrite_length*num_dendrites, num_dendrites = num_dendrites, dendrite_length = dendrite_length, dim = dim, nonlinearity = nonlinearity)
-      neg_neuron = Neuron(size = dendrite_length*num_dendrites, num_dendrites = num_dendrites, dendrite_length = dendrite_length, dim = dim, nonlinearity = nonlinearity)
-      data = generate_evenly_distributed_data_sparse(dim = dim, num_active = a, num_samples = num_samples)
-      labels = numpy.asarray([1 for i in range(num_samples/2)] + [-1 for i in range(num_samples/2)])
-      flipped_labels = labels * -1
+    with open("pm_dim_FP_{}.txt".format(a), "a") as f:
+      f.write(str(dim) + ", " + str(sum(fns + fps)) + ", " + str(num_trials*num_samples) + "\n")
 
-      neuron.HTM_style_initialize_on_data(data, labels)
-      neg_neuron.HTM_style_initialize_on_data(data, flipped_labels)
+def run_trial(a, dim, num_samples, num_dendrites, dendrite_length, nonlinearity):
+  """
+  Runs a single trial of the experiment, and returns its number of false
+  positives and false negatives.
+  """
+  neuron = Neuron(size = dendrite_length*num_dendrites, num_dendrites = num_dendrites, dendrite_length = dendrite_length, dim = dim, nonlinearity = nonlinearity)
+  neg_neuron = Neuron(size = dendrite_length*num_dendrites, num_dendrites = num_dendrites, dendrite_length = dendrite_length, dim = dim, nonlinearity = nonlinearity)
+  data = generate_evenly_distributed_data_sparse(dim = dim, num_active = a, num_samples = num_samples)
+  labels = numpy.asarray([1 for i in range(num_samples/2)] + [-1 for i in range(num_samples/2)])
+  flipped_labels = labels * -1
 
-      error, fp, fn, uc = get_error(data, labels, [neuron], [neg_neuron], add_noise = True)
+  neuron.HTM_style_initialize_on_data(data, labels)
+  neg_neuron.HTM_style_initialize_on_data(data, flipped_labels)
 
-      fps.append(fp)
-      fns.append(fn)
-      print "Error at n = {} is {}, with {} false positives and {} false negatives, with {} unclassified".format(dim, error, fp, fn, uc)
+  error, fp, fn, uc = get_error(data, labels, [neuron], [neg_neuron], add_noise = True)
 
-    with open("pm_dim_FP_{}.txt".format(a), "a") as f:
-      f.write(str(dim) + ", " + str(sum(fns + fps)) + ", " + str(num_trials*num_samples) + "\n")
+  print "Error at n = {} is {}, with {} false positives and {} false negatives, with {} unclassified".format(dim, error, fp, fn, uc)
+  return fp, fn
 
 def get_error(data, labels, pos_neurons, neg_neurons = [], add_noise = False):
   """
@@ -104,4 +117,4 @@ def get_error(data, labels, pos_neurons, neg_neurons = [], add_noise = False):
 
 
 if __name__ == "__main__":
-  run_false_positive_experiment_dim()
+  run_false_positive_experiment_dim(num_processes = cpu_count())
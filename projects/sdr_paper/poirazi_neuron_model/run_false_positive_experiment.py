@@ -24,6 +24,8 @@ import random
 from htmresearch.frameworks.poirazi_neuron_model.neuron_model import power_nonlinearity, threshold_nonlinearity
 from htmresearch.frameworks.poirazi_neuron_model.neuron_model import Matrix_Neuron as Neuron
 from htmresearch.frameworks.poirazi_neuron_model.data_tools import generate_evenly_distributed_data_sparse
+from htmresearch.frameworks.poirazi_neuron_model.parallel_trials import run_trials
+from multiprocessing import cpu_count
 numpy.random.seed(19)
 
 def run_HTM_false_positive_experiment_synapses(num_neurons = 1,
@@ -32,11 +34,13 @@ def run_HTM_false_positive_experiment_synapses(num_neurons = 1,
                          num_samples = 1000,
                          num_dendrites = 500,
                          test_dendrite_lengths = range(2, 32, 2),
-                         num_trials = 1000):
+                         num_trials = 1000,
+                         num_processes = 1):
   """
   Run an experiment to test the false positive rate based on number of
   synapses per dendrite, dimension and sparsity.  Uses a single neuron,
-  with a threshold nonlinearity of theta = s/2.
+  with a threshold nonlinearity of theta = s/2.  Trials are independent, and
+  are run across num_processes processes.
 
   Based on figure 5B in the original SDR paper.
 
@@ -52,26 +56,32 @@ def run_HTM_false_positive_experiment_synapses(num_neurons = 1,
   for dendrite_length in test_dendrite_lengths:
     nonlinearity = threshold_nonlinearity(dendrite_length / 2)
 
-    fps = []
-    fns = []
+    params = dict(a = a, dim = dim, num_samples = num_samples,
+                  num_dendrites = num_dendrites,
+                  dendrite_length = dendrite_length,
+                  nonlinearity = nonlinearity)
+    seeds = numpy.random.randint(2**31, size = num_trials)
+    results = run_trials(run_trial, params, seeds, num_processes)
+    fps = [fp for fp, fn in results]
 
-    for trial in range(num_trials):
-
-      neuron = Neuron(size = dendrite_length*num_dendrites, num_dendrites = num_dendrites, dendrite_length = dendrite_length, dim = dim, nonlinearity = nonlinearity)
-      pos, neg = generate_evenly_distributed_data_sparse(dim = dim, num_active = a, num_samples = num_samples/2), generate_evenly_distributed_data_sparse(dim = dim, num_active = a, num_samples = num_samples/2)
-      #labels = numpy.asarray([1 for i in range(num_samples/2)] + [-1 for i in range(num_samples/2)])
-
-      neuron.HTM_style_initialize_on_data(pos, numpy.asarray([1 for i in range(num_samples/2)]))
+    with open("num_dendrites_FP_{}_{}.txt".format(a, dim), "a") as f:
+      f.write(str(dendrite_length) + ", " + str(sum(fps)) + ", " + str(num_trials*num_samples/2.) + "\n")
 
-      error, fp, fn = get_error(neg, [-1 for i in range(num_samples/2)], [neuron])
+def run_trial(a, dim, num_samples, num_dendrites, dendrite_length, nonlinearity):
+  """
+  Runs a single trial of the experiment, and returns its number of false
+  positives and false negatives.
+  """
+  neuron = Neuron(size = dendrite_length*num_dendrites, num_dendrites = num_dendrites, dendrite_length = dendrite_length, dim = dim, nonlinearity = nonlinearity)
+  pos, neg = generate_evenly_distributed_data_sparse(dim = dim, num_active = a, num_samples = num_samples/2), generate_evenly_distributed_data_sparse(dim = dim, num_active = a, num_samples = num_samples/2)
+  #labels = numpy.asarray([1 for i in range(num_samples/2)] + [-1 for i in range(num_samples/2)])
 
-      fps.append(fp)
-      fns.append(fn)
-      print "Error at {} synapses per dendrite is {}, with {} false positives and {} false negatives".format(dendrite_length, fp/(num_samples/2.), fp, fn)
+  neuron.HTM_style_initialize_on_data(pos, numpy.asarray([1 for i in range(num_samples/2)]))
 
-    with open("num_dendrites_FP_{}_{}.txt".format(a, dim), "a") as f:
-      f.write(str(dendrite_length) + ", " + str(sum(fps)) + ", " + str(num_trials*num_samples/2.) + "\n")
+  error, fp, fn = get_error(neg, [-1 for i in range(num_samples/2)], [neuron])
 
+  print "Error at {} synapses per dendrite is {}, with {} false positives and {} false negatives".format(dendrite_length, fp/(num_samples/2.), fp, fn)
+  return fp, fn
 
 def get_error(data, labels, pos_neurons, neg_neurons = []):
   """
@@ -103,4 +113,4 @@ def get_error(data, labels, pos_neurons, neg_neurons = []):
 
 
 if __name__ == "__main__":
-  run_HTM_false_positive_experiment_synapses()
+  run_HTM_false_positive_experiment_synapses(num_processes = cpu_count())
@@ -25,6 +25,8 @@ import copy
 from htmresearch.frameworks.poirazi_neuron_model.neuron_model import Matrix_Neuron as Neuron
 from htmresearch.frameworks.poirazi_neuron_model.neuron_model import threshold_nonlinearity, power_nonlinearity
 from htmresearch.frameworks.poirazi_neuron_model.data_tools import generate_evenly_distributed_data_sparse, apply_noise
+from htmresearch.frameworks.poirazi_neuron_model.parallel_trials import run_trials
+from multiprocessing import cpu_count
 from nupic.bindings.math import *
 numpy.random.seed(19)
 
@@ -36,7 +38,8 @@ def run_noise_experiment(num_neurons = 1,
              num_dendrites = 500,
              dendrite_length = 30,
              theta = 8,
-             num_trials = 100):
+             num_trials = 100,
+             num_processes = 1):
   """
   Tests the impact of noise on a neuron, using an HTM approach to a P&M
   model of a neuron.  Nonlinearity is a simple threshold at theta, as in the
@@ -47,7 +50,8 @@ def run_noise_experiment(num_neurons = 1,
 
   Training is done via HTM-style initialization.  In the event that the init
   fails to produce an error rate of 0 without noise (which anecdotally never
-  occurs), we simple reinitialize.
+  occurs), we simple reinitialize.  Trials are independent, and are run across
+  num_processes processes.
 
   Results are saved to the file noise_FN_{theta}.txt.
 
@@ -61,35 +65,42 @@ def run_noise_experiment(num_neurons = 1,
   nonlinearity = threshold_nonlinearity(theta)
   for noise in test_noise_levels:
 
-    fps = []
-    fns = []
-
-    for trial in range(num_trials):
-
-      successful_initialization = False
-      while not successful_initialization:
-        neuron = Neuron(size = dendrite_length*num_dendrites, num_dendrites = num_dendrites, dendrite_length = dendrite_length, dim = dim, nonlinearity = nonlinearity)
-        data = generate_evenly_distributed_data_sparse(dim = dim, num_active = a, num_samples = num_samples)
-        labels = [1 for i in range(num_samples)]
-
-        neuron.HTM_style_initialize_on_data(data, labels)
-
-        error, fp, fn = get_error(data, labels, [neuron])
-        print "Initialization error is {}, with {} false positives and {} false negatives".format(error, fp, fn)
-        if error == 0:
-          successful_initialization = True
-        else:
-          print "Repeating to get a successful initialization"
-
-      apply_noise(data, noise)
-      error, fp, fn = get_error(data, labels, [neuron])
-      fps.append(fp)
-      fns.append(fn)
-      print "Error at noise {} is {}, with {} false positives and {} false negatives".format(noise, error, fp, fn)
+    params = dict(a = a, dim = dim, noise = noise, num_samples = num_samples,
+                  num_dendrites = num_dendrites,
+                  dendrite_length = dendrite_length,
+                  nonlinearity = nonlinearity)
+    seeds = numpy.random.randint(2**31, size = num_trials)
+    results = run_trials(run_trial, params, seeds, num_processes)
+    fns = [fn for fp, fn in results]
 
     with open("noise_FN_{}.txt".format(theta), "a") as f:
       f.write(str(noise) + ", " + str(numpy.sum(fns)) + ", " + str(num_trials*num_samples) + "\n")
 
+def run_trial(a, dim, noise, num_samples, num_dendrites, dendrite_length, nonlinearity):
+  """
+  Runs a single trial of the experiment, and returns its number of false
+  positives and false negatives under noise.
+  """
+  successful_initialization = False
+  while not successful_initialization:
+    neuron = Neuron(size = dendrite_length*num_dendrites, num_dendrites = num_dendrites, dendrite_length = dendrite_length, dim = dim, nonlinearity = nonlinearity)
+    data = generate_evenly_distributed_data_sparse(dim = dim, num_active = a, num_samples = num_samples)
+    labels = [1 for i in range(num_samples)]
+
+    neuron.HTM_style_initialize_on_data(data, labels)
+
+    error, fp, fn = get_error(data, labels, [neuron])
+    print "Initialization error is {}, with {} false positives and {} false negatives".format(error, fp, fn)
+    if error == 0:
+      successful_initialization = True
+    else:
+      print "Repeating to get a successful initialization"
+
+  apply_noise(data, noise)
+  error, fp, fn = get_error(data, labels, [neuron])
+  print "Error at noise {} is {}, with {} false positives and {} false negatives".format(noise, error, fp, fn)
+  return fp, fn
+
 def get_error(data, labels, pos_neurons, neg_neurons = []):
   """
   Calculates error, including number of false positives and false negatives.
@@ -120,4 +131,4 @@ def get_error(data, labels, pos_neurons, neg_neurons = []):
 
 
 if __name__ == "__main__":
-  run_noise_experiment()
+  run_noise_experiment(num_processes = cpu_count())
@@ -24,6 +24,8 @@ import os
 from optparse import OptionParser
 import pprint
 import pickle
+import shutil
+import tempfile
 from tabulate import tabulate
 
 import nupic.math.topology as topology
@@ -36,6 +38,8 @@ from htmresearch.frameworks.sp_paper.sp_metrics import (
   calculateStability, calculateInputSpaceCoverage, plotExampleInputOutput,
   reconstructionError, witnessError
 )
+from htmresearch.frameworks.sp_paper.shared_spatial_pooler import (
+  exportSpatialPooler)
 from htmresearch.support.spatial_pooler_monitor_mixin import (
   SpatialPoolerMonitorMixin)
 
@@ -191,6 +195,13 @@ def _getArgs():
                     dest="trackOverlapCurve",
                     help="whether to track overlap curve during learning")
 
+  parser.add_option("--numProcesses",
+                    type=int,
+                    default=1,
+                    dest="numProcesses",
+                    help="number of processes computing the noise robustness "
+                         "and classification metrics")
+
   parser.add_option("--checkRFCenters",
                     type=int,
                     default=0,
@@ -475,9 +486,17 @@ def runSPexperiments(expConfig):
         else:
           sp.killCells(expConfig.killCellPrct)
 
+    # Export the SP once for the worker processes of both evaluations
+    sharedSPPath = None
+    if expConfig.numProcesses > 1 and (expConfig.trackOverlapCurve or
+                                       expConfig.classification):
+      sharedSPPath = tempfile.mkdtemp()
+      exportSpatialPooler(sp, sharedSPPath)
+
     if expConfig.trackOverlapCurve:
       noiseLevelList, inputOverlapScore, outputOverlapScore = \
-        calculateOverlapCurve(sp, testInputs)
+        calculateOverlapCurve(sp, testInputs, expConfig.numProcesses,
+                              sharedSPPath)
       metrics['noiseRobustness'].append(
         np.trapz(np.flipud(np.mean(outputOverlapScore, 0)),
                  noiseLevelList))
@@ -489,12 +508,15 @@ def runSPexperiments(expConfig):
       # classify SDRs with noise
       noiseLevelList = np.linspace(0, 1.0, 21)
       classification_accuracy = classificationAccuracyVsNoise(
-        sp, testInputs, noiseLevelList)
+        sp, testInputs, noiseLevelList, expConfig.numProcesses, sharedSPPath)
       metrics['classification'].append(
         np.trapz(classification_accuracy, noiseLevelList))
       np.savez('./results/classification/{}/epoch_{}'.format(expName, epoch),
                noiseLevelList, classification_accuracy)
 
+    if sharedSPPath is not None:
+      shutil.rmtree(sharedSPPath)
+
     # train SP here,
     # Learn is turned off at the first epoch to gather stats of untrained SP
     learn = False if epoch == 0 else True
@@ -539,10 +561,12 @@ def runSPexperiments(expConfig):
     metrics['numRemoveSyn'].append(np.sum(numEliminatedSynapses))
 
     metrics['reconstructionError'].append(
-      reconstructionError(sp, testInputs, activeColumnsCurrentEpoch))
+      reconstructionError(sp, testInputs, activeColumnsCurrentEpoch,
+                          connectedSyns=connectedSyns))
 
     metrics['witnessError'].append(
-      witnessError(sp, testInputs, activeColumnsCurrentEpoch))
+      witnessError(sp, testInputs, activeColumnsCurrentEpoch,
+                   connectedSyns=connectedSyns))
 
     print tabulate(metrics, headers="keys")
 
@@ -563,7 +587,7 @@ def runSPexperiments(expConfig):
 
     if expConfig.checkInputSpaceCoverage:
       # check coverage of input space, useful to monitor recovery from trauma
-      inputSpaceCoverage = calculateInputSpaceCoverage(sp)
+      inputSpaceCoverage = calculateInputSpaceCoverage(sp, connectedSyns)
       np.savez('results/InputCoverage/{}/epoch_{}'.format(expName, epoch),
                inputSpaceCoverage, connectedCounts)
 
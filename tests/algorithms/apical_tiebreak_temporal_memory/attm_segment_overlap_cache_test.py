@@ -0,0 +1,161 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Test the segment overlap cache of the ApicalTiebreakTemporalMemory.
+"""
+
+import unittest
+
+from mock import patch
+import numpy as np
+
+from htmresearch.algorithms import apical_tiebreak_temporal_memory as attm
+from nupic.bindings.math import SparseMatrixConnections
+
+
+
+class UncachedSegmentOverlaps(attm.SegmentOverlapCache):
+  """
+  Recomputes the overlaps on every call.
+  """
+
+  def computeOverlaps(self, connections, activeInput, connectedPermanence):
+    return attm.computeSegmentOverlaps(connections, activeInput,
+                                       connectedPermanence)
+
+
+
+def constructTM(cached):
+  tm = attm.ApicalTiebreakPairMemory(
+    columnCount=64, basalInputSize=256, apicalInputSize=128,
+    cellsPerColumn=4, activationThreshold=6, reducedBasalThreshold=4,
+    minThreshold=4, sampleSize=8, basalPredictedSegmentDecrement=0.02,
+    apicalPredictedSegmentDecrement=0.02, seed=42)
+  if not cached:
+    tm.basalOverlapCache = UncachedSegmentOverlaps()
+    tm.apicalOverlapCache = UncachedSegmentOverlaps()
+  return tm
+
+
+
+class SegmentOverlapCacheTest(unittest.TestCase):
+
+  def testCacheDoesNotChangeResults(self):
+    """
+    Learn and infer with repeated inputs. The cached TM should behave exactly
+    like a TM that recomputes the overlaps every time.
+    """
+    rng = np.random.RandomState(42)
+    patterns = [(np.sort(rng.choice(64, 8, replace=False)),
+                 np.sort(rng.choice(256, 12, replace=False)),
+                 np.sort(rng.choice(128, 10, replace=False)))
+                for _ in xrange(6)]
+
+    tm = constructTM(cached=True)
+    reference = constructTM(cached=False)
+
+    for _ in xrange(40):
+      learn = rng.rand() < 0.5
+      activeColumns, basalInput, apicalInput = patterns[rng.randint(6)]
+      if rng.rand() < 0.3:
+        apicalInput = np.empty(0, dtype="uint32")
+      for t in (tm, reference):
+        t.compute(activeColumns, basalInput, apicalInput,
+                  basalGrowthCandidates=basalInput,
+                  apicalGrowthCandidates=apicalInput, learn=learn)
+
+      np.testing.assert_equal(tm.getActiveCells(),
+                              reference.getActiveCells())
+      np.testing.assert_equal(tm.getPredictedCells(),
+                              reference.getPredictedCells())
+      np.testing.assert_equal(tm.basalPotentialOverlaps,
+                              reference.basalPotentialOverlaps)
+      np.testing.assert_equal(tm.apicalPotentialOverlaps,
+                              reference.apicalPotentialOverlaps)
+
+
+  def testSkipsRecomputationForUnchangedInput(self):
+    connections = SparseMatrixConnections(16, 32)
+    segments = connections.createSegments(np.arange(4, dtype="uint32"))
+    connections.growSynapses(segments, np.arange(8, dtype="uint32"), 0.6)
+    activeInput = np.arange(4, dtype="uint32")
+    cache = attm.SegmentOverlapCache()
+
+    with patch.object(attm, "computeSegmentOverlaps",
+                      wraps=attm.computeSegmentOverlaps) as mockCompute:
+      overlaps, potentialOverlaps = cache.computeOverlaps(connections,
+                                                          activeInput, 0.5)
+      np.testing.assert_equal(overlaps, [4, 4, 4, 4])
+      np.testing.assert_equal(potentialOverlaps, [4, 4, 4, 4])
+
+      cache.computeOverlaps(connections, activeInput.copy(), 0.5)
+      self.assertEqual(mockCompute.call_count, 1)
+
+      # A different input or connected permanence is recomputed.
+      cache.computeOverlaps(connections, activeInput[:2], 0.5)
+      cache.computeOverlaps(connections, activeInput[:2], 0.7)
+      self.assertEqual(mockCompute.call_count, 3)
+
+      # Growing synapses is detected.
+      connections.growSynapses(segments[:1], np.arange(8, 16, dtype="uint32"),
+                               0.6)
+      overlaps, _ = cache.computeOverlaps(connections,
+                                          np.arange(8, 12, dtype="uint32"),
+                                          0.7)
+      cache.computeOverlaps(connections, np.arange(8, 12, dtype="uint32"),
+                            0.7)
+      self.assertEqual(mockCompute.call_count, 4)
+      connections.growSynapses(segments[1:2],
+                               np.arange(8, 12, dtype="uint32"), 0.8)
+      overlaps, _ = cache.computeOverlaps(connections,
+                                          np.arange(8, 12, dtype="uint32"),
+                                          0.7)
+      np.testing.assert_equal(overlaps, [0, 4, 0, 0])
+      self.assertEqual(mockCompute.call_count, 5)
+
+      # Permanence changes have to be announced.
+      connections.adjustSynapses(segments, np.arange(8, 12, dtype="uint32"),
+                                 -0.2, 0.0)
+      cache.invalidate()
+      overlaps, _ = cache.computeOverlaps(connections,
+                                          np.arange(8, 12, dtype="uint32"),
+                                          0.7)
+      np.testing.assert_equal(overlaps, [0, 0, 0, 0])
+      self.assertEqual(mockCompute.call_count, 6)
+
+
+  def testEmptyInputReturnsSeparateArrays(self):
+    connections = SparseMatrixConnections(16, 32)
+    connections.createSegments(np.arange(4, dtype="uint32"))
+
+    overlaps, potentialOverlaps = attm.computeSegmentOverlaps(
+      connections, np.empty(0, dtype="uint32"), 0.5)
+    np.testing.assert_equal(overlaps, [0, 0, 0, 0])
+    np.testing.assert_equal(potentialOverlaps, [0, 0, 0, 0])
+
+    overlaps[0] = 1
+    np.testing.assert_equal(potentialOverlaps, [0, 0, 0, 0])
+
+
+
+if __name__ == "__main__":
+  unittest.main()
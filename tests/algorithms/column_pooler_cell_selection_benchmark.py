@@ -0,0 +1,73 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+"""
+Micro-benchmark of the ColumnPooler's cell selection with 1-16 lateral
+columns. It prints the time per call of the original union1d loop and of the
+single-pass selection.
+
+Run it directly:
+
+  python column_pooler_cell_selection_benchmark.py
+"""
+
+import time
+
+import numpy
+
+from htmresearch.algorithms.column_pooler import ColumnPooler
+
+from column_pooler_cell_selection_test import (
+  randomSelectionInputs, referenceChooseActiveCells)
+
+
+
+def benchmark(numLateralColumns, numTrials=50):
+  rng = numpy.random.RandomState(42)
+  pooler = ColumnPooler(inputWidth=1024,
+                        lateralInputWidths=[512] * numLateralColumns,
+                        cellCount=4096)
+  trials = [randomSelectionInputs(rng, pooler.cellCount, numLateralColumns,
+                                  pooler.sdrSize)
+            for _ in xrange(numTrials)]
+
+  start = time.time()
+  expected = [referenceChooseActiveCells(pooler, *args) for args in trials]
+  referenceTime = time.time() - start
+
+  start = time.time()
+  actual = [pooler._chooseActiveCells(*args) for args in trials]
+  singlePassTime = time.time() - start
+
+  for a, e in zip(actual, expected):
+    numpy.testing.assert_array_equal(a, e)
+
+  print "%15d | %19.3f | %16.3f" % (numLateralColumns,
+                                    1000 * referenceTime / numTrials,
+                                    1000 * singlePassTime / numTrials)
+
+
+
+if __name__ == "__main__":
+  print "lateral columns | reference loop (ms) | single pass (ms)"
+  for numLateralColumns in (1, 2, 4, 8, 16):
+    benchmark(numLateralColumns)
@@ -0,0 +1,153 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compares the ColumnPooler's single-pass cell selection with the original
+union1d loop. column_pooler_cell_selection_benchmark.py times them.
+"""
+
+import unittest
+
+import numpy
+
+from htmresearch.algorithms.column_pooler import ColumnPooler
+
+
+
+def referenceChooseActiveCells(pooler, feedforwardSupportedCells,
+                               prevActiveCells, numActiveSegmentsByCell):
+  """
+  The original cell selection from ColumnPooler._computeInferenceMode, which
+  lowers the inhibition level one step at a time.
+  """
+  chosenCells = []
+  minNumActiveCells = int(pooler.sdrSize * 0.75)
+
+  numActiveSegsForFFSuppCells = numActiveSegmentsByCell[
+      feedforwardSupportedCells]
+
+  if len(feedforwardSupportedCells) == 0:
+    pass
+  else:
+    ttop = numpy.max(numActiveSegsForFFSuppCells)
+    while ttop > 0 and len(chosenCells) <= minNumActiveCells:
+      chosenCells = numpy.union1d(chosenCells,
+                  feedforwardSupportedCells[numActiveSegsForFFSuppCells >
+                  pooler.distalSegmentInhibitionFactor * ttop])
+      ttop -= 1
+
+  if len(chosenCells) < minNumActiveCells:
+    if pooler.useInertia:
+      prevCells = numpy.setdiff1d(prevActiveCells, chosenCells)
+      inertialCap = int(len(prevCells) * pooler.inertiaFactor)
+      if inertialCap > 0:
+        numActiveSegsForPrevCells = numActiveSegmentsByCell[prevCells]
+        sortIndices = numpy.argsort(numActiveSegsForPrevCells)[::-1]
+        prevCells = prevCells[sortIndices]
+        numActiveSegsForPrevCells = numActiveSegsForPrevCells[sortIndices]
+
+        prevCells = prevCells[:inertialCap]
+        numActiveSegsForPrevCells = numActiveSegsForPrevCells[:inertialCap]
+
+        ttop = numpy.max(numActiveSegsForPrevCells)
+        while ttop >= 0 and len(chosenCells) <= minNumActiveCells:
+          chosenCells = numpy.union1d(chosenCells,
+                      prevCells[numActiveSegsForPrevCells >
+                      pooler.distalSegmentInhibitionFactor * ttop])
+          ttop -= 1
+
+    remFFcells = numpy.setdiff1d(feedforwardSupportedCells, chosenCells)
+    chosenCells = numpy.append(chosenCells, remFFcells)
+
+  chosenCells.sort()
+  return numpy.asarray(chosenCells, dtype="uint32")
+
+
+
+def randomSelectionInputs(rng, cellCount, numLateralColumns, sdrSize):
+  """
+  Generates the activity of an L2 layer that is receiving a union of a few
+  objects: FF-supported cells, previously active cells, and the number of
+  active lateral segments on every cell.
+  """
+  numObjects = rng.randint(1, 5)
+  objects = [rng.choice(cellCount, sdrSize, replace=False)
+             for _ in xrange(numObjects)]
+
+  feedforwardSupportedCells = numpy.unique(numpy.concatenate(
+    [obj[rng.rand(sdrSize) > rng.rand()] for obj in objects] +
+    [rng.choice(cellCount, rng.randint(10), replace=False)]))
+  prevActiveCells = numpy.unique(numpy.concatenate(
+    [objects[rng.randint(numObjects)],
+     rng.choice(cellCount, rng.randint(20), replace=False)])).astype("uint32")
+
+  # Each object gets support from a random subset of the lateral columns.
+  numActiveSegmentsByCell = numpy.zeros(cellCount, dtype="int")
+  for obj in objects:
+    for _ in xrange(numLateralColumns + 1):
+      if rng.rand() > 0.5:
+        numActiveSegmentsByCell[obj[rng.rand(sdrSize) > 0.2]] += 1
+  numActiveSegmentsByCell[rng.choice(cellCount, 50)] += 1
+
+  return feedforwardSupportedCells, prevActiveCells, numActiveSegmentsByCell
+
+
+
+class ColumnPoolerCellSelectionTest(unittest.TestCase):
+
+  def testMatchesReferenceLoop(self):
+    rng = numpy.random.RandomState(42)
+
+    for numLateralColumns in xrange(1, 17):
+      for inhibitionFactor in (0.999, 0.8, 0.5):
+        for inertiaFactor in (1.0, 0.5):
+          for useInertia in (True, False):
+            pooler = ColumnPooler(
+              inputWidth=1024,
+              lateralInputWidths=[512] * numLateralColumns,
+              cellCount=1024,
+              distalSegmentInhibitionFactor=inhibitionFactor,
+              inertiaFactor=inertiaFactor)
+            pooler.setUseInertia(useInertia)
+
+            for _ in xrange(10):
+              args = randomSelectionInputs(rng, pooler.cellCount,
+                                           numLateralColumns, pooler.sdrSize)
+              expected = referenceChooseActiveCells(pooler, *args)
+              actual = pooler._chooseActiveCells(*args)
+              self.assertEqual(actual.dtype, expected.dtype)
+              numpy.testing.assert_array_equal(actual, expected)
+
+
+  def testEmptyActivity(self):
+    pooler = ColumnPooler(inputWidth=1024, cellCount=1024)
+    empty = numpy.empty(0, dtype="uint32")
+    numActiveSegmentsByCell = numpy.zeros(1024, dtype="int")
+
+    numpy.testing.assert_array_equal(
+      pooler._chooseActiveCells(empty, empty, numActiveSegmentsByCell),
+      referenceChooseActiveCells(pooler, empty, empty,
+                                 numActiveSegmentsByCell))
+
+
+
+if __name__ == "__main__":
+  unittest.main()
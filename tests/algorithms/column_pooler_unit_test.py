@@ -788,6 +788,85 @@ class ColumnPoolerTest(unittest.TestCase):
            "Incorrect object representations - expecting single object")
 
 
+  def testComputeBatchMatchesCompute(self):
+    """
+    computeBatch should give exactly the same active cells as calling
+    compute(learn=False) on each input separately.
+    """
+    pooler = self._initializeDefaultPooler(
+      inputWidth=1024,
+      lateralInputWidths=[512, 512],
+    )
+    rng = numpy.random.RandomState(42)
+
+    # Learn a few objects, each with its own lateral input.
+    objects = []
+    for _ in xrange(5):
+      features = [numpy.sort(rng.choice(1024, 40, replace=False))
+                  for _ in xrange(3)]
+      lateralInputs = [numpy.sort(rng.choice(512, 40, replace=False))
+                       for _ in xrange(2)]
+      objects.append((features, lateralInputs))
+
+      pooler.reset()
+      for _ in xrange(3):
+        for feature in features:
+          pooler.compute(feature, lateralInputs, learn=True)
+
+    # Infer on unions and noisy versions of the features, with a mixture of
+    # missing, partial and mismatched lateral input, from various prior
+    # states.
+    feedforwardInputs = []
+    lateralInputsPerStep = []
+    prevActiveCellsPerStep = []
+    for _ in xrange(50):
+      (features1, lateral1), (features2, lateral2) = [
+        objects[i] for i in rng.choice(len(objects), 2)]
+      feedforward = numpy.union1d(features1[rng.randint(3)],
+                                  features2[rng.randint(3)])
+      feedforward = feedforward[rng.rand(len(feedforward)) > 0.2]
+      lateralInputs = [lateral1[0][rng.rand(40) > 0.3],
+                       lateral2[1]][:rng.randint(3)]
+
+      pooler.reset()
+      pooler.compute(features1[rng.randint(3)], (), learn=False)
+      if rng.rand() > 0.5:
+        pooler.compute(feedforward, lateralInputs, learn=False)
+
+      feedforwardInputs.append(feedforward)
+      lateralInputsPerStep.append(lateralInputs)
+      prevActiveCellsPerStep.append(pooler.getActiveCells().copy())
+
+    for useInertia in (True, False):
+      pooler.setUseInertia(useInertia)
+
+      expected = []
+      for i in xrange(len(feedforwardInputs)):
+        pooler.activeCells = prevActiveCellsPerStep[i]
+        pooler.compute(feedforwardInputs[i], lateralInputsPerStep[i],
+                       learn=False)
+        expected.append(pooler.getActiveCells())
+
+      pooler.reset()
+      actual = pooler.computeBatch(feedforwardInputs, lateralInputsPerStep,
+                                   prevActiveCellsPerStep)
+
+      self.assertEqual(len(pooler.getActiveCells()), 0,
+                       "computeBatch shouldn't modify the pooler's state")
+      self.assertEqual(len(actual), len(expected))
+      for a, e in zip(actual, expected):
+        self.assertEqual(a.dtype, e.dtype)
+        numpy.testing.assert_array_equal(a, e)
+
+    # Without explicit previous active cells, the current state is used.
+    pooler.activeCells = prevActiveCellsPerStep[0]
+    actual = pooler.computeBatch(feedforwardInputs[:5])
+    for i in xrange(5):
+      pooler.activeCells = prevActiveCellsPerStep[0]
+      pooler.compute(feedforwardInputs[i], learn=False)
+      numpy.testing.assert_array_equal(actual[i], pooler.getActiveCells())
+
+
 
 if __name__ == "__main__":
   unittest.main()
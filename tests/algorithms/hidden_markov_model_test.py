@@ -0,0 +1,248 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compares the scaled, vectorized Baum-Welch of HMM with the original
+unscaled loops on short sequences, and checks that long sequences train.
+"""
+
+import unittest
+from copy import copy
+
+import numpy as np
+
+from htmresearch.algorithms.hidden_markov_model import HMM, divide
+
+
+
+class ReferenceHMM(HMM):
+  """
+  The original forward-backward, re-estimation and prediction loops.
+  """
+
+  def _initializeTrial(self, observations):
+    super(ReferenceHMM, self)._initializeTrial(observations)
+    self.eps = np.zeros((self.numStates, self.numStates, self.T))
+
+
+  def _forward(self):
+    y1 = self.observations[0]
+    for i in range(self.numStates):
+      self.alpha[i,0] = self.pi[i] * self.B[i,y1]
+
+    for t in range(1, self.T):
+      yt = self.observations[t]
+      for j in range(self.numStates):
+        sumAlphaT1 = 0.0
+        for i in range(self.numStates):
+          sumAlphaT1 += self.alpha[i,t-1]*self.A[i,j]
+        self.alpha[j,t] = self.B[j,yt]*sumAlphaT1
+
+
+  def _backward(self):
+    for i in range(self.numStates):
+      self.beta[i,self.T-1] = 1.0
+
+    for t in range(self.T-1, 0, -1):
+      yt = self.observations[t]
+      for i in range(self.numStates):
+        newBetaiT1 = 0.0
+        for j in range(self.numStates):
+          newBetaiT1 += self.beta[j,t]*self.A[i,j]*self.B[j,yt]
+        self.beta[i,t-1] = newBetaiT1
+
+
+  def _update(self):
+    for t in range(self.T):
+      denom = 0.0
+      for i in range(self.numStates):
+        denom += self.alpha[i,t]*self.beta[i,t]
+      for i in range(self.numStates):
+        self.gamma[i,t] = divide(self.alpha[i,t]*self.beta[i,t], denom)
+
+    for t in range(self.T-1):
+      for i in range(self.numStates):
+        denom = sum([self.alpha[j,t]*self.beta[j,t]
+                     for j in range(self.numStates)])
+        yt1 = self.observations[t+1]
+        for j in range(self.numStates):
+          self.eps[i,j,t] = divide(
+            self.alpha[i,t]*self.A[i,j]*self.beta[j,t+1]*self.B[j,yt1], denom)
+
+    denoms = np.zeros(self.numStates, dtype="float")
+    for i in range(self.numStates):
+      self.pi[i] = self.gamma[i, 0]
+      for t in range(self.T-1):
+        denoms[i] += self.gamma[i,t]
+
+    for i in range(self.numStates):
+      for j in range(self.numStates):
+        numer = 0.0
+        for t in range(self.T-1):
+          numer += self.eps[i,j,t]
+        self.A[i,j] = divide(numer, denoms[i])
+
+    for i in range(self.numStates):
+      for v in self.seenValues:
+        numer = 0.0
+        denom = 0.0
+        for t in range(self.T):
+          denom += self.gamma[i,t]
+          if self.observations[t] == v:
+            numer += self.gamma[i,t]
+        self.B[i,v] = divide(numer, denom)
+
+
+  def train(self, observations):
+    self._initializeTrial(observations)
+
+    while True:
+      startA = copy(self.A)
+      startB = copy(self.B)
+      startpi = copy(self.pi)
+
+      self._forward()
+      self._backward()
+      self._update()
+
+      if (np.max(abs(startpi - self.pi)) <= self.criterion and
+          np.max(abs(startA - self.A)) <= self.criterion and
+          np.max(abs(startB - self.B)) <= self.criterion):
+        break
+
+
+  def predict_next_inputs(self, current_input, threshold=0.3):
+    self._initializeTrial([x for x in self.observations] + [current_input])
+    t = len(self.observations)-1
+    self._forward()
+    denom = 0.0
+    for i in range(self.numStates):
+      denom += self.alpha[i,t]
+
+    curHiddenStateProbs = np.zeros(self.numStates, dtype="float")
+    for i in range(self.numStates):
+      curHiddenStateProbs[i] = divide(self.alpha[i,t], denom)
+
+    nextObservationProbs = np.zeros(self.numCats, dtype="float")
+    for k in range(self.numCats):
+      for j in range(self.numStates):
+        for i in range(self.numStates):
+          nextObservationProbs[k] += (self.B[j,k]*self.A[j,i]*
+                                      curHiddenStateProbs[i])
+
+    next_inputs = set(np.flatnonzero(nextObservationProbs >= threshold))
+    if len(next_inputs) == 0:
+      next_inputs.add(np.argmax(nextObservationProbs))
+    return next_inputs
+
+
+
+def initializeHMM(cls, numStates, numCats, rng):
+  hmm = cls(numCats=numCats, numStates=numStates)
+  hmm.pi = rng.rand(numStates)
+  hmm.pi /= hmm.pi.sum()
+  hmm.A = rng.rand(numStates, numStates)
+  hmm.A /= hmm.A.sum(axis=1)[:, np.newaxis]
+  hmm.B = rng.rand(numStates, numCats)
+  hmm.B /= hmm.B.sum(axis=1)[:, np.newaxis]
+  return hmm
+
+
+
+class HMMTest(unittest.TestCase):
+
+  def testTrainMatchesReference(self):
+    for seed in xrange(3):
+      hmm = initializeHMM(HMM, 3, 6, np.random.RandomState(seed))
+      reference = initializeHMM(ReferenceHMM, 3, 6, np.random.RandomState(seed))
+      rng = np.random.RandomState(seed)
+      for _ in xrange(3):
+        # Leave out some values so that their emission probabilities are kept
+        observations = rng.randint(0, 5, size=25)
+        hmm.train(observations)
+        reference.train(observations)
+
+        np.testing.assert_allclose(hmm.pi, reference.pi, atol=1e-12)
+        np.testing.assert_allclose(hmm.A, reference.A, atol=1e-12)
+        np.testing.assert_allclose(hmm.B, reference.B, atol=1e-12)
+        np.testing.assert_allclose(hmm.gamma, reference.gamma, atol=1e-12)
+
+
+  def testPredictMatchesReference(self):
+    rng = np.random.RandomState(42)
+    hmm = initializeHMM(HMM, 4, 6, rng)
+    hmm.train(rng.randint(0, 6, size=30))
+    reference = ReferenceHMM(numCats=6, numStates=4)
+    reference.pi, reference.A, reference.B = hmm.pi, hmm.A, hmm.B
+
+    for _ in xrange(2):
+      hmm.reset()
+      reference.reset()
+      for value in rng.randint(0, 6, size=20):
+        self.assertEqual(hmm.predict_next_inputs(value, threshold=0.2),
+                         reference.predict_next_inputs(value, threshold=0.2))
+
+
+  def testLongSequence(self):
+    # The unscaled probabilities underflow after a few hundred steps
+    rng = np.random.RandomState(42)
+    hmm = initializeHMM(HMM, 6, 4, rng)
+    hmm.criterion = 0.001
+    hmm.train(np.tile([0, 1, 2, 3, 2, 1], 300))
+
+    np.testing.assert_allclose(hmm.A.sum(axis=1), 1.0)
+    np.testing.assert_allclose(hmm.B.sum(axis=1), 1.0)
+    # Each state learns a single position in the cycle
+    np.testing.assert_allclose(hmm.A.max(axis=1), 1.0, atol=0.01)
+    np.testing.assert_allclose(hmm.B.max(axis=1), 1.0, atol=0.01)
+
+
+  def testTrainBatch(self):
+    sequences = [np.array([0, 1, 2, 1, 0]), np.array([2, 2, 1, 0]),
+                 np.array([1, 0, 3])]
+    hmm = initializeHMM(HMM, 2, 4, np.random.RandomState(42))
+    hmm.trainBatch(sequences)
+
+    # At convergence, one more re-estimation from the summed counts changes
+    # nothing.
+    pi, A, B = hmm.pi.copy(), hmm.A.copy(), hmm.B.copy()
+    counts = []
+    for observations in sequences:
+      hmm._initializeTrial(observations)
+      hmm._forward()
+      hmm._backward()
+      counts.append(hmm._expectedCounts())
+    hmm._reestimate(counts, set([0, 1, 2, 3]))
+    np.testing.assert_allclose(hmm.pi, pi, atol=1e-3)
+    np.testing.assert_allclose(hmm.A, A, atol=1e-3)
+    np.testing.assert_allclose(hmm.B, B, atol=1e-3)
+    np.testing.assert_allclose(hmm.A.sum(axis=1), 1.0)
+
+    single = initializeHMM(HMM, 2, 4, np.random.RandomState(42))
+    batch = initializeHMM(HMM, 2, 4, np.random.RandomState(42))
+    single.train(sequences[0])
+    batch.trainBatch(sequences[:1])
+    np.testing.assert_equal(batch.A, single.A)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
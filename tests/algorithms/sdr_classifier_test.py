@@ -0,0 +1,228 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+import unittest
+
+import numpy
+
+from htmresearch.algorithms.sdr_classifier import SDRClassifier
+
+
+
+class ReferenceSDRClassifier(SDRClassifier):
+  """
+  The original SDRClassifier inference and learning, which loop over every
+  active bit.
+  """
+
+  def compute(self, recordNum, patternNZ, classification, learn, infer):
+    if self._recordNumMinusLearnIteration is None:
+      self._recordNumMinusLearnIteration = recordNum - self._learnIteration
+    self._learnIteration = recordNum - self._recordNumMinusLearnIteration
+    self._patternNZHistory.append((self._learnIteration, patternNZ))
+
+    retval = None
+    if max(patternNZ) > self._maxInputIdx:
+      newMaxInputIdx = max(patternNZ)
+      for nSteps in self.steps:
+        self._weightMatrix[nSteps] = numpy.concatenate((
+          self._weightMatrix[nSteps],
+          numpy.zeros(shape=(newMaxInputIdx-self._maxInputIdx,
+                             self._maxBucketIdx+1))), axis=0)
+      self._maxInputIdx = newMaxInputIdx
+
+    if infer:
+      retval = self.infer(patternNZ, classification)
+
+    if learn and classification["bucketIdx"] is not None:
+      bucketIdx = classification["bucketIdx"]
+      if bucketIdx > self._maxBucketIdx:
+        for nSteps in self.steps:
+          self._weightMatrix[nSteps] = numpy.concatenate((
+            self._weightMatrix[nSteps],
+            numpy.zeros(shape=(self._maxInputIdx+1,
+                               bucketIdx-self._maxBucketIdx))), axis=1)
+        self._maxBucketIdx = bucketIdx
+
+      actValue = classification["actValue"]
+      while self._maxBucketIdx > len(self._actualValues) - 1:
+        self._actualValues.append(None)
+      if self._actualValues[bucketIdx] is None:
+        self._actualValues[bucketIdx] = actValue
+      elif isinstance(actValue, int) or isinstance(actValue, float):
+        self._actualValues[bucketIdx] = ((1.0 - self.actValueAlpha)
+                                         * self._actualValues[bucketIdx]
+                                         + self.actValueAlpha * actValue)
+      else:
+        self._actualValues[bucketIdx] = actValue
+
+      for (iteration, learnPatternNZ) in self._patternNZHistory:
+        error = self.calculateError(classification)
+        nSteps = self._learnIteration - iteration
+        if nSteps in self.steps:
+          for bit in learnPatternNZ:
+            self._weightMatrix[nSteps][bit, :] += self.alpha * error[nSteps]
+
+    return retval
+
+
+  def inferSingleStep(self, patternNZ, weightMatrix):
+    outputActivation = numpy.zeros(self._maxBucketIdx + 1)
+    for bit in patternNZ:
+      outputActivation += weightMatrix[bit, :]
+    expOutputActivation = numpy.exp(outputActivation)
+    return expOutputActivation / numpy.sum(expOutputActivation)
+
+
+
+def randomRecords(rng, numRecords, maxInputWidth, numBuckets):
+  """
+  Generates records whose input width and number of buckets grow over time.
+  Some record numbers are repeated, as they are for multi-class
+  classification, and some are skipped.
+  """
+  recordNum = 0
+  for i in xrange(numRecords):
+    inputWidth = 50 + (maxInputWidth - 50) * (i + 1) // numRecords
+    patternNZ = sorted(rng.choice(inputWidth, 20, replace=False))
+    bucketIdx = int(rng.randint(1 + numBuckets * (i + 1) // numRecords))
+    yield recordNum, patternNZ, {"bucketIdx": bucketIdx,
+                                 "actValue": bucketIdx + rng.rand()}
+
+    r = rng.rand()
+    if r < 0.8:
+      recordNum += 1
+    elif r < 0.9:
+      recordNum += 2
+
+
+
+class SDRClassifierTest(unittest.TestCase):
+
+  def assertWeightsEqual(self, classifier, expected):
+    for nSteps in expected.steps:
+      numpy.testing.assert_array_equal(
+        classifier._weightMatrix[nSteps][:classifier._maxInputIdx + 1,
+                                         :classifier._maxBucketIdx + 1],
+        expected._weightMatrix[nSteps])
+
+
+  def testMatchesReference(self):
+    """
+    The vectorized classifier, with and without preallocation, should give
+    exactly the same weights and predictions as the original loops.
+    """
+    for preallocate in (False, True):
+      rng = numpy.random.RandomState(42)
+      reference = ReferenceSDRClassifier(steps=(1, 2, 5), alpha=0.1)
+      classifier = SDRClassifier(steps=(1, 2, 5), alpha=0.1,
+                                 preallocate=preallocate)
+
+      for recordNum, patternNZ, classification in randomRecords(rng, 300,
+                                                                 2000, 20):
+        expected = reference.compute(recordNum, patternNZ, classification,
+                                     learn=True, infer=True)
+        actual = classifier.compute(recordNum, patternNZ, classification,
+                                    learn=True, infer=True)
+
+        for nSteps in (1, 2, 5):
+          numpy.testing.assert_array_equal(actual[nSteps], expected[nSteps])
+        self.assertEqual(actual["actualValues"], expected["actualValues"])
+
+      self.assertWeightsEqual(classifier, reference)
+      self.assertEqual(classifier._actualValues, reference._actualValues)
+
+
+  def testActualValueRunningAverage(self):
+    for preallocate in (False, True):
+      classifier = SDRClassifier(steps=(1,), actValueAlpha=0.3,
+                                 preallocate=preallocate)
+      for recordNum, (patternNZ, actValue) in enumerate([([1, 4], 2.0),
+                                                         ([2, 7], 4.0),
+                                                         ([3, 9], 1.0)]):
+        result = classifier.compute(recordNum, patternNZ,
+                                    {"bucketIdx": 1, "actValue": actValue},
+                                    learn=True, infer=True)
+
+      expected = 0.7 * (0.7 * 2.0 + 0.3 * 4.0) + 0.3 * 1.0
+      self.assertAlmostEqual(classifier._actualValues[1], expected)
+      result = classifier.compute(3, [1, 4], {"bucketIdx": None,
+                                              "actValue": None},
+                                  learn=False, infer=True)
+      self.assertAlmostEqual(result["actualValues"][1], expected)
+
+
+  def testPreallocateDoublesCapacity(self):
+    classifier = SDRClassifier(steps=(1,), preallocate=True)
+
+    classifier.compute(0, [5], {"bucketIdx": 2, "actValue": 2.0},
+                       learn=True, infer=False)
+    self.assertEqual(classifier._weightMatrix[1].shape, (8, 4))
+
+    classifier.compute(1, [8], {"bucketIdx": 3, "actValue": 3.0},
+                       learn=True, infer=False)
+    self.assertEqual(classifier._weightMatrix[1].shape, (16, 4))
+
+    result = classifier.compute(2, [5, 8], {"bucketIdx": 0, "actValue": 0.0},
+                                learn=False, infer=True)
+    self.assertEqual(len(result[1]), 4)
+    self.assertAlmostEqual(result[1].sum(), 1.0)
+
+
+  def testFitStreamMatchesCompute(self):
+    """
+    fitStream should learn exactly the same weights as calling compute on
+    each record, for any chunk size, and compute should carry on from where
+    fitStream left off.
+    """
+    rng = numpy.random.RandomState(42)
+    records = list(randomRecords(rng, 400, 500, 10))
+    for i in rng.choice(len(records), 40, replace=False):
+      records[i] = (records[i][0], records[i][1],
+                    {"bucketIdx": None, "actValue": None})
+
+    for preallocate in (False, True):
+      expected = SDRClassifier(steps=(0, 1, 3), alpha=0.1,
+                               preallocate=preallocate)
+      for recordNum, patternNZ, classification in records:
+        expected.compute(recordNum, patternNZ, classification,
+                         learn=True, infer=False)
+
+      for chunkSize in (1, 7, 1000):
+        classifier = SDRClassifier(steps=(0, 1, 3), alpha=0.1,
+                                   preallocate=preallocate)
+        classifier.compute(records[0][0], records[0][1], records[0][2],
+                           learn=True, infer=False)
+        classifier.fitStream(iter(records[1:-1]), chunkSize=chunkSize)
+        classifier.compute(records[-1][0], records[-1][1], records[-1][2],
+                           learn=True, infer=False)
+
+        self.assertEqual(classifier._maxInputIdx, expected._maxInputIdx)
+        self.assertEqual(classifier._maxBucketIdx, expected._maxBucketIdx)
+        self.assertEqual(classifier._actualValues, expected._actualValues)
+        for nSteps in expected.steps:
+          numpy.testing.assert_array_equal(classifier._weightMatrix[nSteps],
+                                           expected._weightMatrix[nSteps])
+
+
+
+if __name__ == "__main__":
+  unittest.main()
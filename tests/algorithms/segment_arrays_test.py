@@ -0,0 +1,176 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Test the flat synapse arrays used by the "arrays" segment store of the
+pure-Python TMs.
+"""
+
+import unittest
+
+import numpy as np
+
+from htmresearch.algorithms.segment_arrays import SegmentArrays
+
+
+
+NUM_COLUMNS = 20
+CELLS_PER_COLUMN = 4
+DISTAL_SIZE = 30
+
+
+
+class FakeSegment(object):
+  def __init__(self):
+    self.syns = []
+    self.dsyns = []
+
+
+
+def referenceActivity(cells, activeState, distalInput, connectedPermanence):
+  """
+  Active connected synapses of each segment, computed one segment at a time.
+  """
+  activity = {}
+  for c in xrange(NUM_COLUMNS):
+    for i in xrange(CELLS_PER_COLUMN):
+      for segment in cells[c][i]:
+        count = sum(1 for srcCol, srcIdx, perm in segment.syns
+                    if activeState[srcCol, srcIdx] and
+                    perm >= connectedPermanence)
+        count += sum(1 for srcCol, srcIdx, perm in segment.dsyns
+                     if distalInput[srcCol, srcIdx] and
+                     perm >= connectedPermanence)
+        activity[id(segment)] = ((c, i), count)
+  return activity
+
+
+
+class SegmentArraysTest(unittest.TestCase):
+
+  def setUp(self):
+    self.cells = [[[] for _ in xrange(CELLS_PER_COLUMN)]
+                  for _ in xrange(NUM_COLUMNS)]
+    self.arrays = SegmentArrays(
+      CELLS_PER_COLUMN,
+      [("syns", 0, CELLS_PER_COLUMN),
+       ("dsyns", NUM_COLUMNS * CELLS_PER_COLUMN, 1)])
+
+
+  def checkActivity(self, rng):
+    activeState = (rng.rand(NUM_COLUMNS, CELLS_PER_COLUMN) < 0.3).astype(
+      "int8")
+    distalInput = (rng.rand(DISTAL_SIZE, 1) < 0.3).astype("int8")
+
+    self.arrays.sync(self.cells)
+    overlaps = self.arrays.computeActivity(
+      np.concatenate((activeState.reshape(-1), distalInput.reshape(-1))), 0.5)
+
+    expected = referenceActivity(self.cells, activeState, distalInput, 0.5)
+    actual = {}
+    for slot in xrange(len(overlaps)):
+      segment = self.arrays.getSlotSegment(slot)
+      if segment is not None:
+        cell = divmod(int(self.arrays.getSlotCells([slot])[0]),
+                      CELLS_PER_COLUMN)
+        actual[id(segment)] = (cell, overlaps[slot])
+    self.assertEqual(actual, expected)
+
+
+  def randomSynapses(self, rng, n, numColumns, cellsPerColumn):
+    return [[rng.randint(numColumns), rng.randint(cellsPerColumn),
+             float(rng.choice([0.3, 0.5, 0.7]))] for _ in xrange(n)]
+
+
+  def testMatchesSegmentsThroughChanges(self):
+    rng = np.random.RandomState(42)
+    allSegments = []
+
+    for _ in xrange(300):
+      action = rng.rand()
+      c, i = rng.randint(NUM_COLUMNS), rng.randint(CELLS_PER_COLUMN)
+
+      if action < 0.4 or len(allSegments) == 0:
+        segment = FakeSegment()
+        segment.syns = self.randomSynapses(rng, rng.randint(0, 12),
+                                           NUM_COLUMNS, CELLS_PER_COLUMN)
+        segment.dsyns = self.randomSynapses(rng, rng.randint(0, 12),
+                                            DISTAL_SIZE, 1)
+        self.cells[c][i].append(segment)
+        allSegments.append((c, i, segment))
+        self.arrays.markDirty(c, i, segment)
+      elif action < 0.8:
+        c, i, segment = allSegments[rng.randint(len(allSegments))]
+        for synapse in segment.syns + segment.dsyns:
+          synapse[2] = float(rng.choice([0.3, 0.5, 0.7]))
+        if len(segment.syns) > 0:
+          del segment.syns[0]
+        segment.dsyns += self.randomSynapses(rng, 2, DISTAL_SIZE, 1)
+        self.arrays.markDirty(c, i, segment)
+      else:
+        c, i, segment = allSegments.pop(rng.randint(len(allSegments)))
+        self.cells[c][i] = [s for s in self.cells[c][i] if s is not segment]
+        self.arrays.markDirty(c, i, segment)
+
+      if rng.rand() < 0.2:
+        self.checkActivity(rng)
+
+    self.checkActivity(rng)
+
+
+  def testCompactionKeepsSegments(self):
+    rng = np.random.RandomState(42)
+    segment = FakeSegment()
+    segment.syns = self.randomSynapses(rng, 10, NUM_COLUMNS, CELLS_PER_COLUMN)
+    self.cells[3][1].append(segment)
+    for _ in xrange(500):
+      self.arrays.markDirty(3, 1, segment)
+      self.arrays.sync(self.cells)
+
+    self.assertLess(self.arrays._numStaleSynapses, 1100)
+    self.checkActivity(rng)
+
+
+  def testSegmentReportedForWrongCell(self):
+    """
+    A segment that's changed while reported under another cell is still found
+    in its own cell.
+    """
+    rng = np.random.RandomState(42)
+    segment = FakeSegment()
+    segment.syns = self.randomSynapses(rng, 10, NUM_COLUMNS, CELLS_PER_COLUMN)
+    self.cells[5][2].append(segment)
+    self.arrays.markDirty(5, 2, segment)
+    self.arrays.markDirty(5, 0, segment)
+    self.checkActivity(rng)
+
+    segment.syns = self.randomSynapses(rng, 10, NUM_COLUMNS, CELLS_PER_COLUMN)
+    self.arrays.markDirty(5, 0, segment)
+    self.checkActivity(rng)
+
+    self.cells[5][2].remove(segment)
+    self.arrays.markDirty(5, 2, segment)
+    self.checkActivity(rng)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,118 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compares SparseNet's in-place LCA encoding with the original one, which
+rebuilt the Gram matrix on every call and allocated new arrays on every
+iteration.
+"""
+
+import unittest
+
+import numpy as np
+
+from htmresearch.algorithms.sparse_net import SparseNet
+
+
+
+class RandomBatchSparseNet(SparseNet):
+  def _getDataBatch(self, inputData):
+    indices = np.random.randint(0, inputData.shape[1], self.batchSize)
+    return inputData[:, indices]
+
+
+
+def referenceEncode(net, data):
+  """
+  The original SparseNet.encode, for (filterDim, numPoints) data.
+  """
+  def thresholdNonLinearity(states, threshold):
+    activation = np.copy(states)
+    if net.thresholdType == 'soft':
+      return np.maximum(np.abs(activation) - threshold, 0.) * np.sign(
+        activation)
+    if net.thresholdType == 'absoluteHard':
+      activation[np.abs(activation) < threshold] = 0.
+      return activation
+    if net.thresholdType == 'relativeHard':
+      activation[activation < threshold] = 0.
+      return activation
+
+  projection = net.basis.T.dot(data)
+  representation = net.basis.T.dot(net.basis) - np.eye(net.outputDim)
+  states = np.zeros((net.outputDim, data.shape[1]))
+
+  threshold = 0.5 * np.max(np.abs(projection), axis=0)
+  activations = thresholdNonLinearity(states, threshold)
+
+  for _ in xrange(net.numLcaIterations):
+    states *= (1 - net.lcaLearningRate)
+    states += net.lcaLearningRate * (projection -
+                                     representation.dot(activations))
+    activations = thresholdNonLinearity(states, threshold)
+
+    threshold *= net.thresholdDecay
+    threshold[threshold < net.minThreshold] = net.minThreshold
+
+  return activations
+
+
+
+class SparseNetTest(unittest.TestCase):
+
+  def setUp(self):
+    rng = np.random.RandomState(42)
+    self.data = rng.randn(16, 250)
+
+
+  def testEncodeMatchesReference(self):
+    for thresholdType in ('soft', 'absoluteHard', 'relativeHard'):
+      net = RandomBatchSparseNet(filterDim=16, outputDim=24, batchSize=20,
+                                 numLcaIterations=30, minThreshold=0.1,
+                                 thresholdType=thresholdType)
+      np.testing.assert_equal(net.encode(self.data),
+                              referenceEncode(net, self.data))
+      np.testing.assert_equal(net.encode(self.data[:, 0]),
+                              referenceEncode(net, self.data[:, :1]))
+
+
+  def testGramMatrixFollowsTraining(self):
+    net = RandomBatchSparseNet(filterDim=16, outputDim=24, batchSize=20,
+                               numLcaIterations=30, minThreshold=0.1)
+    net.encode(self.data)
+    net.train(self.data, numIterations=5)
+    np.testing.assert_equal(net.encode(self.data),
+                            referenceEncode(net, self.data))
+
+
+  def testChunkedEncoding(self):
+    net = RandomBatchSparseNet(filterDim=16, outputDim=24,
+                               numLcaIterations=30, minThreshold=0.1)
+    expected = net.encode(self.data)
+    for numProcesses in (1, 2):
+      np.testing.assert_allclose(
+        net.encode(self.data, chunkSize=60, numProcesses=numProcesses),
+        expected, atol=1e-12)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
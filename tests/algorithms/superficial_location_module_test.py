@@ -0,0 +1,177 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Checks the active points of SuperficialLocationModule2D through shifts, anchors
+and learning, and checks SuperficialLocationModuleBank against a list of
+modules.
+"""
+
+import unittest
+
+import numpy as np
+
+from htmresearch.algorithms.superficial_location_module import (
+  SuperficialLocationModule2D, SuperficialLocationModuleBank)
+
+
+
+def cellsForPoints(points, cellDimensions):
+  return np.unique(np.ravel_multi_index(np.floor(points).astype("int").T,
+                                        cellDimensions))
+
+
+
+class SuperficialLocationModule2DTest(unittest.TestCase):
+
+  def setUp(self):
+    self.module = SuperficialLocationModule2D(
+      cellDimensions=(4, 5),
+      moduleMapDimensions=(8.0, 10.0),
+      orientation=0.0,
+      anchorInputSize=100,
+      pointOffsets=(0.25, 0.75),
+      activationThreshold=3,
+      learningThreshold=3,
+      initialPermanence=0.6,
+      sampleSize=5)
+
+
+  def testShiftWrapsPoints(self):
+    self.module.activePoints = [[0.5, 0.5], [3.5, 4.5]]
+    np.testing.assert_equal(self.module.getActiveCells(), [0, 19])
+
+    self.module.shift([1.0, -2.0])
+    np.testing.assert_allclose(self.module.activePoints,
+                               [[1.0, 4.5], [0.0, 3.5]])
+    np.testing.assert_equal(self.module.getActiveCells(), [3, 9])
+    np.testing.assert_equal(self.module.cellsForActivePoints, [9, 3])
+
+
+  def testAnchorReplacesUnsupportedPoints(self):
+    inputA = np.arange(0, 5, dtype="uint32")
+    inputB = np.arange(10, 15, dtype="uint32")
+
+    # Learn inputA at cell 7 and inputB at cells 7 and 12.
+    self.module.activePoints = [[1.5, 2.5]]
+    self.module.learn(inputA)
+    self.module.activePoints = [[1.5, 2.5], [2.5, 2.5]]
+    self.module.learn(inputB)
+
+    self.module.reset()
+    self.module.anchor(inputA)
+    np.testing.assert_equal(self.module.getActiveCells(), [7])
+    np.testing.assert_allclose(self.module.activePoints,
+                               [[1.25, 2.25], [1.25, 2.75],
+                                [1.75, 2.25], [1.75, 2.75]])
+
+    # Cell 7 stays active and keeps its points; cell 12 gets new points.
+    self.module.shift([0.2, 0.0])
+    self.module.anchor(inputB)
+    np.testing.assert_equal(self.module.getActiveCells(), [7, 12])
+    self.assertEqual(len(self.module.activePoints), 8)
+    np.testing.assert_allclose(self.module.activePoints[:4],
+                               [[1.35, 2.25], [1.35, 2.75],
+                                [1.85, 2.25], [1.85, 2.75]])
+    np.testing.assert_equal(
+      cellsForPoints(self.module.activePoints[4:], (4, 5)), [12])
+
+    # Only cell 7 is supported by inputA, so cell 12 loses its points.
+    self.module.anchor(inputA)
+    np.testing.assert_equal(self.module.getActiveCells(), [7])
+    self.assertEqual(len(self.module.activePoints), 4)
+
+
+  def testManyPoints(self):
+    numPoints = 500
+    rng = np.random.RandomState(42)
+    points = rng.rand(numPoints, 2) * [4, 5]
+    self.module.activePoints = points
+    for _ in xrange(5):
+      delta = rng.randn(2)
+      self.module.shift(delta)
+      points = np.mod(points + delta * [0.5, 0.5], [4, 5])
+      np.testing.assert_allclose(self.module.activePoints, points)
+      np.testing.assert_equal(self.module.getActiveCells(),
+                              cellsForPoints(points, (4, 5)))
+
+
+
+class SuperficialLocationModuleBankTest(unittest.TestCase):
+
+  def testMatchesModules(self):
+    rng = np.random.RandomState(42)
+    configs = [{"cellDimensions": tuple(rng.randint(3, 7, size=2)),
+                "moduleMapDimensions": tuple(rng.uniform(5.0, 30.0, size=2)),
+                "orientation": rng.uniform(-0.5, 0.5),
+                "pointOffsets": offsets}
+               for offsets in [(0.5,), (0.2, 0.8), (0.1, 0.5, 0.9)] * 3]
+    params = {
+      "anchorInputSize": 200,
+      "activationThreshold": 5,
+      "learningThreshold": 4,
+      "sampleSize": 8,
+      "initialPermanence": 0.4,
+      "permanenceIncrement": 0.15,
+      "permanenceDecrement": 0.01,
+      "maxSynapsesPerSegment": 10,
+    }
+    modules = [SuperficialLocationModule2D(**dict(config, **params))
+               for config in configs]
+    bank = SuperficialLocationModuleBank(configs, **params)
+    inputs = [np.sort(rng.choice(200, 10, replace=False)).astype("uint32")
+              for _ in xrange(5)]
+
+    np.random.seed(42)
+    for module in modules:
+      module.activateRandomLocation()
+    np.random.seed(42)
+    bank.activateRandomLocation()
+
+    for _ in xrange(150):
+      delta = rng.randn(2) * 3.0
+      anchorInput = inputs[rng.randint(len(inputs))]
+      phase = "learn" if rng.rand() < 0.5 else "anchor"
+      for module in modules:
+        module.shift(delta)
+        getattr(module, phase)(anchorInput)
+      bank.shift(delta)
+      getattr(bank, phase)(anchorInput)
+
+      activeCells = []
+      for i, module in enumerate(modules):
+        np.testing.assert_equal(bank.getModuleActiveCells(i),
+                                module.getActiveCells())
+        np.testing.assert_allclose(
+          sorted(map(tuple, bank.getModuleActivePoints(i))),
+          sorted(map(tuple, module.activePoints)))
+        activeCells.append(module.getActiveCells() + bank.firstCells[i])
+      np.testing.assert_equal(bank.getActiveCells(),
+                              np.concatenate(activeCells))
+
+    self.assertEqual(
+      bank.connections.matrix.nNonZeros(),
+      sum(module.connections.matrix.nNonZeros() for module in modules))
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,197 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+"""
+Test the multi-step predictions of the pure-Python TMs.
+"""
+
+import unittest
+
+import numpy as np
+
+from htmresearch.algorithms.TM import TM
+from htmresearch.algorithms.TM_SM import TM_SM
+
+
+
+NUM_COLUMNS = 100
+NUM_DISTAL_INPUTS = 50
+
+
+
+def statefulPredict(tm, nSteps):
+  """
+  The original predict algorithm, which runs phase 2 on the TM's own state and
+  then restores it.
+  """
+  pristineTPDynamicState = tm._getTPDynamicState()
+
+  multiStepColumnPredictions = np.zeros((nSteps, tm.numberOfCols),
+                                        dtype="float32")
+  step = 0
+  while True:
+    multiStepColumnPredictions[step, :] = tm.topDownCompute()
+    if step == nSteps - 1:
+      break
+    step += 1
+
+    tm.activeState['t-1'][:, :] = tm.activeState['t'][:, :]
+    tm.predictedState['t-1'][:, :] = tm.predictedState['t'][:, :]
+    tm.confidence['t-1'][:, :] = tm.confidence['t'][:, :]
+
+    tm.activeState['t'][:, :] = tm.predictedState['t-1'][:, :]
+    tm.predictedState['t'].fill(0)
+    tm.confidence['t'].fill(0.0)
+    tm.computePhase2(doLearn=False)
+
+  tm._setTPDynamicState(pristineTPDynamicState)
+  return multiStepColumnPredictions
+
+
+
+class TMPredictTest(unittest.TestCase):
+
+  def createTM(self, tmClass, segmentStore):
+    params = dict(numberOfCols=NUM_COLUMNS, cellsPerColumn=4,
+                  activationThreshold=6, minThreshold=4, newSynapseCount=10,
+                  initialPerm=0.5, connectedPerm=0.5, permanenceDec=0.1,
+                  globalDecay=0.0, segmentStore=segmentStore, seed=42)
+    if tmClass is TM_SM:
+      params.update(numberOfDistalInput=NUM_DISTAL_INPUTS,
+                    learnLateralConnections=True)
+    return tmClass(**params)
+
+
+  def createSequences(self, rng):
+    return [[(rng.choice(NUM_COLUMNS, 10, replace=False),
+              rng.choice(NUM_DISTAL_INPUTS, 5, replace=False))
+             for _ in xrange(6)]
+            for _ in xrange(3)]
+
+
+  def step(self, tm, pattern, learn):
+    activeColumns, distalInput = pattern
+    bottomUpInput = np.zeros(NUM_COLUMNS, dtype="uint32")
+    bottomUpInput[activeColumns] = 1
+    if isinstance(tm, TM_SM):
+      distalDendriticInput = np.zeros(NUM_DISTAL_INPUTS, dtype="uint32")
+      distalDendriticInput[distalInput] = 1
+      tm.compute(bottomUpInput, distalDendriticInput, learn)
+    else:
+      tm.compute(bottomUpInput, learn)
+
+
+  def train(self, tm, sequences):
+    for _ in xrange(4):
+      for sequence in sequences:
+        tm.reset()
+        for pattern in sequence:
+          self.step(tm, pattern, True)
+
+
+  def getDynamicState(self, tm):
+    return [tm.activeState['t'].copy(), tm.predictedState['t'].copy(),
+            tm.confidence['t'].copy()]
+
+
+  def checkMatchesStatefulPredict(self, tmClass, segmentStore):
+    rng = np.random.RandomState(42)
+    sequences = self.createSequences(rng)
+    tm = self.createTM(tmClass, segmentStore)
+    self.train(tm, sequences)
+
+    numFuturePredictions = 0
+    for sequence in sequences:
+      tm.reset()
+      for pattern in sequence[:4]:
+        self.step(tm, pattern, False)
+
+        before = self.getDynamicState(tm)
+        # Short, longer and repeated requests use and extend the cache
+        predictions = [tm.predict(2), tm.predict(5), tm.predict(3),
+                       tm.predict(5)]
+        after = self.getDynamicState(tm)
+        for expected, actual in zip(before, after):
+          np.testing.assert_array_equal(actual, expected)
+
+        expected = statefulPredict(tm, 5)
+        for prediction in predictions:
+          np.testing.assert_array_equal(prediction,
+                                        expected[:len(prediction)])
+        numFuturePredictions += np.count_nonzero(expected[1:])
+
+    # Otherwise this test doesn't compare anything beyond the first step. The
+    # TM_SM computes no confidences, so its column predictions are all zero.
+    if tmClass is TM:
+      self.assertGreater(numFuturePredictions, 0)
+
+
+  def testMatchesStatefulPredict(self):
+    self.checkMatchesStatefulPredict(TM, "objects")
+
+
+  def testMatchesStatefulPredictArrays(self):
+    self.checkMatchesStatefulPredict(TM, "arrays")
+
+
+  def testMatchesStatefulPredictSM(self):
+    self.checkMatchesStatefulPredict(TM_SM, "objects")
+
+
+  def testMatchesStatefulPredictSMArrays(self):
+    self.checkMatchesStatefulPredict(TM_SM, "arrays")
+
+
+  def testPredictionCache(self):
+    rng = np.random.RandomState(42)
+    sequences = self.createSequences(rng)
+    tm = self.createTM(TM, "objects")
+    self.train(tm, sequences)
+    tm.reset()
+    self.step(tm, sequences[0][0], False)
+
+    # Repeated calls give the same predictions from the cache
+    first = tm.predict(4)
+    self.assertIsNotNone(tm._predictionCache)
+    second = tm.predict(4)
+    np.testing.assert_array_equal(second, first)
+    # The caller may modify the returned arrays
+    self.assertIsNot(second, first)
+    first.fill(-1)
+    np.testing.assert_array_equal(tm.predict(4), second)
+
+    # The cache is dropped whenever the state or the segments change
+    for change in (lambda: self.step(tm, sequences[0][1], True),
+                   tm.reset,
+                   lambda: self.step(tm, sequences[0][0], False),
+                   lambda: tm.trimSegments(minPermanence=1.0, minNumSyns=1)):
+      tm.predict(4)
+      self.assertIsNotNone(tm._predictionCache)
+      change()
+      self.assertIsNone(tm._predictionCache)
+      prediction = tm.predict(4)
+      np.testing.assert_array_equal(prediction, statefulPredict(tm, 4))
+
+
+
+if __name__ == "__main__":
+  unittest.main()
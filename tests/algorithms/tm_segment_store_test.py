@@ -0,0 +1,109 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+"""
+Test that the "objects" and "arrays" segment stores of the pure-Python TMs
+count the same synapses as connected.
+"""
+
+import unittest
+
+import numpy as np
+
+from htmresearch.algorithms.TM import TM
+from htmresearch.algorithms.TM_SM import TM_SM
+
+
+
+def boundaryPermanences(connectedPerm):
+  """
+  Permanences at and around the connected permanence, as float32 and float64
+  values, including float64 values between neighboring float32 values.
+  """
+  threshold = np.float32(connectedPerm)
+  below = np.nextafter(threshold, np.float32(0))
+  above = np.nextafter(threshold, np.float32(1))
+  return [connectedPerm, threshold, below, above,
+          float(threshold), float(below), float(above),
+          np.nextafter(float(threshold), 0.0),
+          np.nextafter(float(threshold), 1.0),
+          np.nextafter(float(below), 0.0),
+          np.nextafter(float(below), 1.0),
+          np.nextafter(float(above), 0.0)]
+
+
+
+class SegmentStoresTest(unittest.TestCase):
+
+  def checkStoresAgree(self, tmClass, numDistalInputs, **kwargs):
+    connectedPerm = 0.8
+    permanences = boundaryPermanences(connectedPerm)
+
+    predictions = []
+    for segmentStore in ("objects", "arrays"):
+      tm = tmClass(numberOfCols=len(permanences), cellsPerColumn=2,
+                   connectedPerm=connectedPerm, segmentStore=segmentStore,
+                   **kwargs)
+      activeState = np.zeros((tm.numberOfCols, tm.cellsPerColumn),
+                             dtype="int8")
+      activeState[:, 0] = 1
+      # Segments are created during learning, after the first iteration
+      tm.lrnIterationIdx = 1
+
+      # One segment per permanence, on cell 1 of its own column. All of its
+      # synapses come from active cells, so the segment is active exactly
+      # when they are connected.
+      for c, perm in enumerate(permanences):
+        segment = tm._getSegmentClass()(tm, False)
+        segment.syns = [[c, 0, perm], [(c + 1) % tm.numberOfCols, 0, perm]]
+        if numDistalInputs > 0:
+          segment.dsyns = [[d, 0, perm] for d in xrange(numDistalInputs)]
+        tm.cells[c][1].append(segment)
+        tm._segmentChanged(c, 1, segment)
+
+      if numDistalInputs > 0:
+        tm.distalDendriticInput['t'][:] = 1
+
+      predictedState = np.zeros_like(activeState)
+      confidence = np.zeros(activeState.shape, dtype="float32")
+      tm._computePredictedState(activeState, predictedState, confidence)
+      predictions.append(predictedState[:, 1].tolist())
+
+    objectsPredictions, arraysPredictions = predictions
+    self.assertEqual(arraysPredictions, objectsPredictions)
+    # Both sides of the threshold are covered
+    self.assertIn(0, objectsPredictions)
+    self.assertIn(1, objectsPredictions)
+
+
+  def testPermanencesAroundConnectedPerm(self):
+    self.checkStoresAgree(TM, 0, activationThreshold=2)
+
+
+  def testPermanencesAroundConnectedPermSM(self):
+    self.checkStoresAgree(TM_SM, 2, numberOfDistalInput=2,
+                          activationThreshold=3)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
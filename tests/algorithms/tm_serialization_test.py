@@ -0,0 +1,169 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+"""
+Test the serialization of the pure-Python TMs, whose segments are saved as
+flat arrays and only turned back into Segment objects when they're used.
+"""
+
+import cPickle as pickle
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from htmresearch.algorithms.TM import TM
+from htmresearch.algorithms.TM_SM import TM_SM
+
+
+
+NUM_COLUMNS = 100
+NUM_DISTAL_INPUTS = 50
+
+
+
+class TMSerializationTest(unittest.TestCase):
+
+  def setUp(self):
+    rng = np.random.RandomState(42)
+    self.patterns = [(rng.choice(NUM_COLUMNS, 10, replace=False),
+                      rng.choice(NUM_DISTAL_INPUTS, 5, replace=False))
+                     for _ in xrange(6)]
+
+
+  def createTM(self, tmClass, segmentStore):
+    params = dict(numberOfCols=NUM_COLUMNS, cellsPerColumn=4,
+                  activationThreshold=6, minThreshold=4, newSynapseCount=10,
+                  initialPerm=0.5, connectedPerm=0.5, permanenceDec=0.1,
+                  globalDecay=0.0, segmentStore=segmentStore, seed=42)
+    if tmClass is TM_SM:
+      params.update(numberOfDistalInput=NUM_DISTAL_INPUTS,
+                    learnLateralConnections=True)
+    return tmClass(**params)
+
+
+  def step(self, tm, pattern, learn):
+    activeColumns, distalInput = pattern
+    bottomUpInput = np.zeros(NUM_COLUMNS, dtype="uint32")
+    bottomUpInput[activeColumns] = 1
+    if isinstance(tm, TM_SM):
+      distalDendriticInput = np.zeros(NUM_DISTAL_INPUTS, dtype="uint32")
+      distalDendriticInput[distalInput] = 1
+      tm.compute(bottomUpInput, distalDendriticInput, learn)
+    else:
+      tm.compute(bottomUpInput, learn)
+
+
+  def createTrainedTM(self, tmClass, segmentStore):
+    tm = self.createTM(tmClass, segmentStore)
+    for _ in xrange(3):
+      tm.reset()
+      for pattern in self.patterns:
+        self.step(tm, pattern, True)
+    # Serialize in the middle of a sequence
+    tm.reset()
+    for pattern in self.patterns[:2]:
+      self.step(tm, pattern, False)
+    return tm
+
+
+  def assertSameBehavior(self, tm1, tm2):
+    """
+    Run both TMs on the same inputs, learning and inferring, and check that
+    their outputs and segments stay identical.
+    """
+    for learn in (True, False):
+      for pattern in self.patterns:
+        self.step(tm1, pattern, learn)
+        self.step(tm2, pattern, learn)
+        for name in ("activeState", "predictedState", "confidence"):
+          np.testing.assert_array_equal(getattr(tm2, name)['t'],
+                                        getattr(tm1, name)['t'])
+        np.testing.assert_array_equal(tm2.predict(3), tm1.predict(3))
+    self.assertEqual(tm2.getNumSegments(), tm1.getNumSegments())
+    self.assertEqual(tm2.getNumSynapses(), tm1.getNumSynapses())
+
+
+  def assertNotLoaded(self, tm):
+    self.assertNotIn("cells", tm.__dict__)
+    self.assertNotIn("_segmentArrays", tm.__dict__)
+
+
+  def checkRoundTrip(self, tmClass, segmentStore):
+    tm = self.createTrainedTM(tmClass, segmentStore)
+    self.assertGreater(tm.getNumSegments(), 0)
+
+    restored = pickle.loads(pickle.dumps(tm, pickle.HIGHEST_PROTOCOL))
+    self.assertNotLoaded(restored)
+
+    # Pickling without touching the cells saves the packed segments as is
+    restoredAgain = pickle.loads(pickle.dumps(restored,
+                                              pickle.HIGHEST_PROTOCOL))
+    self.assertNotLoaded(restored)
+    self.assertNotLoaded(restoredAgain)
+
+    self.assertSameBehavior(tm, restored)
+    self.assertIn("cells", restored.__dict__)
+
+    # Training is deterministic, so this is the state tm was saved in
+    self.assertSameBehavior(self.createTrainedTM(tmClass, segmentStore),
+                            restoredAgain)
+
+
+  def testRoundTrip(self):
+    self.checkRoundTrip(TM, "objects")
+
+
+  def testRoundTripArrays(self):
+    self.checkRoundTrip(TM, "arrays")
+
+
+  def testRoundTripSM(self):
+    self.checkRoundTrip(TM_SM, "objects")
+
+
+  def testRoundTripSMArrays(self):
+    self.checkRoundTrip(TM_SM, "arrays")
+
+
+  def testSaveToFile(self):
+    tmpDir = tempfile.mkdtemp()
+    try:
+      for segmentStore in ("objects", "arrays"):
+        tm = self.createTrainedTM(TM, segmentStore)
+        filePath = os.path.join(tmpDir, "tm_%s.pkl" % segmentStore)
+        tm.saveToFile(filePath)
+
+        restored = TM.loadFromFile(filePath)
+        self.assertIsInstance(restored, TM)
+        self.assertNotLoaded(restored)
+        self.assertEqual(restored.segmentStore, segmentStore)
+        self.assertSameBehavior(tm, restored)
+    finally:
+      shutil.rmtree(tmpDir)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
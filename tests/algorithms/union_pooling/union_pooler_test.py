@@ -29,6 +29,87 @@ from htmresearch.algorithms.union_temporal_pooler import UnionTemporalPooler
 
 
 REAL_DTYPE = numpy.float32
+UINT_DTYPE = numpy.uint32
+
+
+
+class ReferenceUnionTemporalPooler(UnionTemporalPooler):
+  """
+  The original compute, which takes dense input, keeps the predicted input
+  history in a dense matrix and adapts synapses once per learning rule and
+  time step. Unlike the original, it gives the spatial pooler a dense array
+  of active cells when updating duty cycles.
+  """
+
+  def __init__(self, **kwargs):
+    super(ReferenceUnionTemporalPooler, self).__init__(**kwargs)
+    self._denseHistory = numpy.zeros((self.getNumInputs(),
+                                      self._historyLength), dtype=REAL_DTYPE)
+
+
+  def compute(self, activeInput, predictedActiveInput, learn):
+    self._updateBookeepingVars(learn)
+
+    overlapsActive = self._calculateOverlap(activeInput)
+    overlapsPredictedActive = self._calculateOverlap(predictedActiveInput)
+    totalOverlap = (overlapsActive * self._activeOverlapWeight +
+                    overlapsPredictedActive *
+                    self._predictedActiveOverlapWeight).astype(REAL_DTYPE)
+
+    if learn:
+      boostFactors = numpy.zeros(self.getNumColumns(), dtype=REAL_DTYPE)
+      self.getBoostFactors(boostFactors)
+      boostedOverlaps = boostFactors * totalOverlap
+    else:
+      boostedOverlaps = totalOverlap
+
+    activeCells = self._inhibitColumns(boostedOverlaps)
+    self._activeCells = activeCells
+    self._decayPoolingActivation()
+    self._addToPoolingActivation(activeCells, overlapsPredictedActive)
+    self._getMostActiveCells()
+
+    if learn:
+      self._adaptSynapses(predictedActiveInput, activeCells,
+                          self.getSynPermActiveInc(),
+                          self.getSynPermInactiveDec())
+      self._adaptSynapses(predictedActiveInput, self._unionSDR,
+                          self._synPermPredActiveInc, 0.0)
+      for i in xrange(self._historyLength):
+        self._adaptSynapses(self._denseHistory[:, i], activeCells,
+                            self._synPermPreviousPredActiveInc, 0.0)
+
+      activeArray = numpy.zeros(self.getNumColumns(), dtype=UINT_DTYPE)
+      activeArray[activeCells] = 1
+      self._updateDutyCycles(totalOverlap.astype(UINT_DTYPE), activeArray)
+      self._bumpUpWeakColumns()
+      self._updateBoostFactors()
+      if self._isUpdateRound():
+        self._updateInhibitionRadius()
+        self._updateMinDutyCycles()
+
+    self._denseHistory = numpy.roll(self._denseHistory, 1, 1)
+    if self._historyLength > 0:
+      self._denseHistory[:, 0] = predictedActiveInput
+
+    return self._unionSDR
+
+
+  def _getMostActiveCells(self):
+    poolingActivation = self._poolingActivation
+    nonZeroCells = numpy.argwhere(poolingActivation > 0)[:, 0]
+    poolingActivationSubset = poolingActivation[nonZeroCells] + \
+                              self._poolingActivation_tieBreaker[nonZeroCells]
+    potentialUnionSDR = nonZeroCells[
+      numpy.argsort(poolingActivationSubset)[::-1]]
+    topCells = potentialUnionSDR[0: self._maxUnionCells]
+
+    if max(self._poolingTimer) > self._minHistory:
+      self._unionSDR = numpy.sort(topCells).astype(UINT_DTYPE)
+    else:
+      self._unionSDR = []
+
+    return self._unionSDR
 
 
 
@@ -123,6 +204,59 @@ class UnionTemporalPoolerTest(unittest.TestCase):
     self.assertEquals(result[0], 3)
     self.assertEquals(result[1], 4)
 
+  def testComputeMatchesReference(self):
+    params = dict(inputDimensions=(200, ),
+                  columnDimensions=(150, ),
+                  potentialRadius=200,
+                  potentialPct=0.5,
+                  globalInhibition=True,
+                  numActiveColumnsPerInhArea=10,
+                  stimulusThreshold=1,
+                  synPermInactiveDec=0.01,
+                  synPermActiveInc=0.05,
+                  synPermConnected=0.2,
+                  minPctOverlapDutyCycle=0.1,
+                  dutyCyclePeriod=20,
+                  boostStrength=2.0,
+                  seed=42,
+                  activeOverlapWeight=1.0,
+                  predictedActiveOverlapWeight=10.0,
+                  maxUnionActivity=0.2,
+                  exciteFunctionType="Logistic",
+                  decayFunctionType="Exponential",
+                  decayTimeConst=5.0,
+                  synPermPredActiveInc=0.04,
+                  synPermPreviousPredActiveInc=0.03,
+                  historyLength=3,
+                  minHistory=2)
+    pooler = UnionTemporalPooler(**params)
+    reference = ReferenceUnionTemporalPooler(**params)
+
+    rng = numpy.random.RandomState(42)
+    for step in xrange(60):
+      activeInput = numpy.zeros(200, dtype=UINT_DTYPE)
+      activeInput[rng.choice(200, 20, replace=False)] = 1
+      predictedActiveInput = activeInput * (rng.rand(200) < 0.6)
+      learn = step % 10 != 9
+
+      if step % 2:
+        unionSDR = pooler.compute(activeInput, predictedActiveInput, learn)
+      else:
+        unionSDR = pooler.computeSparse(numpy.flatnonzero(activeInput),
+                                        numpy.flatnonzero(predictedActiveInput),
+                                        learn)
+      expected = reference.compute(activeInput, predictedActiveInput, learn)
+      numpy.testing.assert_equal(unionSDR, expected)
+      numpy.testing.assert_equal(pooler._activeCells, reference._activeCells)
+
+    perm = numpy.zeros(200, dtype=REAL_DTYPE)
+    expectedPerm = numpy.zeros(200, dtype=REAL_DTYPE)
+    for column in xrange(150):
+      pooler.getPermanence(column, perm)
+      reference.getPermanence(column, expectedPerm)
+      numpy.testing.assert_equal(perm, expectedPerm)
+
+
 
 if __name__ == "__main__":
   unittest.main()
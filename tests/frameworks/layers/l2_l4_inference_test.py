@@ -426,6 +426,184 @@ class L4L2ExperimentTest(unittest.TestCase):
           self.assertSequenceEqual(L40, set(exps[e].getL4Representations()[c]))
 
 
+  def testParallelColumnsMatchSerial(self):
+    """
+    Computing the columns in worker processes should give exactly the same
+    representations and statistics as computing them serially.
+    """
+    for networkType in ("MultipleL4L2Columns",
+                        "MultipleL4L2ColumnsWithTopology"):
+      for sparseIO in (False, True):
+        exps = []
+        for numWorkers in (0, 2):
+          random.seed(23)
+          numpy.random.seed(23)
+          objects = createObjectMachine(
+            machineType="simple",
+            numInputBits=20,
+            sensorInputSize=1024,
+            externalInputSize=1024,
+            numCorticalColumns=3,
+            seed=40,
+          )
+          objects.createRandomObjects(4, 5, numLocations=6, numFeatures=4)
+
+          exp = l2_l4_inference.L4L2Experiment(
+            "parallel",
+            numCorticalColumns=3,
+            networkType=networkType,
+            L4Overrides={"implementation": "ApicalTiebreak"},
+            sparseIO=sparseIO,
+            numWorkers=numWorkers,
+          )
+          exp.learnObjects(objects.provideObjectsToLearn())
+          for objectName, pairs in sorted(objects.objects.iteritems()):
+            exp.infer(objects.provideObjectToInfer({
+              "numSteps": 4,
+              "pairs": {c: (pairs[c:] + pairs[:c])[:4] for c in xrange(3)}}),
+                      objectName=objectName)
+          exps.append(exp)
+
+        serial, parallel = exps
+        self.assertEqual(parallel.objectL2Representations,
+                         serial.objectL2Representations)
+        self.assertEqual(parallel.statistics, serial.statistics)
+        self.assertEqual(parallel.getL4Representations(),
+                         serial.getL4Representations())
+        numpy.testing.assert_array_equal(parallel.getCurrentObjectOverlaps(),
+                                         serial.getCurrentObjectOverlaps())
+        self.assertEqual(
+          parallel.columnRunner.callMethod(["L2Column_1"],
+                                           "_pooler.getActiveCells")[0].tolist(),
+          serial.L2Columns[1]._pooler.getActiveCells().tolist())
+        parallel.close()
+
+
+  def testPhaseProfiling(self):
+    """
+    Phase profiling should record the same phases and segment counts whether
+    or not the columns run in parallel, and shouldn't change the results.
+    """
+    exps = []
+    for numWorkers, profile in ((0, False), (0, True), (2, True)):
+      objects = createObjectMachine(
+        machineType="simple",
+        numInputBits=20,
+        sensorInputSize=1024,
+        externalInputSize=1024,
+        numCorticalColumns=2,
+        seed=40,
+      )
+      objects.createRandomObjects(3, 4, numLocations=5, numFeatures=4)
+
+      exp = l2_l4_inference.L4L2Experiment(
+        "profiling",
+        numCorticalColumns=2,
+        L4Overrides={"implementation": "ApicalTiebreak"},
+        numWorkers=numWorkers,
+      )
+      if profile:
+        exp.enablePhaseProfiling()
+      exp.learnObjects(objects.provideObjectsToLearn())
+      exp.infer(objects.provideObjectToInfer({
+        "numSteps": 3,
+        "pairs": {0: objects.objects[0][:3], 1: objects.objects[0][1:4]}}),
+                objectName=0)
+      exps.append(exp)
+
+    unprofiled, serial, parallel = exps
+    self.assertEqual(serial.statistics, unprofiled.statistics)
+
+    serialProfile = serial.getPhaseProfile()
+    parallelProfile = parallel.getPhaseProfile()
+    self.assertEqual(sorted(serialProfile.keys()), ["L2", "L4"])
+    self.assertIn("basalSegmentActivity", serialProfile["L4"]["phases"])
+    self.assertIn("growNewSegments", serialProfile["L4"]["phases"])
+    self.assertIn("learnProximal", serialProfile["L2"]["phases"])
+    self.assertIn("proximalOverlaps", serialProfile["L2"]["phases"])
+    for layer in ("L2", "L4"):
+      self.assertEqual(parallelProfile[layer]["sizes"],
+                       serialProfile[layer]["sizes"])
+      for name, phase in serialProfile[layer]["phases"].iteritems():
+        self.assertEqual(parallelProfile[layer]["phases"][name]["calls"],
+                         phase["calls"])
+    self.assertEqual(len(serial.getPhaseProfile(perColumn=True)["L4"]), 2)
+
+    for exp in (serial, parallel):
+      exp.resetProfile()
+      self.assertEqual(exp.getPhaseProfile()["L4"]["phases"], {})
+      exp.disablePhaseProfiling()
+      exp.infer(objects.provideObjectToInfer({
+        "numSteps": 1,
+        "pairs": {0: objects.objects[1][:1], 1: objects.objects[1][1:2]}}))
+      self.assertEqual(exp.getPhaseProfile()["L2"]["phases"], {})
+    parallel.close()
+
+
+  def testCloseStopsWorkers(self):
+    """
+    Closing an experiment should stop its worker processes, and it shouldn't
+    be possible to run it afterwards.
+    """
+    objects = createObjectMachine(
+      machineType="simple",
+      numInputBits=20,
+      sensorInputSize=1024,
+      externalInputSize=1024,
+      numCorticalColumns=2,
+      seed=40,
+    )
+    objects.createRandomObjects(2, 3, numLocations=4, numFeatures=3)
+
+    with l2_l4_inference.L4L2Experiment(
+        "close",
+        numCorticalColumns=2,
+        L4Overrides={"implementation": "ApicalTiebreak"},
+        numWorkers=2) as exp:
+      processes = list(exp.columnRunner.processes)
+      self.assertEqual(len(processes), 2)
+      exp.learnObjects(objects.provideObjectsToLearn())
+      exp.infer(objects.provideObjectToInfer({
+        "numSteps": 2,
+        "pairs": {0: objects.objects[0][:2], 1: objects.objects[0][1:3]}}),
+                objectName=0)
+      self.assertTrue(all(process.is_alive() for process in processes))
+
+    self.assertFalse(any(process.is_alive() for process in processes))
+    with self.assertRaises(RuntimeError):
+      exp.sendReset()
+
+    # Closing again, or closing a serial experiment, does nothing.
+    exp.close()
+    serial = l2_l4_inference.L4L2Experiment("close", numCorticalColumns=2)
+    serial.close()
+
+
+  def testWorkerErrorsAreReraised(self):
+    """
+    An exception in a worker process should be raised in the main process
+    with the worker's traceback, and the workers should keep serving
+    requests.
+    """
+    with l2_l4_inference.L4L2Experiment(
+        "errors",
+        numCorticalColumns=2,
+        L4Overrides={"implementation": "ApicalTiebreak"},
+        numWorkers=2) as exp:
+      with self.assertRaises(RuntimeError) as context:
+        exp.columnRunner.callMethod(["L2Column_0", "L2Column_1"],
+                                    "_pooler.noSuchMethod")
+      message = str(context.exception)
+      self.assertIn("Worker 0 failed", message)
+      self.assertIn("Worker 1 failed", message)
+      self.assertIn("AttributeError", message)
+      self.assertIn("noSuchMethod", message)
+
+      activeCells = exp.columnRunner.callMethod(["L2Column_1"],
+                                                "_pooler.getActiveCells")
+      self.assertEqual(activeCells[0].tolist(), [])
+
+
   def testObjectClassificationUnit(self):
     """
     Unit Test for multi column object classification
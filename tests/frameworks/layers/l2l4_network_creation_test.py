@@ -19,6 +19,7 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 
+import copy
 import unittest
 import random
 
@@ -1109,6 +1110,75 @@ class LaminarNetworkTest(unittest.TestCase):
     self.assertGreaterEqual(len(self.getL4BurstingCells(L4Column1)), 20 * 7)
 
 
+  def testSparseIOMatchesDenseIO(self):
+    """
+    Networks with and without sparse I/O should compute exactly the same
+    representations in every L4 and L2 column.
+    """
+    sparseConfig = copy.deepcopy(networkConfig2)
+    sparseConfig["sparseIO"] = True
+
+    denseNet = createNetwork(networkConfig2)
+    sparseNet = createNetwork(sparseConfig)
+    numColumns = networkConfig2["numCorticalColumns"]
+
+    features = [self.generatePattern(1024, 20) for _ in xrange(3)]
+    locations = [self.generatePattern(1024, 20) for _ in xrange(3)]
+    sensations = [(features[i % 3], locations[(i * 2) % 3]) for i in xrange(6)]
+
+    for learn in (True, False):
+      for net in (denseNet, sparseNet):
+        for i in xrange(numColumns):
+          net.regions["L2Column_%d" % i].getSelf().setParameter(
+            "learningMode", 0, learn)
+          net.regions["L4Column_%d" % i].getSelf().setParameter(
+            "learn", 0, learn)
+
+      for _ in xrange(3):
+        for feature, location in sensations:
+          for net in (denseNet, sparseNet):
+            for i in xrange(numColumns):
+              net.regions["sensorInput_%d" % i].getSelf().addDataToQueue(
+                feature, 0, 0)
+              net.regions["externalInput_%d" % i].getSelf().addDataToQueue(
+                location, 0, 0)
+            net.run(1)
+
+          for i in xrange(numColumns):
+            denseL2 = denseNet.regions["L2Column_%d" % i].getSelf()
+            sparseL2 = sparseNet.regions["L2Column_%d" % i].getSelf()
+            self.assertEqual(self.getCurrentL2Representation(sparseL2),
+                             self.getCurrentL2Representation(denseL2))
+
+            denseL4 = denseNet.regions["L4Column_%d" % i].getSelf()
+            sparseL4 = sparseNet.regions["L4Column_%d" % i].getSelf()
+            self.assertEqual(set(sparseL4._tm.getActiveCells()),
+                             set(denseL4._tm.getActiveCells()))
+            self.assertEqual(self.getL4PredictedCells(sparseL4),
+                             self.getL4PredictedCells(denseL4))
+
+        for net in (denseNet, sparseNet):
+          for i in xrange(numColumns):
+            net.regions["sensorInput_%d" % i].getSelf().addResetToQueue(0)
+            net.regions["externalInput_%d" % i].getSelf().addResetToQueue(0)
+          net.run(1)
+
+
+  def testSparseIOWithSpatialPoolers(self):
+    """Sparse I/O can't be combined with spatial poolers."""
+    config = copy.deepcopy(networkConfig1)
+    config["sparseIO"] = True
+    config["sensorInputSize"] = 2048
+    config["L4Params"]["columnCount"] = 1024
+    config["feedForwardSPParams"] = {
+      "inputWidth": 2048,
+      "columnCount": 1024,
+    }
+
+    with self.assertRaises(ValueError):
+      createNetwork(config)
+
+
   def generatePattern(self, max, size):
     """Generates a random feedback pattern."""
     cellsIndices = range(max)
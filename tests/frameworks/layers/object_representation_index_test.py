@@ -0,0 +1,153 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""Tests for the inverted index of learned L2 object representations."""
+
+from mock import patch
+import random
+import unittest
+
+from htmresearch.frameworks.layers import l2_l4_inference
+from htmresearch.frameworks.layers.object_representation_index import (
+  IndexedObjectRepresentations)
+
+
+
+def _randomRepresentation(numColumns, cellCount, sdrSize):
+  return [set(random.sample(xrange(cellCount), sdrSize))
+          for _ in xrange(numColumns)]
+
+
+def _referenceClassification(objectL2Representations, l2sdr, minOverlap,
+                             includeZeros):
+  """
+  The original classification, which intersects the active cells with every
+  object's representation.
+  """
+  results = {}
+  for objectName, objectSdr in objectL2Representations.iteritems():
+    count = 0
+    score = 0.0
+    for i in xrange(len(l2sdr)):
+      if len(l2sdr[i]) == 0:
+        continue
+
+      count += 1
+      overlap = len(l2sdr[i] & objectSdr[i])
+      if overlap >= minOverlap:
+        score += 1
+
+    if count == 0:
+      if includeZeros:
+        results[objectName] = 0
+    else:
+      if includeZeros or score > 0.0:
+        results[objectName] = score / count
+
+  return results
+
+
+
+class IndexedObjectRepresentationsTest(unittest.TestCase):
+
+  def testOverlapsMatchIntersections(self):
+    random.seed(42)
+    representations = IndexedObjectRepresentations(3)
+    expected = {}
+    for objectName in xrange(200):
+      representation = _randomRepresentation(3, 256, 20)
+      representations[objectName] = representation
+      expected[objectName] = representation
+
+    # Replace and delete some objects
+    for objectName in xrange(0, 200, 7):
+      representation = _randomRepresentation(3, 256, 20)
+      representations[objectName] = representation
+      expected[objectName] = representation
+    for objectName in xrange(3, 200, 11):
+      del representations[objectName]
+      del expected[objectName]
+
+    self.assertEqual(representations, expected)
+
+    for column in xrange(3):
+      activeCells = set(random.sample(xrange(256), 40))
+      overlaps = representations.getOverlaps(column, activeCells)
+      for objectName, representation in expected.iteritems():
+        self.assertEqual(overlaps[objectName],
+                         len(activeCells & representation[column]))
+
+
+  def testDeleteCleansIndex(self):
+    representations = IndexedObjectRepresentations(
+      2, {"A": [set([1, 2]), set([3])]})
+    representations["B"] = [set([2]), set()]
+    del representations["A"]
+    representations["B"] = [set([5]), set()]
+
+    self.assertEqual(dict(representations._objectsByCell[0]),
+                     {5: set(["B"])})
+    self.assertEqual(dict(representations._objectsByCell[1]), {})
+
+
+  def testClassificationMatchesReference(self):
+    random.seed(42)
+    numColumns = 4
+    objectL2SDR = dict((objectName,
+                        _randomRepresentation(numColumns, 512, 40))
+                       for objectName in xrange(100))
+
+    with patch.object(l2_l4_inference.L4L2Experiment,
+                      "getL2Representations") as mock_getL2Representations:
+      exp = l2_l4_inference.L4L2Experiment("indexedClassification",
+                                           numCorticalColumns=numColumns)
+      exp.objectL2Representations = objectL2SDR
+
+      for _ in xrange(50):
+        # Mix columns that see an object, a union, noise, or nothing.
+        l2sdr = []
+        for _ in xrange(numColumns):
+          r = random.random()
+          if r < 0.3:
+            cells = set(objectL2SDR[random.randrange(100)][len(l2sdr)])
+          elif r < 0.6:
+            cells = set.union(*[objectL2SDR[random.randrange(100)][len(l2sdr)]
+                                for _ in xrange(3)])
+          elif r < 0.9:
+            cells = set(random.sample(xrange(512), 40))
+          else:
+            cells = set()
+          l2sdr.append(cells)
+        mock_getL2Representations.return_value = l2sdr
+
+        for minOverlap in (None, 0, 5, 20):
+          for includeZeros in (True, False):
+            expected = _referenceClassification(
+              objectL2SDR, l2sdr,
+              20 if minOverlap is None else minOverlap, includeZeros)
+            self.assertEqual(
+              exp.getCurrentClassification(minOverlap, includeZeros),
+              expected)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,238 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+"""
+Checks the bulk dendrite initialization, the mini-batch HTM-style training
+and the parallel trials of the poirazi neuron model.
+"""
+
+import random
+import unittest
+
+import numpy
+from scipy import sparse
+from nupic.bindings.math import SM32
+
+from htmresearch.frameworks.poirazi_neuron_model.neuron_model import (
+  Matrix_Neuron, threshold_nonlinearity, sigmoid_nonlinearity, random_subsets,
+  random_row_nonzeros)
+from htmresearch.frameworks.poirazi_neuron_model.data_tools import (
+  generate_evenly_distributed_data_sparse)
+from htmresearch.frameworks.poirazi_neuron_model.parallel_trials import (
+  run_trials)
+
+
+
+def prototype_data(dim, num_active, num_prototypes, num_samples):
+  """
+  Positive datapoints are noisy copies of a few prototypes, and negative ones
+  are random.
+  """
+  prototypes = random_subsets(num_prototypes, dim, num_active)
+  labels = numpy.where(numpy.random.rand(num_samples) < 0.5, 1, -1)
+  data = numpy.zeros((num_samples, dim), dtype="float32")
+  for i in xrange(num_samples):
+    if labels[i] > 0:
+      bits = prototypes[numpy.random.randint(num_prototypes)].copy()
+      noisy = numpy.random.rand(num_active) < 0.1
+      bits[noisy] = numpy.random.randint(dim, size=noisy.sum())
+    else:
+      bits = numpy.random.choice(dim, num_active, replace=False)
+    data[i, bits] = 1
+  return SM32(data), labels
+
+
+
+def classification_error(neuron, data, labels):
+  classifications = numpy.sign(neuron.calculate_on_entire_dataset(data))
+  return numpy.mean((classifications > 0) != (labels > 0))
+
+
+
+def random_trial(size):
+  return numpy.random.rand(size), [random.random() for _ in xrange(size)]
+
+
+
+
+def clustered_trial(num_samples):
+  data, labels = prototype_data(dim=200, num_active=20, num_prototypes=5,
+                                num_samples=num_samples)
+  neuron = Matrix_Neuron(num_dendrites=10, dendrite_length=10, dim=200)
+  neuron.HTM_style_initialize_on_data(data, labels)
+  neuron.HTM_style_train_on_data(data, labels)
+  return neuron.dendrites.toDense(), neuron.permanences.toDense()
+
+
+
+class NeuronModelTest(unittest.TestCase):
+
+  def setUp(self):
+    numpy.random.seed(42)
+
+
+  def testRandomSubsets(self):
+    for num_subsets, population_size, subset_size in [(300, 5000, 30),
+                                                      (300, 40, 25),
+                                                      (10, 30, 30)]:
+      subsets = random_subsets(num_subsets, population_size, subset_size)
+      self.assertEqual(subsets.shape, (num_subsets, subset_size))
+      self.assertTrue((numpy.diff(subsets, axis=1) > 0).all())
+      self.assertTrue(subsets.min() >= 0)
+      self.assertTrue(subsets.max() < population_size)
+
+    counts = numpy.bincount(random_subsets(10000, 50, 5).ravel(), minlength=50)
+    self.assertTrue(numpy.abs(counts - 1000).max() < 150)
+
+
+  def testRandomRowNonZeros(self):
+    data = generate_evenly_distributed_data_sparse(dim=500, num_active=40,
+                                                   num_samples=200)
+    rows, cols = random_row_nonzeros(data, 25)
+    numpy.testing.assert_equal(numpy.bincount(rows, minlength=200), 25)
+    numpy.testing.assert_equal(data.toDense()[rows, cols], 1)
+    self.assertEqual(len(set(zip(rows, cols))), len(rows))
+
+
+  def testInitialization(self):
+    neuron = Matrix_Neuron(num_dendrites=100, dendrite_length=20, dim=2000)
+    dendrites = neuron.dendrites.toDense()
+    numpy.testing.assert_equal(dendrites.sum(axis=0), 20)
+    numpy.testing.assert_equal(neuron.permanences.toDense(), dendrites * 0.5)
+
+    data = generate_evenly_distributed_data_sparse(dim=2000, num_active=40,
+                                                   num_samples=100)
+    labels = [1, -1] * 50
+    neuron.HTM_style_initialize_on_data(data, labels)
+    dendrites = neuron.dendrites.toDense()
+    numpy.testing.assert_equal(dendrites[:, :50].sum(axis=0), 20)
+    numpy.testing.assert_equal(dendrites[:, 50:], 0)
+    self.assertTrue(
+      (dendrites[:, :50].T <= data.toDense()[::2]).all())
+
+
+  def testBatchTraining(self):
+    data, labels = prototype_data(dim=1000, num_active=40, num_prototypes=50,
+                                  num_samples=2000)
+    neuron = Matrix_Neuron(num_dendrites=100, dendrite_length=20, dim=1000,
+                           nonlinearity=threshold_nonlinearity(8))
+    self.assertGreater(classification_error(neuron, data, labels), 0.3)
+
+    for _ in xrange(3):
+      neuron.HTM_style_train_on_data(data, labels, batch_size=100)
+    self.assertLess(classification_error(neuron, data, labels), 0.02)
+
+    dendrites = neuron.dendrites.toDense()
+    numpy.testing.assert_equal(dendrites.sum(axis=0), 20)
+    self.assertTrue(((neuron.permanences.toDense() != 0) <= dendrites).all())
+
+
+  def checkBatchOfOneMatchesDatapoints(self, nonlinearity, dim=400):
+    """
+    Training on batches of one datapoint applies the same permanence changes
+    as training one datapoint at a time.
+    """
+    data, labels = prototype_data(dim=dim, num_active=20, num_prototypes=5,
+                                  num_samples=80)
+    # Branches grown on other noisy copies of a prototype have some inactive
+    # synapses on the training datapoints.
+    neuron = Matrix_Neuron(num_dendrites=40, dendrite_length=10, dim=dim,
+                           nonlinearity=nonlinearity)
+    neuron.HTM_style_initialize_on_data(data.getSlice(0, 40, 0, dim),
+                                        labels[:40])
+    data, labels = data.getSlice(40, 80, 0, dim), labels[40:]
+    dendrites = neuron.dendrites.toDense()
+    permanences = neuron.permanences.toDense()
+    initial_permanences = permanences.copy()
+
+    rows, cols = data.getAllNonZeros(True)[:2]
+    batches = sparse.csr_matrix(
+      (numpy.ones(len(rows), dtype="float32"), (rows, cols)),
+      shape=(data.nRows(), data.nCols()))
+    for i in xrange(data.nRows()):
+      neuron.HTM_style_train_on_batch(batches[i:i + 1], labels[i:i + 1],
+                                      dendrites, permanences)
+    neuron.HTM_style_train_on_data(data, labels, batch_size=1)
+
+    # Every positive was detected and no synapse got weak enough to be moved,
+    # so neither path made random changes.
+    numpy.testing.assert_equal(neuron.dendrites.toDense(), dendrites)
+    numpy.testing.assert_allclose(neuron.permanences.toDense(), permanences,
+                                  rtol=0, atol=1e-6)
+
+    # Both the active and the inactive synapses of detected branches changed
+    connected = dendrites > 0
+    changes = (permanences - initial_permanences)[connected]
+    self.assertTrue(
+      numpy.isclose(changes, neuron.permanence_increment).any())
+    self.assertTrue(
+      numpy.isclose(changes, neuron.permanence_decrement).any())
+
+
+  def testBatchOfOneMatchesDatapoints(self):
+    self.checkBatchOfOneMatchesDatapoints(threshold_nonlinearity(6))
+
+
+  def testBatchOfOneMatchesDatapointsSigmoid(self):
+    """
+    sigmoid_nonlinearity returns a new matrix, which neither training path
+    uses, so they both pick branches by their raw overlaps, and datapoints
+    without any overlap don't count as detected.  Those are common with this
+    many input bits.
+    """
+    self.checkBatchOfOneMatchesDatapoints(sigmoid_nonlinearity(11.5, 5),
+                                          dim=1000)
+
+
+  def testRunTrials(self):
+    """
+    Trials are seeded, for numpy and for the random module, so they give the
+    same results in one process and in several.
+    """
+    seeds = range(5)
+    expected = run_trials(random_trial, {"size": 3}, seeds)
+    for num_processes in (2, 3):
+      numpy.testing.assert_equal(
+        run_trials(random_trial, {"size": 3}, seeds,
+                   num_processes=num_processes),
+        expected)
+
+    numpy.random.seed(3)
+    random.seed(3)
+    numpy.testing.assert_equal(expected[3], random_trial(3))
+
+
+  def testRunTrialsWithClustering(self):
+    """
+    Initializing on more datapoints than dendrites clusters them and picks
+    synapses with the random module. Training one datapoint at a time also
+    uses it.
+    """
+    params = {"num_samples": 60}
+    expected = run_trials(clustered_trial, params, [1, 2])
+    numpy.testing.assert_equal(
+      run_trials(clustered_trial, params, [1, 2], num_processes=2), expected)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
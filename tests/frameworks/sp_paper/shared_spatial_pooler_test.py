@@ -0,0 +1,128 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+"""
+Compares the SharedSpatialPooler with the C++ and Python spatial poolers it
+was exported from, computing without learning.
+"""
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from nupic.algorithms.spatial_pooler import SpatialPooler as PYSpatialPooler
+from nupic.bindings.algorithms import SpatialPooler as CPPSpatialPooler
+
+from htmresearch.frameworks.sp_paper.shared_spatial_pooler import (
+  exportSpatialPooler, SharedSpatialPooler)
+
+
+
+class SharedSpatialPoolerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.path = tempfile.mkdtemp()
+    self.rng = np.random.RandomState(42)
+
+
+  def tearDown(self):
+    shutil.rmtree(self.path)
+
+
+  def checkMatches(self, sp, numTrainingInputs=50):
+    numInputs = sp.getNumInputs()
+    numColumns = sp.getNumColumns()
+    output = np.zeros(numColumns, dtype="uint32")
+    for _ in xrange(numTrainingInputs):
+      sp.compute((self.rng.rand(numInputs) < 0.1).astype("uint32"), True,
+                 output)
+
+    exportSpatialPooler(sp, self.path)
+    shared = SharedSpatialPooler(self.path)
+
+    inputVectors = (self.rng.rand(60, numInputs) <
+                    self.rng.choice([0.02, 0.1, 0.3], size=(60, 1)))
+    inputVectors = inputVectors.astype("uint32")
+    expected = np.zeros((len(inputVectors), numColumns), dtype="uint32")
+    for inputVector, outputColumns in zip(inputVectors, expected):
+      sp.compute(inputVector, False, outputColumns)
+    np.testing.assert_equal(shared.computeBatch(inputVectors), expected)
+
+    shared.compute(inputVectors[0], False, output)
+    np.testing.assert_equal(output, expected[0])
+
+    expectedPermanence = np.zeros(numInputs, dtype="float32")
+    permanence = np.zeros(numInputs, dtype="float32")
+    expectedConnected = np.zeros(numInputs, dtype="uint32")
+    connected = np.zeros(numInputs, dtype="uint32")
+    for column in (0, numColumns / 2, numColumns - 1):
+      sp.getPermanence(column, expectedPermanence)
+      shared.getPermanence(column, permanence)
+      np.testing.assert_equal(permanence, expectedPermanence)
+      sp.getConnectedSynapses(column, expectedConnected)
+      shared.getConnectedSynapses(column, connected)
+      np.testing.assert_equal(connected, expectedConnected)
+
+
+  def testGlobalInhibition(self):
+    for SpatialPooler in (CPPSpatialPooler, PYSpatialPooler):
+      for localAreaDensity, numActiveColumnsPerInhArea in ((0.04, -1),
+                                                           (-1, 10)):
+        self.checkMatches(SpatialPooler(
+          inputDimensions=(200,), columnDimensions=(256,),
+          globalInhibition=True, localAreaDensity=localAreaDensity,
+          numActiveColumnsPerInhArea=numActiveColumnsPerInhArea,
+          stimulusThreshold=1, seed=7))
+
+
+  def testLocalInhibition(self):
+    for SpatialPooler in (CPPSpatialPooler, PYSpatialPooler):
+      for wrapAround in (True, False):
+        self.checkMatches(SpatialPooler(
+          inputDimensions=(10, 20), columnDimensions=(16, 16),
+          potentialRadius=5, globalInhibition=False, localAreaDensity=0.1,
+          numActiveColumnsPerInhArea=-1, wrapAround=wrapAround,
+          stimulusThreshold=1, seed=7))
+
+        # A neighborhood that is wider than one of the dimensions.
+        sp = SpatialPooler(
+          inputDimensions=(10, 30), columnDimensions=(8, 40),
+          potentialRadius=300, globalInhibition=False, localAreaDensity=-1,
+          numActiveColumnsPerInhArea=10, wrapAround=wrapAround,
+          stimulusThreshold=2, seed=3)
+        sp.setInhibitionRadius(6)
+        self.checkMatches(sp, numTrainingInputs=0)
+
+
+  def testCannotLearn(self):
+    exportSpatialPooler(CPPSpatialPooler(inputDimensions=(20,),
+                                         columnDimensions=(30,)), self.path)
+    shared = SharedSpatialPooler(self.path)
+    self.assertRaises(ValueError, shared.compute, np.zeros(20, dtype="uint32"),
+                      True, np.zeros(30, dtype="uint32"))
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,292 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compares the batched noise robustness metrics and the matrix-form diagnostics
+with the original loops, which handled one input, column or pair at a time.
+"""
+
+import copy
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+import numpy as np
+
+from nupic.bindings.algorithms import SpatialPooler
+
+from htmresearch.frameworks.sp_paper import sp_metrics
+from htmresearch.frameworks.sp_paper.shared_spatial_pooler import (
+  exportSpatialPooler)
+from htmresearch.frameworks.sp_paper.sp_metrics import (
+  calculateInputOverlapMat, calculateInputSpaceCoverage, calculateOverlapCurve,
+  classificationAccuracyVsNoise, corruptSparseVector, generateRandomSDR,
+  getConnectedSyns, meanMutualInformation, mutualInformation,
+  pairwiseMutualInformation, percentOverlap, reconstructionError,
+  witnessError)
+
+
+
+def referenceOverlapCurve(sp, inputVectors):
+  columnNumber = np.prod(sp.getColumnDimensions())
+  numInputVector, inputSize = inputVectors.shape
+  outputColumns = np.zeros((numInputVector, columnNumber), dtype="uint32")
+  outputColumnsCorrupted = np.zeros((numInputVector, columnNumber),
+                                    dtype="uint32")
+
+  noiseLevelList = np.linspace(0, 1.0, 21)
+  inputOverlapScore = np.zeros((numInputVector, len(noiseLevelList)))
+  outputOverlapScore = np.zeros((numInputVector, len(noiseLevelList)))
+  for i in range(numInputVector):
+    for j in range(len(noiseLevelList)):
+      inputVectorCorrupted = copy.deepcopy(inputVectors[i][:])
+      corruptSparseVector(inputVectorCorrupted, noiseLevelList[j])
+      sp.compute(inputVectors[i][:], False, outputColumns[i][:])
+      sp.compute(inputVectorCorrupted, False, outputColumnsCorrupted[i][:])
+      inputOverlapScore[i][j] = percentOverlap(inputVectors[i][:],
+                                               inputVectorCorrupted)
+      outputOverlapScore[i][j] = percentOverlap(outputColumns[i][:],
+                                                outputColumnsCorrupted[i][:])
+
+  return noiseLevelList, inputOverlapScore, outputOverlapScore
+
+
+
+def referenceClassificationAccuracy(sp, inputVectors, noiseLevelList):
+  numInputVector, inputSize = inputVectors.shape
+  if sp is None:
+    targetOutputColumns = copy.deepcopy(inputVectors)
+  else:
+    columnNumber = np.prod(sp.getColumnDimensions())
+    targetOutputColumns = np.zeros((numInputVector, columnNumber),
+                                   dtype="uint32")
+    for i in range(numInputVector):
+      sp.compute(inputVectors[i][:], False, targetOutputColumns[i][:])
+
+  outcomes = np.zeros((len(noiseLevelList), numInputVector))
+  for i in range(len(noiseLevelList)):
+    for j in range(numInputVector):
+      corruptedInputVector = copy.deepcopy(inputVectors[j][:])
+      corruptSparseVector(corruptedInputVector, noiseLevelList[i])
+      if sp is None:
+        outputColumns = copy.deepcopy(corruptedInputVector)
+      else:
+        outputColumns = np.zeros((columnNumber, ), dtype="uint32")
+        sp.compute(corruptedInputVector, False, outputColumns)
+
+      overlap = [percentOverlap(outputColumns, target)
+                 for target in targetOutputColumns]
+      outcomes[i][j] = np.argmax(overlap) == j
+
+  return np.mean(outcomes, 1)
+
+
+
+def referenceMutualInformation(activeColumns, i, j):
+  batchSize = activeColumns.shape[0]
+  ci, cj, cij = 0., 0., dict([((0,0),0.), ((1,0),0.), ((0,1),0.), ((1,1),0.)])
+  for t in range(batchSize):
+    ai = activeColumns[t, i]
+    aj = activeColumns[t, j]
+    cij[(ai, aj)] += 1.
+    ci += ai
+    cj += aj
+
+  Iij = 0
+  for a,b in [(0,0), (1,0), (0,1), (1,1)]:
+    pij = cij[(a,b)]/batchSize
+    pi  = ci/batchSize if a == 1 else 1. - ci/batchSize
+    pj  = cj/batchSize if b == 1 else 1. - cj/batchSize
+    Iij += pij * np.log2(pij/(pi*pj)) if pij > 0 else 0
+  return Iij
+
+
+
+class SPMetricsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.inputVectors = generateRandomSDR(30, 200, 20, seed=42)
+
+
+  def createSP(self):
+    sp = SpatialPooler(inputDimensions=(200,), columnDimensions=(300,),
+                       potentialRadius=200, potentialPct=0.5,
+                       globalInhibition=True, numActiveColumnsPerInhArea=15,
+                       seed=42)
+    # Train a little so that the output depends on the learned synapses
+    output = np.zeros(300, dtype="uint32")
+    for inputVector in self.inputVectors:
+      sp.compute(inputVector, True, output)
+    return sp
+
+
+  def testOverlapCurve(self):
+    np.random.seed(42)
+    reference = self.createSP()
+    expected = referenceOverlapCurve(reference, self.inputVectors)
+
+    for numProcesses in (1, 2):
+      np.random.seed(42)
+      sp = self.createSP()
+      result = calculateOverlapCurve(sp, self.inputVectors,
+                                     numProcesses=numProcesses)
+      for values, expectedValues in zip(result, expected):
+        np.testing.assert_equal(values, expectedValues)
+      self.assertEqual(sp.getIterationNum(), reference.getIterationNum())
+
+
+  def testClassificationAccuracy(self):
+    noiseLevelList = np.linspace(0, 1.0, 11)
+    np.random.seed(42)
+    reference = self.createSP()
+    expected = referenceClassificationAccuracy(reference, self.inputVectors,
+                                               noiseLevelList)
+    np.random.seed(42)
+    expectedWithoutSP = referenceClassificationAccuracy(
+      None, self.inputVectors, noiseLevelList)
+
+    for numProcesses in (1, 2):
+      np.random.seed(42)
+      sp = self.createSP()
+      np.testing.assert_equal(
+        classificationAccuracyVsNoise(sp, self.inputVectors, noiseLevelList,
+                                      numProcesses=numProcesses),
+        expected)
+      self.assertEqual(sp.getIterationNum(), reference.getIterationNum())
+
+    np.random.seed(42)
+    np.testing.assert_equal(
+      classificationAccuracyVsNoise(None, self.inputVectors, noiseLevelList),
+      expectedWithoutSP)
+
+
+  def testExportsSPOncePerEvaluation(self):
+    # More inputs than computeSPOutputs puts in a chunk, so that the clean
+    # and the corrupted inputs are both computed by the worker processes
+    inputVectors = generateRandomSDR(120, 200, 20, seed=43)
+    noiseLevelList = np.linspace(0, 1.0, 11)
+    np.random.seed(42)
+    sp = self.createSP()
+    np.random.seed(42)
+    expectedCurve = calculateOverlapCurve(sp, inputVectors)
+    expectedAccuracy = classificationAccuracyVsNoise(sp, inputVectors,
+                                                     noiseLevelList)
+
+    with patch.object(sp_metrics, "exportSpatialPooler",
+                      wraps=exportSpatialPooler) as mockExport:
+      np.random.seed(42)
+      calculateOverlapCurve(sp, inputVectors, numProcesses=2)
+      classificationAccuracyVsNoise(sp, inputVectors, noiseLevelList,
+                                    numProcesses=2)
+      self.assertEqual(mockExport.call_count, 2)
+
+      # An SP exported by the caller is reused by every evaluation
+      sharedSPPath = tempfile.mkdtemp()
+      try:
+        exportSpatialPooler(sp, sharedSPPath)
+        np.random.seed(42)
+        curve = calculateOverlapCurve(sp, inputVectors, numProcesses=2,
+                                      sharedSPPath=sharedSPPath)
+        accuracy = classificationAccuracyVsNoise(
+          sp, inputVectors, noiseLevelList, numProcesses=2,
+          sharedSPPath=sharedSPPath)
+      finally:
+        shutil.rmtree(sharedSPPath)
+      self.assertEqual(mockExport.call_count, 2)
+
+    for values, expectedValues in zip(curve, expectedCurve):
+      np.testing.assert_equal(values, expectedValues)
+    np.testing.assert_equal(accuracy, expectedAccuracy)
+
+
+  def testDiagnostics(self):
+    sp = self.createSP()
+    numColumns = 300
+    activeColumns = np.zeros((len(self.inputVectors), numColumns),
+                             dtype="uint32")
+    for i, inputVector in enumerate(self.inputVectors):
+      sp.compute(inputVector, False, activeColumns[i])
+    connectedSyns = getConnectedSyns(sp)
+
+    overlapMat = calculateInputOverlapMat(self.inputVectors, sp)
+    for c in xrange(numColumns):
+      for i, inputVector in enumerate(self.inputVectors):
+        self.assertEqual(overlapMat[c, i],
+                         percentOverlap(connectedSyns[c], inputVector))
+
+    np.testing.assert_equal(calculateInputSpaceCoverage(sp),
+                            np.sum(connectedSyns, 0))
+
+    expected = 0.
+    for i, inputVector in enumerate(self.inputVectors):
+      active = np.flatnonzero(activeColumns[i])
+      expected += np.mean([np.sum(np.absolute(connectedSyns[j] - inputVector))
+                           for j in active])
+    expected /= len(self.inputVectors)
+    self.assertAlmostEqual(witnessError(sp, self.inputVectors, activeColumns),
+                           expected)
+    # Reconstruction and witness errors agree on binary inputs
+    self.assertAlmostEqual(
+      reconstructionError(sp, self.inputVectors, activeColumns,
+                          connectedSyns=connectedSyns),
+      expected)
+
+
+  def testWitnessErrorWithoutActiveColumns(self):
+    sp = self.createSP()
+    activeColumns = np.zeros((len(self.inputVectors), 300), dtype="uint32")
+    activeColumns[:, :5] = 1
+    activeColumns[1] = 0
+    with self.assertRaises(ValueError):
+      witnessError(sp, self.inputVectors, activeColumns)
+
+
+  def testMutualInformation(self):
+    rng = np.random.RandomState(42)
+    activeColumns = (rng.rand(50, 12) < 0.3).astype("uint32")
+    activeColumns[:, 3] = activeColumns[:, 2]
+    activeColumns[:, 4] = 1 - activeColumns[:, 2]
+    activeColumns[:, 5] = 0
+
+    mutualInfo = pairwiseMutualInformation(activeColumns)
+    pairs = []
+    for i in xrange(12):
+      for j in xrange(12):
+        expected = referenceMutualInformation(activeColumns, i, j)
+        self.assertAlmostEqual(mutualInfo[i, j], expected)
+        self.assertAlmostEqual(
+          mutualInformation(None, activeColumns, i, j), expected)
+        if i < j:
+          pairs.append(expected)
+
+    sp = self.createSP()
+    self.assertAlmostEqual(
+      meanMutualInformation(sp, activeColumns, range(12)), np.mean(pairs))
+    columns = [1, 3, 2, 7]
+    np.testing.assert_allclose(
+      pairwiseMutualInformation(activeColumns, columns),
+      mutualInfo[np.ix_(columns, columns)])
+
+
+
+if __name__ == "__main__":
+  unittest.main()
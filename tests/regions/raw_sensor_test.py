@@ -27,6 +27,7 @@ import unittest
 
 from nupic.engine import Network
 from htmresearch.support.register_regions import registerAllResearchRegions
+from htmresearch.support.sparse_region_io import readIndices
 
 
 
@@ -105,6 +106,55 @@ class RawSensorTest(unittest.TestCase):
                       "Value of sequenceIdOut incorrect")
 
 
+  def testDataBlock(self):
+    """
+    Records added as a block should be output in order, interleaved correctly
+    with records added one at a time, in both dense and sparse mode, and a
+    partially consumed block should survive save/load.
+    """
+    for sparseIO in (False, True):
+      net = Network()
+      rawSensor = net.addRegion("raw", "py.RawSensor",
+                                json.dumps({"outputWidth": 1029,
+                                            "sparseIO": sparseIO}))
+      rawSensorPy = rawSensor.getSelf()
+
+      rawSensorPy.addDataToQueue([2, 4, 6], 0, 42)
+      rawSensorPy.addDataBlockToQueue([set([7, 3]), [1023, 0, 0], [], [5]],
+                                      sequenceId=43)
+      rawSensorPy.addDataBlockToQueue([])
+      rawSensorPy.addResetToQueue(44)
+
+      def getIndices(region):
+        output = region.getOutputData("dataOut")
+        if sparseIO:
+          return list(readIndices(output))
+        return list(output.nonzero()[0])
+
+      expected = [([2, 4, 6], 0, 42),
+                  ([3, 7], 0, 43),
+                  ([0, 1023], 0, 43),
+                  ([], 0, 43),
+                  ([5], 0, 43),
+                  ([], 1, 44)]
+
+      for i, (indices, reset, sequenceId) in enumerate(expected):
+        if i == 3:
+          # Save and load in the middle of the block
+          path = os.path.join(self.tmpDir, "rawNetworkBlock.nta")
+          net.save(path)
+          net = Network(path)
+          rawSensor = net.regions.get("raw")
+
+        net.run(1)
+        self.assertEqual(getIndices(rawSensor), indices)
+        self.assertEqual(rawSensor.getOutputData("resetOut")[0], reset)
+        self.assertEqual(rawSensor.getOutputData("sequenceIdOut")[0],
+                         sequenceId)
+
+      self.assertEqual(len(rawSensor.getSelf().queue), 0)
+
+
 if __name__ == "__main__":
   unittest.main()
 